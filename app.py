@@ -3,6 +3,8 @@
 运行方式: python app.py
 """
 
+import asyncio
+
 import uvicorn
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
@@ -11,9 +13,10 @@ from fastapi.responses import FileResponse
 from fastapi.responses import JSONResponse
 from fastapi import Request
 
-from backend.config import HOST, PORT, DEBUG, FRONTEND_DIR, UPLOAD_DIR, DATABASE_DIR
+from backend.config import HOST, PORT, DEBUG, FRONTEND_DIR, UPLOAD_DIR, DATABASE_DIR, RETENTION_DAYS, WARM_ENABLED
 from backend.database import init_db
 from backend.api import api_router
+from backend.services.upstream_limiter import UpstreamOverloaded
 
 import logging
 
@@ -51,6 +54,15 @@ def create_app() -> FastAPI:
             content={"detail": str(exc), "code": "VALIDATION_ERROR"},
         )
 
+    @app.exception_handler(UpstreamOverloaded)
+    async def upstream_overloaded_handler(request: Request, exc: UpstreamOverloaded):
+        """上游繁忙时快速拒绝，提示客户端稍后重试"""
+        return JSONResponse(
+            status_code=429,
+            content={"detail": str(exc), "code": "UPSTREAM_OVERLOADED", "retry_after": exc.retry_after},
+            headers={"Retry-After": str(exc.retry_after)},
+        )
+
     # 注册 API 路由
     app.include_router(api_router, prefix="/api")
 
@@ -84,8 +96,34 @@ def create_app() -> FastAPI:
         """应用生命周期管理"""
         DATABASE_DIR.mkdir(parents=True, exist_ok=True)
         await init_db()
+
+        # 加载运行时设置（数据库共享），并定期检查其他进程的修改
+        from backend.services.runtime_settings import refresh_settings, settings_refresh_loop
+        await refresh_settings(force=True)
+        background_tasks = [asyncio.create_task(settings_refresh_loop())]
+
+        # 恢复上次进程中断的批量任务
+        from backend.services.batch_runner import recover_batches
+        await recover_batches()
+
+        # 配置了保留天数时定期归档过期记录
+        if RETENTION_DAYS > 0:
+            from backend.services.archive import retention_loop
+            background_tasks.append(asyncio.create_task(retention_loop()))
+
+        # 预先建立到启用模型端点的 keep-alive 连接，并定期保温空闲端点
+        if WARM_ENABLED:
+            from backend.services.prewarm import warm_loop
+            background_tasks.append(asyncio.create_task(warm_loop()))
+
         yield
 
+        for task in background_tasks:
+            task.cancel()
+
+        from backend.services.model_client import close_clients
+        await close_clients()
+
     app.router.lifespan_context = lifespan
 
     return app
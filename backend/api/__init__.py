@@ -11,6 +11,7 @@ from backend.api.batch import router as batch_router
 from backend.api.history import router as history_router
 from backend.api.statistics import router as statistics_router
 from backend.api.settings import router as settings_router
+from backend.api.upstream import router as upstream_router
 
 api_router = APIRouter()
 
@@ -24,3 +25,4 @@ api_router.include_router(batch_router)
 api_router.include_router(history_router)
 api_router.include_router(statistics_router)
 api_router.include_router(settings_router)
+api_router.include_router(upstream_router)
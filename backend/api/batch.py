@@ -1,19 +1,23 @@
 """批量测试 API 路由"""
 
 import json
-from fastapi import APIRouter, Depends, HTTPException, Query
-from fastapi.responses import PlainTextResponse, JSONResponse
+from fastapi import APIRouter, Depends, File, Form, HTTPException, Query, UploadFile
+from fastapi.responses import JSONResponse, StreamingResponse
 from sse_starlette.sse import EventSourceResponse, ServerSentEvent
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from backend.config import BATCH_MAX_CONCURRENCY
 from backend.database import get_db
 from backend.schemas.batch import BatchRequest
 from backend.services.batch import (
     create_batch,
     get_batch_detail,
-    stream_batch,
-    export_batch,
+    list_batch_results,
 )
+from backend.services.batch_runner import resume_batch, start_batch, subscribe_batch
+from backend.services.batch_upload import create_batch_from_upload
+from backend.services.export import export_media, stream_batch_export
+from backend.services.prefix_cache import get_batch_cache_report
 
 router = APIRouter(prefix="/batch", tags=["batch"])
 
@@ -23,20 +27,79 @@ async def create_batch_task(
     request: BatchRequest,
     db: AsyncSession = Depends(get_db),
 ):
-    """创建关键词批量测试任务"""
+    """创建关键词批量测试任务（提交后立即在后台开始执行）"""
     try:
         result = await create_batch(
             db=db,
             model_config_id=request.model_config_id,
+            model_config_ids=request.model_config_ids,
+            param_variants=request.param_variants,
             keywords=request.keywords,
             prompt_template=request.prompt_template,
             params=request.params,
+            concurrency=request.concurrency,
+            deduplicate=request.deduplicate,
+            stop_rules=request.stop_rules,
+            prefix_cache=request.prefix_cache,
         )
+        # 先提交，后台执行器使用独立会话读取批次
+        await db.commit()
+        start_batch(result["id"])
         return JSONResponse(content=result, status_code=201)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
+@router.post("/upload")
+async def upload_batch_task(
+    file: UploadFile = File(..., description="CSV（首行为表头）或 JSONL 文件"),
+    prompt_template: str = Form(..., description="提示词模板，可用 {列名} 引用任意列"),
+    model_config_id: str | None = Form(default=None),
+    model_config_ids: str | None = Form(default=None, description="矩阵批次：模型配置 ID 的 JSON 数组"),
+    param_variants: str | None = Form(default=None, description="矩阵批次：参数组合的 JSON 数组"),
+    params: str | None = Form(default=None, description="自定义模型参数（JSON 对象）"),
+    concurrency: int | None = Form(default=None, ge=1, le=BATCH_MAX_CONCURRENCY),
+    deduplicate: bool = Form(default=True),
+    stop_rules: str | None = Form(default=None, description="停止规则（JSON 数组）"),
+    prefix_cache: bool = Form(default=False, description="前缀缓存模式"),
+    db: AsyncSession = Depends(get_db),
+):
+    """从 CSV / JSONL 文件创建批量测试任务（文件流式解析，提交后立即在后台开始执行）"""
+    try:
+        result = await create_batch_from_upload(
+            db=db,
+            file=file.file,
+            filename=file.filename,
+            prompt_template=prompt_template,
+            model_config_id=model_config_id,
+            model_config_ids=_json_form(model_config_ids, "model_config_ids", list),
+            param_variants=_json_form(param_variants, "param_variants", list),
+            params=_json_form(params, "params", dict),
+            concurrency=concurrency,
+            deduplicate=deduplicate,
+            stop_rules=_json_form(stop_rules, "stop_rules", list),
+            prefix_cache=prefix_cache,
+        )
+        await db.commit()
+        start_batch(result["id"])
+        return JSONResponse(content=result, status_code=201)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def _json_form(value: str | None, name: str, expected: type):
+    """解析 JSON 格式的表单字段"""
+    if not value:
+        return None
+    try:
+        parsed = json.loads(value)
+    except json.JSONDecodeError:
+        raise ValueError(f"{name} 不是合法的 JSON")
+    if not isinstance(parsed, expected):
+        raise ValueError(f"{name} 格式错误")
+    return parsed
+
+
 @router.get("/{batch_id}")
 async def get_batch(batch_id: str, db: AsyncSession = Depends(get_db)):
     """获取批量测试任务状态和结果"""
@@ -46,12 +109,47 @@ async def get_batch(batch_id: str, db: AsyncSession = Depends(get_db)):
     return detail
 
 
+@router.get("/{batch_id}/results")
+async def get_batch_results(
+    batch_id: str,
+    offset: int = Query(default=0, ge=0),
+    limit: int = Query(default=100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_db),
+):
+    """分页获取批量测试结果"""
+    page = await list_batch_results(db, batch_id, offset=offset, limit=limit)
+    if page is None:
+        raise HTTPException(status_code=404, detail="批量任务未找到")
+    return page
+
+
+@router.get("/{batch_id}/cache-report")
+async def get_batch_cache_stats(batch_id: str, db: AsyncSession = Depends(get_db)):
+    """批次的上下文缓存命中情况，以及延迟与输入费用的节省"""
+    report = await get_batch_cache_report(db, batch_id)
+    if report is None:
+        raise HTTPException(status_code=404, detail="批量任务未找到")
+    return report
+
+
+@router.post("/{batch_id}/resume")
+async def resume_batch_task(batch_id: str):
+    """重新执行批次中未完成或失败的项（已完成的项不会重复执行）"""
+    try:
+        result = await resume_batch(batch_id)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if result is None:
+        raise HTTPException(status_code=404, detail="批量任务未找到")
+    return result
+
+
 @router.get("/{batch_id}/stream")
-async def stream_batch_progress(batch_id: str, db: AsyncSession = Depends(get_db)):
-    """流式获取批量测试进度（SSE）"""
+async def stream_batch_progress(batch_id: str):
+    """订阅批量测试进度（SSE）：先返回进度快照，再推送后续事件；断开连接不影响执行"""
 
     async def event_generator():
-        async for event_type, event_data in stream_batch(db, batch_id):
+        async for event_type, event_data in subscribe_batch(batch_id):
             yield ServerSentEvent(
                 data=json.dumps(event_data, ensure_ascii=False),
                 event=event_type,
@@ -63,18 +161,15 @@ async def stream_batch_progress(batch_id: str, db: AsyncSession = Depends(get_db
 @router.get("/{batch_id}/export")
 async def export_batch_results(
     batch_id: str,
-    format: str = Query(default="csv", pattern="^(csv|json)$"),
+    format: str = Query(default="csv", pattern="^(csv|json|jsonl)$"),
+    gzip: bool = Query(default=False),
+    layout: str = Query(default="rows", pattern="^(rows|pivot)$"),
     db: AsyncSession = Depends(get_db),
 ):
-    """导出批量测试结果"""
+    """流式导出批量测试结果（layout=pivot 时每个关键词一行，各模型/参数组合的输出并列）"""
     try:
-        result = await export_batch(db, batch_id, format)
-        if format == "json":
-            return JSONResponse(content=result)
-        return PlainTextResponse(
-            content=result,
-            media_type="text/csv",
-            headers={"Content-Disposition": f"attachment; filename=batch_{batch_id}.csv"},
-        )
+        body = await stream_batch_export(db, batch_id, format, compress=gzip, layout=layout)
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
+    media_type, headers = export_media(format, gzip, f"batch_{batch_id}")
+    return StreamingResponse(body, media_type=media_type, headers=headers)
@@ -1,13 +1,17 @@
 """对比 API 路由：POST /api/comparison（SSE 流式响应）"""
 
 import json
+from contextlib import aclosing
 from fastapi import APIRouter, Depends, HTTPException
 from sse_starlette.sse import EventSourceResponse, ServerSentEvent
+from starlette.background import BackgroundTask
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from backend.database import get_db
 from backend.schemas.comparison import ComparisonRequest
 from backend.services.comparison import run_comparison
+from backend.services.runtime_settings import get_model_config
+from backend.services.upstream_limiter import UpstreamPriority, admit
 
 router = APIRouter(tags=["comparison"])
 
@@ -17,23 +21,43 @@ async def create_comparison(
     request: ComparisonRequest,
     db: AsyncSession = Depends(get_db),
 ):
-    """发起双模型对比测试（流式 SSE 响应）"""
+    """发起双模型对比测试（流式 SSE 响应）；上游繁忙时返回 429"""
     if not request.text and not request.file_ids:
         raise HTTPException(status_code=400, detail="请输入文本或上传文件")
 
     if len(request.groups) != 2:
         raise HTTPException(status_code=400, detail="需要恰好两组模型配置")
 
+    # 准入控制：每个请求只预先获取一个名额（第一组），第二组在推送开始后排队获取。
+    # 两组各自预先占用名额会在上限很小时互相等待（同一上游上限为 1 时必然超时），
+    # 多个对比请求各占一个名额后也会互相等待，直至全部超时
+    model_config = await get_model_config(request.groups[0].model_config_id)
+    admitted = None
+    if model_config:  # 否则由 run_comparison 返回错误事件
+        admitted = [await admit(model_config, UpstreamPriority.COMPARISON), None]
+
     async def event_generator():
-        async for event_type, event_data in run_comparison(
-            db=db,
-            text=request.text,
-            file_ids=request.file_ids,
-            groups=[g.model_dump() for g in request.groups],
-        ):
-            yield ServerSentEvent(
-                data=json.dumps(event_data, ensure_ascii=False),
-                event=event_type,
-            )
-
-    return EventSourceResponse(event_generator())
+        try:
+            async with aclosing(run_comparison(
+                db=db,
+                text=request.text,
+                file_ids=request.file_ids,
+                groups=[g.model_dump() for g in request.groups],
+                admitted=admitted,
+            )) as events:
+                async for event_type, event_data in events:
+                    yield ServerSentEvent(
+                        data=json.dumps(event_data, ensure_ascii=False),
+                        event=event_type,
+                    )
+        finally:
+            # 客户端断开时关闭推理生成器（取消上游调用）
+            if admitted:
+                admitted[0].release()
+
+    async def release_admitted():
+        # 生成器未开始迭代（推送开始前断开）时 finally 不会执行，由响应结束后的后台任务兜底归还名额（重复归还无影响）
+        if admitted:
+            admitted[0].release()
+
+    return EventSourceResponse(event_generator(), background=BackgroundTask(release_admitted))
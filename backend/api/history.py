@@ -1,16 +1,27 @@
 """历史记录 API 路由"""
 
+import shutil
+import tempfile
+import zipfile
+from pathlib import Path
+
 from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from backend.database import get_db
-from backend.schemas.history import BatchDeleteRequest
+from backend.schemas.history import ArchiveRequest, BatchDeleteRequest
 from backend.services.history import (
     list_history,
     get_record_detail,
     delete_record,
     batch_delete_records,
+    parse_date_range,
 )
+from backend.services.cleanup import start_delete_all_job, get_delete_job
+from backend.services.archive import start_archive_job, get_archive_job, list_partitions
+from backend.services.export import export_media, stream_history_export, write_parquet_export
 
 router = APIRouter(prefix="/history", tags=["history"])
 
@@ -24,6 +35,7 @@ async def get_history(
     start_date: str | None = Query(default=None),
     end_date: str | None = Query(default=None),
     status: str | None = Query(default=None),
+    include_archived: bool = Query(default=False),
     db: AsyncSession = Depends(get_db),
 ):
     """获取历史测试记录列表"""
@@ -31,7 +43,105 @@ async def get_history(
         db, page=page, page_size=page_size,
         model_id=model_id, keyword=keyword,
         start_date=start_date, end_date=end_date, status=status,
+        include_archived=include_archived,
+    )
+
+
+def _parse_export_dates(start_date: str | None, end_date: str | None):
+    """导出前解析日期范围，格式错误时返回 400"""
+    try:
+        return parse_date_range(start_date, end_date)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/export")
+async def export_history(
+    format: str = Query(default="csv", pattern="^(csv|json|jsonl)$"),
+    gzip: bool = Query(default=False),
+    model_id: str | None = Query(default=None),
+    keyword: str | None = Query(default=None),
+    start_date: str | None = Query(default=None),
+    end_date: str | None = Query(default=None),
+    status: str | None = Query(default=None),
+    include_archived: bool = Query(default=False),
+):
+    """流式导出历史记录（筛选条件与列表接口一致）"""
+    # 响应头发出后无法再返回错误状态码：参数须在开始流式输出前校验
+    start, end = _parse_export_dates(start_date, end_date)
+    body = stream_history_export(
+        format, compress=gzip,
+        model_id=model_id, keyword=keyword,
+        start=start, end=end, status=status,
+        include_archived=include_archived,
     )
+    media_type, headers = export_media(format, gzip, "history")
+    return StreamingResponse(body, media_type=media_type, headers=headers)
+
+
+@router.get("/export/parquet")
+async def export_history_parquet(
+    start_date: str | None = Query(default=None),
+    end_date: str | None = Query(default=None),
+    model_id: str | None = Query(default=None),
+    batch_id: str | None = Query(default=None),
+    partition_by_day: bool = Query(default=False),
+):
+    """导出 Parquet 列式文件（按天分区时返回 zip 压缩包）"""
+    start, end = _parse_export_dates(start_date, end_date)
+    work_dir = Path(tempfile.mkdtemp(prefix="parquet_export_"))
+    cleanup = BackgroundTask(shutil.rmtree, work_dir, ignore_errors=True)
+    try:
+        if partition_by_day:
+            out_dir = work_dir / "history"
+            await write_parquet_export(
+                out_dir, start=start, end=end,
+                model_id=model_id, batch_id=batch_id, partition_by_day=True,
+            )
+            # Parquet 本身已压缩，zip 只做打包
+            zip_path = work_dir / "history_parquet.zip"
+            with zipfile.ZipFile(zip_path, "w", compression=zipfile.ZIP_STORED) as zf:
+                for file in sorted(out_dir.rglob("*.parquet")):
+                    zf.write(file, file.relative_to(out_dir).as_posix())
+            return FileResponse(
+                zip_path, media_type="application/zip",
+                filename="history_parquet.zip", background=cleanup,
+            )
+
+        out_file = work_dir / "history.parquet"
+        await write_parquet_export(
+            out_file, start=start, end=end,
+            model_id=model_id, batch_id=batch_id,
+        )
+        return FileResponse(
+            out_file, media_type="application/vnd.apache.parquet",
+            filename="history.parquet", background=cleanup,
+        )
+    except Exception:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        raise
+
+
+@router.post("/archive")
+async def archive_records(request: ArchiveRequest):
+    """手动归档早于 N 天的记录（后台执行，返回 202 与任务信息）"""
+    job = await start_archive_job(request.older_than_days)
+    return JSONResponse(content=job, status_code=202)
+
+
+@router.get("/archive/jobs/{job_id}")
+async def get_archive_job_status(job_id: str):
+    """查询归档任务进度"""
+    job = await get_archive_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="归档任务未找到")
+    return job
+
+
+@router.get("/archive/partitions")
+async def get_archive_partitions(db: AsyncSession = Depends(get_db)):
+    """获取归档清单"""
+    return {"partitions": await list_partitions(db)}
 
 
 @router.get("/{record_id}")
@@ -56,10 +166,23 @@ async def batch_delete(
     request: BatchDeleteRequest,
     db: AsyncSession = Depends(get_db),
 ):
-    """批量删除历史记录"""
-    count = await batch_delete_records(
-        db,
-        record_ids=request.record_ids if request.record_ids else None,
-        delete_all=request.delete_all,
-    )
+    """批量删除历史记录
+
+    delete_all=true 时启动后台分块清空任务并返回 202 与任务信息，
+    可通过 GET /history/delete-jobs/{job_id} 查询进度。
+    """
+    if request.delete_all:
+        job = await start_delete_all_job()
+        return JSONResponse(content=job, status_code=202)
+
+    count = await batch_delete_records(db, record_ids=request.record_ids)
     return {"deleted_count": count}
+
+
+@router.get("/delete-jobs/{job_id}")
+async def get_delete_job_status(job_id: str):
+    """查询后台清空任务进度"""
+    job = await get_delete_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="删除任务未找到")
+    return job
@@ -1,13 +1,18 @@
 """推理 API 路由：POST /api/inference（SSE 流式响应）"""
 
 import json
+from contextlib import aclosing
 from fastapi import APIRouter, Depends, HTTPException
 from sse_starlette.sse import EventSourceResponse, ServerSentEvent
+from starlette.background import BackgroundTask
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from backend.database import get_db
 from backend.schemas.inference import InferenceRequest
 from backend.services.inference import run_inference
+from backend.services.runtime_settings import get_model_config
+from backend.services.stop_rules import validate_stop_rules
+from backend.services.upstream_limiter import UpstreamPriority, admit
 
 router = APIRouter(tags=["inference"])
 
@@ -17,21 +22,41 @@ async def create_inference(
     request: InferenceRequest,
     db: AsyncSession = Depends(get_db),
 ):
-    """发起单次模型推理请求（流式 SSE 响应）"""
+    """发起单次模型推理请求（流式 SSE 响应）；上游繁忙时返回 429"""
     if not request.text and not request.file_ids:
         raise HTTPException(status_code=400, detail="请输入文本或上传文件")
+    stop_rules = validate_stop_rules(request.stop_rules)
+
+    # 准入控制：先获得上游名额再开始推送
+    model_config = await get_model_config(request.model_config_id)
+    admitted = await admit(model_config, UpstreamPriority.INTERACTIVE) if model_config else None
 
     async def event_generator():
-        async for event_type, event_data in run_inference(
-            db=db,
-            model_config_id=request.model_config_id,
-            text=request.text,
-            file_ids=request.file_ids,
-            params=request.params,
-        ):
-            yield ServerSentEvent(
-                data=json.dumps(event_data, ensure_ascii=False),
-                event=event_type,
-            )
-
-    return EventSourceResponse(event_generator())
+        try:
+            async with aclosing(run_inference(
+                db=db,
+                model_config_id=request.model_config_id,
+                text=request.text,
+                file_ids=request.file_ids,
+                params=request.params,
+                admitted=admitted,
+                hedge=request.hedge,
+                hedge_model_config_id=request.hedge_model_config_id,
+                stop_rules=stop_rules,
+            )) as events:
+                async for event_type, event_data in events:
+                    yield ServerSentEvent(
+                        data=json.dumps(event_data, ensure_ascii=False),
+                        event=event_type,
+                    )
+        finally:
+            # 客户端断开时关闭推理生成器（取消上游调用）
+            if admitted:
+                admitted.release()
+
+    async def release_admitted():
+        # 生成器未开始迭代（推送开始前断开）时 finally 不会执行，由响应结束后的后台任务兜底归还名额（重复归还无影响）
+        if admitted:
+            admitted.release()
+
+    return EventSourceResponse(event_generator(), background=BackgroundTask(release_admitted))
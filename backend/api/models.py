@@ -1,16 +1,17 @@
 """模型列表 API 路由：GET 列表 + CRUD 自定义模型 + Test Connection"""
 
-import asyncio
-import time
-
 from fastapi import APIRouter, Depends, HTTPException
-from openai import AsyncOpenAI
 from pydantic import BaseModel as PydanticModel
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from backend.database import get_db
 from backend.models.model_config import ModelConfig
+from backend.services.key_pool import model_api_keys, validate_api_keys
+from backend.services.circuit_breaker import breaker_health
+from backend.services.model_client import probe_model, validate_stream_deadlines
+from backend.services.upstream_limiter import upstream_base_url
+from backend.services.runtime_settings import invalidate_model_configs
 
 router = APIRouter(prefix="/models", tags=["models"])
 
@@ -23,8 +24,10 @@ class CustomModelCreate(PydanticModel):
     model_id: str
     base_url: str
     api_key: str
+    api_keys: list[str] | None = None
     supported_modalities: list[str] = ["text"]
     default_params: dict = {"temperature": 0.7, "max_tokens": 2048}
+    stream_deadlines: dict | None = None
 
 
 class CustomModelUpdate(PydanticModel):
@@ -33,9 +36,11 @@ class CustomModelUpdate(PydanticModel):
     model_id: str | None = None
     base_url: str | None = None
     api_key: str | None = None
+    api_keys: list[str] | None = None
     supported_modalities: list[str] | None = None
     default_params: dict | None = None
     is_active: bool | None = None
+    stream_deadlines: dict | None = None
 
 
 class TestConnectionRequest(PydanticModel):
@@ -64,11 +69,15 @@ async def list_models(db: AsyncSession = Depends(get_db)):
                 "provider": m.provider,
                 "supported_modalities": m.supported_modalities,
                 "default_params": m.default_params,
+                "stream_deadlines": m.stream_deadlines,
                 "is_active": m.is_active,
                 "is_custom": m.is_custom,
                 # 自定义模型额外返回 base_url（API Key 脱敏）
                 "custom_base_url": m.custom_base_url if m.is_custom else None,
                 "custom_api_key_set": bool(m.custom_api_key) if m.is_custom else None,
+                "custom_api_key_count": len(model_api_keys(m)) if m.is_custom else None,
+                # 上游熔断状态（state 为 open / half_open 时调用会立即失败）
+                "health": breaker_health(upstream_base_url(m)),
             }
             for m in models
         ]
@@ -94,12 +103,15 @@ async def get_model(model_config_id: str, db: AsyncSession = Depends(get_db)):
         "api_endpoint": model.api_endpoint,
         "supported_modalities": model.supported_modalities,
         "default_params": model.default_params,
+        "stream_deadlines": model.stream_deadlines,
         "is_active": model.is_active,
         "is_custom": model.is_custom,
+        "health": breaker_health(upstream_base_url(model)),
     }
     if model.is_custom:
         resp["custom_base_url"] = model.custom_base_url
         resp["custom_api_key_masked"] = _mask_key(model.custom_api_key)
+        resp["custom_api_keys_masked"] = [_mask_key(key) for key in model.custom_api_keys or []]
     return resp
 
 
@@ -118,14 +130,17 @@ async def create_custom_model(
         provider="custom",
         api_endpoint=base_url,
         default_params=body.default_params,
+        stream_deadlines=validate_stream_deadlines(body.stream_deadlines),
         supported_modalities=body.supported_modalities,
         is_active=True,
         is_custom=True,
         custom_api_key=body.api_key,
+        custom_api_keys=validate_api_keys(body.api_keys),
         custom_base_url=base_url,
     )
     db.add(model)
-    await db.flush()
+    await db.commit()
+    await invalidate_model_configs()
 
     return {
         "id": model.id,
@@ -143,15 +158,18 @@ async def update_custom_model(
     body: CustomModelUpdate,
     db: AsyncSession = Depends(get_db),
 ):
-    """更新自定义模型配置"""
+    """更新自定义模型配置（预置模型只可修改截止时间 stream_deadlines）"""
     result = await db.execute(
         select(ModelConfig).where(ModelConfig.id == model_config_id)
     )
     model = result.scalar_one_or_none()
     if not model:
         raise HTTPException(status_code=404, detail="模型未找到")
-    if not model.is_custom:
-        raise HTTPException(status_code=403, detail="预置模型不可编辑")
+    if not model.is_custom and body.model_dump(exclude_unset=True).keys() - {"stream_deadlines"}:
+        raise HTTPException(status_code=403, detail="预置模型只可修改截止时间")
+
+    if "stream_deadlines" in body.model_fields_set:
+        model.stream_deadlines = validate_stream_deadlines(body.stream_deadlines)
 
     if body.name is not None:
         model.name = body.name
@@ -163,6 +181,8 @@ async def update_custom_model(
         model.api_endpoint = base_url
     if body.api_key is not None:
         model.custom_api_key = body.api_key
+    if "api_keys" in body.model_fields_set:
+        model.custom_api_keys = validate_api_keys(body.api_keys)
     if body.supported_modalities is not None:
         model.supported_modalities = body.supported_modalities
     if body.default_params is not None:
@@ -170,7 +190,8 @@ async def update_custom_model(
     if body.is_active is not None:
         model.is_active = body.is_active
 
-    await db.flush()
+    await db.commit()
+    await invalidate_model_configs()
     return {"message": "更新成功", "id": model.id}
 
 
@@ -191,7 +212,8 @@ async def delete_custom_model(
 
     # 软删除（标记为不活跃）
     model.is_active = False
-    await db.flush()
+    await db.commit()
+    await invalidate_model_configs()
     return {"message": "已删除", "id": model.id}
 
 
@@ -201,50 +223,7 @@ async def test_connection(body: TestConnectionRequest):
     测试自定义模型的连接是否正常。
     发送一个简短的非流式请求来验证 base_url、api_key、model_id 是否有效。
     """
-    base_url = body.base_url.rstrip("/")
-    client = AsyncOpenAI(
-        api_key=body.api_key,
-        base_url=base_url,
-        timeout=15,
-    )
-
-    start = time.time()
-    try:
-        response = await asyncio.wait_for(
-            client.chat.completions.create(
-                model=body.model_id,
-                messages=[{"role": "user", "content": "Hi"}],
-                max_tokens=5,
-                stream=False,
-            ),
-            timeout=15,
-        )
-        elapsed_ms = int((time.time() - start) * 1000)
-
-        # 提取返回信息
-        text = ""
-        if response.choices and response.choices[0].message.content:
-            text = response.choices[0].message.content[:100]
-
-        return {
-            "success": True,
-            "message": f"连接成功 ({elapsed_ms}ms)",
-            "response_preview": text,
-            "model": response.model if hasattr(response, "model") else body.model_id,
-            "elapsed_ms": elapsed_ms,
-        }
-    except asyncio.TimeoutError:
-        return {
-            "success": False,
-            "message": "连接超时（15秒），请检查 Base URL 是否正确",
-            "elapsed_ms": int((time.time() - start) * 1000),
-        }
-    except Exception as e:
-        return {
-            "success": False,
-            "message": f"连接失败: {str(e)}",
-            "elapsed_ms": int((time.time() - start) * 1000),
-        }
+    return await probe_model(body.base_url.rstrip("/"), body.api_key, body.model_id)
 
 
 def _mask_key(key: str | None) -> str:
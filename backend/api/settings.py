@@ -1,9 +1,11 @@
 """设置 API 路由"""
 
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel, Field
 
-from backend.services.model_client import set_custom_api_key, get_custom_api_key
+from backend.services.key_pool import global_api_keys, validate_api_keys
+from backend.services.model_client import get_custom_api_key
+from backend.services.runtime_settings import list_settings, set_setting, validate_rate_limits
 from backend.config import DASHSCOPE_API_KEY
 
 router = APIRouter(prefix="/settings", tags=["settings"])
@@ -14,6 +16,20 @@ class SetApiKeyRequest(BaseModel):
     api_key: str = Field(description="阿里云 DashScope API Key")
 
 
+class SetApiKeyPoolRequest(BaseModel):
+    """设置全局 Key 池请求"""
+    api_keys: list[str] = Field(description="额外的 API Key，与主 Key 一起按负载分摊调用")
+
+
+class RuntimeSettingsUpdate(BaseModel):
+    """运行时设置更新请求（只更新提供的字段）"""
+    rate_limits: dict | None = Field(
+        default=None,
+        description="限流参数（取值为正整数），目前支持 {\"batch_model_concurrency\": 8}",
+    )
+    features: dict[str, bool] | None = Field(default=None, description="功能开关，如 {\"autocomplete\": false}")
+
+
 def _mask_key(key: str) -> str:
     """脱敏 API Key"""
     if not key or len(key) < 8:
@@ -23,8 +39,8 @@ def _mask_key(key: str) -> str:
 
 @router.post("/api-key")
 async def set_api_key(request: SetApiKeyRequest):
-    """设置用户自定义 API Key"""
-    set_custom_api_key(request.api_key)
+    """设置用户自定义 API Key（保存在数据库中，所有进程共享）"""
+    await set_setting("api_key_override", request.api_key)
     return {
         "message": "API Key 已设置",
         "masked_key": _mask_key(request.api_key),
@@ -34,7 +50,7 @@ async def set_api_key(request: SetApiKeyRequest):
 @router.delete("/api-key")
 async def clear_api_key():
     """清除用户自定义 API Key"""
-    set_custom_api_key(None)
+    await set_setting("api_key_override", None)
     return {
         "message": "已恢复使用服务端默认 API Key",
         "masked_key": _mask_key(DASHSCOPE_API_KEY) if DASHSCOPE_API_KEY else None,
@@ -60,3 +76,49 @@ async def get_api_key_status():
             "source": "none",
             "masked_key": None,
         }
+
+
+@router.put("/api-key-pool")
+async def set_api_key_pool(request: SetApiKeyPoolRequest):
+    """设置全局 Key 池的额外 Key（保存在数据库中，所有进程共享）"""
+    await set_setting("api_key_pool", validate_api_keys(request.api_keys))
+    return await get_api_key_pool()
+
+
+@router.delete("/api-key-pool")
+async def clear_api_key_pool():
+    """清除全局 Key 池的额外 Key"""
+    await set_setting("api_key_pool", None)
+    return await get_api_key_pool()
+
+
+@router.get("/api-key-pool")
+async def get_api_key_pool():
+    """获取全局 Key 池（含主 Key 与 .env 中的 DASHSCOPE_API_KEYS，Key 脱敏）"""
+    keys = global_api_keys()
+    return {
+        "count": len(keys),
+        "masked_keys": [_mask_key(key) for key in keys],
+    }
+
+
+@router.get("/runtime")
+async def get_runtime_settings():
+    """获取运行时设置（限流参数、功能开关；API Key 通过 /api-key、/api-key-pool 管理）"""
+    settings = list_settings()
+    settings.pop("api_key_override", None)
+    settings.pop("api_key_pool", None)
+    return settings
+
+
+@router.put("/runtime")
+async def update_runtime_settings(request: RuntimeSettingsUpdate):
+    """更新运行时设置，所有进程在刷新间隔内生效"""
+    updates = request.model_dump(exclude_none=True)
+    if not updates:
+        raise HTTPException(status_code=400, detail="没有需要更新的设置")
+    if "rate_limits" in updates:
+        validate_rate_limits(updates["rate_limits"])
+    for key, value in updates.items():
+        await set_setting(key, value)
+    return await get_runtime_settings()
@@ -0,0 +1,59 @@
+"""上游并发控制 API 路由"""
+
+from fastapi import APIRouter, HTTPException, Query
+
+from backend.services.circuit_breaker import list_breakers
+from backend.services.hedging import list_hedge_stats
+from backend.services.key_pool import list_key_stats
+from backend.services.prewarm import list_warm_status
+from backend.services.upstream_limiter import get_limiter_history, list_limiters, list_providers
+
+router = APIRouter(prefix="/upstream", tags=["upstream"])
+
+
+@router.get("/limiters")
+async def limiters():
+    """各 (base_url, 模型) 自适应并发控制器的当前上限与统计（本进程）"""
+    return {"limiters": list_limiters()}
+
+
+@router.get("/providers")
+async def providers():
+    """各上游（base_url）的排队深度（按优先级）与准入拒绝次数（本进程）"""
+    return {"providers": list_providers()}
+
+
+@router.get("/hedging")
+async def hedging():
+    """各模型的对冲请求次数与胜负统计（本进程）"""
+    return {"hedging": list_hedge_stats()}
+
+
+@router.get("/breakers")
+async def breakers():
+    """各上游（base_url）的熔断状态、连续失败次数与探测次数（本进程）"""
+    return {"breakers": list_breakers()}
+
+
+@router.get("/connections")
+async def connections():
+    """各端点最近一次连接预热的结果（本进程）"""
+    return {"connections": list_warm_status()}
+
+
+@router.get("/keys")
+async def keys():
+    """各 API Key 的进行中调用数、调用次数、token 用量与暂停状态（本进程，Key 脱敏）"""
+    return {"keys": list_key_stats()}
+
+
+@router.get("/limiters/history")
+async def limiter_history(
+    base_url: str = Query(description="上游 base_url"),
+    model_id: str = Query(description="模型标识符"),
+):
+    """控制器的上限变化历史"""
+    history = get_limiter_history(base_url, model_id)
+    if history is None:
+        raise HTTPException(status_code=404, detail="该模型尚无并发控制记录")
+    return {"base_url": base_url, "model_id": model_id, "history": history}
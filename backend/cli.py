@@ -0,0 +1,55 @@
+"""命令行工具
+
+运行方式:
+    python -m backend.cli export-parquet --out history.parquet [--start-date 2026-01-01] [--end-date 2026-01-31]
+                                         [--model-id <模型配置ID>] [--batch-id <批次ID>] [--partition-by-day]
+"""
+
+import argparse
+import asyncio
+from pathlib import Path
+
+from backend.services.export import write_parquet_export
+from backend.services.history import parse_date_range
+
+
+def _build_parser() -> argparse.ArgumentParser:
+    """构建命令行参数解析器"""
+    parser = argparse.ArgumentParser(prog="python -m backend.cli", description="统一多模态模型评测平台命令行工具")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export-parquet", help="导出测试记录为 Parquet（需安装 pyarrow）")
+    export_parser.add_argument("--out", required=True, help="输出文件路径（按天分区时为输出目录）")
+    export_parser.add_argument("--start-date", help="开始日期（YYYY-MM-DD）")
+    export_parser.add_argument("--end-date", help="结束日期（YYYY-MM-DD，包含当天）")
+    export_parser.add_argument("--model-id", help="按模型配置 ID 筛选")
+    export_parser.add_argument("--batch-id", help="按批量任务 ID 筛选")
+    export_parser.add_argument("--partition-by-day", action="store_true", help="按天分区写入 date=YYYY-MM-DD/ 子目录")
+    return parser
+
+
+def main(argv: list[str] | None = None):
+    """命令行入口"""
+    parser = _build_parser()
+    args = parser.parse_args(argv)
+
+    if args.command == "export-parquet":
+        try:
+            start, end = parse_date_range(args.start_date, args.end_date)
+        except ValueError as e:
+            parser.error(str(e))
+        result = asyncio.run(write_parquet_export(
+            Path(args.out),
+            start=start,
+            end=end,
+            model_id=args.model_id,
+            batch_id=args.batch_id,
+            partition_by_day=args.partition_by_day,
+        ))
+        print(f"[*] 已导出 {result['rows']} 条记录，共 {len(result['files'])} 个文件")
+        for file in result["files"]:
+            print(f"    {file}")
+
+
+if __name__ == "__main__":
+    main()
@@ -22,6 +22,26 @@ DATABASE_URL = f"sqlite+aiosqlite:///{DATABASE_DIR / 'eval.db'}"
 # 文件上传配置
 UPLOAD_DIR = BASE_DIR / "uploads"
 
+# 批量删除配置：分块删除以缩短单个写事务，避免长时间占用 SQLite 写锁
+DELETE_CHUNK_SIZE = int(os.getenv("DELETE_CHUNK_SIZE", "500"))     # 每个事务删除的记录数
+DELETE_CHUNK_PAUSE = float(os.getenv("DELETE_CHUNK_PAUSE", "0.05"))  # 块间让出写锁的间隔（秒）
+VACUUM_PAGES_PER_STEP = 2000                                        # 每步增量回收的页数
+JOB_SYNC_INTERVAL = 2                                               # 后台任务进度写入数据库的间隔（秒），其他进程据此查询
+JOB_STALE_SECONDS = 60                                              # 执行中的任务超过该时长未写入进度视为执行进程已退出
+
+# 数据保留与归档配置
+ARCHIVE_DIR = DATABASE_DIR / "archive"
+RETENTION_DAYS = int(os.getenv("RETENTION_DAYS", "0"))              # 超过 N 天的记录自动归档，0 表示不自动归档
+ARCHIVE_FORMAT = os.getenv("ARCHIVE_FORMAT", "jsonl")               # jsonl（gzip 压缩）或 parquet（需安装 pyarrow）
+ARCHIVE_PART_SIZE = 2000                                            # 每个分区文件（及对应删除事务）的记录数
+ARCHIVE_KEYWORD_SCAN_PARTITIONS = int(os.getenv("ARCHIVE_KEYWORD_SCAN_PARTITIONS", "24"))  # 关键字搜索归档时最多解压的分区数，超出需缩小筛选范围
+RETENTION_CHECK_INTERVAL = 6 * 3600                                 # 自动归档检查间隔（秒）
+
+# 流式导出配置
+EXPORT_FETCH_SIZE = 500                 # 游标每次从数据库读取的行数
+EXPORT_FLUSH_BYTES = 64 * 1024          # 编码缓冲达到该大小时向客户端输出一块
+PARQUET_ROW_GROUP_SIZE = 10000          # Parquet 导出每个 row group 的行数（即内存中缓冲的最大行数）
+
 # 文件大小限制（字节）
 MAX_IMAGE_SIZE = 10 * 1024 * 1024       # 10MB
 MAX_VIDEO_SIZE = 100 * 1024 * 1024      # 100MB
@@ -54,10 +74,88 @@ DASHSCOPE_BASE_URL = os.getenv(
     "DASHSCOPE_BASE_URL",
     "https://dashscope.aliyuncs.com/compatible-mode/v1",
 )
+# 额外的 DashScope API Key（逗号分隔），与 DASHSCOPE_API_KEY 组成 Key 池分摊调用
+DASHSCOPE_API_KEYS = [key.strip() for key in os.getenv("DASHSCOPE_API_KEYS", "").split(",") if key.strip()]
+
+# API Key 池：按进行中的调用数选择负载最低的 Key，被限流或鉴权失败的 Key 暂停使用一段时间
+KEY_COOLDOWN_RATE_LIMITED = float(os.getenv("KEY_COOLDOWN_RATE_LIMITED", "30"))  # 返回 429 后暂停的时间（秒），连续限流时逐次翻倍
+KEY_COOLDOWN_AUTH = 600                                                          # 返回 401 / 403 后暂停的时间（秒）
+KEY_COOLDOWN_MAX = 600                                                           # 暂停时间上限（秒）
 
 # 模型 API 超时（秒）
 MODEL_API_TIMEOUT = 60
 
+# 上游连接复用与预热：同一 base_url 共享连接池，定期探测空闲端点使 keep-alive 连接保持可用
+UPSTREAM_KEEPALIVE_CONNECTIONS = 32                                # 每个 base_url 保留的空闲连接数上限
+UPSTREAM_KEEPALIVE_EXPIRY = 90.0                                   # 空闲连接保留时间（秒），须大于 WARM_INTERVAL
+WARM_ENABLED = os.getenv("WARM_ENABLED", "true").lower() == "true"  # 启动时预热并定期保温启用模型的端点
+WARM_INTERVAL = float(os.getenv("WARM_INTERVAL", "30"))            # 保温间隔（秒），期间有过调用的端点不再探测
+WARM_CONNECTIONS = int(os.getenv("WARM_CONNECTIONS", "2"))         # 每个端点预热的并行连接数
+WARM_MAX_ENDPOINTS = int(os.getenv("WARM_MAX_ENDPOINTS", "10"))    # 预热的端点数上限（控制探测开销）
+
+# 流式调用截止时间（秒）的全局默认值，可按模型覆盖（ModelConfig.stream_deadlines）
+STREAM_CONNECT_TIMEOUT = float(os.getenv("STREAM_CONNECT_TIMEOUT", "30"))          # 发出请求到收到响应头
+STREAM_FIRST_TOKEN_TIMEOUT = float(os.getenv("STREAM_FIRST_TOKEN_TIMEOUT", "60"))  # 发出请求到收到首个输出
+STREAM_IDLE_TIMEOUT = float(os.getenv("STREAM_IDLE_TIMEOUT", "30"))                # 首个输出之后相邻两块数据的最大间隔
+STREAM_TOTAL_TIMEOUT = float(os.getenv("STREAM_TOTAL_TIMEOUT", "600"))             # 单次调用的总耗时上限
+
+# 运行时设置（存放在数据库中，多进程共享）
+SETTINGS_REFRESH_INTERVAL = float(os.getenv("SETTINGS_REFRESH_INTERVAL", "2"))  # 各进程检查设置版本的间隔（秒），即修改生效的最大延迟
+
+# 批量测试并发配置
+BATCH_DEFAULT_CONCURRENCY = int(os.getenv("BATCH_DEFAULT_CONCURRENCY", "4"))          # 未指定时每个批次的并发数
+BATCH_MAX_CONCURRENCY = 32                                                            # 单个批次允许设置的最大并发数
+BATCH_MATRIX_MAX_ITEMS = 5000                                                         # 矩阵批次展开后的最大任务项数
+BATCH_UPLOAD_CHUNK_ROWS = 1000                                                        # 文件导入时每次解析并写入的行数
+BATCH_MODEL_CONCURRENCY_LIMIT = int(os.getenv("BATCH_MODEL_CONCURRENCY_LIMIT", "8"))  # 同一模型所有批次的并发上限
+BATCH_RECOVERY_MODE = os.getenv("BATCH_RECOVERY_MODE", "resume")                     # 启动时中断批次的处理方式：resume / fail
+BATCH_RUNNER_LEASE_SECONDS = 60                                                       # inline 模式下执行批次的进程租约（秒），执行期间续约，进程退出后过期才可被其他进程接管
+BATCH_RECOVERY_RECORD_GRACE = STREAM_TOTAL_TIMEOUT + 60                               # 启动恢复时创建超过该时长（秒）仍在执行中的单次推理 / 对比记录才视为中断
+BATCH_EXECUTION_MODE = os.getenv("BATCH_EXECUTION_MODE", "inline")                   # inline：Web 进程内执行；worker：由独立 worker 进程执行
+BATCH_PROGRESS_INTERVAL = float(os.getenv("BATCH_PROGRESS_INTERVAL", "1.0"))        # 进度快照的发布间隔（秒），worker 模式下也是轮询间隔
+BATCH_PROGRESS_RATE_WINDOW = 30                                                       # 估算完成速率的滑动窗口（秒）
+BATCH_RECENT_FAILURES = 10                                                            # 进度快照中附带的最近失败项数
+BATCH_CACHE_HIT_PRICE_RATIO = float(os.getenv("BATCH_CACHE_HIT_PRICE_RATIO", "0.2"))  # 命中上下文缓存的输入 token 按原价的该比例计费（估算前缀缓存的节省）
+BATCH_PREFIX_CACHE_MIN_CHARS = int(os.getenv("BATCH_PREFIX_CACHE_MIN_CHARS", "256"))  # 前缀缓存模式要求模板第一个变量之前的固定文本至少有该字符数，过短的前缀不会命中缓存
+BATCH_SUBSCRIBER_QUEUE_SIZE = 1000                                                    # 每个进度订阅者的事件缓冲上限，溢出后改发快照
+
+# 批量 worker 进程配置（python -m backend.worker）
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "8"))  # 每个 worker 进程同时执行的任务项数
+WORKER_LEASE_SECONDS = 60                                        # 任务项租约时长（秒），过期后可被其他 worker 重领
+WORKER_HEARTBEAT_INTERVAL = 15                                   # 续约间隔（秒）
+WORKER_POLL_INTERVAL = 1.0                                       # 队列为空时的轮询间隔（秒）
+WORKER_MAX_ATTEMPTS = 3                                          # 任务项最多领取次数，租约多次过期（worker 反复崩溃）后标记失败
+
+# 上游自适应并发（AIMD，按 base_url + 模型）
+UPSTREAM_LIMIT_INITIAL = int(os.getenv("UPSTREAM_LIMIT_INITIAL", "4"))       # 初始并发上限
+UPSTREAM_LIMIT_MIN = 1                                                       # 并发上限下界
+UPSTREAM_LIMIT_MAX = int(os.getenv("UPSTREAM_LIMIT_MAX", "32"))              # 并发上限上界
+UPSTREAM_DECREASE_FACTOR = 0.5                                               # 遇到 429 / 503 时上限乘以该系数
+UPSTREAM_TTFT_DECREASE_FACTOR = 0.8                                          # 首 token 延迟突增时上限乘以该系数
+UPSTREAM_TTFT_SPIKE_RATIO = 3.0                                              # 首 token 延迟超过平均值的该倍数视为突增
+UPSTREAM_TTFT_MIN_SAMPLES = 20                                               # 判断延迟突增前至少需要的样本数
+UPSTREAM_DECREASE_COOLDOWN = 2.0                                             # 两次下调的最小间隔（秒），同一波拥塞只下调一次
+UPSTREAM_HISTORY_SIZE = 200                                                  # 保留的上限变化历史条数
+UPSTREAM_INTERACTIVE_RESERVE = 0.25                                          # 上限中只留给单次推理的比例（对比 / 批量 / 后台不可占用）
+UPSTREAM_QUEUE_MAX_DEPTH = int(os.getenv("UPSTREAM_QUEUE_MAX_DEPTH", "64"))  # 每个上游同等及更高优先级的最大排队数，超出立即拒绝（429）
+UPSTREAM_QUEUE_MAX_WAIT = float(os.getenv("UPSTREAM_QUEUE_MAX_WAIT", "15"))  # 推理 / 对比请求等待上游名额的最长时间（秒），超时拒绝（429）
+UPSTREAM_RETRY_AFTER_MAX = 60                                                # 拒绝时建议的最长重试间隔（秒）
+
+# 上游熔断（按 base_url）：连续失败后快速失败，暂停期满后用轻量探测请求判断是否恢复
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))  # 连续连接失败 / 5xx / 首 token 超时的次数达到该值时熔断
+BREAKER_OPEN_SECONDS = 30.0                                                   # 熔断后首次探测前的暂停时间（秒），探测失败时逐次翻倍
+BREAKER_OPEN_MAX = 300.0                                                      # 暂停时间上限（秒）
+PROBE_TIMEOUT = 15                                                            # 探测请求与测试连接的超时（秒）
+
+# 对冲请求（单次推理）：首 token 迟迟未到时向同一或等价模型再发一份请求，先出 token 的胜出
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "false").lower() == "true"  # 请求未指定 hedge 时的默认值
+HEDGE_PERCENTILE = 0.9                                                 # 等待超过最近首 token 延迟的该分位数后发起对冲
+HEDGE_MIN_SAMPLES = 20                                                 # 样本不足时使用 HEDGE_DEFAULT_DELAY
+HEDGE_DEFAULT_DELAY = 3.0                                              # 样本不足时的对冲等待时间（秒）
+HEDGE_MIN_DELAY = 0.2                                                  # 对冲等待时间下限（秒）
+HEDGE_MAX_RATE = float(os.getenv("HEDGE_MAX_RATE", "0.1"))             # 每个模型最近请求中发起对冲的最大比例（控制额外花费）
+HEDGE_RATE_WINDOW = 100                                                # 统计对冲比例的最近请求数
+
 # AI 自动补全配置
 AUTOCOMPLETE_MODEL = os.getenv("AUTOCOMPLETE_MODEL", "qwen-turbo")
 AUTOCOMPLETE_MAX_TOKENS = 100
@@ -1,6 +1,8 @@
 """数据库连接、会话管理、初始化"""
 
-from sqlalchemy import event, text
+import enum
+
+from sqlalchemy import event, inspect, text
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 
 from backend.config import DATABASE_URL, DATABASE_DIR
@@ -19,6 +21,7 @@ engine = create_async_engine(
 def _set_sqlite_pragma(dbapi_conn, connection_record):
     """为每个新 SQLite 连接启用 WAL 模式和优化配置"""
     cursor = dbapi_conn.cursor()
+    cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")  # 新库生效：删除后可增量回收空间
     cursor.execute("PRAGMA journal_mode=WAL")      # 允许并发读写
     cursor.execute("PRAGMA synchronous=NORMAL")     # 平衡性能与安全
     cursor.execute("PRAGMA busy_timeout=30000")     # 30 秒锁等待
@@ -53,11 +56,72 @@ async def init_db():
 
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_migrate_schema)
 
     # 填充种子数据
     await _seed_models()
 
 
+# 新增列后需要执行的数据回填 SQL：(表名, 列名) -> SQL
+_COLUMN_BACKFILLS = {
+    # 历史批量记录按插入顺序回填关键词序号（旧版按关键词顺序逐个执行）
+    ("test_records", "batch_item_index"): """
+        UPDATE test_records SET batch_item_index = (
+            SELECT t.item_index FROM (
+                SELECT id, ROW_NUMBER() OVER (PARTITION BY keyword_batch_id ORDER BY rowid) - 1 AS item_index
+                FROM test_records WHERE keyword_batch_id IS NOT NULL
+            ) AS t WHERE t.id = test_records.id
+        ) WHERE keyword_batch_id IS NOT NULL
+    """,
+    # 单模型批次的任务项序号即关键词序号
+    ("batch_items", "keyword_index"): "UPDATE batch_items SET keyword_index = item_index",
+}
+
+
+def _migrate_schema(conn):
+    """轻量级结构迁移：为已存在的表补齐新增列与索引
+
+    create_all 只会创建缺失的表，已有表的新增列 / 索引需在此补齐。
+    新增列须可为空或带有标量默认值。
+    """
+    inspector = inspect(conn)
+    existing_tables = set(inspector.get_table_names())
+
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+
+        existing_columns = {c["name"] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing_columns:
+                continue
+            ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=conn.dialect)}"
+            default = column.default.arg if column.default is not None and column.default.is_scalar else None
+            if default is not None:
+                ddl += f" DEFAULT {_sql_literal(default)}"
+            if not column.nullable and default is not None:
+                ddl += " NOT NULL"
+            conn.execute(text(ddl))
+
+            backfill = _COLUMN_BACKFILLS.get((table.name, column.name))
+            if backfill:
+                conn.execute(text(backfill))
+
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
+
+def _sql_literal(value) -> str:
+    """将标量默认值转换为 SQL 字面量"""
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, (int, float)):
+        return str(value)
+    if isinstance(value, enum.Enum):  # 非原生 Enum 列存储的是成员名
+        value = value.name
+    return "'" + str(value).replace("'", "''") + "'"
+
+
 async def _seed_models():
     """预置阿里云 Qwen 系列模型配置"""
     from backend.models.model_config import ModelConfig
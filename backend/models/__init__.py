@@ -5,12 +5,16 @@ from backend.models.model_config import ModelConfig
 from backend.models.test_input import TestInput, InputType
 from backend.models.uploaded_file import UploadedFile, FileModality
 from backend.models.test_record import TestRecord, RecordStatus
-from backend.models.keyword_batch import KeywordBatch, BatchStatus
+from backend.models.keyword_batch import KeywordBatch, BatchStatus, BatchType
+from backend.models.batch_item import BatchItem, BatchItemStatus
 from backend.models.comparison import (
     ComparisonSession,
     ComparisonGroup,
     ComparisonStatus,
 )
+from backend.models.archive import ArchivePartition, ArchivedRecord
+from backend.models.runtime_setting import RuntimeSetting
+from backend.models.background_job import BackgroundJob
 
 __all__ = [
     "Base",
@@ -24,7 +28,14 @@ __all__ = [
     "RecordStatus",
     "KeywordBatch",
     "BatchStatus",
+    "BatchType",
+    "BatchItem",
+    "BatchItemStatus",
     "ComparisonSession",
     "ComparisonGroup",
     "ComparisonStatus",
+    "ArchivePartition",
+    "ArchivedRecord",
+    "RuntimeSetting",
+    "BackgroundJob",
 ]
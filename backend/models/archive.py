@@ -0,0 +1,59 @@
+"""ArchivePartition + ArchivedRecord ORM 模型：归档清单与归档记录索引"""
+
+from datetime import datetime
+
+from sqlalchemy import DateTime, ForeignKey, Index, Integer, JSON, String
+from sqlalchemy.orm import Mapped, mapped_column, relationship
+
+from backend.models.base import BaseModel
+
+
+class ArchivePartition(BaseModel):
+    """归档清单表：每行对应一个归档分区文件"""
+    __tablename__ = "archive_partitions"
+    __table_args__ = (
+        Index("ix_archive_partitions_month", "month"),
+    )
+
+    month: Mapped[str] = mapped_column(String(7), nullable=False, comment="分区月份（YYYY-MM）")
+    path: Mapped[str] = mapped_column(String(500), nullable=False, comment="相对于归档目录的文件路径")
+    format: Mapped[str] = mapped_column(String(10), nullable=False, comment="文件格式（jsonl / parquet）")
+    record_count: Mapped[int] = mapped_column(Integer, nullable=False, comment="记录数")
+    min_created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, comment="最早记录时间")
+    max_created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, comment="最晚记录时间")
+
+    # 关系
+    records = relationship("ArchivedRecord", back_populates="partition")
+
+
+class ArchivedRecord(BaseModel):
+    """归档记录索引表：保留 ID 与筛选字段，正文存放在分区文件中
+
+    id 与原 TestRecord.id 相同，created_at 为原记录的创建时间。
+    归档时保留的上传文件 / 输出音频登记在 file_paths 中，移除索引时一并从磁盘删除。
+    """
+    __tablename__ = "archived_records"
+    __table_args__ = (
+        Index("ix_archived_records_created_at", "created_at"),
+        Index("ix_archived_records_model_config_id", "model_config_id", "created_at"),
+        Index("ix_archived_records_partition_id", "partition_id"),
+        Index("ix_archived_records_test_input_id", "test_input_id"),
+    )
+
+    partition_id: Mapped[str] = mapped_column(
+        String(36),
+        ForeignKey("archive_partitions.id"),
+        nullable=False,
+        comment="所在归档分区",
+    )
+    model_config_id: Mapped[str] = mapped_column(String(36), nullable=False, comment="使用的模型配置")
+    status: Mapped[str] = mapped_column(String(10), nullable=False, comment="记录状态")
+    test_input_id: Mapped[str | None] = mapped_column(String(36), nullable=True, comment="原输入 ID（同一输入的记录共享上传文件）")
+    file_paths: Mapped[list | None] = mapped_column(
+        JSON,
+        nullable=True,
+        comment="归档后仍保留在 uploads/ 下的文件相对路径（上传文件与输出音频）",
+    )
+
+    # 关系
+    partition = relationship("ArchivePartition", back_populates="records")
@@ -0,0 +1,34 @@
+"""BackgroundJob ORM 模型：后台任务（清空、归档）的状态与进度，多进程共享"""
+
+from datetime import datetime
+
+from sqlalchemy import DateTime, Index, Integer, JSON, String, Text
+from sqlalchemy.orm import Mapped, mapped_column
+
+from backend.models.base import BaseModel, utcnow
+
+
+class BackgroundJob(BaseModel):
+    """后台任务表：执行进程定期写入进度，任意进程都可查询
+
+    updated_at 兼作心跳，执行中的任务长时间未更新说明执行进程已退出。
+    """
+    __tablename__ = "background_jobs"
+    __table_args__ = (
+        Index("ix_background_jobs_kind_status", "kind", "status"),
+    )
+
+    kind: Mapped[str] = mapped_column(String(32), nullable=False, comment="任务类型（delete_all / archive）")
+    status: Mapped[str] = mapped_column(String(16), nullable=False, comment="pending / running / completed / failed")
+    total: Mapped[int] = mapped_column(Integer, nullable=False, default=0, comment="总数")
+    processed: Mapped[int] = mapped_column(Integer, nullable=False, default=0, comment="已处理数")
+    error: Mapped[str | None] = mapped_column(Text, nullable=True, comment="失败原因")
+    details: Mapped[dict | None] = mapped_column(JSON, nullable=True, comment="各类任务的附加字段")
+    started_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, comment="开始时间")
+    finished_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True, comment="结束时间")
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        default=utcnow,
+        nullable=False,
+        comment="最近一次写入进度的时间",
+    )
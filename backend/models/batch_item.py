@@ -0,0 +1,93 @@
+"""BatchItem ORM 模型：批量任务中单个关键词的执行状态（断点续跑依据）"""
+
+import enum
+from datetime import datetime
+
+from sqlalchemy import DateTime, Enum, ForeignKey, Index, Integer, JSON, String, Text
+from sqlalchemy.orm import Mapped, mapped_column, relationship
+
+from backend.models.base import BaseModel
+
+
+class BatchItemStatus(str, enum.Enum):
+    """批量任务项状态枚举"""
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+class BatchItem(BaseModel):
+    """批量任务项表：每个关键词一行，与结果记录在同一事务中更新
+
+    worker 模式下同时作为任务队列：worker 领取时写入租约（lease_owner / lease_expires_at）
+    并定期续约，租约过期的执行中项可被其他 worker 重新领取。
+    重复项（duplicate_of 不为空）不进入队列，在原始项完成时一并写入结果。
+    """
+    __tablename__ = "batch_items"
+    __table_args__ = (
+        Index("ix_batch_items_batch_index", "keyword_batch_id", "item_index", unique=True),
+        Index("ix_batch_items_batch_status", "keyword_batch_id", "status"),
+        Index("ix_batch_items_status", "status", "created_at"),
+        Index("ix_batch_items_finished_at", "keyword_batch_id", "finished_at"),
+        Index("ix_batch_items_keyword", "keyword_batch_id", "keyword_index"),
+    )
+
+    keyword_batch_id: Mapped[str] = mapped_column(
+        String(36),
+        ForeignKey("keyword_batches.id"),
+        nullable=False,
+        comment="所属批次",
+    )
+    item_index: Mapped[int] = mapped_column(Integer, nullable=False, comment="任务项序号（即执行顺序）")
+    keyword_index: Mapped[int | None] = mapped_column(Integer, nullable=True, comment="关键词序号")
+    keyword: Mapped[str] = mapped_column(Text, nullable=False, comment="关键词")
+    variables: Mapped[dict | None] = mapped_column(
+        JSON,
+        nullable=True,
+        comment="文件导入的整行数据，作为模板变量（为空时只有 {keyword}）",
+    )
+    model_config_id: Mapped[str | None] = mapped_column(
+        String(36),
+        nullable=True,
+        comment="矩阵批次中该项使用的模型配置（为空时使用批次的模型）",
+    )
+    variant_index: Mapped[int | None] = mapped_column(Integer, nullable=True, comment="矩阵批次中该项使用的参数组合序号")
+    duplicate_of: Mapped[int | None] = mapped_column(
+        Integer,
+        nullable=True,
+        comment="与之完全相同（模型、提示词、参数）的首个任务项序号；不单独调用模型，直接复用其结果",
+    )
+    status: Mapped[BatchItemStatus] = mapped_column(
+        Enum(BatchItemStatus, native_enum=False, length=10),
+        nullable=False,
+        default=BatchItemStatus.PENDING,
+        comment="执行状态",
+    )
+    test_record_id: Mapped[str | None] = mapped_column(
+        String(36),
+        ForeignKey("test_records.id"),
+        nullable=True,
+        comment="最近一次执行的记录",
+    )
+    record_removed: Mapped[str | None] = mapped_column(
+        String(16),
+        nullable=True,
+        comment="test_record_id 指向的记录已被删除（deleted）或归档（archived），结果中以此作为状态",
+    )
+    attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0, comment="执行次数")
+    error_message: Mapped[str | None] = mapped_column(Text, nullable=True, comment="最近一次错误信息")
+    lease_owner: Mapped[str | None] = mapped_column(String(64), nullable=True, comment="持有租约的 worker")
+    lease_expires_at: Mapped[datetime | None] = mapped_column(
+        DateTime(timezone=True),
+        nullable=True,
+        comment="租约到期时间",
+    )
+    finished_at: Mapped[datetime | None] = mapped_column(
+        DateTime(timezone=True),
+        nullable=True,
+        comment="最近一次执行结束时间",
+    )
+
+    # 关系
+    keyword_batch = relationship("KeywordBatch", back_populates="items")
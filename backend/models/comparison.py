@@ -14,6 +14,7 @@ class ComparisonStatus(str, enum.Enum):
     RUNNING = "running"
     COMPLETED = "completed"
     FAILED = "failed"
+    CANCELLED = "cancelled"
 
 
 class ComparisonSession(BaseModel):
@@ -3,7 +3,7 @@
 import enum
 from datetime import datetime
 
-from sqlalchemy import DateTime, Enum, ForeignKey, Index, Integer, JSON, String, Text
+from sqlalchemy import Boolean, DateTime, Enum, ForeignKey, Index, Integer, JSON, String, Text
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from backend.models.base import BaseModel
@@ -17,6 +17,12 @@ class BatchStatus(str, enum.Enum):
     CANCELLED = "cancelled"
 
 
+class BatchType(str, enum.Enum):
+    """批量任务类型枚举"""
+    SINGLE = "single"    # 单模型：关键词 × 1 个模型
+    MATRIX = "matrix"    # 矩阵：关键词 × 多个模型 × 多组参数
+
+
 class KeywordBatch(BaseModel):
     """关键词批次表"""
     __tablename__ = "keyword_batches"
@@ -36,6 +42,18 @@ class KeywordBatch(BaseModel):
     total_count: Mapped[int] = mapped_column(Integer, nullable=False, comment="关键词总数")
     completed_count: Mapped[int] = mapped_column(Integer, default=0, comment="已完成数")
     failed_count: Mapped[int] = mapped_column(Integer, default=0, comment="失败数")
+    concurrency: Mapped[int] = mapped_column(Integer, nullable=False, default=1, comment="并发执行数（矩阵批次为每个服务商的并发数）")
+    batch_type: Mapped[BatchType] = mapped_column(
+        Enum(BatchType, native_enum=False, length=10),
+        nullable=False,
+        default=BatchType.SINGLE,
+        comment="批次类型",
+    )
+    model_config_ids: Mapped[list | None] = mapped_column(JSON, nullable=True, comment="矩阵批次的模型配置列表")
+    param_variants: Mapped[list | None] = mapped_column(JSON, nullable=True, comment="矩阵批次的参数组合列表")
+    stop_rules: Mapped[list | None] = mapped_column(JSON, nullable=True, comment="停止规则，命中时提前结束输出")
+    prefix_cache: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False, comment="前缀缓存模式：模板固定部分作为共享前缀发送")
+    saved_calls: Mapped[int] = mapped_column(Integer, nullable=False, default=0, comment="重复任务项复用结果节省的调用数")
     status: Mapped[BatchStatus] = mapped_column(
         Enum(BatchStatus, native_enum=False, length=15),
         nullable=False,
@@ -47,6 +65,13 @@ class KeywordBatch(BaseModel):
         nullable=True,
         comment="完成时间",
     )
+    runner_id: Mapped[str | None] = mapped_column(String(64), nullable=True, comment="inline 模式下正在执行该批次的进程")
+    runner_expires_at: Mapped[datetime | None] = mapped_column(
+        DateTime(timezone=True),
+        nullable=True,
+        comment="执行进程的租约到期时间",
+    )
 
     # 关系
     test_records = relationship("TestRecord", back_populates="keyword_batch")
+    items = relationship("BatchItem", back_populates="keyword_batch")
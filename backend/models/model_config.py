@@ -27,8 +27,15 @@ class ModelConfig(BaseModel):
     # --- 自定义模型扩展字段 ---
     is_custom: Mapped[bool] = mapped_column(Boolean, default=False, comment="是否为用户自定义模型")
     custom_api_key: Mapped[Optional[str]] = mapped_column(String(500), nullable=True, comment="自定义模型的 API Key")
+    custom_api_keys: Mapped[Optional[list]] = mapped_column(JSON, nullable=True, comment="自定义模型的额外 API Key（与 custom_api_key 组成 Key 池）")
     custom_base_url: Mapped[Optional[str]] = mapped_column(String(500), nullable=True, comment="自定义模型的 Base URL (OpenAI 兼容)")
 
+    stream_deadlines: Mapped[Optional[dict]] = mapped_column(
+        JSON,
+        nullable=True,
+        comment="流式调用截止时间覆盖（秒）：connect / first_token / idle / total，未设置的使用全局默认值",
+    )
+
     updated_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True),
         default=utcnow,
@@ -0,0 +1,31 @@
+"""RuntimeSetting ORM 模型：运行时可修改的设置（多进程共享）"""
+
+from datetime import datetime
+
+from sqlalchemy import DateTime, Index, Integer, JSON, String
+from sqlalchemy.orm import Mapped, mapped_column
+
+from backend.models.base import BaseModel, utcnow
+
+
+class RuntimeSetting(BaseModel):
+    """运行时设置表：每个设置项一行
+
+    每次写入都把 version 置为全表最大值 + 1，
+    各进程只需比较 MAX(version) 即可判断是否需要重新加载。
+    """
+    __tablename__ = "runtime_settings"
+    __table_args__ = (
+        Index("ix_runtime_settings_key", "key", unique=True),
+        Index("ix_runtime_settings_version", "version"),
+    )
+
+    key: Mapped[str] = mapped_column(String(64), nullable=False, comment="设置项名称")
+    value: Mapped[object | None] = mapped_column(JSON, nullable=True, comment="设置值（JSON）")
+    version: Mapped[int] = mapped_column(Integer, nullable=False, default=0, comment="写入版本号")
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        default=utcnow,
+        onupdate=utcnow,
+        nullable=False,
+    )
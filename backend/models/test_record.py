@@ -15,6 +15,7 @@ class RecordStatus(str, enum.Enum):
     SUCCESS = "success"
     FAILED = "failed"
     TIMEOUT = "timeout"
+    CANCELLED = "cancelled"
 
 
 class TestRecord(BaseModel):
@@ -24,7 +25,7 @@ class TestRecord(BaseModel):
         Index("ix_test_records_created_at", "created_at"),
         Index("ix_test_records_model_config_id", "model_config_id", "created_at"),
         Index("ix_test_records_status", "status"),
-        Index("ix_test_records_keyword_batch_id", "keyword_batch_id"),
+        Index("ix_test_records_batch_item", "keyword_batch_id", "batch_item_index"),
         Index("ix_test_records_comparison_session_id", "comparison_session_id"),
     )
 
@@ -46,13 +47,20 @@ class TestRecord(BaseModel):
     output_audio_path: Mapped[str | None] = mapped_column(String(500), nullable=True, comment="模型返回的音频文件路径")
     token_input: Mapped[int] = mapped_column(Integer, default=0, comment="输入 Token 消耗")
     token_output: Mapped[int] = mapped_column(Integer, default=0, comment="输出 Token 消耗")
+    token_cached: Mapped[int | None] = mapped_column(Integer, nullable=True, comment="输入中命中上游上下文缓存的 Token 数")
     response_time_ms: Mapped[int] = mapped_column(Integer, default=0, comment="响应耗时（毫秒）")
+    queue_wait_ms: Mapped[int | None] = mapped_column(Integer, nullable=True, comment="等待上游调用名额的耗时（毫秒）")
     status: Mapped[RecordStatus] = mapped_column(
         Enum(RecordStatus, native_enum=False, length=10),
         nullable=False,
         default=RecordStatus.PENDING,
         comment="状态",
     )
+    stop_reason: Mapped[str | None] = mapped_column(
+        String(30),
+        nullable=True,
+        comment="结束原因：上游 finish_reason（如 stop / length）或触发的截止时间（如 idle_timeout）",
+    )
     error_message: Mapped[str | None] = mapped_column(Text, nullable=True, comment="失败时的错误信息")
     raw_response: Mapped[str | None] = mapped_column(Text, nullable=True, comment="模型原始返回（JSON 字符串，调试用）")
     keyword_batch_id: Mapped[str | None] = mapped_column(
@@ -61,6 +69,11 @@ class TestRecord(BaseModel):
         nullable=True,
         comment="所属批量测试",
     )
+    batch_item_index: Mapped[int | None] = mapped_column(
+        Integer,
+        nullable=True,
+        comment="在所属批量测试中的关键词序号（从 0 开始）",
+    )
     comparison_session_id: Mapped[str | None] = mapped_column(
         String(36),
         ForeignKey("comparison_sessions.id"),
@@ -2,12 +2,42 @@
 
 from pydantic import BaseModel, Field
 
+from backend.config import BATCH_MAX_CONCURRENCY
+
 
 class BatchRequest(BaseModel):
-    """批量测试请求"""
-    model_config_id: str = Field(description="模型配置 ID")
+    """批量测试请求
+
+    单模型批次只需 model_config_id；提供 model_config_ids 或 param_variants 时创建矩阵批次，
+    展开为 关键词 × 模型 × 参数组合。
+    """
+    model_config_id: str | None = Field(default=None, description="模型配置 ID")
+    model_config_ids: list[str] | None = Field(
+        default=None, min_length=1, max_length=10,
+        description="矩阵批次：参与对比的模型配置 ID 列表",
+    )
+    param_variants: list[dict] | None = Field(
+        default=None, min_length=1, max_length=10,
+        description="矩阵批次：参数组合列表，每组覆盖在 params 之上，如 [{\"temperature\": 0.2}, {\"temperature\": 0.8}]",
+    )
     keywords: list[str] = Field(min_length=1, max_length=200, description="关键词列表")
-    prompt_template: str = Field(description="提示词模板，使用 {keyword} 作为占位符")
+    prompt_template: str = Field(description="提示词模板，使用 {keyword} 作为占位符（引用其他列请使用文件导入）")
     params: dict | None = Field(default=None, description="自定义模型参数")
+    concurrency: int | None = Field(
+        default=None, ge=1, le=BATCH_MAX_CONCURRENCY,
+        description="并发执行数（受单模型并发上限约束）",
+    )
+    deduplicate: bool = Field(
+        default=True,
+        description="模型、提示词、参数完全相同的任务项只调用一次模型，结果复用到各重复项",
+    )
+    stop_rules: list[dict] | None = Field(
+        default=None,
+        description="停止规则，命中时提前结束输出，如 [{\"type\": \"regex\", \"pattern\": \"^(正面|负面)\"}]",
+    )
+    prefix_cache: bool = Field(
+        default=False,
+        description="前缀缓存模式：模板中第一个占位符之前的固定文本作为各任务项共享的前缀发送，命中上游的上下文缓存以降低延迟与费用；固定文本短于 BATCH_PREFIX_CACHE_MIN_CHARS 时拒绝创建（变量应放在模板末尾）",
+    )
 
     model_config = {"protected_namespaces": ()}
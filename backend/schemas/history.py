@@ -12,9 +12,15 @@ class HistoryFilterParams(BaseModel):
     start_date: str | None = Field(default=None, description="开始日期")
     end_date: str | None = Field(default=None, description="结束日期")
     status: str | None = Field(default=None, description="状态筛选")
+    include_archived: bool = Field(default=False, description="是否包含已归档记录")
 
 
 class BatchDeleteRequest(BaseModel):
     """批量删除请求"""
     record_ids: list[str] = Field(default_factory=list, description="要删除的记录 ID 列表")
     delete_all: bool = Field(default=False, description="是否删除全部记录")
+
+
+class ArchiveRequest(BaseModel):
+    """手动归档请求"""
+    older_than_days: int = Field(ge=1, description="归档早于 N 天的记录")
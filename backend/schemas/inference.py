@@ -9,6 +9,12 @@ class InferenceRequest(BaseModel):
     text: str | None = Field(default=None, description="文本输入")
     file_ids: list[str] = Field(default_factory=list, description="已上传文件的 ID 列表")
     params: dict | None = Field(default=None, description="自定义模型参数")
+    hedge: bool | None = Field(default=None, description="首 token 迟迟未到时发起对冲请求（为空时取服务端默认）")
+    hedge_model_config_id: str | None = Field(default=None, description="对冲使用的等价模型配置 ID（为空时与主请求相同）")
+    stop_rules: list[dict] | None = Field(
+        default=None,
+        description="停止规则，命中时提前结束输出，如 [{\"type\": \"json_complete\"}, {\"type\": \"max_chars\", \"value\": 200}]",
+    )
 
     # 允许 model_config 不与 pydantic 冲突
     model_config = {"protected_namespaces": ()}
@@ -34,6 +40,7 @@ class InferenceSSEDone(BaseModel):
     """SSE done 事件"""
     record_id: str
     response_time_ms: int
+    stop_reason: str | None = None
 
 
 class InferenceSSEError(BaseModel):
@@ -0,0 +1,575 @@
+"""数据保留与归档服务：将过期记录按月迁移到压缩分区文件，并支持按需回读
+
+- 归档：created_at 早于保留期的已结束记录（含输入文本、文件元数据、raw 返回）
+  写入 data/archive/YYYY-MM/part-*.jsonl.gz（或 .parquet），随后从在线库级联删除
+- 清单：ArchivePartition 记录每个分区文件，ArchivedRecord 保留 ID、筛选字段
+  以及仍保留在磁盘上的上传文件路径（移除归档记录时一并删除）
+- 回读：历史详情按 ID 定位分区；历史搜索可选择合并归档结果
+"""
+
+import asyncio
+import enum
+import gzip
+import json
+import logging
+import os
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import AsyncGenerator, Callable, Iterator
+
+from sqlalchemy import and_, func, select, true
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+from backend.config import (
+    ARCHIVE_DIR,
+    ARCHIVE_FORMAT,
+    ARCHIVE_KEYWORD_SCAN_PARTITIONS,
+    ARCHIVE_PART_SIZE,
+    DELETE_CHUNK_PAUSE,
+    RETENTION_CHECK_INTERVAL,
+    RETENTION_DAYS,
+)
+from backend.database import async_session
+from backend.models import (
+    ArchivedRecord,
+    ArchivePartition,
+    RecordStatus,
+    TestInput,
+    TestRecord,
+)
+from backend.services.cleanup import delete_records_cascade, remove_disk_files
+from backend.services.jobs import create_job, find_active_job, get_job, job_view, start_job
+
+logger = logging.getLogger(__name__)
+
+_FILE_EXTENSIONS = {"jsonl": "jsonl.gz", "parquet": "parquet"}
+
+
+# ---- 归档任务 ----
+
+async def start_archive_job(older_than_days: int) -> dict:
+    """启动后台归档任务；已有进行中的任务时直接返回该任务"""
+    _check_format(ARCHIVE_FORMAT)
+    job = await find_active_job("archive")
+    if job is None:
+        job = create_job("archive", older_than_days=older_than_days, partitions=0)
+        await start_job(job, _run_archive)
+    return job_view(job)
+
+
+async def get_archive_job(job_id: str) -> dict | None:
+    """查询后台归档任务进度"""
+    job = await get_job(job_id, kind="archive")
+    return job_view(job) if job else None
+
+
+async def retention_loop():
+    """按 RETENTION_DAYS 定期归档过期记录（由应用生命周期启动）"""
+    while True:
+        try:
+            await start_archive_job(RETENTION_DAYS)
+        except Exception as e:
+            logger.error(f"自动归档启动失败: {e}")
+        await asyncio.sleep(RETENTION_CHECK_INTERVAL)
+
+
+async def _run_archive(job: dict):
+    """分块归档：每块先写入并落盘分区文件，再在同一短事务中登记清单并删除在线数据"""
+    fmt = ARCHIVE_FORMAT
+    cutoff = datetime.now(timezone.utc) - timedelta(days=job["older_than_days"])
+    conditions = [
+        TestRecord.created_at < cutoff,
+        # 仍在执行中的记录不归档
+        TestRecord.status.notin_([RecordStatus.PENDING, RecordStatus.RUNNING]),
+    ]
+
+    async with async_session() as session:
+        job["total"] = (await session.execute(
+            select(func.count(TestRecord.id)).where(*conditions)
+        )).scalar() or 0
+
+    while True:
+        written_paths = []
+        refs = {}
+        async with async_session() as session:
+            records = (await session.execute(
+                select(TestRecord)
+                .options(
+                    selectinload(TestRecord.model_config),
+                    selectinload(TestRecord.test_input).selectinload(TestInput.uploaded_files),
+                )
+                .where(*conditions)
+                .order_by(TestRecord.created_at)
+                .limit(ARCHIVE_PART_SIZE)
+            )).scalars().all()
+            if not records:
+                break
+
+            by_month = defaultdict(list)
+            for record in records:
+                by_month[record.created_at.strftime("%Y-%m")].append(record)
+
+            try:
+                for month, group in by_month.items():
+                    rel_path = f"{month}/part-{uuid.uuid4().hex}.{_FILE_EXTENSIONS[fmt]}"
+                    rows = [_serialize_record(r) for r in group]
+                    await asyncio.to_thread(_write_partition_file, rel_path, fmt, rows)
+                    written_paths.append(rel_path)
+
+                    partition = ArchivePartition(
+                        month=month,
+                        path=rel_path,
+                        format=fmt,
+                        record_count=len(group),
+                        min_created_at=group[0].created_at,
+                        max_created_at=group[-1].created_at,
+                    )
+                    session.add(partition)
+                    await session.flush()
+                    for r in group:
+                        refs[r.id] = ArchivedRecord(
+                            id=r.id,
+                            created_at=r.created_at,
+                            partition_id=partition.id,
+                            model_config_id=r.model_config_id,
+                            status=_plain(r.status),
+                            test_input_id=r.test_input_id,
+                        )
+                session.add_all(refs.values())
+
+                # 不再被在线数据引用的文件保留在磁盘上（归档记录的预览链接仍然可用），
+                # 登记到归档索引，移除索引时再删除
+                _, disk_paths = await delete_records_cascade(
+                    session, [r.id for r in records], removed_as="archived",
+                )
+                orphaned = set(disk_paths)
+                for record in records:
+                    paths = _owned_paths(record, orphaned)
+                    orphaned.difference_update(paths)  # 共享输入的上传文件只登记到一条记录
+                    refs[record.id].file_paths = paths or None
+                await session.commit()
+            except BaseException:
+                # 事务未提交：删除本块已写出的分区文件，保持清单与文件一致
+                await asyncio.to_thread(_remove_partition_files, written_paths)
+                raise
+
+        job["processed"] += len(records)
+        job["partitions"] += len(written_paths)
+        await asyncio.sleep(DELETE_CHUNK_PAUSE)
+
+
+async def list_partitions(db: AsyncSession) -> list[dict]:
+    """列出归档清单"""
+    result = await db.execute(
+        select(ArchivePartition).order_by(ArchivePartition.max_created_at.desc())
+    )
+    return [
+        {
+            "id": p.id,
+            "month": p.month,
+            "path": p.path,
+            "format": p.format,
+            "record_count": p.record_count,
+            "min_created_at": p.min_created_at.isoformat(),
+            "max_created_at": p.max_created_at.isoformat(),
+            "archived_at": p.created_at.isoformat() if p.created_at else None,
+        }
+        for p in result.scalars().all()
+    ]
+
+
+# ---- 回读 ----
+
+async def get_archived_record_detail(db: AsyncSession, record_id: str) -> dict | None:
+    """从归档分区读取单条记录详情，未归档时返回 None"""
+    result = await db.execute(
+        select(ArchivedRecord)
+        .options(selectinload(ArchivedRecord.partition))
+        .where(ArchivedRecord.id == record_id)
+    )
+    ref = result.scalar_one_or_none()
+    if not ref:
+        return None
+
+    rows = await asyncio.to_thread(
+        _scan_partition, ref.partition.path, ref.partition.format,
+        lambda row: row["id"] == record_id,
+    )
+    return _format_archived_detail(rows[0]) if rows else None
+
+
+async def search_archive(
+    db: AsyncSession,
+    offset: int,
+    limit: int,
+    model_id: str | None = None,
+    keyword: str | None = None,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    status: str | None = None,
+) -> tuple[int, list[dict]]:
+    """
+    在归档中搜索历史记录（按创建时间倒序）。
+
+    无关键字时完全走 ArchivedRecord 索引，只读取当前页所在的分区；
+    有关键字时需要扫描候选分区的正文，候选分区超过 ARCHIVE_KEYWORD_SCAN_PARTITIONS
+    时要求缩小筛选范围（ValueError）。
+
+    Returns:
+        (匹配总数, 当前页记录摘要列表)
+    """
+    where = _archive_conditions(model_id, start, end, status)
+
+    if not keyword:
+        total = (await db.execute(
+            select(func.count(ArchivedRecord.id)).where(where)
+        )).scalar() or 0
+        if limit <= 0:
+            return total, []
+        refs = (await db.execute(
+            select(ArchivedRecord.id, ArchivePartition.path, ArchivePartition.format)
+            .join(ArchivePartition, ArchivedRecord.partition_id == ArchivePartition.id)
+            .where(where)
+            .order_by(ArchivedRecord.created_at.desc())
+            .offset(offset)
+            .limit(limit)
+        )).all()
+
+        by_partition = defaultdict(set)
+        for ref in refs:
+            by_partition[(ref.path, ref.format)].add(ref.id)
+        found = {}
+        for (path, fmt), ids in by_partition.items():
+            rows = await asyncio.to_thread(_scan_partition, path, fmt, lambda row, ids=ids: row["id"] in ids)
+            found.update({row["id"]: row for row in rows})
+        return total, [_format_archived_summary(found[ref.id]) for ref in refs if ref.id in found]
+
+    # 关键字搜索：先按分区时间范围与索引筛出候选分区，只解压这些分区的正文
+    partitions = (await db.execute(
+        select(ArchivePartition)
+        .where(_partition_range(start, end))
+        .where(ArchivePartition.id.in_(
+            select(ArchivedRecord.partition_id).where(where).distinct()
+        ))
+        .order_by(ArchivePartition.max_created_at.desc())
+    )).scalars().all()
+    if len(partitions) > ARCHIVE_KEYWORD_SCAN_PARTITIONS:
+        raise ValueError(
+            f"关键字搜索涉及 {len(partitions)} 个归档分区（上限 {ARCHIVE_KEYWORD_SCAN_PARTITIONS} 个），"
+            "请缩小日期范围或指定模型后再搜索归档"
+        )
+
+    needle = keyword.lower()
+    matches = []
+    for partition in partitions:
+        ids = set((await db.execute(
+            select(ArchivedRecord.id)
+            .where(ArchivedRecord.partition_id == partition.id)
+            .where(where)
+        )).scalars().all())
+        rows = await asyncio.to_thread(
+            _scan_partition, partition.path, partition.format,
+            lambda row, ids=ids: row["id"] in ids and _row_contains(row, needle),
+        )
+        matches.extend(_format_archived_summary(row) for row in rows)
+
+    matches.sort(key=lambda m: m["created_at"] or "", reverse=True)
+    return len(matches), (matches[offset:offset + limit] if limit > 0 else [])
+
+
+async def iter_archived_records(
+    db: AsyncSession,
+    model_id: str | None = None,
+    keyword: str | None = None,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    status: str | None = None,
+) -> AsyncGenerator[dict, None]:
+    """逐分区流式读取满足条件的归档记录（新分区在前），内存占用以单个分区为上限"""
+    where = _archive_conditions(model_id, start, end, status)
+    needle = keyword.lower() if keyword else None
+
+    partitions = (await db.execute(
+        select(ArchivePartition)
+        .where(_partition_range(start, end))
+        .where(ArchivePartition.id.in_(
+            select(ArchivedRecord.partition_id).where(where).distinct()
+        ))
+        .order_by(ArchivePartition.max_created_at.desc())
+    )).scalars().all()
+
+    for partition in partitions:
+        ids = set((await db.execute(
+            select(ArchivedRecord.id)
+            .where(ArchivedRecord.partition_id == partition.id)
+            .where(where)
+        )).scalars().all())
+        rows = await asyncio.to_thread(
+            _scan_partition, partition.path, partition.format,
+            lambda row, ids=ids: row["id"] in ids and (needle is None or _row_contains(row, needle)),
+        )
+        rows.sort(key=lambda row: row.get("created_at") or "", reverse=True)
+        for row in rows:
+            yield row
+
+
+async def forget_archived_record(db: AsyncSession, record_id: str) -> bool:
+    """从归档索引中移除记录并删除其保留的文件（分区文件不重写，记录将不再可见）
+
+    同一输入的其他归档记录仍在时，上传文件转交给其中一条，待最后一条移除时再删除。
+    """
+    ref = await db.get(ArchivedRecord, record_id)
+    if not ref:
+        return False
+
+    disk_paths = list(ref.file_paths or [])
+    if disk_paths and ref.test_input_id:
+        heir = (await db.execute(
+            select(ArchivedRecord)
+            .where(ArchivedRecord.test_input_id == ref.test_input_id, ArchivedRecord.id != ref.id)
+            .limit(1)
+        )).scalar_one_or_none()
+        if heir:
+            heir.file_paths = list(heir.file_paths or []) + disk_paths
+            disk_paths = []
+
+    await db.delete(ref)
+    await db.commit()
+    # 提交成功后再删除磁盘文件，避免回滚导致索引与文件不一致
+    if disk_paths:
+        await asyncio.to_thread(remove_disk_files, disk_paths)
+    return True
+
+
+# ---- 序列化与文件读写 ----
+
+def _archive_conditions(
+    model_id: str | None,
+    start: datetime | None,
+    end: datetime | None,
+    status: str | None,
+):
+    """构建归档索引的筛选条件（关键字需扫描正文，不在此处理）"""
+    conditions = []
+    if model_id:
+        conditions.append(ArchivedRecord.model_config_id == model_id)
+    if status:
+        conditions.append(ArchivedRecord.status == status)
+    if start:
+        conditions.append(ArchivedRecord.created_at >= start)
+    if end:
+        conditions.append(ArchivedRecord.created_at <= end)
+    return and_(*conditions) if conditions else true()
+
+
+def _partition_range(start: datetime | None, end: datetime | None):
+    """按分区的起止时间排除与日期范围不相交的分区（无需读取记录索引）"""
+    conditions = []
+    if start:
+        conditions.append(ArchivePartition.max_created_at >= start)
+    if end:
+        conditions.append(ArchivePartition.min_created_at <= end)
+    return and_(*conditions) if conditions else true()
+
+
+def _plain(value):
+    """将枚举 / 时间转换为可 JSON 序列化的值"""
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _serialize_record(record: TestRecord) -> dict:
+    """将记录及其模型快照、输入内容序列化为 dict（覆盖全部列，新增列自动归档）"""
+    data = {attr.key: _plain(getattr(record, attr.key)) for attr in TestRecord.__mapper__.column_attrs}
+
+    mc = record.model_config
+    data["model"] = {
+        "id": mc.id,
+        "name": mc.name,
+        "model_id": mc.model_id,
+        "provider": mc.provider,
+    } if mc else None
+
+    ti = record.test_input
+    data["input"] = {
+        "id": ti.id,
+        "text": ti.text_content,
+        "input_type": _plain(ti.input_type),
+        "files": [
+            {
+                "id": f.id,
+                "file_name": f.file_name,
+                "file_path": f.file_path,
+                "file_size": f.file_size,
+                "mime_type": f.mime_type,
+                "modality": _plain(f.modality),
+            }
+            for f in ti.uploaded_files
+        ],
+    } if ti else None
+    return data
+
+
+def _owned_paths(record: TestRecord, orphaned: set[str]) -> list[str]:
+    """记录归档后由归档索引接管的文件：输出音频，以及输入已无在线引用时的上传文件"""
+    paths = [record.output_audio_path] if record.output_audio_path in orphaned else []
+    if record.test_input:
+        paths.extend(f.file_path for f in record.test_input.uploaded_files if f.file_path in orphaned)
+    return paths
+
+
+def _check_format(fmt: str):
+    """校验归档格式，parquet 需要可选依赖 pyarrow"""
+    if fmt not in _FILE_EXTENSIONS:
+        raise ValueError(f"不支持的归档格式: {fmt}（可选 jsonl / parquet）")
+    if fmt == "parquet":
+        require_pyarrow()
+
+
+def require_pyarrow():
+    """按需导入 pyarrow"""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ValueError("Parquet 格式需要安装 pyarrow：pip install pyarrow")
+    return pyarrow, pyarrow.parquet
+
+
+def _write_partition_file(rel_path: str, fmt: str, rows: list[dict]):
+    """写入分区文件：先写临时文件并 fsync，再原子重命名"""
+    abs_path = ARCHIVE_DIR / rel_path
+    abs_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = abs_path.with_name(abs_path.name + ".tmp")
+
+    if fmt == "parquet":
+        pa, pq = require_pyarrow()
+        # 嵌套字段（参数、模型快照、输入）以 JSON 字符串存储，列名记录在 schema 元数据中
+        json_columns = sorted({k for row in rows for k, v in row.items() if isinstance(v, (dict, list))})
+        flat_rows = [
+            {k: (json.dumps(v, ensure_ascii=False) if k in json_columns and v is not None else v)
+             for k, v in row.items()}
+            for row in rows
+        ]
+        table = pa.Table.from_pylist(flat_rows)
+        table = table.replace_schema_metadata({"json_columns": json.dumps(json_columns)})
+        pq.write_table(table, tmp_path, compression="zstd")
+    else:
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+    with open(tmp_path, "rb") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp_path, abs_path)
+
+
+def _iter_partition(rel_path: str, fmt: str) -> Iterator[dict]:
+    """流式读取分区文件中的记录"""
+    abs_path = ARCHIVE_DIR / rel_path
+    if fmt == "parquet":
+        _, pq = require_pyarrow()
+        parquet_file = pq.ParquetFile(abs_path)
+        metadata = parquet_file.schema_arrow.metadata or {}
+        json_columns = json.loads(metadata.get(b"json_columns", b"[]"))
+        for batch in parquet_file.iter_batches(batch_size=500):
+            for row in batch.to_pylist():
+                for column in json_columns:
+                    if row.get(column) is not None:
+                        row[column] = json.loads(row[column])
+                yield row
+    else:
+        with gzip.open(abs_path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def _scan_partition(rel_path: str, fmt: str, predicate: Callable[[dict], bool]) -> list[dict]:
+    """扫描分区文件，返回满足条件的记录（在线程中执行）"""
+    try:
+        return [row for row in _iter_partition(rel_path, fmt) if predicate(row)]
+    except FileNotFoundError:
+        logger.warning(f"归档分区文件缺失: {rel_path}")
+        return []
+
+
+def _remove_partition_files(rel_paths: list[str]):
+    """删除分区文件（归档事务失败时回滚用）"""
+    for rel_path in rel_paths:
+        try:
+            (ARCHIVE_DIR / rel_path).unlink()
+        except FileNotFoundError:
+            pass
+
+
+def _row_contains(row: dict, needle: str) -> bool:
+    """关键字匹配提示词或输出（不区分大小写，与在线搜索的 ilike 一致）"""
+    return any(needle in (row.get(field) or "").lower() for field in ("prompt_text", "output_text"))
+
+
+# ---- 格式化（与 history 服务的在线记录格式保持一致） ----
+
+def _format_archived_summary(row: dict) -> dict:
+    """格式化归档记录摘要"""
+    input_data = row.get("input") or {}
+    modalities = {"text"} | {f["modality"] for f in input_data.get("files", [])}
+    input_text = row.get("prompt_text") or input_data.get("text") or ""
+    return {
+        "id": row["id"],
+        "model_name": (row.get("model") or {}).get("name", "未知"),
+        "input_summary": input_text[:100],
+        "output_summary": (row.get("output_text") or "")[:100],
+        "modalities": list(modalities),
+        "token_total": (row.get("token_input") or 0) + (row.get("token_output") or 0),
+        "response_time_ms": row.get("response_time_ms"),
+        "status": row.get("status"),
+        "created_at": row.get("created_at"),
+        "archived": True,
+    }
+
+
+def _format_archived_detail(row: dict) -> dict:
+    """格式化归档记录详情"""
+    input_data = row.get("input") or {}
+    model = row.get("model")
+    files = [
+        {
+            "id": f["id"],
+            "file_name": f["file_name"],
+            "file_size": f["file_size"],
+            "mime_type": f["mime_type"],
+            "modality": f["modality"],
+            "preview_url": f"/uploads/{f['file_path'].replace(chr(92), '/')}",
+        }
+        for f in input_data.get("files", [])
+    ]
+    audio_path = row.get("output_audio_path")
+    return {
+        "id": row["id"],
+        "model": {
+            "id": model["id"],
+            "name": model["name"],
+            "model_id": model["model_id"],
+        } if model else None,
+        "input": {
+            "text": row.get("prompt_text") or input_data.get("text"),
+            "files": files,
+        },
+        "output_text": row.get("output_text"),
+        "output_audio_url": f"/uploads/{audio_path.replace(chr(92), '/')}" if audio_path else None,
+        "params": row.get("custom_params"),
+        "token_input": row.get("token_input"),
+        "token_output": row.get("token_output"),
+        "response_time_ms": row.get("response_time_ms"),
+        "status": row.get("status"),
+        "error_message": row.get("error_message"),
+        "raw_response": row.get("raw_response"),
+        "created_at": row.get("created_at"),
+        "archived": True,
+    }
@@ -1,15 +1,15 @@
 """AI 自动补全服务：调用轻量模型生成建议"""
 
-from openai import AsyncOpenAI
-
 from backend.config import (
-    DASHSCOPE_API_KEY,
     DASHSCOPE_BASE_URL,
     AUTOCOMPLETE_MODEL,
     AUTOCOMPLETE_MAX_TOKENS,
     MODEL_API_TIMEOUT,
 )
-from backend.services.model_client import _custom_api_key
+from backend.services.key_pool import acquire_key, global_api_keys
+from backend.services.model_client import get_client
+from backend.services.runtime_settings import get_feature
+from backend.services.upstream_limiter import UpstreamPriority, get_limiter_for
 
 
 async def get_suggestions(text: str, max_suggestions: int = 3) -> list[str]:
@@ -23,47 +23,55 @@ async def get_suggestions(text: str, max_suggestions: int = 3) -> list[str]:
     Returns:
         建议文本列表
     """
-    if not text or len(text.strip()) < 2:
+    if not text or len(text.strip()) < 2 or not get_feature("autocomplete"):
         return []
 
-    key = _custom_api_key or DASHSCOPE_API_KEY
-    if not key:
+    keys = global_api_keys()
+    if not keys:
         return []
 
-    client = AsyncOpenAI(
-        api_key=key,
-        base_url=DASHSCOPE_BASE_URL,
-        timeout=10,  # 自动补全需要更快响应
-    )
-
+    lease = None
+    status_code = None
+    tokens = 0
     try:
-        response = await client.chat.completions.create(
-            model=AUTOCOMPLETE_MODEL,
-            messages=[
-                {
-                    "role": "system",
-                    "content": (
-                        "你是一个文本补全助手。用户正在输入一段提示词，"
-                        "请根据已输入的内容，给出最可能的补全建议。"
-                        f"只返回补全部分（不含用户已输入的文字），最多 {max_suggestions} 条，"
-                        "每条用换行符分隔。只返回补全文本，不要编号或额外说明。"
-                    ),
-                },
-                {
-                    "role": "user",
-                    "content": f"请补全以下文本：\n{text}",
-                },
-            ],
-            max_tokens=AUTOCOMPLETE_MAX_TOKENS,
-            temperature=0.3,
-        )
+        # 后台优先级：上游繁忙时让位于推理、对比与批量任务
+        async with get_limiter_for(DASHSCOPE_BASE_URL, AUTOCOMPLETE_MODEL).slot(UpstreamPriority.BACKGROUND):
+            lease = acquire_key(keys)
+            # 复用共享连接池；自动补全需要更快响应
+            client = get_client(api_key=lease.key, base_url=DASHSCOPE_BASE_URL).with_options(timeout=10)
+            response = await client.chat.completions.create(
+                model=AUTOCOMPLETE_MODEL,
+                messages=[
+                    {
+                        "role": "system",
+                        "content": (
+                            "你是一个文本补全助手。用户正在输入一段提示词，"
+                            "请根据已输入的内容，给出最可能的补全建议。"
+                            f"只返回补全部分（不含用户已输入的文字），最多 {max_suggestions} 条，"
+                            "每条用换行符分隔。只返回补全文本，不要编号或额外说明。"
+                        ),
+                    },
+                    {
+                        "role": "user",
+                        "content": f"请补全以下文本：\n{text}",
+                    },
+                ],
+                max_tokens=AUTOCOMPLETE_MAX_TOKENS,
+                temperature=0.3,
+            )
 
+        tokens = response.usage.total_tokens if response.usage else 0
         result_text = response.choices[0].message.content or ""
         suggestions = [
             s.strip() for s in result_text.strip().split("\n") if s.strip()
         ]
         return suggestions[:max_suggestions]
 
-    except Exception:
+    except Exception as e:
         # 自动补全失败不应影响用户体验
+        status_code = getattr(e, "status_code", None)
         return []
+
+    finally:
+        if lease:
+            lease.release(status_code, tokens)
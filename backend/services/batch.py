@@ -1,62 +1,258 @@
-"""批量测试服务：逐一拼接关键词+模板、调用模型、更新进度"""
+"""批量测试服务：关键词+模板拼接后由有界并发的 worker 池调用模型、更新进度
+
+每个关键词对应一行 BatchItem，其状态与结果记录在同一事务中提交，
+进程中断后可据此只重新执行未完成或失败的项。
+"""
 
 import asyncio
+import hashlib
+import json
+import logging
+from collections import deque
 from datetime import datetime, timezone
+from itertools import zip_longest
 from typing import AsyncGenerator
 
-from sqlalchemy import select
+from sqlalchemy import exists, func, insert, or_, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from backend.config import (
+    BATCH_DEFAULT_CONCURRENCY,
+    BATCH_PROGRESS_INTERVAL,
+    BATCH_MATRIX_MAX_ITEMS,
+    BATCH_MODEL_CONCURRENCY_LIMIT,
+)
+from backend.database import async_session
 from backend.models import (
     ModelConfig,
     TestInput,
     TestRecord,
     KeywordBatch,
+    BatchItem,
     InputType,
     RecordStatus,
     BatchStatus,
+    BatchType,
+    BatchItemStatus,
 )
+from backend.services.batch_progress import ProgressMeter
+from backend.services.key_pool import model_api_keys
 from backend.services.model_client import stream_chat_completion, build_messages
+from backend.services.prefix_cache import build_prefixed_messages, validate_prefix_template
+from backend.services.prompt_template import (
+    PromptTemplate,
+    compile_template,
+    render_item_prompt,
+    render_item_prompt_prefixed,
+)
+from backend.services.runtime_settings import get_model_config, get_rate_limit
+from backend.services.stop_rules import validate_stop_rules
+from backend.services.upstream_limiter import UpstreamPriority, admit_batch, get_limiter
+
+logger = logging.getLogger(__name__)
+
+# 未结束的任务项状态
+UNFINISHED_ITEM_STATUSES = (BatchItemStatus.PENDING, BatchItemStatus.RUNNING)
 
 
 async def create_batch(
     db: AsyncSession,
-    model_config_id: str,
     keywords: list[str],
     prompt_template: str,
+    model_config_id: str | None = None,
     params: dict | None = None,
+    concurrency: int | None = None,
+    model_config_ids: list[str] | None = None,
+    param_variants: list[dict] | None = None,
+    deduplicate: bool = True,
+    stop_rules: list[dict] | None = None,
+    prefix_cache: bool = False,
 ) -> dict:
-    """创建批量测试任务"""
-    result = await db.execute(
-        select(ModelConfig).where(ModelConfig.id == model_config_id)
-    )
-    model_config = result.scalar_one_or_none()
-    if not model_config:
-        raise ValueError("模型配置未找到")
+    """
+    创建批量测试任务。
+
+    提供 model_config_ids 或 param_variants 时创建矩阵批次：
+    关键词 × 模型 × 参数组合 展开为任务项，并按服务商轮转排列。
+    deduplicate=True 时，模型、渲染后的提示词、参数都相同的任务项只执行首个，其余复用其结果。
+    stop_rules 应用于每个任务项的输出，命中时提前结束（见 stop_rules）。
+    prefix_cache=True 时模板的固定部分作为各任务项共享的前缀发送，以命中上游的上下文缓存（见 prefix_cache）。
+    """
+    stop_rules = validate_stop_rules(stop_rules)
+    is_matrix = bool(model_config_ids or param_variants)
+    model_ids, model_configs = await resolve_batch_models(db, model_config_id, model_config_ids)
+    template = compile_template(prompt_template)
+    if prefix_cache:
+        validate_prefix_template(template, ["keyword"])
+
+    if is_matrix:
+        variants = param_variants or [{}]
+        plan = plan_matrix_items(keywords, [model_configs[mid] for mid in model_ids], len(variants))
+        if len(plan) > BATCH_MATRIX_MAX_ITEMS:
+            raise ValueError(f"矩阵展开后共 {len(plan)} 项，超过上限 {BATCH_MATRIX_MAX_ITEMS}")
+    else:
+        plan = [
+            {"item_index": idx, "keyword_index": idx, "keyword": keyword}
+            for idx, keyword in enumerate(keywords)
+        ]
+
+    saved_calls = mark_duplicates(
+        plan, template, model_configs, model_ids[0], params, param_variants,
+    ) if deduplicate else 0
 
     batch = KeywordBatch(
-        model_config_id=model_config_id,
+        model_config_id=model_ids[0],
         keywords=keywords,
         prompt_template=prompt_template,
         custom_params=params or {},
-        total_count=len(keywords),
+        total_count=len(plan),
+        concurrency=min(concurrency or BATCH_DEFAULT_CONCURRENCY, model_concurrency_limit()),
+        batch_type=BatchType.MATRIX if is_matrix else BatchType.SINGLE,
+        model_config_ids=model_ids if is_matrix else None,
+        param_variants=(param_variants or [{}]) if is_matrix else None,
+        stop_rules=stop_rules,
+        prefix_cache=prefix_cache,
+        saved_calls=saved_calls,
         status=BatchStatus.PENDING,
     )
     db.add(batch)
     await db.flush()
+    await db.execute(insert(BatchItem), [{"keyword_batch_id": batch.id, **item} for item in plan])
 
     return {
         "id": batch.id,
         "status": batch.status.value,
+        "batch_type": batch.batch_type.value,
         "total_count": batch.total_count,
         "completed_count": 0,
         "failed_count": 0,
+        "concurrency": batch.concurrency,
+        "saved_calls": saved_calls,
         "created_at": batch.created_at.isoformat() if batch.created_at else None,
     }
 
 
-async def get_batch_detail(db: AsyncSession, batch_id: str) -> dict | None:
-    """获取批量测试任务详情"""
+async def resolve_batch_models(
+    db: AsyncSession,
+    model_config_id: str | None,
+    model_config_ids: list[str] | None,
+) -> tuple[list[str], dict[str, ModelConfig]]:
+    """
+    校验批次使用的模型配置，并做批量任务准入检查。
+
+    Returns:
+        (去重后的模型配置 ID 列表, ID → 模型配置)
+    Raises:
+        ValueError: 未提供模型或模型配置不存在
+        UpstreamOverloaded: 涉及的上游排队已满
+    """
+    if model_config_ids:
+        model_ids = list(dict.fromkeys(model_config_ids))
+    elif model_config_id:
+        model_ids = [model_config_id]
+    else:
+        raise ValueError("需要提供 model_config_id 或 model_config_ids")
+
+    result = await db.execute(select(ModelConfig).where(ModelConfig.id.in_(model_ids)))
+    model_configs = {mc.id: mc for mc in result.scalars().all()}
+    missing = [mid for mid in model_ids if mid not in model_configs]
+    if missing:
+        raise ValueError(f"模型配置未找到: {', '.join(missing)}")
+    admit_batch(model_configs.values())
+    return model_ids, model_configs
+
+
+def mark_duplicates(
+    plan: list[dict],
+    template: PromptTemplate,
+    model_configs: dict[str, ModelConfig],
+    default_model_id: str,
+    custom_params: dict | None,
+    param_variants: list[dict] | None,
+    seen: dict[bytes, int] | None = None,
+) -> int:
+    """
+    预先渲染提示词，把 (模型, 提示词, 参数) 相同的任务项指向首个相同项（写入 duplicate_of）。
+
+    分块导入时传入同一个 seen 跨块去重；键为摘要，内存只与不重复的项数有关。
+
+    Returns:
+        本次发现的重复项数量，即节省的模型调用数
+    """
+    seen = {} if seen is None else seen
+    duplicates = 0
+    for item in plan:
+        model_config = model_configs[item.get("model_config_id") or default_model_id]
+        params = item_params(model_config, custom_params, param_variants, item.get("variant_index"))
+        key = hashlib.sha1(json.dumps(
+            [
+                model_config.id,
+                render_item_prompt(template, item["keyword"], item.get("variables")),
+                params,
+            ],
+            sort_keys=True, ensure_ascii=False, default=str,
+        ).encode("utf-8")).digest()
+        original = seen.setdefault(key, item["item_index"])
+        item["duplicate_of"] = original if original != item["item_index"] else None
+        if item["duplicate_of"] is not None:
+            duplicates += 1
+    return duplicates
+
+
+def matrix_combos(model_configs: list[ModelConfig], variant_count: int) -> list[tuple[str, int]]:
+    """
+    每个关键词要执行的 (模型配置 ID, 参数组合序号) 列表。
+
+    先按服务商分组再轮转交错，使相邻任务项落在不同服务商，各服务商的并发额度可以同时用满。
+    """
+    lanes: dict[str, list[tuple[str, int]]] = {}
+    for mc in model_configs:
+        for variant_index in range(variant_count):
+            lanes.setdefault(provider_key(mc), []).append((mc.id, variant_index))
+    return [combo for group in zip_longest(*lanes.values()) for combo in group if combo]
+
+
+def plan_matrix_items(
+    keywords: list[str],
+    model_configs: list[ModelConfig],
+    variant_count: int,
+) -> list[dict]:
+    """展开 关键词 × 模型 × 参数组合（顺序见 matrix_combos）"""
+    combos = matrix_combos(model_configs, variant_count)
+    plan = []
+    for keyword_index, keyword in enumerate(keywords):
+        for model_config_id, variant_index in combos:
+            plan.append({
+                "item_index": len(plan),
+                "keyword_index": keyword_index,
+                "keyword": keyword,
+                "model_config_id": model_config_id,
+                "variant_index": variant_index,
+            })
+    return plan
+
+
+def provider_key(model_config: ModelConfig) -> str:
+    """服务商标识：同一 base_url 共享限额"""
+    return model_config.api_endpoint or model_config.provider
+
+
+def item_params(
+    model_config: ModelConfig,
+    custom_params: dict | None,
+    param_variants: list[dict] | None,
+    variant_index: int | None,
+) -> dict:
+    """任务项的最终参数：模型默认参数 < 批次参数 < 参数组合"""
+    variant = param_variants[variant_index] if param_variants and variant_index is not None else {}
+    return {**model_config.default_params, **(custom_params or {}), **variant}
+
+
+async def get_batch_detail(
+    db: AsyncSession,
+    batch_id: str,
+    result_limit: int = 100,
+) -> dict | None:
+    """获取批量测试任务详情（附带第一页结果，其余通过 list_batch_results 分页获取）"""
     result = await db.execute(
         select(KeywordBatch).where(KeywordBatch.id == batch_id)
     )
@@ -64,23 +260,7 @@ async def get_batch_detail(db: AsyncSession, batch_id: str) -> dict | None:
     if not batch:
         return None
 
-    # 获取关联的测试记录
-    records_result = await db.execute(
-        select(TestRecord).where(TestRecord.keyword_batch_id == batch_id)
-    )
-    records = records_result.scalars().all()
-
-    results = []
-    for i, keyword in enumerate(batch.keywords):
-        record = next((r for r in records if r.prompt_text and keyword in r.prompt_text), None)
-        results.append({
-            "keyword": keyword,
-            "output": record.output_text if record else None,
-            "status": (record.status.value if record and hasattr(record.status, 'value') else record.status) if record else "pending",
-            "token_input": record.token_input if record else 0,
-            "token_output": record.token_output if record else 0,
-            "error_message": record.error_message if record else None,
-        })
+    page = await _batch_results_page(db, batch, 0, result_limit)
 
     return {
         "id": batch.id,
@@ -88,155 +268,720 @@ async def get_batch_detail(db: AsyncSession, batch_id: str) -> dict | None:
         "total_count": batch.total_count,
         "completed_count": batch.completed_count,
         "failed_count": batch.failed_count,
+        "concurrency": batch.concurrency,
+        "saved_calls": batch.saved_calls,
+        "batch_type": batch.batch_type.value if hasattr(batch.batch_type, 'value') else batch.batch_type,
+        "model_config_ids": batch.model_config_ids,
+        "param_variants": batch.param_variants,
+        "stop_rules": batch.stop_rules,
+        "prefix_cache": batch.prefix_cache,
         "keywords": batch.keywords,
         "prompt_template": batch.prompt_template,
-        "results": results,
+        "results": page,
         "created_at": batch.created_at.isoformat() if batch.created_at else None,
     }
 
 
-async def stream_batch(
+async def list_batch_results(
     db: AsyncSession,
     batch_id: str,
-) -> AsyncGenerator[tuple[str, dict], None]:
-    """流式执行批量测试，返回 (event_type, event_data) 元组流"""
-    result = await db.execute(
-        select(KeywordBatch).where(KeywordBatch.id == batch_id)
-    )
-    batch = result.scalar_one_or_none()
+    offset: int = 0,
+    limit: int = 100,
+) -> dict | None:
+    """分页获取批量测试结果（按任务项序号；单模型批次即关键词序号）"""
+    batch = await db.get(KeywordBatch, batch_id)
     if not batch:
-        yield ("error", {"message": "批量任务未找到"})
-        return
+        return None
+    return {
+        "total": batch.total_count,
+        "offset": offset,
+        "limit": limit,
+        "results": await _batch_results_page(db, batch, offset, limit),
+    }
+
+
+async def _batch_results_page(
+    db: AsyncSession,
+    batch: KeywordBatch,
+    offset: int,
+    limit: int,
+) -> list[dict]:
+    """按任务项序号一次查询出一页结果；尚未补建任务项的旧批次按 (keyword_batch_id, batch_item_index) 查询记录"""
+    results = await _items_results_page(db, batch, offset, limit)
+    if results or batch.batch_type == BatchType.MATRIX:
+        return results
 
-    mc_result = await db.execute(
-        select(ModelConfig).where(ModelConfig.id == batch.model_config_id)
+    records_result = await db.execute(
+        select(TestRecord)
+        .where(TestRecord.keyword_batch_id == batch.id)
+        .where(TestRecord.batch_item_index >= offset)
+        .where(TestRecord.batch_item_index < offset + limit)
+        .order_by(TestRecord.batch_item_index, TestRecord.created_at)
     )
-    model_config = mc_result.scalar_one_or_none()
-    if not model_config:
-        yield ("error", {"message": "模型配置未找到"})
-        return
+    # 同一序号有多条记录时（重试）以最新的一条为准
+    records_by_index = {r.batch_item_index: r for r in records_result.scalars().all()}
 
-    batch.status = BatchStatus.RUNNING
-    await db.flush()
+    results = []
+    for index, keyword in enumerate(batch.keywords[offset:offset + limit], start=offset):
+        record = records_by_index.get(index)
+        results.append({
+            "index": index,
+            "keyword": keyword,
+            "record_id": record.id if record else None,
+            "output": record.output_text if record else None,
+            "status": (record.status.value if hasattr(record.status, 'value') else record.status) if record else "pending",
+            "token_input": record.token_input if record else 0,
+            "token_output": record.token_output if record else 0,
+            "error_message": record.error_message if record else None,
+        })
+    return results
 
-    merged_params = {**model_config.default_params, **(batch.custom_params or {})}
 
-    for idx, keyword in enumerate(batch.keywords):
-        prompt = batch.prompt_template.replace("{keyword}", keyword)
+async def _items_results_page(
+    db: AsyncSession,
+    batch: KeywordBatch,
+    offset: int,
+    limit: int,
+) -> list[dict]:
+    """按任务项序号分页，结果取自任务项最近一次执行的记录（重复项为原始项的记录）"""
+    rows = (await db.execute(
+        select(BatchItem, TestRecord)
+        .outerjoin(TestRecord, TestRecord.id == BatchItem.test_record_id)
+        .where(BatchItem.keyword_batch_id == batch.id)
+        .where(BatchItem.item_index >= offset)
+        .where(BatchItem.item_index < offset + limit)
+        .order_by(BatchItem.item_index)
+    )).all()
 
-        # 发送进度（sleep(0) 确保事件能及时 flush 到客户端）
-        yield ("progress", {
-            "completed": batch.completed_count,
-            "total": batch.total_count,
-            "current_keyword": keyword,
+    results = []
+    for item, record in rows:
+        ended = item.status in (BatchItemStatus.DONE, BatchItemStatus.FAILED)
+        finished = ended and record is not None
+        if finished:
+            status = record.status.value if hasattr(record.status, 'value') else record.status
+        elif ended and item.record_removed:
+            status = item.record_removed  # 结果记录已删除 / 归档
+        else:
+            status = "pending"
+        results.append({
+            "index": item.item_index,
+            "keyword_index": item.keyword_index,
+            "keyword": item.keyword,
+            "model_config_id": item.model_config_id,
+            "variant_index": item.variant_index,
+            "duplicate_of": item.duplicate_of,
+            "record_id": record.id if record else None,
+            "output": record.output_text if finished else None,
+            "status": status,
+            "token_input": record.token_input if finished else 0,
+            "token_output": record.token_output if finished else 0,
+            "error_message": record.error_message if finished else None,
         })
-        await asyncio.sleep(0)
+    return results
+
+
+class ModelConcurrencyLimiter:
+    """同一模型在所有批次间共享的并发限制（进程内）：占用计数 + 先进先出的等待队列
+
+    上限可原地调整，始终只有一份计数：调低后已在执行的调用照常完成，
+    新调用等到占用数降到新上限以下；调高后立即放行等待中的调用。
+    用法与信号量相同：async with limiter: ...
+    """
 
-        # 创建 TestInput + TestRecord
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+        self._waiters: deque[asyncio.Future] = deque()
+
+    def resize(self, limit: int):
+        """调整上限"""
+        self.limit = limit
+        self._wake()
+
+    async def __aenter__(self):
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            return self
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # 名额已分配但调用方已取消：归还名额
+                self._release()
+            else:
+                self._waiters.remove(waiter)
+            raise
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._release()
+
+    def _release(self):
+        self.active -= 1
+        self._wake()
+
+    def _wake(self):
+        """按等待顺序放行，直到占用数达到上限"""
+        while self._waiters and self.active < self.limit:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.active += 1
+                waiter.set_result(None)
+
+
+# model_config_id → 并发限制器
+_model_limiters: dict[str, ModelConcurrencyLimiter] = {}
+
+
+def model_concurrency_limit() -> int:
+    """单模型并发上限（可通过运行时设置 rate_limits.batch_model_concurrency 调整）"""
+    return int(get_rate_limit("batch_model_concurrency", BATCH_MODEL_CONCURRENCY_LIMIT))
+
+
+def get_model_limiter(model_config_id: str) -> ModelConcurrencyLimiter:
+    """获取模型级并发限制器，限制同一模型同时进行的调用数（上限变化时原地调整）"""
+    limit = model_concurrency_limit()
+    limiter = _model_limiters.get(model_config_id)
+    if limiter is None:
+        limiter = ModelConcurrencyLimiter(limit)
+        _model_limiters[model_config_id] = limiter
+    elif limiter.limit != limit:
+        limiter.resize(limit)
+    return limiter
+
+
+async def execute_batch(batch_id: str) -> AsyncGenerator[tuple[str, dict], None]:
+    """
+    并发执行批量测试，返回 (event_type, event_data) 元组流。
+
+    由后台执行器（batch_runner）驱动，不依赖任何客户端连接。
+    任务项按服务商分队列，由 worker 池并发执行，每个服务商的并发数取批次设置与模型上限中的较小值；
+    执行期间每 BATCH_PROGRESS_INTERVAL 秒发出一次聚合的 progress 事件（见 ProgressMeter），
+    不逐条推送结果。
+    """
+    async with async_session() as db:
+        batch = await db.get(KeywordBatch, batch_id)
+        if not batch:
+            yield ("error", {"message": "批量任务未找到"})
+            return
+
+        # 旧版本创建的批次没有任务项，按已有记录补建
+        await _ensure_items(db, batch)
+        await db.commit()
+
+        # 只执行待处理的项；读取完成后即关闭会话，后续写入均在各自的短事务中完成
+        pending_items = (await db.execute(
+            select(
+                BatchItem.item_index,
+                BatchItem.keyword,
+                BatchItem.model_config_id,
+                BatchItem.variant_index,
+                BatchItem.variables,
+            )
+            .where(BatchItem.keyword_batch_id == batch_id)
+            .where(BatchItem.status == BatchItemStatus.PENDING)
+            .where(BatchItem.duplicate_of.is_(None))  # 重复项随原始项一并完成
+            .order_by(BatchItem.item_index)
+        )).all()
+        completed, failed = batch.completed_count, batch.failed_count
+        total = batch.total_count
+        template = compile_template(batch.prompt_template)
+        custom_params = batch.custom_params or {}
+        param_variants = batch.param_variants
+        stop_rules = batch.stop_rules
+        prefix_cache = batch.prefix_cache
+        default_model_id = batch.model_config_id
+        batch_concurrency = max(1, min(batch.concurrency or 1, model_concurrency_limit()))
+
+    # 按服务商分队列：每个服务商各自使用批次并发数，互不占用对方的额度
+    lanes: dict[str, asyncio.Queue] = {}
+    for row in pending_items:
+        model_config = await get_model_config(row.model_config_id or default_model_id)
+        if not model_config:
+            yield ("error", {"message": "模型配置未找到"})
+            return
+        params = item_params(model_config, custom_params, param_variants, row.variant_index)
+        lanes.setdefault(provider_key(model_config), asyncio.Queue()).put_nowait(
+            (model_config, params, row.item_index, row.keyword, row.variant_index, row.variables)
+        )
+
+    await _update_batch(batch_id, status=BatchStatus.RUNNING)
+
+    async def worker(pending: asyncio.Queue):
+        while True:
+            try:
+                model_config, params, idx, keyword, variant_index, variables = pending.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            if prefix_cache:
+                prefix, prompt = render_item_prompt_prefixed(template, keyword, variables)
+            else:
+                prefix, prompt = None, render_item_prompt(template, keyword, variables)
+            try:
+                async with get_model_limiter(model_config.id):
+                    item = await run_batch_item(
+                        batch_id, model_config, params, prompt, idx, keyword,
+                        variant_index=variant_index,
+                        stop_rules=stop_rules,
+                        prompt_prefix=prefix,
+                    )
+            except Exception as e:
+                # 单项异常（如数据库错误）只让该项失败，worker 继续执行队列中的其余项
+                logger.error(f"批量任务项执行异常: {batch_id}#{idx} - {e}", exc_info=True)
+                item = await fail_batch_item(batch_id, idx, keyword, str(e), model_config.id, variant_index)
+            if item:
+                meter.record(item)
+
+    lane_workers = [min(batch_concurrency, pending.qsize()) for pending in lanes.values()]
+    meter = ProgressMeter(total, completed, failed, max(1, sum(lane_workers)))
+    workers = [
+        asyncio.create_task(worker(pending))
+        for pending, count in zip(lanes.values(), lane_workers)
+        for _ in range(count)
+    ]
+
+    async def wait_workers():
+        outcomes = await asyncio.gather(*workers, return_exceptions=True)
+        for outcome in outcomes:
+            if isinstance(outcome, Exception):
+                logger.error(f"批量任务 worker 异常退出: {batch_id} - {outcome}")
+
+    all_done = asyncio.create_task(wait_workers())
+
+    # 按固定间隔发布聚合进度，单个结果由客户端通过分页接口获取
+    try:
+        yield ("progress", meter.snapshot())
+        while not all_done.done():
+            await asyncio.wait({all_done}, timeout=BATCH_PROGRESS_INTERVAL)
+            yield ("progress", meter.snapshot())
+    finally:
+        # 执行器被取消（如进程关闭）时停止仍在执行的 worker
+        for task in (*workers, all_done):
+            task.cancel()
+
+    # 所有项都已结束时才完成（计数以数据库中原子累加的结果为准）；
+    # worker 异常退出留下的待执行项保留，批次回到 pending，可通过 resume 继续
+    if not await complete_batch_if_drained(batch_id):
+        counts = await _update_batch(batch_id, status=BatchStatus.PENDING)
+        yield ("error", {
+            "message": "批量任务执行中断，部分任务项未完成，可通过 resume 继续执行",
+            "completed": counts["completed_count"],
+            "failed": counts["failed_count"],
+        })
+        return
+    counts = await _update_batch(batch_id)
+
+    yield ("done", {
+        "batch_id": batch_id,
+        "completed": counts["completed_count"],
+        "failed": counts["failed_count"],
+    })
+
+
+async def _update_batch(batch_id: str, **values) -> dict:
+    """在独立短事务中更新批次字段（不传字段时只读取），返回最新计数"""
+    async with async_session() as session:
+        if values:
+            await session.execute(
+                update(KeywordBatch).where(KeywordBatch.id == batch_id).values(**values)
+            )
+        row = (await session.execute(
+            select(KeywordBatch.completed_count, KeywordBatch.failed_count)
+            .where(KeywordBatch.id == batch_id)
+        )).one()
+        await session.commit()
+    return {"completed_count": row.completed_count, "failed_count": row.failed_count}
+
+
+async def run_batch_item(
+    batch_id: str,
+    model_config: ModelConfig,
+    params: dict,
+    prompt: str,
+    idx: int,
+    keyword: str,
+    lease_owner: str | None = None,
+    variant_index: int | None = None,
+    stop_rules: list[dict] | None = None,
+    prompt_prefix: str | None = None,
+) -> dict:
+    """
+    执行单个关键词：使用独立会话写入记录，并原子累加批次计数。
+
+    lease_owner 不为空时表示该项已由 worker 领取（worker 模式），
+    只有仍持有租约时才会写回任务项状态与批次计数，避免租约过期被他人重领后重复计数。
+    variant_index 为矩阵批次中的参数组合序号，仅随结果返回。
+    stop_rules 为批次的停止规则，命中时提前结束该项的输出。
+    prompt_prefix 为前缀缓存模式下 prompt 的静态前缀，单独作为一个文本片段发送，命中的缓存 token 记入 token_cached。
+    该项的重复项在同一事务中写入相同结果，其 (序号, 关键词) 列表放在返回值的 duplicates 中。
+    """
+    async with async_session() as session:
+        # 创建 TestInput + TestRecord，先提交以尽快释放写锁
         test_input = TestInput(text_content=prompt, input_type=InputType.BATCH)
-        db.add(test_input)
-        await db.flush()
+        session.add(test_input)
+        await session.flush()
 
         record = TestRecord(
             model_config_id=model_config.id,
             test_input_id=test_input.id,
-            custom_params=merged_params,
+            custom_params=params,
             prompt_text=prompt,
             status=RecordStatus.RUNNING,
-            keyword_batch_id=batch.id,
+            keyword_batch_id=batch_id,
+            batch_item_index=idx,
         )
-        db.add(record)
-        await db.flush()
+        session.add(record)
+        await session.flush()
+        item_update = _item_update(batch_id, idx)
+        if lease_owner:
+            item_update = item_update.where(BatchItem.lease_owner == lease_owner)
+            await session.execute(item_update.values(test_record_id=record.id, record_removed=None))
+        else:
+            await session.execute(item_update.values(
+                status=BatchItemStatus.RUNNING,
+                attempts=BatchItem.attempts + 1,
+                test_record_id=record.id,
+                record_removed=None,
+            ))
+        await session.commit()
 
         # 解析自定义模型参数
         custom_base = model_config.custom_base_url if model_config.is_custom else None
-        custom_key = model_config.custom_api_key if model_config.is_custom else None
+        custom_keys = model_api_keys(model_config)
 
-        # 调用模型
+        # 调用模型（受上游自适应并发控制，批次之间公平排队）
         full_text = ""
+        timed_out = False
         try:
-            messages = build_messages(text=prompt)
-            async for event in stream_chat_completion(
-                model_id=model_config.model_id,
-                messages=messages,
-                params=merged_params,
-                api_key=custom_key,
-                base_url=custom_base,
-            ):
-                if event["type"] == "token":
-                    full_text += event["text"]
-                elif event["type"] == "usage":
-                    record.token_input = event.get("input_tokens", 0)
-                    record.token_output = event.get("output_tokens", 0)
-                elif event["type"] == "done":
-                    record.response_time_ms = event.get("response_time_ms", 0)
-                elif event["type"] == "error":
-                    raise Exception(event["message"])
+            if prompt_prefix:  # 模板以变量开头时前缀为空，按普通消息发送
+                messages = build_prefixed_messages(prompt_prefix, prompt, model_config)
+            else:
+                messages = build_messages(text=prompt)
+            async with get_limiter(model_config).slot(UpstreamPriority.BATCH, flow=batch_id) as call:
+                record.queue_wait_ms = call.queue_wait_ms
+                async for event in stream_chat_completion(
+                    model_id=model_config.model_id,
+                    messages=messages,
+                    params=params,
+                    api_key=custom_keys,
+                    base_url=custom_base,
+                    deadlines=model_config.stream_deadlines,
+                    stop_rules=stop_rules,
+                ):
+                    call.observe(event)
+                    if event["type"] == "token":
+                        full_text += event["text"]
+                    elif event["type"] == "usage":
+                        record.token_input = event.get("input_tokens", 0)
+                        record.token_output = event.get("output_tokens", 0)
+                        record.token_cached = event.get("cached_tokens", 0)
+                    elif event["type"] == "done":
+                        record.response_time_ms = event.get("response_time_ms", 0)
+                        record.stop_reason = event.get("stop_reason")
+                    elif event["type"] == "error":
+                        record.stop_reason = event.get("stop_reason")
+                        timed_out = event.get("is_timeout", False)
+                        raise Exception(event["message"])
 
             record.output_text = full_text
             record.status = RecordStatus.SUCCESS
-            batch.completed_count += 1
-
-            yield ("result", {
+            item = {
+                "index": idx,
                 "keyword": keyword,
+                "model_config_id": model_config.id,
+                "variant_index": variant_index,
+                "record_id": record.id,
                 "output": full_text[:200],
                 "status": "success",
                 "token_input": record.token_input,
                 "token_output": record.token_output,
-            })
-            await asyncio.sleep(0)
+            }
 
         except Exception as e:
             record.error_message = str(e)
-            record.status = RecordStatus.FAILED
-            record.output_text = full_text
-            batch.failed_count += 1
-            batch.completed_count += 1
-
-            yield ("result", {
+            record.status = RecordStatus.TIMEOUT if timed_out else RecordStatus.FAILED
+            record.output_text = full_text  # 保留已生成的部分输出
+            item = {
+                "index": idx,
                 "keyword": keyword,
+                "model_config_id": model_config.id,
+                "variant_index": variant_index,
+                "record_id": record.id,
                 "output": None,
                 "status": "failed",
                 "error_message": str(e),
-            })
-            await asyncio.sleep(0)
+            }
+
+        # 记录结果、任务项状态与批次计数在同一事务中提交，计数用 SQL 自增避免并发覆盖
+        result = await session.execute(
+            item_update.values(
+                status=BatchItemStatus.FAILED if item["status"] == "failed" else BatchItemStatus.DONE,
+                test_record_id=record.id,
+                error_message=record.error_message,
+                lease_owner=None,
+                lease_expires_at=None,
+                finished_at=datetime.now(timezone.utc),
+            )
+        )
+        if result.rowcount:
+            # 重复项直接引用本次记录，不再调用模型
+            duplicates = (await session.execute(
+                update(BatchItem)
+                .where(BatchItem.keyword_batch_id == batch_id)
+                .where(BatchItem.duplicate_of == idx)
+                .values(
+                    status=BatchItemStatus.FAILED if item["status"] == "failed" else BatchItemStatus.DONE,
+                    test_record_id=record.id,
+                    record_removed=None,
+                    error_message=record.error_message,
+                    attempts=BatchItem.attempts + 1,
+                    finished_at=datetime.now(timezone.utc),
+                )
+                .returning(BatchItem.item_index, BatchItem.keyword)
+            )).all()
+            finished_count = 1 + len(duplicates)
+            await session.execute(
+                update(KeywordBatch)
+                .where(KeywordBatch.id == batch_id)
+                .values(
+                    completed_count=KeywordBatch.completed_count + finished_count,
+                    failed_count=KeywordBatch.failed_count + (finished_count if item["status"] == "failed" else 0),
+                )
+            )
+            if duplicates:
+                item["duplicates"] = sorted((row.item_index, row.keyword) for row in duplicates)
+        else:
+            logger.warning(f"批量任务项租约已失效，结果不计入批次: {batch_id}#{idx}")
+        await session.commit()
+
+    return item
+
+
+async def fail_batch_item(
+    batch_id: str,
+    idx: int,
+    keyword: str,
+    error: str,
+    model_config_id: str | None = None,
+    variant_index: int | None = None,
+) -> dict | None:
+    """
+    执行异常的任务项（连同其重复项）标记为失败并累加批次计数。
+
+    Returns:
+        与 run_batch_item 格式相同的结果；该项已结束（已计数）时返回 None
+    """
+    message = f"执行异常: {error}"
+    async with async_session() as session:
+        rows = (await session.execute(
+            update(BatchItem)
+            .where(BatchItem.keyword_batch_id == batch_id)
+            .where(or_(BatchItem.item_index == idx, BatchItem.duplicate_of == idx))
+            .where(BatchItem.status.in_(UNFINISHED_ITEM_STATUSES))
+            .values(
+                status=BatchItemStatus.FAILED,
+                error_message=message,
+                lease_owner=None,
+                lease_expires_at=None,
+                finished_at=datetime.now(timezone.utc),
+            )
+            .returning(BatchItem.item_index, BatchItem.keyword, BatchItem.test_record_id)
+        )).all()
+        if not any(row.item_index == idx for row in rows):
+            await session.rollback()
+            return None
+        record_ids = [row.test_record_id for row in rows if row.test_record_id]
+        if record_ids:
+            await session.execute(
+                update(TestRecord)
+                .where(TestRecord.id.in_(record_ids))
+                .where(TestRecord.status.in_([RecordStatus.PENDING, RecordStatus.RUNNING]))
+                .values(status=RecordStatus.FAILED, error_message=message)
+            )
+        await session.execute(
+            update(KeywordBatch)
+            .where(KeywordBatch.id == batch_id)
+            .values(
+                completed_count=KeywordBatch.completed_count + len(rows),
+                failed_count=KeywordBatch.failed_count + len(rows),
+            )
+        )
+        await session.commit()
+
+    item = {
+        "index": idx,
+        "keyword": keyword,
+        "model_config_id": model_config_id,
+        "variant_index": variant_index,
+        "record_id": None,
+        "output": None,
+        "status": "failed",
+        "error_message": message,
+    }
+    duplicates = sorted((row.item_index, row.keyword) for row in rows if row.item_index != idx)
+    if duplicates:
+        item["duplicates"] = duplicates
+    return item
+
+
+async def complete_batch_if_drained(batch_id: str) -> bool:
+    """
+    批次已无待执行/执行中的项时标记为完成（条件更新，多个 worker 并发调用也只生效一次）。
+
+    Returns:
+        批次是否已无未结束的项（已完成或本次标记为完成）
+    """
+    async with async_session() as session:
+        await session.execute(
+            update(KeywordBatch)
+            .where(KeywordBatch.id == batch_id)
+            .where(KeywordBatch.status.in_([BatchStatus.PENDING, BatchStatus.RUNNING]))
+            .where(~exists(
+                select(BatchItem.id)
+                .where(BatchItem.keyword_batch_id == batch_id)
+                .where(BatchItem.status.in_(UNFINISHED_ITEM_STATUSES))
+            ))
+            .values(status=BatchStatus.COMPLETED, completed_at=datetime.now(timezone.utc))
+        )
+        unfinished = (await session.execute(
+            select(BatchItem.id)
+            .where(BatchItem.keyword_batch_id == batch_id)
+            .where(BatchItem.status.in_(UNFINISHED_ITEM_STATUSES))
+            .limit(1)
+        )).first()
+        await session.commit()
+    return unfinished is None
+
+
+def _item_update(batch_id: str, idx: int):
+    """按 (批次, 序号) 定位任务项的 UPDATE 语句"""
+    return (
+        update(BatchItem)
+        .where(BatchItem.keyword_batch_id == batch_id)
+        .where(BatchItem.item_index == idx)
+    )
 
-        await db.flush()
 
-    # 完成
-    batch.status = BatchStatus.COMPLETED
-    batch.completed_at = datetime.now(timezone.utc)
-    await db.flush()
+async def _ensure_items(db: AsyncSession, batch: KeywordBatch):
+    """为没有任务项的旧批次补建任务项：以每个序号最新的记录判断是否已完成"""
+    has_items = (await db.execute(
+        select(BatchItem.id).where(BatchItem.keyword_batch_id == batch.id).limit(1)
+    )).first()
+    if has_items:
+        return
 
-    yield ("done", {
-        "batch_id": batch.id,
-        "completed": batch.completed_count,
-        "failed": batch.failed_count,
-    })
+    records = (await db.execute(
+        select(TestRecord.id, TestRecord.batch_item_index, TestRecord.status, TestRecord.error_message)
+        .where(TestRecord.keyword_batch_id == batch.id)
+        .order_by(TestRecord.batch_item_index, TestRecord.created_at)
+    )).all()
+    latest = {r.batch_item_index: r for r in records}
+
+    rows = []
+    for idx, keyword in enumerate(batch.keywords):
+        record = latest.get(idx)
+        if record is None or record.status in (RecordStatus.PENDING, RecordStatus.RUNNING):
+            status = BatchItemStatus.PENDING
+        elif record.status == RecordStatus.SUCCESS:
+            status = BatchItemStatus.DONE
+        else:
+            status = BatchItemStatus.FAILED
+        rows.append({
+            "keyword_batch_id": batch.id,
+            "item_index": idx,
+            "keyword_index": idx,
+            "keyword": keyword,
+            "status": status,
+            "test_record_id": record.id if record else None,
+            "attempts": 1 if record else 0,
+            "error_message": record.error_message if record else None,
+        })
+    if rows:
+        await db.execute(insert(BatchItem), rows)
 
 
-async def export_batch(db: AsyncSession, batch_id: str, fmt: str = "csv") -> str | list:
-    """导出批量测试结果"""
-    detail = await get_batch_detail(db, batch_id)
-    if not detail:
-        raise ValueError("批量任务未找到")
-
-    if fmt == "json":
-        return detail["results"]
-
-    # CSV 格式
-    import csv
-    import io
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(["关键词", "状态", "输出", "输入Token", "输出Token", "错误信息"])
-    for r in detail["results"]:
-        writer.writerow([
-            r["keyword"],
-            r["status"],
-            r.get("output", ""),
-            r.get("token_input", 0),
-            r.get("token_output", 0),
-            r.get("error_message", ""),
-        ])
-    return output.getvalue()
+async def _recount_batch(db: AsyncSession, batch: KeywordBatch) -> int:
+    """按任务项状态重算批次计数，返回待执行的项数"""
+    counts = dict((await db.execute(
+        select(BatchItem.status, func.count())
+        .where(BatchItem.keyword_batch_id == batch.id)
+        .group_by(BatchItem.status)
+    )).all())
+    failed = counts.get(BatchItemStatus.FAILED, 0)
+    batch.completed_count = counts.get(BatchItemStatus.DONE, 0) + failed
+    batch.failed_count = failed
+    return counts.get(BatchItemStatus.PENDING, 0)
+
+
+async def prepare_resume(db: AsyncSession, batch_id: str) -> int | None:
+    """
+    把批次中未完成或失败的项重置为待执行，并校正批次计数。
+
+    已完成的项保持不变，不会重复调用模型。
+
+    Returns:
+        需要重新执行的项数；批次不存在时返回 None
+    """
+    batch = await db.get(KeywordBatch, batch_id)
+    if not batch:
+        return None
+    await _ensure_items(db, batch)
+
+    # 执行中但已无人持有租约的项视为中断（worker 模式下仍在租约内的项保持不动）
+    now = datetime.now(timezone.utc)
+    abandoned = (
+        (BatchItem.status == BatchItemStatus.RUNNING)
+        & (BatchItem.lease_expires_at.is_(None) | (BatchItem.lease_expires_at <= now))
+    )
+    # 中断项对应的执行中记录不会再有结果
+    await db.execute(
+        update(TestRecord)
+        .where(TestRecord.id.in_(
+            select(BatchItem.test_record_id)
+            .where(BatchItem.keyword_batch_id == batch_id)
+            .where(abandoned)
+        ))
+        .where(TestRecord.status.in_([RecordStatus.PENDING, RecordStatus.RUNNING]))
+        .values(status=RecordStatus.FAILED, error_message="执行中断")
+    )
+    await db.execute(
+        update(BatchItem)
+        .where(BatchItem.keyword_batch_id == batch_id)
+        .where(abandoned | (BatchItem.status == BatchItemStatus.FAILED))
+        .values(status=BatchItemStatus.PENDING, lease_owner=None, lease_expires_at=None)
+    )
+
+    pending = await _recount_batch(db, batch)
+    if pending:
+        batch.status = BatchStatus.PENDING
+        batch.completed_at = None
+    else:
+        batch.status = BatchStatus.COMPLETED
+    await db.flush()
+    return pending
+
+
+async def mark_batch_interrupted(db: AsyncSession, batch_id: str):
+    """把中断批次的未完成项标记为失败并结束批次（之后仍可通过 resume 重新执行）"""
+    batch = await db.get(KeywordBatch, batch_id)
+    if not batch:
+        return
+    await _ensure_items(db, batch)
+    await db.execute(
+        update(TestRecord)
+        .where(TestRecord.keyword_batch_id == batch_id)
+        .where(TestRecord.status.in_([RecordStatus.PENDING, RecordStatus.RUNNING]))
+        .values(status=RecordStatus.FAILED, error_message="服务重启，执行中断")
+    )
+    await db.execute(
+        update(BatchItem)
+        .where(BatchItem.keyword_batch_id == batch_id)
+        .where(BatchItem.status.in_([BatchItemStatus.PENDING, BatchItemStatus.RUNNING]))
+        .values(status=BatchItemStatus.FAILED, error_message="服务重启，执行中断")
+    )
+    await _recount_batch(db, batch)
+    batch.status = BatchStatus.COMPLETED
+    batch.completed_at = datetime.now(timezone.utc)
+    await db.flush()
@@ -0,0 +1,63 @@
+"""批量任务进度汇总：按固定间隔发布聚合快照（计数、速率、预计剩余时间、最近失败项）
+
+单个结果不再逐条推送，由客户端按需通过分页结果接口获取。
+"""
+
+import time
+from collections import deque
+
+from backend.config import BATCH_PROGRESS_RATE_WINDOW, BATCH_RECENT_FAILURES
+
+
+class ProgressMeter:
+    """批次进度计量：累计完成数，并按滑动时间窗口估算速率与剩余时间"""
+
+    def __init__(self, total: int, completed: int, failed: int, concurrency: int | None):
+        self.total = total
+        self.completed = completed
+        self.failed = failed
+        self.concurrency = concurrency
+        self.recent_failures: deque[dict] = deque(maxlen=BATCH_RECENT_FAILURES)
+        # (时间, 已完成数) 采样点，只保留窗口内的
+        self._samples: deque[tuple[float, int]] = deque([(time.monotonic(), completed)])
+
+    def record(self, item: dict):
+        """记录一个执行完成的任务项（连同复用其结果的重复项）"""
+        duplicates = item.get("duplicates") or []
+        finished = 1 + len(duplicates)
+        self.completed += finished
+        if item["status"] == "failed":
+            self.failed += finished
+            self.recent_failures.append({
+                "index": item["index"],
+                "keyword": item["keyword"],
+                "error_message": item.get("error_message"),
+            })
+
+    def update(self, completed: int, failed: int, recent_failures: list[dict] | None = None):
+        """直接设置计数（worker 模式下由数据库轮询得到）"""
+        self.completed = completed
+        self.failed = failed
+        if recent_failures is not None:
+            self.recent_failures = deque(recent_failures, maxlen=BATCH_RECENT_FAILURES)
+
+    def snapshot(self) -> dict:
+        """当前进度的聚合快照"""
+        now = time.monotonic()
+        self._samples.append((now, self.completed))
+        while len(self._samples) > 2 and now - self._samples[0][0] > BATCH_PROGRESS_RATE_WINDOW:
+            self._samples.popleft()
+
+        start_time, start_completed = self._samples[0]
+        elapsed = now - start_time
+        rate = (self.completed - start_completed) / elapsed if elapsed > 0 else 0.0
+        remaining = max(self.total - self.completed, 0)
+        return {
+            "completed": self.completed,
+            "failed": self.failed,
+            "total": self.total,
+            "concurrency": self.concurrency,
+            "rate": round(rate, 2),  # 每秒完成的项数
+            "eta_seconds": round(remaining / rate) if rate > 0 else None,
+            "recent_failures": list(self.recent_failures),
+        }
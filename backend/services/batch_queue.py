@@ -0,0 +1,319 @@
+"""批量任务队列（worker 模式）：以 batch_items 表作为 SQLite 任务队列
+
+- worker 进程通过单条 UPDATE ... RETURNING 原子领取任务项并写入租约
+- 执行期间定期续约；进程退出后租约过期，任务项可被其他 worker 重新领取
+- Web 进程不执行任务，只定期轮询数据库把聚合进度转发给 SSE 订阅者
+"""
+
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import AsyncGenerator, Callable
+
+from sqlalchemy import and_, func, or_, select, update
+from sqlalchemy.orm import aliased
+
+from backend.config import (
+    BATCH_PROGRESS_INTERVAL,
+    BATCH_RECENT_FAILURES,
+    WORKER_LEASE_SECONDS,
+    WORKER_MAX_ATTEMPTS,
+)
+from backend.database import async_session
+from backend.models import (
+    BatchItem,
+    BatchItemStatus,
+    BatchStatus,
+    KeywordBatch,
+    ModelConfig,
+    RecordStatus,
+    TestRecord,
+)
+from backend.services.batch import (
+    complete_batch_if_drained,
+    fail_batch_item,
+    get_model_limiter,
+    item_params,
+    run_batch_item,
+)
+from backend.services.batch_progress import ProgressMeter
+from backend.services.prompt_template import (
+    PromptTemplate,
+    compile_template,
+    render_item_prompt,
+    render_item_prompt_prefixed,
+)
+from backend.services.runtime_settings import get_model_config
+
+logger = logging.getLogger(__name__)
+
+# 批次执行配置缓存（worker 进程内）：batch_id → (model_config_id, custom_params, param_variants, 编译后的模板, 停止规则, 前缀缓存开关)
+_batch_settings: dict[str, tuple[str, dict, list[dict] | None, PromptTemplate, list[dict] | None, bool]] = {}
+_BATCH_SETTINGS_CACHE_SIZE = 256
+
+
+async def claim_batch_item(owner: str) -> dict | None:
+    """
+    领取一个待执行的任务项：待执行的项，或租约已过期的执行中项。
+
+    同一批次内持有有效租约的项数不超过批次并发数（矩阵批次乘以模型数）。
+    已领取 WORKER_MAX_ATTEMPTS 次的项不再领取，而是标记为失败（见 _fail_exhausted_items）。
+
+    Returns:
+        {"id", "batch_id", "index", "keyword", "model_config_id", "variant_index", "variables"}；
+        没有可领取的项时返回 None
+    """
+    now = datetime.now(timezone.utc)
+    await _fail_exhausted_items(now)
+
+    leased = aliased(BatchItem)
+    leased_count = (
+        select(func.count())
+        .select_from(leased)
+        .where(leased.keyword_batch_id == BatchItem.keyword_batch_id)
+        .where(leased.status == BatchItemStatus.RUNNING)
+        .where(leased.lease_expires_at > now)
+        .scalar_subquery()
+    )
+    candidate = (
+        select(BatchItem.id)
+        .join(KeywordBatch, KeywordBatch.id == BatchItem.keyword_batch_id)
+        .where(KeywordBatch.status.in_([BatchStatus.PENDING, BatchStatus.RUNNING]))
+        .where(BatchItem.duplicate_of.is_(None))  # 重复项随原始项一并完成，不进入队列
+        .where(BatchItem.attempts < WORKER_MAX_ATTEMPTS)
+        .where(or_(
+            BatchItem.status == BatchItemStatus.PENDING,
+            and_(
+                BatchItem.status == BatchItemStatus.RUNNING,
+                BatchItem.lease_expires_at <= now,
+            ),
+        ))
+        # 单模型批次的 model_config_ids 为 JSON null（数组长度 0），按 1 个模型计
+        .where(leased_count < KeywordBatch.concurrency * func.max(
+            func.coalesce(func.json_array_length(KeywordBatch.model_config_ids), 0), 1,
+        ))
+        .order_by(BatchItem.created_at, BatchItem.item_index)
+        .limit(1)
+        .scalar_subquery()
+    )
+
+    async with async_session() as session:
+        row = (await session.execute(
+            update(BatchItem)
+            .where(BatchItem.id == candidate)
+            .where(BatchItem.attempts < WORKER_MAX_ATTEMPTS)
+            .values(
+                status=BatchItemStatus.RUNNING,
+                lease_owner=owner,
+                lease_expires_at=now + timedelta(seconds=WORKER_LEASE_SECONDS),
+                attempts=BatchItem.attempts + 1,
+            )
+            .returning(
+                BatchItem.id,
+                BatchItem.keyword_batch_id,
+                BatchItem.item_index,
+                BatchItem.keyword,
+                BatchItem.model_config_id,
+                BatchItem.variant_index,
+                BatchItem.variables,
+                BatchItem.test_record_id,
+            )
+        )).first()
+        if row is None:
+            await session.rollback()
+            return None
+
+        # 上一个持有者留下的执行中记录不会再有结果
+        if row.test_record_id:
+            await session.execute(
+                update(TestRecord)
+                .where(TestRecord.id == row.test_record_id)
+                .where(TestRecord.status == RecordStatus.RUNNING)
+                .values(status=RecordStatus.FAILED, error_message="worker 租约过期，执行中断")
+            )
+        await session.execute(
+            update(KeywordBatch)
+            .where(KeywordBatch.id == row.keyword_batch_id)
+            .where(KeywordBatch.status == BatchStatus.PENDING)
+            .values(status=BatchStatus.RUNNING)
+        )
+        await session.commit()
+
+    return {
+        "id": row.id,
+        "batch_id": row.keyword_batch_id,
+        "index": row.item_index,
+        "keyword": row.keyword,
+        "model_config_id": row.model_config_id,
+        "variant_index": row.variant_index,
+        "variables": row.variables,
+    }
+
+
+async def _fail_exhausted_items(now: datetime) -> None:
+    """
+    领取次数已达上限且未在执行中（待执行或租约已过期）的项标记为失败，避免反复让 worker 崩溃的项无限重试。
+
+    这些项已被领取条件排除，不会与 worker 的领取并发；批次因此排空时标记为完成。
+    """
+    async with async_session() as session:
+        rows = (await session.execute(
+            select(
+                BatchItem.keyword_batch_id,
+                BatchItem.item_index,
+                BatchItem.keyword,
+                BatchItem.model_config_id,
+                BatchItem.variant_index,
+                BatchItem.attempts,
+            )
+            .join(KeywordBatch, KeywordBatch.id == BatchItem.keyword_batch_id)
+            .where(KeywordBatch.status.in_([BatchStatus.PENDING, BatchStatus.RUNNING]))
+            .where(BatchItem.duplicate_of.is_(None))
+            .where(BatchItem.attempts >= WORKER_MAX_ATTEMPTS)
+            .where(or_(
+                BatchItem.status == BatchItemStatus.PENDING,
+                and_(
+                    BatchItem.status == BatchItemStatus.RUNNING,
+                    BatchItem.lease_expires_at <= now,
+                ),
+            ))
+        )).all()
+
+    for row in rows:
+        item = await fail_batch_item(
+            row.keyword_batch_id, row.item_index, row.keyword,
+            f"已领取 {row.attempts} 次仍未完成（worker 租约多次过期）",
+            row.model_config_id, row.variant_index,
+        )
+        if item:
+            logger.warning("任务项 %s#%s 重试次数已达上限，标记为失败", row.keyword_batch_id, row.item_index)
+    for batch_id in {row.keyword_batch_id for row in rows}:
+        await complete_batch_if_drained(batch_id)
+
+
+async def renew_leases(owner: str) -> int:
+    """为本 worker 持有的全部执行中任务项续约，返回续约数量"""
+    async with async_session() as session:
+        result = await session.execute(
+            update(BatchItem)
+            .where(BatchItem.lease_owner == owner)
+            .where(BatchItem.status == BatchItemStatus.RUNNING)
+            .values(lease_expires_at=datetime.now(timezone.utc) + timedelta(seconds=WORKER_LEASE_SECONDS))
+        )
+        await session.commit()
+    return result.rowcount or 0
+
+
+async def release_leases(owner: str) -> int:
+    """worker 退出时归还未完成的任务项，使其可被立即重领"""
+    async with async_session() as session:
+        result = await session.execute(
+            update(BatchItem)
+            .where(BatchItem.lease_owner == owner)
+            .where(BatchItem.status == BatchItemStatus.RUNNING)
+            .values(lease_expires_at=datetime.now(timezone.utc))
+        )
+        await session.commit()
+    return result.rowcount or 0
+
+
+async def execute_claimed_item(owner: str, claim: dict) -> dict:
+    """执行已领取的任务项；批次最后一项完成时结束批次"""
+    batch_id = claim["batch_id"]
+    model_config, params, template, stop_rules, prefix_cache = await _load_batch_settings(
+        batch_id, claim.get("model_config_id"), claim.get("variant_index"),
+    )
+    if prefix_cache:
+        prefix, prompt = render_item_prompt_prefixed(template, claim["keyword"], claim.get("variables"))
+    else:
+        prefix, prompt = None, render_item_prompt(template, claim["keyword"], claim.get("variables"))
+    async with get_model_limiter(model_config.id):
+        item = await run_batch_item(
+            batch_id, model_config, params, prompt,
+            claim["index"], claim["keyword"],
+            lease_owner=owner,
+            variant_index=claim.get("variant_index"),
+            stop_rules=stop_rules,
+            prompt_prefix=prefix,
+        )
+    await complete_batch_if_drained(batch_id)
+    return item
+
+
+async def relay_batch(
+    batch_id: str,
+    keep_running: Callable[[], bool],
+) -> AsyncGenerator[tuple[str, dict], None]:
+    """
+    轮询数据库转发 worker 的执行进度，事件格式与进程内执行一致（聚合的 progress 快照 + done）。
+
+    Args:
+        batch_id: 批次 ID
+        keep_running: 每轮轮询前调用，返回 False 时停止转发（如已无订阅者）
+    """
+    meter = None
+    while keep_running():
+        async with async_session() as session:
+            batch = await session.get(KeywordBatch, batch_id)
+            if not batch:
+                yield ("error", {"message": "批量任务未找到"})
+                return
+            recent_failures = (await session.execute(
+                select(BatchItem.item_index, BatchItem.keyword, BatchItem.error_message)
+                .where(BatchItem.keyword_batch_id == batch_id)
+                .where(BatchItem.status == BatchItemStatus.FAILED)
+                .where(BatchItem.finished_at.is_not(None))
+                .order_by(BatchItem.finished_at.desc())
+                .limit(BATCH_RECENT_FAILURES)
+            )).all()
+
+        if meter is None:
+            meter = ProgressMeter(batch.total_count, batch.completed_count, batch.failed_count, batch.concurrency)
+        meter.update(batch.completed_count, batch.failed_count, [
+            {"index": row.item_index, "keyword": row.keyword, "error_message": row.error_message}
+            for row in reversed(recent_failures)
+        ])
+        yield ("progress", meter.snapshot())
+
+        if batch.status in (BatchStatus.COMPLETED, BatchStatus.CANCELLED):
+            yield ("done", {
+                "batch_id": batch_id,
+                "completed": batch.completed_count,
+                "failed": batch.failed_count,
+            })
+            return
+
+        await asyncio.sleep(BATCH_PROGRESS_INTERVAL)
+
+
+async def _load_batch_settings(
+    batch_id: str,
+    model_config_id: str | None = None,
+    variant_index: int | None = None,
+) -> tuple[ModelConfig, dict, PromptTemplate, list[dict] | None, bool]:
+    """读取任务项执行所需的模型配置、参数、模板、停止规则与前缀缓存开关（矩阵批次按任务项的模型与参数组合）
+
+    批次字段创建后不变，按批次缓存；模型配置走运行时设置的模型缓存，修改后可及时生效。
+    """
+    settings = _batch_settings.get(batch_id)
+    if settings is None:
+        async with async_session() as session:
+            batch = await session.get(KeywordBatch, batch_id)
+            settings = (
+                batch.model_config_id,
+                batch.custom_params or {},
+                batch.param_variants,
+                compile_template(batch.prompt_template),
+                batch.stop_rules,
+                batch.prefix_cache,
+            )
+        if len(_batch_settings) >= _BATCH_SETTINGS_CACHE_SIZE:
+            _batch_settings.clear()
+        _batch_settings[batch_id] = settings
+
+    default_model_id, custom_params, param_variants, template, stop_rules, prefix_cache = settings
+    model_config = await get_model_config(model_config_id or default_model_id)
+    if not model_config:
+        raise ValueError("模型配置未找到")
+    params = item_params(model_config, custom_params, param_variants, variant_index)
+    return model_config, params, template, stop_rules, prefix_cache
@@ -0,0 +1,382 @@
+"""批量任务后台执行器：批次创建后即在后台运行，进度通过进程内发布/订阅分发
+
+- 每个批次在进程内至多一个执行协程，客户端断开或多开页面都不影响执行
+- 任意数量的 SSE 订阅者可随时接入，接入时先收到一份当前进度快照（snapshot）
+- 执行期间按固定间隔推送聚合进度（计数、速率、预计剩余时间、最近失败项），
+  单个结果通过分页结果接口按需获取
+- 订阅者消费过慢导致缓冲溢出时，丢弃积压事件并补发一份快照
+- 启动时恢复上次进程中断的批次：继续执行或标记为失败（BATCH_RECOVERY_MODE）
+- 多个 Web 进程（uvicorn --workers N）之间以批次租约（runner_id）保证同一批次只由一个进程执行：
+  执行期间续约，进程退出后租约过期才可被接管；其他进程的订阅者轮询数据库转发进度
+- worker 模式（BATCH_EXECUTION_MODE=worker）下本进程不执行批次，
+  有订阅者时轮询数据库转发 worker 进程的进度（见 batch_queue）
+"""
+
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import AsyncGenerator
+
+from sqlalchemy import or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.config import (
+    BATCH_EXECUTION_MODE,
+    BATCH_RECOVERY_MODE,
+    BATCH_RECOVERY_RECORD_GRACE,
+    BATCH_RUNNER_LEASE_SECONDS,
+    BATCH_SUBSCRIBER_QUEUE_SIZE,
+)
+from backend.database import async_session
+from backend.models import KeywordBatch, BatchStatus, TestRecord, RecordStatus
+from backend.services.batch import execute_batch, mark_batch_interrupted, prepare_resume
+from backend.services.batch_queue import relay_batch
+from backend.services.jobs import spawn
+from backend.services.runtime_settings import get_model_config
+from backend.services.upstream_limiter import admit_batch
+
+logger = logging.getLogger(__name__)
+
+# batch_id → 运行中批次的频道（进度状态 + 订阅者队列）
+_channels: dict[str, dict] = {}
+
+# 结束订阅的事件类型
+_TERMINAL_EVENTS = ("done", "error")
+
+# 本进程的标识，用于批次租约
+RUNNER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def start_batch(batch_id: str) -> bool:
+    """
+    在后台启动批次执行；该批次已在运行时返回 False。
+
+    worker 模式下批次由 worker 进程从队列领取，这里不做任何事。
+    """
+    if BATCH_EXECUTION_MODE == "worker" or batch_id in _channels:
+        return False
+    _open_channel(batch_id)
+    return True
+
+
+def _open_channel(batch_id: str, relay: bool = False) -> dict:
+    """登记批次频道并启动事件源（进程内执行，或 relay=True 时转发其他进程的进度）"""
+    channel = {
+        "batch_id": batch_id,
+        "status": BatchStatus.PENDING.value,
+        "total": 0,
+        "completed": 0,
+        "failed": 0,
+        "concurrency": None,
+        "rate": 0.0,
+        "eta_seconds": None,
+        "recent_failures": [],
+        "subscribers": set(),
+    }
+    _channels[batch_id] = channel
+    spawn(_run_channel(channel, relay))
+    return channel
+
+
+def is_batch_active(batch_id: str) -> bool:
+    """批次是否正由本进程执行（或转发其他进程的执行进度）"""
+    return BATCH_EXECUTION_MODE != "worker" and batch_id in _channels
+
+
+async def resume_batch(batch_id: str) -> dict | None:
+    """
+    重新执行批次中未完成或失败的项。
+
+    Returns:
+        {"id", "status", "resumed_count"}；批次不存在时返回 None
+    Raises:
+        ValueError: 批次正在本进程或其他进程中执行
+        UpstreamOverloaded: 涉及的上游排队已满
+    """
+    if is_batch_active(batch_id):
+        raise ValueError("批量任务正在执行中")
+    async with async_session() as session:
+        batch = await session.get(KeywordBatch, batch_id)
+        if batch is None:
+            return None
+        model_configs = [await get_model_config(mid) for mid in batch.model_config_ids or [batch.model_config_id]]
+        admit_batch(mc for mc in model_configs if mc)
+
+        # 先取得批次租约：持有租约的进程仍在执行时，其执行中的项不能被当作中断重置
+        if BATCH_EXECUTION_MODE != "worker" and not await _claim_runner(session, batch_id):
+            raise ValueError("批量任务正在其他进程中执行")
+        pending = await prepare_resume(session, batch_id)
+        if pending is None:
+            return None
+        if not pending:
+            await _release_runner(session, batch_id)
+        await session.commit()
+    if pending:
+        start_batch(batch_id)
+    return {
+        "id": batch_id,
+        "status": (BatchStatus.RUNNING if pending else BatchStatus.COMPLETED).value,
+        "resumed_count": pending,
+    }
+
+
+async def recover_batches():
+    """
+    启动恢复：结束中断的执行中记录，按配置继续执行或结束未完成的批次。
+
+    多个 Web 进程各自启动时都会调用：批次只处理租约已过期（原执行进程已退出）的，
+    单次推理 / 对比记录只结束超过 BATCH_RECOVERY_RECORD_GRACE 的（其余可能属于其他仍在运行的进程，
+    到期后再检查一次）。批量记录随批次恢复处理，worker 模式下批量任务项由租约机制恢复。
+    """
+    started_at = datetime.now(timezone.utc)
+    interrupted_records = await _fail_interrupted_records(
+        started_at - timedelta(seconds=BATCH_RECOVERY_RECORD_GRACE)
+    )
+    if interrupted_records:
+        logger.info(f"已将 {interrupted_records} 条中断的执行中记录标记为失败")
+    spawn(_fail_interrupted_records_later(started_at))
+    if BATCH_EXECUTION_MODE == "worker":
+        return
+
+    async with async_session() as session:
+        batch_ids = (await session.execute(
+            select(KeywordBatch.id)
+            .where(KeywordBatch.status.in_([BatchStatus.PENDING, BatchStatus.RUNNING]))
+            .order_by(KeywordBatch.created_at)
+        )).scalars().all()
+
+    for batch_id in batch_ids:
+        if BATCH_RECOVERY_MODE == "resume":
+            try:
+                await resume_batch(batch_id)
+            except ValueError:
+                continue  # 由其他进程执行
+            logger.info(f"继续执行中断的批量任务: {batch_id}")
+        else:
+            async with async_session() as session:
+                if not await _claim_runner(session, batch_id):
+                    continue
+                await mark_batch_interrupted(session, batch_id)
+                await _release_runner(session, batch_id)
+                await session.commit()
+            logger.info(f"已结束中断的批量任务: {batch_id}")
+
+
+async def _fail_interrupted_records(created_before: datetime) -> int:
+    """把创建于 created_before 之前、仍在执行中的非批量记录标记为失败，返回记录数"""
+    async with async_session() as session:
+        result = await session.execute(
+            update(TestRecord)
+            .where(TestRecord.status.in_([RecordStatus.PENDING, RecordStatus.RUNNING]))
+            .where(TestRecord.keyword_batch_id.is_(None))
+            .where(TestRecord.created_at < created_before)
+            .values(status=RecordStatus.FAILED, error_message="服务重启，执行中断")
+        )
+        await session.commit()
+    return result.rowcount or 0
+
+
+async def _fail_interrupted_records_later(started_at: datetime):
+    """等待所有进程中启动前开始的调用都已超时，再结束其中仍在执行中的记录"""
+    await asyncio.sleep(BATCH_RECOVERY_RECORD_GRACE)
+    count = await _fail_interrupted_records(started_at)
+    if count:
+        logger.info(f"已将 {count} 条中断的执行中记录标记为失败")
+
+
+async def _claim_runner(session: AsyncSession, batch_id: str) -> bool:
+    """取得或续约批次租约（未被持有、已由本进程持有或已过期时成功）"""
+    now = datetime.now(timezone.utc)
+    result = await session.execute(
+        update(KeywordBatch)
+        .where(KeywordBatch.id == batch_id)
+        .where(or_(
+            KeywordBatch.runner_id.is_(None),
+            KeywordBatch.runner_id == RUNNER_ID,
+            KeywordBatch.runner_expires_at <= now,
+        ))
+        .values(runner_id=RUNNER_ID, runner_expires_at=now + timedelta(seconds=BATCH_RUNNER_LEASE_SECONDS))
+        .execution_options(synchronize_session=False)
+    )
+    return bool(result.rowcount)
+
+
+async def _release_runner(session: AsyncSession, batch_id: str):
+    """释放本进程持有的批次租约"""
+    await session.execute(
+        update(KeywordBatch)
+        .where(KeywordBatch.id == batch_id)
+        .where(KeywordBatch.runner_id == RUNNER_ID)
+        .values(runner_id=None, runner_expires_at=None)
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def _renew_runner_loop(batch_id: str):
+    """执行期间定期续约批次租约"""
+    while True:
+        await asyncio.sleep(BATCH_RUNNER_LEASE_SECONDS / 4)
+        try:
+            async with async_session() as session:
+                if not await _claim_runner(session, batch_id):
+                    logger.warning(f"批量任务的执行租约已被其他进程接管: {batch_id}")
+                await session.commit()
+        except Exception as e:
+            logger.warning(f"批量任务续约失败: {batch_id} - {e}")
+
+
+async def _runner_alive(batch_id: str) -> bool:
+    """批次是否由某个进程持有有效租约"""
+    async with async_session() as session:
+        expires_at = (await session.execute(
+            select(KeywordBatch.runner_expires_at)
+            .where(KeywordBatch.id == batch_id)
+            .where(KeywordBatch.runner_id.is_not(None))
+        )).scalar_one_or_none()
+    if expires_at is None:
+        return False
+    if expires_at.tzinfo is None:  # SQLite 不保存时区
+        expires_at = expires_at.replace(tzinfo=timezone.utc)
+    return expires_at > datetime.now(timezone.utc)
+
+
+async def subscribe_batch(batch_id: str) -> AsyncGenerator[tuple[str, dict], None]:
+    """
+    订阅批次进度，返回 (event_type, event_data) 元组流。
+
+    首个事件为 snapshot（当前进度），之后转发执行器定期发布的 progress 事件，
+    直到 done 或 error。批次未在运行时只返回数据库中的快照。
+    """
+    channel = _channels.get(batch_id)
+    if channel is None:
+        snapshot = await _snapshot_from_db(batch_id)
+        if snapshot is None:
+            yield ("error", {"message": "批量任务未找到"})
+            return
+        unfinished = snapshot["status"] in (BatchStatus.PENDING.value, BatchStatus.RUNNING.value)
+        if unfinished and (BATCH_EXECUTION_MODE == "worker" or await _runner_alive(batch_id)):
+            # 由 worker 进程或其他 Web 进程执行：按需启动进度转发
+            channel = _channels.get(batch_id) or _open_channel(batch_id, relay=True)
+            channel.update({k: v for k, v in snapshot.items() if k != "batch_id"})
+        else:
+            yield ("snapshot", snapshot)
+            if snapshot["status"] == BatchStatus.COMPLETED.value:
+                yield ("done", {
+                    "batch_id": batch_id,
+                    "completed": snapshot["completed"],
+                    "failed": snapshot["failed"],
+                })
+            return
+
+    # 登记队列与生成快照之间没有 await，快照之后的事件不会遗漏
+    queue: asyncio.Queue[tuple[str, dict]] = asyncio.Queue(maxsize=BATCH_SUBSCRIBER_QUEUE_SIZE)
+    channel["subscribers"].add(queue)
+    try:
+        yield ("snapshot", _channel_snapshot(channel))
+        while True:
+            event_type, event_data = await queue.get()
+            if event_type == "resync":
+                yield ("snapshot", event_data)
+                continue
+            yield (event_type, event_data)
+            if event_type in _TERMINAL_EVENTS:
+                return
+    finally:
+        channel["subscribers"].discard(queue)
+
+
+async def _run_channel(channel: dict, relay: bool = False):
+    """驱动批次执行（或转发 worker / 其他进程的进度）并把事件发布给订阅者"""
+    batch_id = channel["batch_id"]
+    renew_task = None
+    try:
+        if not relay and BATCH_EXECUTION_MODE != "worker":
+            async with async_session() as session:
+                relay = not await _claim_runner(session, batch_id)
+                await session.commit()
+            if relay:
+                logger.info(f"批量任务已由其他进程执行: {batch_id}")
+            else:
+                renew_task = spawn(_renew_runner_loop(batch_id))
+        if relay or BATCH_EXECUTION_MODE == "worker":
+            # 订阅者全部断开后停止转发，下次订阅时重新启动
+            source = relay_batch(batch_id, keep_running=lambda: bool(channel["subscribers"]))
+        else:
+            source = execute_batch(batch_id)
+        async for event_type, event_data in source:
+            _publish(channel, event_type, event_data)
+    except Exception as e:
+        logger.error(f"批量任务执行失败: {batch_id} - {e}", exc_info=True)
+        _publish(channel, "error", {"message": f"批量任务执行失败: {e}"})
+    finally:
+        _channels.pop(batch_id, None)
+        if renew_task is not None:
+            renew_task.cancel()
+            async with async_session() as session:
+                await _release_runner(session, batch_id)
+                await session.commit()
+
+
+def _publish(channel: dict, event_type: str, event_data: dict):
+    """更新频道进度并分发事件（不阻塞执行器）"""
+    if event_type == "progress":
+        channel["status"] = BatchStatus.RUNNING.value
+        channel["total"] = event_data["total"]
+        channel["completed"] = event_data["completed"]
+        channel["failed"] = event_data["failed"]
+        channel["concurrency"] = event_data.get("concurrency")
+        channel["rate"] = event_data.get("rate", 0.0)
+        channel["eta_seconds"] = event_data.get("eta_seconds")
+        channel["recent_failures"] = event_data.get("recent_failures", [])
+    elif event_type == "done":
+        channel["status"] = BatchStatus.COMPLETED.value
+        channel["completed"] = event_data["completed"]
+        channel["failed"] = event_data["failed"]
+
+    for queue in list(channel["subscribers"]):
+        try:
+            queue.put_nowait((event_type, event_data))
+        except asyncio.QueueFull:
+            # 订阅者跟不上：丢弃积压，改为补发快照（终止事件必须送达）
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(("resync", _channel_snapshot(channel)))
+            if event_type in _TERMINAL_EVENTS:
+                queue.put_nowait((event_type, event_data))
+
+
+def _channel_snapshot(channel: dict) -> dict:
+    """运行中批次的进度快照"""
+    return {
+        "batch_id": channel["batch_id"],
+        "status": channel["status"],
+        "total": channel["total"],
+        "completed": channel["completed"],
+        "failed": channel["failed"],
+        "concurrency": channel["concurrency"],
+        "rate": channel["rate"],
+        "eta_seconds": channel["eta_seconds"],
+        "recent_failures": channel["recent_failures"],
+    }
+
+
+async def _snapshot_from_db(batch_id: str) -> dict | None:
+    """未在运行的批次从数据库读取快照"""
+    async with async_session() as session:
+        batch = await session.get(KeywordBatch, batch_id)
+        if not batch:
+            return None
+        return {
+            "batch_id": batch.id,
+            "status": batch.status.value if hasattr(batch.status, 'value') else batch.status,
+            "total": batch.total_count,
+            "completed": batch.completed_count,
+            "failed": batch.failed_count,
+            "concurrency": batch.concurrency,
+            "rate": 0.0,
+            "eta_seconds": None,
+            "recent_failures": [],
+        }
@@ -0,0 +1,203 @@
+"""批量任务文件导入：从 CSV / JSONL 文件流式创建批次
+
+- 文件按行流式解析，每 BATCH_UPLOAD_CHUNK_ROWS 行批量写入一次任务项（executemany），
+  任意时刻内存中只有一块数据
+- 整行数据作为模板变量，模板可引用任意列（如 {product}、{lang}），在调用模型前按表头校验
+- 关键词列：有 keyword 列时取该列，否则取第一列
+"""
+
+import asyncio
+import codecs
+import csv
+import json
+from pathlib import PurePath
+from typing import BinaryIO, Iterator
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.config import BATCH_DEFAULT_CONCURRENCY, BATCH_UPLOAD_CHUNK_ROWS
+from backend.models import BatchItem, BatchStatus, BatchType, KeywordBatch
+from backend.services.batch import mark_duplicates, matrix_combos, model_concurrency_limit, resolve_batch_models
+from backend.services.prefix_cache import validate_prefix_template
+from backend.services.prompt_template import compile_template
+from backend.services.stop_rules import validate_stop_rules
+
+# 文件扩展名 → 格式
+UPLOAD_FORMATS = {
+    ".csv": "csv",
+    ".jsonl": "jsonl",
+    ".ndjson": "jsonl",
+}
+
+
+async def create_batch_from_upload(
+    db: AsyncSession,
+    file: BinaryIO,
+    filename: str,
+    prompt_template: str,
+    model_config_id: str | None = None,
+    params: dict | None = None,
+    concurrency: int | None = None,
+    model_config_ids: list[str] | None = None,
+    param_variants: list[dict] | None = None,
+    deduplicate: bool = True,
+    stop_rules: list[dict] | None = None,
+    prefix_cache: bool = False,
+) -> dict:
+    """
+    从上传的 CSV / JSONL 文件创建批量测试任务（参数含义与 create_batch 相同）。
+
+    Raises:
+        ValueError: 文件格式不支持、模板引用了不存在的列、前缀缓存模式下模板前缀过短、文件内容有误或没有数据行
+    """
+    fmt = UPLOAD_FORMATS.get(PurePath(filename or "").suffix.lower())
+    if fmt is None:
+        raise ValueError(f"不支持的文件格式，请上传 {' / '.join(UPLOAD_FORMATS)} 文件")
+
+    stop_rules = validate_stop_rules(stop_rules)
+    is_matrix = bool(model_config_ids or param_variants)
+    model_ids, model_configs = await resolve_batch_models(db, model_config_id, model_config_ids)
+    template = compile_template(prompt_template)
+    variants = (param_variants or [{}]) if is_matrix else None
+    combos = (
+        matrix_combos([model_configs[mid] for mid in model_ids], len(variants))
+        if is_matrix else [(None, None)]
+    )
+
+    # 先读表头并校验模板，再写入任何数据
+    rows = _iter_csv_rows(file) if fmt == "csv" else _iter_jsonl_rows(file)
+    columns = await asyncio.to_thread(next, rows)
+    template.validate(columns)
+    if prefix_cache:
+        validate_prefix_template(template, columns)
+    keyword_column = "keyword" if "keyword" in columns else columns[0]
+
+    batch = KeywordBatch(
+        model_config_id=model_ids[0],
+        keywords=[],  # 文件导入的关键词只保存在任务项中
+        prompt_template=prompt_template,
+        custom_params=params or {},
+        total_count=0,
+        concurrency=min(concurrency or BATCH_DEFAULT_CONCURRENCY, model_concurrency_limit()),
+        batch_type=BatchType.MATRIX if is_matrix else BatchType.SINGLE,
+        model_config_ids=model_ids if is_matrix else None,
+        param_variants=variants,
+        stop_rules=stop_rules,
+        prefix_cache=prefix_cache,
+        status=BatchStatus.PENDING,
+    )
+    db.add(batch)
+    await db.flush()
+
+    seen: dict[bytes, int] = {}
+    keyword_index = item_index = saved_calls = 0
+    while True:
+        chunk = await asyncio.to_thread(_next_chunk, rows, BATCH_UPLOAD_CHUNK_ROWS)
+        if not chunk:
+            break
+        items = []
+        for row in chunk:
+            keyword = row.get(keyword_column)
+            keyword = "" if keyword is None else str(keyword)
+            for combo_model_id, variant_index in combos:
+                items.append({
+                    "keyword_batch_id": batch.id,
+                    "item_index": item_index,
+                    "keyword_index": keyword_index,
+                    "keyword": keyword,
+                    "variables": row,
+                    "model_config_id": combo_model_id,
+                    "variant_index": variant_index,
+                })
+                item_index += 1
+            keyword_index += 1
+        if deduplicate:
+            saved_calls += mark_duplicates(
+                items, template, model_configs, model_ids[0], params, variants, seen=seen,
+            )
+        await db.execute(insert(BatchItem), items)
+
+    if item_index == 0:
+        raise ValueError("文件中没有数据行")
+
+    batch.total_count = item_index
+    batch.saved_calls = saved_calls
+    await db.flush()
+
+    return {
+        "id": batch.id,
+        "status": batch.status.value,
+        "batch_type": batch.batch_type.value,
+        "total_count": batch.total_count,
+        "completed_count": 0,
+        "failed_count": 0,
+        "concurrency": batch.concurrency,
+        "saved_calls": saved_calls,
+        "row_count": keyword_index,
+        "columns": columns,
+        "created_at": batch.created_at.isoformat() if batch.created_at else None,
+    }
+
+
+def _next_chunk(rows: Iterator[dict], size: int) -> list[dict]:
+    """从行迭代器取出至多 size 行（在线程中执行，避免阻塞事件循环）"""
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            break
+    return chunk
+
+
+def _iter_text_lines(file: BinaryIO) -> Iterator[str]:
+    """按行解码（UTF-8，兼容 BOM），保留换行符以便 csv 处理引号内的换行"""
+    reader = codecs.getreader("utf-8-sig")(file)
+    try:
+        yield from reader
+    except UnicodeDecodeError:
+        raise ValueError("文件编码错误，请使用 UTF-8 编码")
+
+
+def _iter_csv_rows(file: BinaryIO) -> Iterator:
+    """首个元素为表头（列名列表），之后逐行返回 {列名: 值}"""
+    reader = csv.reader(_iter_text_lines(file))
+    header = next(reader, None)
+    columns = [name.strip() for name in header or []]
+    if not columns or not all(columns):
+        raise ValueError("CSV 文件缺少表头或表头含空列名")
+    if len(set(columns)) != len(columns):
+        raise ValueError("CSV 表头存在重复列名")
+    yield columns
+
+    for values in reader:
+        if not any(values):
+            continue  # 跳过空行
+        if len(values) != len(columns):
+            raise ValueError(f"CSV 第 {reader.line_num} 行有 {len(values)} 列，与表头的 {len(columns)} 列不一致")
+        yield dict(zip(columns, values))
+
+
+def _iter_jsonl_rows(file: BinaryIO) -> Iterator:
+    """首个元素为表头（首行对象的键），之后逐行返回 JSON 对象；后续行须包含表头中的全部键"""
+    columns = None
+    for line_num, line in enumerate(_iter_text_lines(file), start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"JSONL 第 {line_num} 行不是合法的 JSON: {e.msg}")
+        if not isinstance(row, dict) or not row:
+            raise ValueError(f"JSONL 第 {line_num} 行须为非空 JSON 对象")
+        if columns is None:
+            columns = list(row)
+            yield columns
+        else:
+            missing = [name for name in columns if name not in row]
+            if missing:
+                raise ValueError(f"JSONL 第 {line_num} 行缺少字段: {', '.join(missing)}")
+        yield row
+
+    if columns is None:
+        raise ValueError("文件中没有数据行")
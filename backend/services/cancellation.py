@@ -0,0 +1,79 @@
+"""流式调用的取消处理：SSE 客户端断开时结束上游调用并保存部分结果
+
+客户端断开后 sse-starlette 取消推送任务，取消沿生成器链传播到 stream_chat_completion，
+由其关闭与上游的连接；执行中的记录标记为已取消并保留已生成的部分输出。
+被取消的推送任务中任何 await 都会再次被取消，请求会话也可能正被框架回滚或关闭，
+因此等待子任务结束与写入取消结果都在后台任务中用独立会话完成，并用 asyncio.shield 保护。
+"""
+
+import asyncio
+
+from sqlalchemy import update
+
+from backend.database import async_session
+from backend.models import ComparisonSession, ComparisonStatus, RecordStatus, TestRecord
+from backend.services.jobs import spawn
+
+CANCELLED_MESSAGE = "客户端已断开，调用已取消"
+
+# 取消时写回的记录字段（已结束的记录也一并写回，请求会话中的未提交结果不会丢失）
+_SAVED_FIELDS = (
+    "model_config_id",
+    "status",
+    "output_text",
+    "error_message",
+    "token_input",
+    "token_output",
+    "token_cached",
+    "response_time_ms",
+    "queue_wait_ms",
+    "raw_response",
+    "stop_reason",
+)
+
+
+async def save_cancelled(
+    records: list[TestRecord],
+    outputs: list[str],
+    comparison_session_id: str | None = None,
+    tasks: tuple[asyncio.Task, ...] = (),
+):
+    """
+    把执行中的记录标记为已取消（保留部分输出）并写入数据库。
+
+    Args:
+        records: 本次请求的记录
+        outputs: 各记录已生成的文本（tasks 结束后读取）
+        comparison_session_id: 对比会话 ID，不为空时会话标记为已取消
+        tasks: 已取消、须等待其结束（上游连接关闭）的子任务
+    """
+    await asyncio.shield(spawn(_save_cancelled(records, outputs, comparison_session_id, tasks)))
+
+
+async def _save_cancelled(
+    records: list[TestRecord],
+    outputs: list[str],
+    comparison_session_id: str | None,
+    tasks: tuple[asyncio.Task, ...],
+):
+    """等待子任务结束后，在独立会话中写入取消结果"""
+    if tasks:
+        await asyncio.wait(tasks)
+    values = []
+    for record, output_text in zip(records, outputs):
+        if record.status in (RecordStatus.PENDING, RecordStatus.RUNNING):
+            record.status = RecordStatus.CANCELLED
+            record.output_text = output_text
+            record.error_message = CANCELLED_MESSAGE
+        values.append((record.id, {field: getattr(record, field) for field in _SAVED_FIELDS}))
+
+    async with async_session() as session:
+        for record_id, fields in values:
+            await session.execute(update(TestRecord).where(TestRecord.id == record_id).values(**fields))
+        if comparison_session_id:
+            await session.execute(
+                update(ComparisonSession)
+                .where(ComparisonSession.id == comparison_session_id)
+                .values(status=ComparisonStatus.CANCELLED)
+            )
+        await session.commit()
@@ -0,0 +1,153 @@
+"""上游熔断：按 base_url 统计连续失败，端点不可用时快速失败，不再等待完整超时
+
+- closed：正常调用；连接失败、5xx 或首 token 超时连续 BREAKER_FAILURE_THRESHOLD 次后熔断
+- open：调用立即失败（stop_reason 为 circuit_open），BREAKER_OPEN_SECONDS 后进入 half_open
+- half_open：后台发送一次轻量探测请求（与「测试连接」相同），成功则恢复，失败则重新熔断且暂停时间翻倍
+- 熔断期间仍在进行的调用若成功，同样立即恢复
+状态按进程维护，通过 GET /api/models（health 字段）与 /api/upstream/breakers 查看。
+"""
+
+import asyncio
+import enum
+import logging
+import time
+from typing import Awaitable, Callable
+
+from backend.config import BREAKER_FAILURE_THRESHOLD, BREAKER_OPEN_MAX, BREAKER_OPEN_SECONDS
+from backend.services.jobs import spawn
+
+logger = logging.getLogger(__name__)
+
+
+class BreakerState(str, enum.Enum):
+    """熔断状态枚举"""
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """单个上游 base_url 的熔断器"""
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+        self.state = BreakerState.CLOSED
+        self.consecutive_failures = 0
+        self.last_error: str | None = None
+        self.open_seconds = BREAKER_OPEN_SECONDS
+        self.open_until = 0.0
+        self.opened = 0     # 熔断次数
+        self.rejected = 0   # 熔断期间快速失败的调用数
+        self.probes = 0
+        # 探测请求（由最近一次调用设置，使用其模型与 Key），返回测试连接的结果
+        self.probe: Callable[[], Awaitable[dict]] | None = None
+        self._probe_task: asyncio.Task | None = None
+
+    def allow(self) -> bool:
+        """是否放行调用；熔断期间计入快速失败次数"""
+        if self.state == BreakerState.CLOSED:
+            return True
+        self.rejected += 1
+        return False
+
+    def retry_in(self) -> float:
+        """距下次探测的秒数"""
+        return max(self.open_until - time.monotonic(), 0.0)
+
+    def record_success(self):
+        """调用成功（收到输出）"""
+        self.consecutive_failures = 0
+        if self.state != BreakerState.CLOSED:
+            self._close()
+
+    def record_failure(self, error: str):
+        """调用因端点不可用而失败"""
+        self.consecutive_failures += 1
+        self.last_error = error
+        if self.state == BreakerState.CLOSED and self.consecutive_failures >= BREAKER_FAILURE_THRESHOLD:
+            self.opened += 1
+            self._open()
+            logger.warning(f"上游 {self.base_url} 连续失败 {self.consecutive_failures} 次，已熔断: {error}")
+
+    def _open(self):
+        """进入熔断状态，并启动后台探测（尚未运行时）"""
+        self.state = BreakerState.OPEN
+        self.open_until = time.monotonic() + self.open_seconds
+        if self._probe_task is None or self._probe_task.done():
+            self._probe_task = spawn(self._probe_loop())
+
+    def _close(self):
+        """恢复正常"""
+        self.state = BreakerState.CLOSED
+        self.consecutive_failures = 0
+        self.last_error = None
+        self.open_seconds = BREAKER_OPEN_SECONDS
+        logger.info(f"上游 {self.base_url} 已恢复")
+
+    async def _probe_loop(self):
+        """暂停期满后探测，直到端点恢复"""
+        while self.state != BreakerState.CLOSED:
+            await asyncio.sleep(self.retry_in())
+            if self.state == BreakerState.CLOSED:
+                return  # 熔断期间进行中的调用成功，已恢复
+            self.state = BreakerState.HALF_OPEN
+            self.probes += 1
+            try:
+                result = await self.probe() if self.probe else {"success": False, "message": "没有可用的探测请求"}
+            except Exception as e:
+                result = {"success": False, "message": str(e)}
+            if self.state == BreakerState.CLOSED:
+                return
+            if endpoint_reachable(result):
+                self._close()
+                return
+            self.last_error = result.get("message")
+            self.open_seconds = min(self.open_seconds * 2, BREAKER_OPEN_MAX)
+            self._open()  # 探测循环仍在运行，不会重复启动
+
+    def snapshot(self) -> dict:
+        """当前状态"""
+        return {
+            "base_url": self.base_url,
+            "state": self.state.value,
+            "consecutive_failures": self.consecutive_failures,
+            "last_error": self.last_error,
+            "retry_in": round(self.retry_in(), 1) if self.state != BreakerState.CLOSED else None,
+            "opened": self.opened,
+            "rejected": self.rejected,
+            "probes": self.probes,
+        }
+
+
+# base_url → 熔断器
+_breakers: dict[str, CircuitBreaker] = {}
+
+
+def get_breaker(base_url: str) -> CircuitBreaker:
+    """获取 base_url 对应的熔断器"""
+    breaker = _breakers.get(base_url)
+    if breaker is None:
+        breaker = _breakers[base_url] = CircuitBreaker(base_url)
+    return breaker
+
+
+def endpoint_reachable(result: dict) -> bool:
+    """探测结果是否说明端点可用（鉴权失败、限流等 4xx 也说明端点在正常响应）"""
+    if result.get("success"):
+        return True
+    status_code = result.get("status_code")
+    return status_code is not None and status_code < 500
+
+
+def breaker_health(base_url: str) -> dict:
+    """base_url 的熔断状态（未出现过失败时为 closed）"""
+    breaker = _breakers.get(base_url)
+    if breaker is None:
+        return {"state": BreakerState.CLOSED.value, "consecutive_failures": 0, "retry_in": None, "last_error": None}
+    snapshot = breaker.snapshot()
+    return {key: snapshot[key] for key in ("state", "consecutive_failures", "retry_in", "last_error")}
+
+
+def list_breakers() -> list[dict]:
+    """全部熔断器的状态（本进程）"""
+    return [breaker.snapshot() for breaker in _breakers.values()]
@@ -0,0 +1,241 @@
+"""记录清理服务：级联删除测试记录、后台分块清空、存储空间回收
+
+删除测试记录时一并清理：
+- 引用这些记录的 ComparisonGroup，以及已无记录的 ComparisonSession
+- 不再被任何记录/对比会话引用的 TestInput 及其 UploadedFile
+- 磁盘上的上传文件与输出音频
+"""
+
+import asyncio
+import logging
+
+from sqlalchemy import delete, literal_column, select, text, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.config import (
+    DELETE_CHUNK_PAUSE,
+    DELETE_CHUNK_SIZE,
+    UPLOAD_DIR,
+    VACUUM_PAGES_PER_STEP,
+)
+from backend.database import async_session, engine
+from backend.models import (
+    BatchItem,
+    ComparisonGroup,
+    ComparisonSession,
+    TestInput,
+    TestRecord,
+    UploadedFile,
+)
+from backend.services.jobs import create_job, find_active_job, get_job, job_view, start_job
+
+logger = logging.getLogger(__name__)
+
+
+async def delete_records_cascade(
+    db: AsyncSession,
+    record_ids: list[str],
+    remove_files: bool = True,
+    removed_as: str = "deleted",
+) -> tuple[dict, list[str]]:
+    """
+    在当前事务中级联删除一组测试记录。
+
+    Args:
+        db: 数据库会话
+        record_ids: 要删除的记录 ID（调用方负责控制规模）
+        remove_files: 是否收集需要从磁盘删除的文件路径
+        removed_as: 引用这些记录的批量任务项记为 deleted（删除）或 archived（归档）
+
+    Returns:
+        (各表删除数量, 待删除的磁盘文件相对路径列表)
+    """
+    counts = {"records": 0, "comparison_sessions": 0, "inputs": 0, "files": 0}
+    if not record_ids:
+        return counts, []
+
+    rows = (await db.execute(
+        select(
+            TestRecord.id,
+            TestRecord.test_input_id,
+            TestRecord.comparison_session_id,
+            TestRecord.output_audio_path,
+        ).where(TestRecord.id.in_(record_ids))
+    )).all()
+    if not rows:
+        return counts, []
+
+    ids = [r.id for r in rows]
+    input_ids = {r.test_input_id for r in rows if r.test_input_id}
+    session_ids = {r.comparison_session_id for r in rows if r.comparison_session_id}
+    disk_paths = [r.output_audio_path for r in rows if r.output_audio_path]
+
+    # 1. 对比组 / 批量任务项引用 → 记录
+    await db.execute(delete(ComparisonGroup).where(ComparisonGroup.test_record_id.in_(ids)))
+    await db.execute(
+        update(BatchItem)
+        .where(BatchItem.test_record_id.in_(ids))
+        .values(test_record_id=None, record_removed=removed_as)
+    )
+    result = await db.execute(delete(TestRecord).where(TestRecord.id.in_(ids)))
+    counts["records"] = result.rowcount or 0
+
+    # 2. 已无任何记录的对比会话
+    if session_ids:
+        still_used = set((await db.execute(
+            select(TestRecord.comparison_session_id)
+            .where(TestRecord.comparison_session_id.in_(session_ids))
+            .distinct()
+        )).scalars().all())
+        orphan_sessions = list(session_ids - still_used)
+        if orphan_sessions:
+            session_inputs = (await db.execute(
+                select(ComparisonSession.test_input_id)
+                .where(ComparisonSession.id.in_(orphan_sessions))
+            )).scalars().all()
+            input_ids.update(session_inputs)
+            await db.execute(
+                delete(ComparisonGroup)
+                .where(ComparisonGroup.comparison_session_id.in_(orphan_sessions))
+            )
+            result = await db.execute(
+                delete(ComparisonSession).where(ComparisonSession.id.in_(orphan_sessions))
+            )
+            counts["comparison_sessions"] = result.rowcount or 0
+
+    # 3. 已无引用的输入及其上传文件
+    if input_ids:
+        used_by_records = (await db.execute(
+            select(TestRecord.test_input_id).where(TestRecord.test_input_id.in_(input_ids))
+        )).scalars().all()
+        used_by_sessions = (await db.execute(
+            select(ComparisonSession.test_input_id)
+            .where(ComparisonSession.test_input_id.in_(input_ids))
+        )).scalars().all()
+        orphan_inputs = list(input_ids - set(used_by_records) - set(used_by_sessions))
+        if orphan_inputs:
+            file_paths = (await db.execute(
+                select(UploadedFile.file_path).where(UploadedFile.test_input_id.in_(orphan_inputs))
+            )).scalars().all()
+            disk_paths.extend(file_paths)
+            result = await db.execute(
+                delete(UploadedFile).where(UploadedFile.test_input_id.in_(orphan_inputs))
+            )
+            counts["files"] = result.rowcount or 0
+            result = await db.execute(delete(TestInput).where(TestInput.id.in_(orphan_inputs)))
+            counts["inputs"] = result.rowcount or 0
+
+    return counts, (disk_paths if remove_files else [])
+
+
+def remove_disk_files(paths: list[str]) -> int:
+    """删除 uploads/ 下的文件，返回实际删除的数量（不存在的文件忽略）"""
+    removed = 0
+    upload_root = UPLOAD_DIR.resolve()
+    for rel_path in paths:
+        abs_path = (UPLOAD_DIR / rel_path).resolve()
+        # 防御：只允许删除上传目录内的文件
+        if upload_root not in abs_path.parents:
+            continue
+        try:
+            abs_path.unlink()
+            removed += 1
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"删除文件失败: {abs_path} - {e}")
+    return removed
+
+
+async def start_delete_all_job() -> dict:
+    """启动后台清空任务；已有进行中的任务时直接返回该任务"""
+    job = await find_active_job("delete_all")
+    if job is None:
+        job = create_job(
+            "delete_all",
+            counts={"records": 0, "comparison_sessions": 0, "inputs": 0, "files": 0},
+            disk_files_removed=0,
+        )
+        await start_job(job, _run_delete_all)
+    return job_view(job)
+
+
+async def get_delete_job(job_id: str) -> dict | None:
+    """查询后台删除任务进度"""
+    job = await get_job(job_id, kind="delete_all")
+    return job_view(job) if job else None
+
+
+async def _run_delete_all(job: dict):
+    """按 rowid 区间分块删除全部记录：每块一个短事务，块间让出写锁"""
+    # 只删除任务开始时已存在的记录，新写入的记录不受影响
+    async with async_session() as session:
+        bounds = (await session.execute(
+            text("SELECT COUNT(*), COALESCE(MAX(rowid), 0) FROM test_records")
+        )).one()
+    job["total"], max_rowid = bounds[0], bounds[1]
+
+    last_rowid = 0
+    while last_rowid < max_rowid:
+        async with async_session() as session:
+            chunk = (await session.execute(
+                select(literal_column("rowid"), TestRecord.id)
+                .select_from(TestRecord)
+                .where(literal_column("rowid") > last_rowid)
+                .where(literal_column("rowid") <= max_rowid)
+                .order_by(literal_column("rowid"))
+                .limit(DELETE_CHUNK_SIZE)
+            )).all()
+            if not chunk:
+                break
+            last_rowid = chunk[-1][0]
+
+            counts, disk_paths = await delete_records_cascade(
+                session, [row[1] for row in chunk],
+            )
+            await session.commit()
+
+        for key, value in counts.items():
+            job["counts"][key] += value
+        job["processed"] += counts["records"]
+
+        # 提交成功后再删除磁盘文件，避免回滚导致数据与文件不一致
+        if disk_paths:
+            job["disk_files_removed"] += await asyncio.to_thread(remove_disk_files, disk_paths)
+
+        await asyncio.sleep(DELETE_CHUNK_PAUSE)
+
+    await reclaim_storage()
+
+
+async def reclaim_storage():
+    """分步增量回收空闲页，最后执行 WAL checkpoint 截断日志文件"""
+    async with engine.connect() as conn:
+        auto_vacuum = (await conn.exec_driver_sql("PRAGMA auto_vacuum")).scalar()
+
+    # auto_vacuum=INCREMENTAL(2) 才支持增量回收；旧库需手动 VACUUM 一次才会切换
+    if auto_vacuum == 2:
+        last_free_pages = None
+        while True:
+            async with engine.connect() as conn:
+                free_pages = (await conn.exec_driver_sql("PRAGMA freelist_count")).scalar() or 0
+                # 没有空闲页，或上一步未能推进（例如被其他连接占用）时结束
+                if free_pages <= 0 or free_pages == last_free_pages:
+                    break
+                last_free_pages = free_pages
+                # sqlite3 的 execute 对该 PRAGMA 只单步执行（每次仅回收一页），
+                # 需通过 executescript 执行到底
+                raw_conn = await conn.get_raw_connection()
+                await raw_conn.driver_connection.executescript(
+                    f"PRAGMA incremental_vacuum({VACUUM_PAGES_PER_STEP});"
+                )
+            await asyncio.sleep(DELETE_CHUNK_PAUSE)
+    else:
+        logger.info("数据库未启用 auto_vacuum=INCREMENTAL，跳过增量回收")
+
+    async with engine.connect() as conn:
+        busy, log_pages, checkpointed = (
+            await conn.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+        ).one()
+    if busy:
+        logger.info(f"WAL checkpoint 未能截断（仍有读连接），已回写 {checkpointed}/{log_pages} 页")
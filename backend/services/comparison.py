@@ -2,13 +2,13 @@
 
 import asyncio
 import json
+from contextlib import aclosing
 from typing import AsyncGenerator
 
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from backend.models import (
-    ModelConfig,
     TestInput,
     TestRecord,
     UploadedFile,
@@ -18,8 +18,12 @@ from backend.models import (
     RecordStatus,
     ComparisonStatus,
 )
+from backend.services.cancellation import save_cancelled
+from backend.services.key_pool import model_api_keys
 from backend.services.model_client import stream_chat_completion, build_messages
 from backend.services.file_manager import get_file_base64_url
+from backend.services.runtime_settings import get_model_config
+from backend.services.upstream_limiter import UpstreamCall, UpstreamPriority, get_limiter
 
 
 async def run_comparison(
@@ -27,17 +31,17 @@ async def run_comparison(
     text: str | None,
     file_ids: list[str],
     groups: list[dict],
+    admitted: list[UpstreamCall] | None = None,
 ) -> AsyncGenerator[tuple[str, dict], None]:
     """
     执行双模型对比，返回 (event_type, event_data) 元组流。
+
+    admitted 为 API 层准入控制已为各组获得的上游名额（未获得名额的组为 None），为 None 的组在调用前排队获取。
     """
     # 1. 获取两组模型配置
     model_configs = []
     for g in groups:
-        result = await db.execute(
-            select(ModelConfig).where(ModelConfig.id == g["model_config_id"])
-        )
-        mc = result.scalar_one_or_none()
+        mc = await get_model_config(g["model_config_id"])
         if not mc:
             yield ("error", {"message": f"模型配置未找到: {g['model_config_id']}"})
             return
@@ -98,85 +102,110 @@ async def run_comparison(
         records.append(record)
         comp_groups.append(cg)
 
-    await db.flush()
+    # 尽早提交：调用期间不占用写锁，客户端断开时记录也已落库
+    await db.commit()
 
     # 6. 构建 messages
     messages = build_messages(text=text, file_urls=file_urls if file_urls else None)
 
     # 7. 并行调用两组模型，通过 queue 合并事件
     queue = asyncio.Queue()
+    outputs = [""] * len(records)  # 各组已生成的文本（取消时作为部分输出保存）
 
-    async def stream_group(group_idx, model_config, params, record):
-        full_text = ""
+    async def stream_group(group_idx, model_config, params, record, admitted_call):
         # 解析自定义模型参数
         custom_base = model_config.custom_base_url if model_config.is_custom else None
-        custom_key = model_config.custom_api_key if model_config.is_custom else None
+        custom_keys = model_api_keys(model_config)
 
         try:
-            async for event in stream_chat_completion(
-                model_id=model_config.model_id,
-                messages=messages,
-                params=params,
-                api_key=custom_key,
-                base_url=custom_base,
-            ):
-                event["group"] = group_idx
-                if event["type"] == "token":
-                    full_text += event["text"]
-                await queue.put(event)
-
-            record.output_text = full_text
-            record.status = RecordStatus.SUCCESS
+            async with get_limiter(model_config).slot(
+                UpstreamPriority.COMPARISON, admitted=admitted_call,
+            ) as call:
+                record.queue_wait_ms = call.queue_wait_ms
+                async with aclosing(stream_chat_completion(
+                    model_id=model_config.model_id,
+                    messages=messages,
+                    params=params,
+                    api_key=custom_keys,
+                    base_url=custom_base,
+                    deadlines=model_config.stream_deadlines,
+                )) as events:
+                    async for event in events:
+                        call.observe(event)
+                        event["group"] = group_idx
+                        if event["type"] == "token":
+                            outputs[group_idx] += event["text"]
+                        elif event["type"] == "done":
+                            record.stop_reason = event.get("stop_reason")
+                            record.status = RecordStatus.SUCCESS
+                        elif event["type"] == "error":
+                            record.error_message = event["message"]
+                            record.stop_reason = event.get("stop_reason")
+                            record.status = RecordStatus.TIMEOUT if event.get("is_timeout") else RecordStatus.FAILED
+                        await queue.put(event)
+
+            # 出错时同样保留已生成的部分输出
+            record.output_text = outputs[group_idx]
         except Exception as e:
             record.error_message = str(e)
             record.status = RecordStatus.FAILED
             await queue.put({"type": "error", "group": group_idx, "message": str(e)})
 
-    # 启动两个并行任务
+    # 启动两个并行任务，全部结束后放入哨兵值
     tasks = []
     for idx, (g, mc, record) in enumerate(zip(groups, model_configs, records)):
         merged_params = {**mc.default_params, **(g.get("params") or {})}
         tasks.append(asyncio.create_task(
-            stream_group(idx, mc, merged_params, record)
+            stream_group(idx, mc, merged_params, record, admitted[idx] if admitted else None)
         ))
 
     async def wait_all():
-        await asyncio.gather(*tasks)
+        await asyncio.wait(tasks)
         await queue.put(None)  # 哨兵值
 
-    asyncio.create_task(wait_all())
-
-    while True:
-        event = await queue.get()
-        if event is None:
-            break
-
-        event_type = event.get("type")
-        group = event.get("group", 0)
-
-        if event_type == "token":
-            yield ("token", {"group": group, "text": event["text"]})
-        elif event_type == "audio":
-            yield ("audio", {"group": group, "audio_url": event["audio_url"]})
-        elif event_type == "usage":
-            records[group].token_input = event.get("input_tokens", 0)
-            records[group].token_output = event.get("output_tokens", 0)
-            yield ("usage", {
-                "group": group,
-                "input_tokens": event.get("input_tokens", 0),
-                "output_tokens": event.get("output_tokens", 0),
-            })
-        elif event_type == "done":
-            records[group].response_time_ms = event.get("response_time_ms", 0)
-            # 保留 raw 原始返回
-            raw_chunks = event.get("raw_chunks")
-            if raw_chunks:
-                try:
-                    records[group].raw_response = json.dumps(raw_chunks, ensure_ascii=False)
-                except Exception:
-                    pass
-        elif event_type == "error":
-            yield ("error", {"group": group, "message": event["message"]})
+    waiter = asyncio.create_task(wait_all())
+
+    try:
+        while True:
+            event = await queue.get()
+            if event is None:
+                break
+
+            event_type = event.get("type")
+            group = event.get("group", 0)
+
+            if event_type == "token":
+                yield ("token", {"group": group, "text": event["text"]})
+            elif event_type == "audio":
+                yield ("audio", {"group": group, "audio_url": event["audio_url"]})
+            elif event_type == "usage":
+                records[group].token_input = event.get("input_tokens", 0)
+                records[group].token_output = event.get("output_tokens", 0)
+                yield ("usage", {
+                    "group": group,
+                    "input_tokens": event.get("input_tokens", 0),
+                    "output_tokens": event.get("output_tokens", 0),
+                    "estimated": event.get("estimated", False),
+                })
+            elif event_type == "done":
+                records[group].response_time_ms = event.get("response_time_ms", 0)
+                # 保留 raw 原始返回
+                raw_chunks = event.get("raw_chunks")
+                if raw_chunks:
+                    try:
+                        records[group].raw_response = json.dumps(raw_chunks, ensure_ascii=False)
+                    except Exception:
+                        pass
+            elif event_type == "error":
+                yield ("error", {"group": group, "message": event["message"], "stop_reason": event.get("stop_reason")})
+
+    except (asyncio.CancelledError, GeneratorExit):
+        # 客户端断开：取消两组调用（随之关闭上游连接），待其结束后保存部分输出
+        for task in (*tasks, waiter):
+            task.cancel()
+        session.status = ComparisonStatus.CANCELLED
+        await save_cancelled(records, outputs, comparison_session_id=session.id, tasks=(*tasks, waiter))
+        raise
 
     # 更新 session 状态
     await db.flush()
@@ -0,0 +1,653 @@
+"""流式导出服务：通过服务端游标分批读取记录，逐块编码为 CSV / JSON / JSONL（可选 gzip）
+或按 row group 写入 Parquet（供离线分析）
+
+导出生成器使用独立的数据库会话，内存占用只与缓冲块 / row group 大小有关，与记录总数无关。
+"""
+
+import asyncio
+import csv
+import io
+import json
+import zlib
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import AsyncGenerator, AsyncIterator
+
+from sqlalchemy import and_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.config import EXPORT_FETCH_SIZE, EXPORT_FLUSH_BYTES, PARQUET_ROW_GROUP_SIZE
+from backend.database import async_session
+from backend.models import BatchItem, BatchItemStatus, BatchType, KeywordBatch, ModelConfig, TestRecord
+from backend.services.archive import iter_archived_records, require_pyarrow
+from backend.services.history import build_history_conditions
+
+# (字段名, CSV 表头)
+HISTORY_CSV_COLUMNS = [
+    ("id", "记录ID"),
+    ("created_at", "创建时间"),
+    ("model_name", "模型"),
+    ("status", "状态"),
+    ("prompt_text", "输入"),
+    ("output_text", "输出"),
+    ("token_input", "输入Token"),
+    ("token_output", "输出Token"),
+    ("response_time_ms", "响应耗时(ms)"),
+    ("error_message", "错误信息"),
+]
+
+BATCH_CSV_COLUMNS = [
+    ("keyword", "关键词"),
+    ("status", "状态"),
+    ("output", "输出"),
+    ("token_input", "输入Token"),
+    ("token_output", "输出Token"),
+    ("error_message", "错误信息"),
+    ("duplicate_of", "复用结果序号"),
+]
+
+MATRIX_CSV_COLUMNS = [
+    ("keyword", "关键词"),
+    ("model_name", "模型"),
+    ("variant", "参数组合"),
+    ("status", "状态"),
+    ("output", "输出"),
+    ("token_input", "输入Token"),
+    ("token_output", "输出Token"),
+    ("error_message", "错误信息"),
+    ("duplicate_of", "复用结果序号"),
+]
+
+_MEDIA_TYPES = {
+    "csv": "text/csv",
+    "json": "application/json",
+    "jsonl": "application/x-ndjson",
+}
+
+
+def export_media(fmt: str, compress: bool, basename: str) -> tuple[str, dict]:
+    """返回导出响应的 (media_type, headers)"""
+    filename = f"{basename}.{fmt}"
+    if compress:
+        filename += ".gz"
+        media_type = "application/gzip"
+    else:
+        media_type = _MEDIA_TYPES[fmt]
+    return media_type, {"Content-Disposition": f"attachment; filename={filename}"}
+
+
+async def encode_rows(
+    rows: AsyncIterator[dict],
+    fmt: str,
+    csv_columns: list[tuple[str, str]],
+    compress: bool = False,
+) -> AsyncGenerator[bytes, None]:
+    """
+    将记录流编码为导出格式的字节块。
+
+    Args:
+        rows: 记录字典的异步迭代器
+        fmt: csv / json / jsonl
+        csv_columns: CSV 导出的 (字段名, 表头) 列表
+        compress: 是否以 gzip 压缩输出
+    """
+    compressor = zlib.compressobj(wbits=31) if compress else None  # wbits=31 → gzip 格式
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    if fmt == "csv":
+        writer.writerow([label for _, label in csv_columns])
+    elif fmt == "json":
+        buffer.write("[")
+
+    first = True
+    async for row in rows:
+        if fmt == "csv":
+            writer.writerow([_csv_cell(row.get(key)) for key, _ in csv_columns])
+        elif fmt == "json":
+            buffer.write(("" if first else ",") + json.dumps(row, ensure_ascii=False))
+        else:
+            buffer.write(json.dumps(row, ensure_ascii=False) + "\n")
+        first = False
+
+        if buffer.tell() >= EXPORT_FLUSH_BYTES:
+            chunk = _drain(buffer, compressor)
+            if chunk:
+                yield chunk
+
+    if fmt == "json":
+        buffer.write("]")
+    tail = _drain(buffer, compressor)
+    if compressor:
+        tail += compressor.flush()
+    if tail:
+        yield tail
+
+
+def stream_history_export(
+    fmt: str = "csv",
+    compress: bool = False,
+    model_id: str | None = None,
+    keyword: str | None = None,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    status: str | None = None,
+    include_archived: bool = False,
+) -> AsyncGenerator[bytes, None]:
+    """
+    流式导出历史记录（筛选条件与 list_history 一致）。
+
+    日期范围由调用方在响应开始前用 parse_date_range 解析，格式错误时可直接返回 400。
+    """
+    return encode_rows(
+        _iter_history_rows(model_id, keyword, start, end, status, include_archived),
+        fmt, HISTORY_CSV_COLUMNS, compress,
+    )
+
+
+async def stream_batch_export(
+    db: AsyncSession,
+    batch_id: str,
+    fmt: str = "csv",
+    compress: bool = False,
+    layout: str = "rows",
+) -> AsyncGenerator[bytes, None]:
+    """
+    流式导出批量测试结果；批次不存在时在响应开始前抛出 ValueError。
+
+    Args:
+        layout: rows 每个任务项一行；pivot 每个关键词一行、每个 (模型, 参数组合) 一列，便于横向对比
+    """
+    batch = await db.get(KeywordBatch, batch_id)
+    if not batch:
+        raise ValueError("批量任务未找到")
+
+    if batch.batch_type != BatchType.MATRIX:
+        if layout == "pivot":
+            model_config = await db.get(ModelConfig, batch.model_config_id)
+            label = model_config.name if model_config else batch.model_config_id
+            columns = [("keyword", "关键词"), (label, label)]
+            return encode_rows(_pivot_single_rows(batch_id, label), fmt, columns, compress)
+        return encode_rows(_iter_batch_rows(batch_id), fmt, BATCH_CSV_COLUMNS, compress)
+
+    model_names = dict((await db.execute(
+        select(ModelConfig.id, ModelConfig.name)
+        .where(ModelConfig.id.in_(batch.model_config_ids or []))
+    )).all())
+    variants = batch.param_variants or [{}]
+    if layout == "pivot":
+        combos = _matrix_columns(batch.model_config_ids or [], model_names, variants)
+        columns = [("keyword", "关键词")] + [(label, label) for label in combos.values()]
+        return encode_rows(_iter_matrix_pivot_rows(batch_id, combos), fmt, columns, compress)
+    return encode_rows(
+        _iter_matrix_rows(batch_id, model_names, variants), fmt, MATRIX_CSV_COLUMNS, compress,
+    )
+
+
+async def _iter_history_rows(
+    model_id: str | None,
+    keyword: str | None,
+    start: datetime | None,
+    end: datetime | None,
+    status: str | None,
+    include_archived: bool,
+) -> AsyncGenerator[dict, None]:
+    """按创建时间倒序流式读取历史记录"""
+    conditions = build_history_conditions(model_id, keyword, start, end, status)
+
+    query = (
+        select(
+            TestRecord.id,
+            TestRecord.created_at,
+            TestRecord.model_config_id,
+            ModelConfig.name.label("model_name"),
+            TestRecord.status,
+            TestRecord.prompt_text,
+            TestRecord.output_text,
+            TestRecord.custom_params,
+            TestRecord.token_input,
+            TestRecord.token_output,
+            TestRecord.response_time_ms,
+            TestRecord.error_message,
+            TestRecord.keyword_batch_id,
+            TestRecord.comparison_session_id,
+        )
+        .outerjoin(ModelConfig, TestRecord.model_config_id == ModelConfig.id)
+        .order_by(TestRecord.created_at.desc())
+        .execution_options(yield_per=EXPORT_FETCH_SIZE)
+    )
+    if conditions:
+        query = query.where(and_(*conditions))
+
+    async with async_session() as session:
+        result = await session.stream(query)
+        async for row in result:
+            yield {
+                "id": row.id,
+                "created_at": row.created_at.isoformat() if row.created_at else None,
+                "model_config_id": row.model_config_id,
+                "model_name": row.model_name,
+                "status": row.status.value if hasattr(row.status, 'value') else row.status,
+                "prompt_text": row.prompt_text,
+                "output_text": row.output_text,
+                "params": row.custom_params,
+                "token_input": row.token_input,
+                "token_output": row.token_output,
+                "response_time_ms": row.response_time_ms,
+                "error_message": row.error_message,
+                "keyword_batch_id": row.keyword_batch_id,
+                "comparison_session_id": row.comparison_session_id,
+            }
+
+        if include_archived:
+            async for row in iter_archived_records(
+                session, model_id=model_id, keyword=keyword,
+                start=start, end=end, status=status,
+            ):
+                yield {
+                    "id": row["id"],
+                    "created_at": row.get("created_at"),
+                    "model_config_id": row.get("model_config_id"),
+                    "model_name": (row.get("model") or {}).get("name"),
+                    "status": row.get("status"),
+                    "prompt_text": row.get("prompt_text"),
+                    "output_text": row.get("output_text"),
+                    "params": row.get("custom_params"),
+                    "token_input": row.get("token_input"),
+                    "token_output": row.get("token_output"),
+                    "response_time_ms": row.get("response_time_ms"),
+                    "error_message": row.get("error_message"),
+                    "keyword_batch_id": row.get("keyword_batch_id"),
+                    "comparison_session_id": row.get("comparison_session_id"),
+                    "archived": True,
+                }
+
+
+async def _iter_batch_rows(batch_id: str) -> AsyncGenerator[dict, None]:
+    """按关键词序号流式读取批量结果，尚未执行的关键词以 pending 输出"""
+    async with async_session() as session:
+        has_items = (await session.execute(
+            select(BatchItem.id).where(BatchItem.keyword_batch_id == batch_id).limit(1)
+        )).first()
+        if has_items:
+            result = await session.stream(_batch_item_query(batch_id).order_by(BatchItem.item_index))
+            async for row in result:
+                status = _item_row_status(row)
+                finished = status != "pending" and row.status is not None  # 记录已删除 / 归档时没有结果字段
+                yield {
+                    "keyword": row.keyword,
+                    "status": status,
+                    "output": row.output_text if finished else None,
+                    "token_input": row.token_input if finished else 0,
+                    "token_output": row.token_output if finished else 0,
+                    "error_message": row.error_message if finished else None,
+                    "duplicate_of": row.duplicate_of,
+                }
+            return
+
+        # 尚未补建任务项的旧批次：按记录的关键词序号读取
+        batch = await session.get(KeywordBatch, batch_id)
+        keywords = batch.keywords
+
+        result = await session.stream(
+            select(
+                TestRecord.batch_item_index,
+                TestRecord.output_text,
+                TestRecord.status,
+                TestRecord.token_input,
+                TestRecord.token_output,
+                TestRecord.error_message,
+            )
+            .where(TestRecord.keyword_batch_id == batch_id)
+            .where(TestRecord.batch_item_index.is_not(None))
+            .order_by(TestRecord.batch_item_index, TestRecord.created_at.desc())
+            .execution_options(yield_per=EXPORT_FETCH_SIZE)
+        )
+
+        next_index = 0
+        async for row in result:
+            index = row.batch_item_index
+            # 同一序号有多条记录时（重试）只输出最新的一条
+            if index < next_index or index >= len(keywords):
+                continue
+            for keyword in keywords[next_index:index]:
+                yield _pending_batch_row(keyword)
+            yield {
+                "keyword": keywords[index],
+                "status": row.status.value if hasattr(row.status, 'value') else row.status,
+                "output": row.output_text,
+                "token_input": row.token_input,
+                "token_output": row.token_output,
+                "error_message": row.error_message,
+                "duplicate_of": None,
+            }
+            next_index = index + 1
+
+        for keyword in keywords[next_index:]:
+            yield _pending_batch_row(keyword)
+
+
+async def _pivot_single_rows(batch_id: str, label: str) -> AsyncGenerator[dict, None]:
+    """单模型批次的透视导出：关键词 + 一列输出"""
+    async for row in _iter_batch_rows(batch_id):
+        yield {"keyword": row["keyword"], label: _pivot_cell(row["status"], row["output"], row["error_message"])}
+
+
+def _matrix_columns(
+    model_ids: list[str],
+    model_names: dict[str, str],
+    variants: list[dict],
+) -> dict[tuple[str, int], str]:
+    """矩阵批次的 (模型, 参数组合序号) → 列名，按创建时的模型与参数组合顺序排列"""
+    columns = {}
+    for model_id in model_ids:
+        name = model_names.get(model_id, model_id)
+        for variant_index, variant in enumerate(variants):
+            columns[(model_id, variant_index)] = (
+                f"{name} | {_variant_label(variant, variant_index)}" if len(variants) > 1 else name
+            )
+    return columns
+
+
+def _variant_label(variant: dict, variant_index: int) -> str:
+    """参数组合的简短描述，如 temperature=0.2, top_p=0.9"""
+    if not variant:
+        return f"参数组合{variant_index + 1}（默认）"
+    return ", ".join(f"{key}={value}" for key, value in variant.items())
+
+
+# 透视表中非成功的终态单元格的状态标签
+_PIVOT_STATUS_LABELS = {
+    "failed": "失败",
+    "timeout": "超时",
+    "cancelled": "已取消",
+    "deleted": "记录已删除",
+    "archived": "记录已归档",
+}
+
+
+def _pivot_cell(status: str, output: str | None, error_message: str | None) -> str | None:
+    """透视表单元格：成功为输出，其余终态为状态标签（及错误信息），未执行或执行中为空"""
+    if status == "success":
+        return output
+    if status in ("pending", "running"):
+        return None
+    label = f"[{_PIVOT_STATUS_LABELS.get(status, status)}]"
+    return f"{label} {error_message}" if error_message else label
+
+
+def _batch_item_query(batch_id: str):
+    """批次任务项及其最近一次执行记录（重复项为原始项的记录）"""
+    return (
+        select(
+            BatchItem.keyword_index,
+            BatchItem.keyword,
+            BatchItem.model_config_id,
+            BatchItem.variant_index,
+            BatchItem.duplicate_of,
+            BatchItem.status.label("item_status"),
+            BatchItem.record_removed,
+            TestRecord.status,
+            TestRecord.output_text,
+            TestRecord.token_input,
+            TestRecord.token_output,
+            TestRecord.error_message,
+        )
+        .outerjoin(TestRecord, TestRecord.id == BatchItem.test_record_id)
+        .where(BatchItem.keyword_batch_id == batch_id)
+        .execution_options(yield_per=EXPORT_FETCH_SIZE)
+    )
+
+
+def _item_row_status(row) -> str:
+    """任务项已结束时取记录状态（记录已删除 / 归档时为 deleted / archived），否则为 pending"""
+    if row.item_status in (BatchItemStatus.DONE, BatchItemStatus.FAILED):
+        if row.status is not None:
+            return row.status.value if hasattr(row.status, 'value') else row.status
+        if row.record_removed:
+            return row.record_removed
+    return "pending"
+
+
+async def _iter_matrix_rows(
+    batch_id: str,
+    model_names: dict[str, str],
+    variants: list[dict],
+) -> AsyncGenerator[dict, None]:
+    """按关键词、模型、参数组合顺序流式读取矩阵批次的每个任务项"""
+    async with async_session() as session:
+        result = await session.stream(
+            _batch_item_query(batch_id).order_by(BatchItem.keyword_index, BatchItem.item_index)
+        )
+        async for row in result:
+            status = _item_row_status(row)
+            finished = status != "pending" and row.status is not None  # 记录已删除 / 归档时没有结果字段
+            variant_index = row.variant_index or 0
+            yield {
+                "keyword": row.keyword,
+                "model_config_id": row.model_config_id,
+                "model_name": model_names.get(row.model_config_id, row.model_config_id),
+                "variant_index": variant_index,
+                "variant": variants[variant_index] if variant_index < len(variants) else {},
+                "status": status,
+                "output": row.output_text if finished else None,
+                "token_input": row.token_input if finished else 0,
+                "token_output": row.token_output if finished else 0,
+                "error_message": row.error_message if finished else None,
+                "duplicate_of": row.duplicate_of,
+            }
+
+
+async def _iter_matrix_pivot_rows(
+    batch_id: str,
+    columns: dict[tuple[str, int], str],
+) -> AsyncGenerator[dict, None]:
+    """按关键词序号流式读取，同一关键词的各任务项合并为一行"""
+    async with async_session() as session:
+        result = await session.stream(
+            _batch_item_query(batch_id).order_by(BatchItem.keyword_index, BatchItem.item_index)
+        )
+        current_index, current = None, None
+        async for row in result:
+            if row.keyword_index != current_index:
+                if current is not None:
+                    yield current
+                current_index = row.keyword_index
+                current = {"keyword": row.keyword, **{label: None for label in columns.values()}}
+            label = columns.get((row.model_config_id, row.variant_index or 0))
+            if label:
+                current[label] = _pivot_cell(_item_row_status(row), row.output_text, row.error_message)
+        if current is not None:
+            yield current
+
+
+def _pending_batch_row(keyword: str) -> dict:
+    """尚未执行的关键词"""
+    return {
+        "keyword": keyword,
+        "status": "pending",
+        "output": None,
+        "token_input": 0,
+        "token_output": 0,
+        "error_message": None,
+        "duplicate_of": None,
+    }
+
+
+async def write_parquet_export(
+    dest: Path,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    model_id: str | None = None,
+    batch_id: str | None = None,
+    partition_by_day: bool = False,
+) -> dict:
+    """
+    将测试记录（关联模型名称、参数、Token、耗时、状态）导出为 Parquet。
+
+    按创建时间升序流式读取，每 PARQUET_ROW_GROUP_SIZE 行写入一个 row group。
+    partition_by_day=True 时 dest 为目录，按 Hive 风格写入 date=YYYY-MM-DD/part-0.parquet；
+    否则 dest 为单个文件。
+
+    Returns:
+        {"rows": 导出行数, "files": [写出的文件路径]}
+    """
+    pa, pq = require_pyarrow()
+    schema = _parquet_schema(pa)
+
+    conditions = build_history_conditions(model_id=model_id, start=start, end=end)
+    if batch_id:
+        conditions.append(TestRecord.keyword_batch_id == batch_id)
+
+    query = (
+        select(
+            TestRecord.id,
+            TestRecord.created_at,
+            TestRecord.model_config_id,
+            ModelConfig.name.label("model_name"),
+            ModelConfig.model_id.label("model_id"),
+            ModelConfig.provider,
+            TestRecord.status,
+            TestRecord.custom_params,
+            TestRecord.prompt_text,
+            TestRecord.output_text,
+            TestRecord.token_input,
+            TestRecord.token_output,
+            TestRecord.response_time_ms,
+            TestRecord.error_message,
+            TestRecord.keyword_batch_id,
+            TestRecord.comparison_session_id,
+        )
+        .outerjoin(ModelConfig, TestRecord.model_config_id == ModelConfig.id)
+        .order_by(TestRecord.created_at)
+        .execution_options(yield_per=EXPORT_FETCH_SIZE)
+    )
+    if conditions:
+        query = query.where(and_(*conditions))
+
+    files: list[str] = []
+    total_rows = 0
+    writer = None
+    current_day = None
+    buffer: list[dict] = []
+
+    async def flush():
+        if buffer:
+            table = pa.Table.from_pylist(buffer, schema=schema)
+            await asyncio.to_thread(writer.write_table, table, row_group_size=PARQUET_ROW_GROUP_SIZE)
+            buffer.clear()
+
+    def open_writer(path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        files.append(str(path))
+        return pq.ParquetWriter(path, schema, compression="zstd")
+
+    try:
+        if not partition_by_day:
+            writer = open_writer(dest)
+
+        async with async_session() as session:
+            result = await session.stream(query)
+            async for row in result:
+                created_at = row.created_at.replace(tzinfo=timezone.utc) if row.created_at else None
+                if partition_by_day:
+                    day = created_at.strftime("%Y-%m-%d") if created_at else "unknown"
+                    # 升序读取，日期变化时关闭上一天的文件（任意时刻只打开一个 writer）
+                    if day != current_day:
+                        if writer:
+                            await flush()
+                            writer.close()
+                        writer = open_writer(dest / f"date={day}" / "part-0.parquet")
+                        current_day = day
+
+                params = row.custom_params or {}
+                buffer.append({
+                    "id": row.id,
+                    "created_at": created_at,
+                    "model_config_id": row.model_config_id,
+                    "model_name": row.model_name,
+                    "model_id": row.model_id,
+                    "provider": row.provider,
+                    "status": row.status.value if hasattr(row.status, 'value') else row.status,
+                    "temperature": _as_float(params.get("temperature")),
+                    "max_tokens": _as_int(params.get("max_tokens")),
+                    "top_p": _as_float(params.get("top_p")),
+                    "params": json.dumps(params, ensure_ascii=False),
+                    "prompt_text": row.prompt_text,
+                    "output_text": row.output_text,
+                    "token_input": row.token_input,
+                    "token_output": row.token_output,
+                    "response_time_ms": row.response_time_ms,
+                    "error_message": row.error_message,
+                    "keyword_batch_id": row.keyword_batch_id,
+                    "comparison_session_id": row.comparison_session_id,
+                })
+                total_rows += 1
+                if len(buffer) >= PARQUET_ROW_GROUP_SIZE:
+                    await flush()
+
+        if writer:
+            await flush()
+    finally:
+        if writer:
+            writer.close()
+
+    return {"rows": total_rows, "files": files}
+
+
+def _parquet_schema(pa):
+    """Parquet 导出的固定 schema（保证各分区文件 schema 一致）"""
+    return pa.schema([
+        ("id", pa.string()),
+        ("created_at", pa.timestamp("us", tz="UTC")),
+        ("model_config_id", pa.string()),
+        ("model_name", pa.string()),
+        ("model_id", pa.string()),
+        ("provider", pa.string()),
+        ("status", pa.string()),
+        ("temperature", pa.float64()),
+        ("max_tokens", pa.int64()),
+        ("top_p", pa.float64()),
+        ("params", pa.string()),
+        ("prompt_text", pa.string()),
+        ("output_text", pa.string()),
+        ("token_input", pa.int64()),
+        ("token_output", pa.int64()),
+        ("response_time_ms", pa.int64()),
+        ("error_message", pa.string()),
+        ("keyword_batch_id", pa.string()),
+        ("comparison_session_id", pa.string()),
+    ])
+
+
+def _as_float(value) -> float | None:
+    """参数值转 float，无法转换时返回 None"""
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _as_int(value) -> int | None:
+    """参数值转 int，无法转换时返回 None"""
+    try:
+        return int(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _csv_cell(value):
+    """CSV 单元格：None 输出为空，dict/list 输出为 JSON"""
+    if value is None:
+        return ""
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+
+def _drain(buffer: io.StringIO, compressor) -> bytes:
+    """取出缓冲区内容并清空，按需压缩"""
+    data = buffer.getvalue().encode("utf-8")
+    buffer.seek(0)
+    buffer.truncate(0)
+    return compressor.compress(data) if compressor else data
@@ -0,0 +1,208 @@
+"""对冲请求：单次推理的首 token 迟迟未到时，向同一或等价模型再发一份请求
+
+- 等待时间取该模型最近首 token 延迟的 HEDGE_PERCENTILE 分位数（样本不足时用 HEDGE_DEFAULT_DELAY）
+- 先产生输出（token 或完成）的请求胜出，另一份立即取消（关闭上游连接）
+- 对冲请求不排队：上游没有空闲名额时放弃对冲；每个模型最近请求中的对冲比例不超过 HEDGE_MAX_RATE
+- 对冲次数与胜负按模型统计，通过 /api/upstream/hedging 查看
+"""
+
+import asyncio
+from collections import deque
+from contextlib import aclosing
+from typing import AsyncGenerator, Callable
+
+from backend.config import (
+    HEDGE_DEFAULT_DELAY,
+    HEDGE_MAX_RATE,
+    HEDGE_MIN_DELAY,
+    HEDGE_MIN_SAMPLES,
+    HEDGE_PERCENTILE,
+    HEDGE_RATE_WINDOW,
+)
+from backend.models import ModelConfig
+from backend.services.jobs import spawn
+from backend.services.upstream_limiter import AdaptiveLimiter, UpstreamCall, UpstreamPriority, get_limiter
+
+# 主请求与对冲请求在合并队列中的编号
+PRIMARY = 0
+HEDGE = 1
+
+
+class HedgeStats:
+    """单个模型的对冲统计"""
+
+    def __init__(self, model_config_id: str):
+        self.model_config_id = model_config_id
+        self.requests = 0
+        self.hedged = 0
+        self.won = 0    # 对冲请求胜出
+        self.lost = 0   # 主请求胜出
+        self.skipped_rate = 0      # 超过对冲比例上限而放弃
+        self.skipped_capacity = 0  # 上游没有空闲名额而放弃
+        self._recent: deque[bool] = deque(maxlen=HEDGE_RATE_WINDOW)
+
+    def record(self, hedged: bool, hedge_won: bool):
+        """记录一次请求的结果"""
+        self._recent.append(hedged)
+        if hedged:
+            if hedge_won:
+                self.won += 1
+            else:
+                self.lost += 1
+
+    def hedge_rate(self) -> float:
+        """最近请求中发起对冲的比例"""
+        return sum(self._recent) / len(self._recent) if self._recent else 0.0
+
+    def snapshot(self) -> dict:
+        """当前统计"""
+        return {
+            "model_config_id": self.model_config_id,
+            "requests": self.requests,
+            "hedged": self.hedged,
+            "won": self.won,
+            "lost": self.lost,
+            "skipped_rate": self.skipped_rate,
+            "skipped_capacity": self.skipped_capacity,
+            "hedge_rate": round(self.hedge_rate(), 4),
+        }
+
+
+# model_config_id → 统计
+_stats: dict[str, HedgeStats] = {}
+
+
+def get_hedge_stats(model_config_id: str) -> HedgeStats:
+    """获取模型的对冲统计"""
+    stats = _stats.get(model_config_id)
+    if stats is None:
+        stats = _stats[model_config_id] = HedgeStats(model_config_id)
+    return stats
+
+
+def list_hedge_stats() -> list[dict]:
+    """全部模型的对冲统计（本进程）"""
+    return [stats.snapshot() for stats in _stats.values()]
+
+
+def hedge_delay(limiter: AdaptiveLimiter) -> float:
+    """发起对冲前等待首 token 的时间（秒）"""
+    if len(limiter.ttft_window) < HEDGE_MIN_SAMPLES:
+        return HEDGE_DEFAULT_DELAY
+    return max(limiter.ttft_percentile(HEDGE_PERCENTILE) / 1000, HEDGE_MIN_DELAY)
+
+
+async def _pump(
+    lane: int,
+    events: AsyncGenerator[dict, None],
+    merged: asyncio.Queue,
+    call: UpstreamCall,
+    release: bool = False,
+):
+    """把一路请求的事件转入合并队列（并记录到该路的名额上），结束时放入 (lane, None)"""
+    try:
+        async with aclosing(events):
+            async for event in events:
+                call.observe(event)
+                merged.put_nowait((lane, event))
+    finally:
+        if release:
+            call.release()
+        merged.put_nowait((lane, None))
+
+
+async def hedged_stream(
+    primary: AsyncGenerator[dict, None],
+    primary_call: UpstreamCall,
+    model_config: ModelConfig,
+    make_hedge: Callable[[], AsyncGenerator[dict, None]],
+    hedge_model_config: ModelConfig | None = None,
+) -> AsyncGenerator[dict, None]:
+    """
+    带对冲的事件流：主请求超过等待时间仍无输出时发起对冲，输出先到的一路。
+
+    两路事件都在这里记录到各自的名额上，调用方不必再观测；
+    主请求的名额由调用方释放，对冲请求不排队地获取并自行释放名额。
+    确定胜者后先产出 {"type": "hedge", "winner": "primary" | "hedge", "model_config_id": ...}
+    （仅在发起了对冲时），再产出胜者的全部事件。
+
+    Args:
+        primary: 主请求的事件流
+        primary_call: 主请求持有的名额
+        model_config: 主请求的模型
+        make_hedge: 创建对冲请求事件流
+        hedge_model_config: 对冲使用的等价模型（为空时与主请求相同）
+    """
+    hedge_model_config = hedge_model_config or model_config
+    stats = get_hedge_stats(model_config.id)
+    stats.requests += 1
+    loop = asyncio.get_running_loop()
+    hedge_at = loop.time() + hedge_delay(get_limiter(model_config))
+
+    merged: asyncio.Queue = asyncio.Queue()
+    pumps = {PRIMARY: spawn(_pump(PRIMARY, primary, merged, primary_call))}
+    buffered: dict[int, list[dict]] = {PRIMARY: []}
+    finished: set[int] = set()
+    hedge_tried = False
+    winner = None
+
+    try:
+        # 阶段一：等待某一路先产生输出
+        while winner is None:
+            timeout = None if hedge_tried else max(hedge_at - loop.time(), 0)
+            try:
+                lane, event = await asyncio.wait_for(merged.get(), timeout)
+            except asyncio.TimeoutError:
+                hedge_tried = True
+                if stats.hedge_rate() >= HEDGE_MAX_RATE:
+                    stats.skipped_rate += 1
+                    continue
+                call = get_limiter(hedge_model_config).try_acquire(UpstreamPriority.INTERACTIVE)
+                if call is None:
+                    stats.skipped_capacity += 1
+                    continue
+                stats.hedged += 1
+                buffered[HEDGE] = []
+                pumps[HEDGE] = spawn(_pump(HEDGE, make_hedge(), merged, call, release=True))
+                continue
+
+            if event is None:
+                # 该路未产生输出即结束（出错）：另一路仍在运行时等待另一路，否则以它的结果为准
+                finished.add(lane)
+                if len(finished) < len(pumps):
+                    buffered.pop(lane)
+                    continue
+                winner = lane
+                break
+            buffered[lane].append(event)
+            if event["type"] in ("token", "done"):
+                winner = lane
+
+        stats.record(HEDGE in pumps, winner == HEDGE)
+        if HEDGE in pumps:
+            yield {
+                "type": "hedge",
+                "winner": "hedge" if winner == HEDGE else "primary",
+                "model_config_id": (hedge_model_config if winner == HEDGE else model_config).id,
+            }
+
+        # 取消落败的一路（随之关闭上游连接）
+        for lane, task in pumps.items():
+            if lane != winner:
+                task.cancel()
+
+        # 阶段二：输出胜者已缓冲的事件，再继续转发直到结束
+        for event in buffered.get(winner, []):
+            yield event
+        if winner in finished:
+            return
+        while True:
+            lane, event = await merged.get()
+            if lane != winner:
+                continue
+            if event is None:
+                return
+            yield event
+    finally:
+        for task in pumps.values():
+            task.cancel()
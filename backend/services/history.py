@@ -1,12 +1,58 @@
 """历史记录 CRUD 服务"""
 
+import asyncio
 from datetime import datetime
 
-from sqlalchemy import select, func, delete, and_, or_
+from sqlalchemy import select, func, and_, or_
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
+from backend.config import DELETE_CHUNK_SIZE
 from backend.models import TestRecord, TestInput, ModelConfig, UploadedFile, RecordStatus
+from backend.services.archive import (
+    forget_archived_record,
+    get_archived_record_detail,
+    search_archive,
+)
+from backend.services.cleanup import delete_records_cascade, remove_disk_files
+
+
+def parse_date_range(
+    start_date: str | None,
+    end_date: str | None,
+) -> tuple[datetime | None, datetime | None]:
+    """解析日期筛选参数（结束日期包含当天），格式错误时抛出 ValueError"""
+    try:
+        start = datetime.fromisoformat(start_date) if start_date else None
+        end = datetime.fromisoformat(end_date + "T23:59:59") if end_date else None
+    except ValueError:
+        raise ValueError("日期格式错误，应为 YYYY-MM-DD")
+    return start, end
+
+
+def build_history_conditions(
+    model_id: str | None = None,
+    keyword: str | None = None,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    status: str | None = None,
+) -> list:
+    """构建历史记录筛选条件（列表查询与导出共用）"""
+    conditions = []
+    if model_id:
+        conditions.append(TestRecord.model_config_id == model_id)
+    if status:
+        conditions.append(TestRecord.status == status)
+    if keyword:
+        conditions.append(or_(
+            TestRecord.prompt_text.ilike(f"%{keyword}%"),
+            TestRecord.output_text.ilike(f"%{keyword}%"),
+        ))
+    if start:
+        conditions.append(TestRecord.created_at >= start)
+    if end:
+        conditions.append(TestRecord.created_at <= end)
+    return conditions
 
 
 async def list_history(
@@ -18,27 +64,20 @@ async def list_history(
     start_date: str | None = None,
     end_date: str | None = None,
     status: str | None = None,
+    include_archived: bool = False,
 ) -> dict:
-    """分页查询历史记录"""
+    """分页查询历史记录
+
+    include_archived=True 时在在线记录之后接续归档记录（归档记录均早于在线记录，
+    按时间倒序拼接即可保持整体有序）。
+    """
     query = select(TestRecord).options(
         selectinload(TestRecord.model_config),
         selectinload(TestRecord.test_input).selectinload(TestInput.uploaded_files),
     )
 
-    conditions = []
-    if model_id:
-        conditions.append(TestRecord.model_config_id == model_id)
-    if status:
-        conditions.append(TestRecord.status == status)
-    if keyword:
-        conditions.append(or_(
-            TestRecord.prompt_text.ilike(f"%{keyword}%"),
-            TestRecord.output_text.ilike(f"%{keyword}%"),
-        ))
-    if start_date:
-        conditions.append(TestRecord.created_at >= datetime.fromisoformat(start_date))
-    if end_date:
-        conditions.append(TestRecord.created_at <= datetime.fromisoformat(end_date + "T23:59:59"))
+    start, end = parse_date_range(start_date, end_date)
+    conditions = build_history_conditions(model_id, keyword, start, end, status)
 
     if conditions:
         query = query.where(and_(*conditions))
@@ -51,17 +90,32 @@ async def list_history(
     total = total_result.scalar() or 0
 
     # 分页
+    offset = (page - 1) * page_size
     query = query.order_by(TestRecord.created_at.desc())
-    query = query.offset((page - 1) * page_size).limit(page_size)
-
-    result = await db.execute(query)
-    records = result.scalars().unique().all()
+    query = query.offset(offset).limit(page_size)
+
+    records = []
+    if offset < total:
+        result = await db.execute(query)
+        records = result.scalars().unique().all()
+    summaries = [_format_record_summary(r) for r in records]
+
+    if include_archived:
+        archived_total, archived = await search_archive(
+            db,
+            offset=max(0, offset - total),
+            limit=page_size - len(summaries),
+            model_id=model_id, keyword=keyword,
+            start=start, end=end, status=status,
+        )
+        total += archived_total
+        summaries.extend(archived)
 
     return {
         "total": total,
         "page": page,
         "page_size": page_size,
-        "records": [_format_record_summary(r) for r in records],
+        "records": summaries,
     }
 
 
@@ -77,37 +131,41 @@ async def get_record_detail(db: AsyncSession, record_id: str) -> dict | None:
     )
     record = result.scalar_one_or_none()
     if not record:
-        return None
+        # 不在在线库中时回读归档
+        return await get_archived_record_detail(db, record_id)
     return _format_record_detail(record)
 
 
 async def delete_record(db: AsyncSession, record_id: str) -> bool:
-    """删除单条历史记录"""
-    result = await db.execute(
-        select(TestRecord).where(TestRecord.id == record_id)
-    )
-    record = result.scalar_one_or_none()
-    if not record:
-        return False
-    await db.delete(record)
+    """删除单条历史记录（级联清理输入、上传文件与对比会话）"""
+    counts, disk_paths = await delete_records_cascade(db, [record_id])
+    if not counts["records"]:
+        return await forget_archived_record(db, record_id)
+    await db.commit()
+    if disk_paths:
+        await asyncio.to_thread(remove_disk_files, disk_paths)
     return True
 
 
 async def batch_delete_records(
     db: AsyncSession,
     record_ids: list[str] | None = None,
-    delete_all: bool = False,
 ) -> int:
-    """批量删除历史记录"""
-    if delete_all:
-        result = await db.execute(delete(TestRecord))
-        return result.rowcount
-    elif record_ids:
-        result = await db.execute(
-            delete(TestRecord).where(TestRecord.id.in_(record_ids))
-        )
-        return result.rowcount
-    return 0
+    """按 ID 批量删除历史记录，按块提交以缩短写锁占用时间
+
+    清空全部记录请使用后台任务 cleanup.start_delete_all_job。
+    """
+    if not record_ids:
+        return 0
+
+    deleted = 0
+    for i in range(0, len(record_ids), DELETE_CHUNK_SIZE):
+        counts, disk_paths = await delete_records_cascade(db, record_ids[i:i + DELETE_CHUNK_SIZE])
+        await db.commit()
+        deleted += counts["records"]
+        if disk_paths:
+            await asyncio.to_thread(remove_disk_files, disk_paths)
+    return deleted
 
 
 def _format_record_summary(record: TestRecord) -> dict:
@@ -163,6 +221,8 @@ def _format_record_detail(record: TestRecord) -> dict:
         "token_input": record.token_input,
         "token_output": record.token_output,
         "response_time_ms": record.response_time_ms,
+        "queue_wait_ms": record.queue_wait_ms,
+        "stop_reason": record.stop_reason,
         "status": record.status.value if hasattr(record.status, 'value') else record.status,
         "error_message": record.error_message,
         "raw_response": record.raw_response,
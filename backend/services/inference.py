@@ -1,11 +1,14 @@
 """单次推理服务：接收多模态输入、构建 API 请求、流式调用模型、保存 TestRecord"""
 
+import asyncio
 import json
+from contextlib import aclosing
 from typing import AsyncGenerator
 
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from backend.config import HEDGE_ENABLED
 from backend.models import (
     ModelConfig,
     TestInput,
@@ -14,8 +17,13 @@ from backend.models import (
     InputType,
     RecordStatus,
 )
+from backend.services.cancellation import save_cancelled
 from backend.services.model_client import stream_chat_completion, build_messages
 from backend.services.file_manager import get_file_base64_url
+from backend.services.hedging import hedged_stream
+from backend.services.key_pool import model_api_keys
+from backend.services.runtime_settings import get_model_config
+from backend.services.upstream_limiter import UpstreamCall, UpstreamPriority, get_limiter
 
 
 async def run_inference(
@@ -24,25 +32,35 @@ async def run_inference(
     text: str | None = None,
     file_ids: list[str] | None = None,
     params: dict | None = None,
+    admitted: UpstreamCall | None = None,
+    hedge: bool | None = None,
+    hedge_model_config_id: str | None = None,
+    stop_rules: list[dict] | None = None,
 ) -> AsyncGenerator[tuple[str, dict], None]:
     """
     执行单次推理，返回 (event_type, event_data) 元组流。
 
+    admitted 为 API 层准入控制已获得的上游名额，为空时在调用前排队获取。
+    hedge 为真（为空时取 HEDGE_ENABLED）时，首 token 迟迟未到会向同一模型
+    或 hedge_model_config_id 指定的等价模型再发一份请求，采用先到的结果。
+    stop_rules 为已校验的停止规则，命中时提前结束（记录的 stop_reason 为 "rule_<type>"）。
+
     Yields:
         (event_type, event_data): 如 ("token", {"text": "..."})
     """
     # 1. 获取模型配置
-    result = await db.execute(
-        select(ModelConfig).where(ModelConfig.id == model_config_id)
-    )
-    model_config = result.scalar_one_or_none()
+    model_config = await get_model_config(model_config_id)
     if not model_config:
         yield ("error", {"message": "模型配置未找到"})
         return
 
-    # 2. 解析自定义模型的 base_url / api_key
-    custom_base_url = model_config.custom_base_url if model_config.is_custom else None
-    custom_api_key = model_config.custom_api_key if model_config.is_custom else None
+    hedge = HEDGE_ENABLED if hedge is None else hedge
+    hedge_model_config = None
+    if hedge and hedge_model_config_id:
+        hedge_model_config = await get_model_config(hedge_model_config_id)
+        if not hedge_model_config:
+            yield ("error", {"message": "对冲模型配置未找到"})
+            return
 
     # 3. 处理输入内容 — 将本地文件转为 base64 data URL 供模型 API 使用
     file_urls = []
@@ -81,9 +99,9 @@ async def run_inference(
     db.add(test_record)
     await db.flush()
 
-    # 6. 更新状态为 running
+    # 6. 更新状态为 running，尽早提交：调用期间不占用写锁，客户端断开时记录也已落库
     test_record.status = RecordStatus.RUNNING
-    await db.flush()
+    await db.commit()
 
     # 7. 构建 messages 并调用模型
     messages = build_messages(text=text, file_urls=file_urls if file_urls else None)
@@ -93,66 +111,100 @@ async def run_inference(
     output_tokens = 0
     response_time_ms = 0
 
-    try:
-        async for event in stream_chat_completion(
-            model_id=model_config.model_id,
+    def open_stream(config: ModelConfig) -> AsyncGenerator[dict, None]:
+        """向指定模型发起流式调用（自定义模型使用其 base_url 与 Key 池）"""
+        return stream_chat_completion(
+            model_id=config.model_id,
             messages=messages,
             params=merged_params,
-            api_key=custom_api_key,
-            base_url=custom_base_url,
-        ):
-            event_type = event.get("type")
-
-            if event_type == "token":
-                full_text += event["text"]
-                yield ("token", {"text": event["text"]})
-
-            elif event_type == "audio":
-                yield ("audio", {"audio_url": event["audio_url"]})
-
-            elif event_type == "usage":
-                input_tokens = event.get("input_tokens", 0)
-                output_tokens = event.get("output_tokens", 0)
-                yield ("usage", {
-                    "input_tokens": input_tokens,
-                    "output_tokens": output_tokens,
-                })
+            api_key=model_api_keys(config),
+            base_url=config.custom_base_url if config.is_custom else None,
+            deadlines=config.stream_deadlines,
+            stop_rules=stop_rules,
+        )
 
-            elif event_type == "done":
-                response_time_ms = event.get("response_time_ms", 0)
-                raw_chunks = event.get("raw_chunks")
-
-                # 更新记录
-                test_record.output_text = full_text
-                test_record.token_input = input_tokens
-                test_record.token_output = output_tokens
-                test_record.response_time_ms = response_time_ms
-                test_record.status = RecordStatus.SUCCESS
-
-                # 保留 raw 原始返回（调试用）
-                if raw_chunks:
-                    try:
-                        test_record.raw_response = json.dumps(raw_chunks, ensure_ascii=False)
-                    except Exception:
-                        pass
-
-                await db.flush()
-
-                yield ("done", {
-                    "record_id": test_record.id,
-                    "response_time_ms": response_time_ms,
-                })
-
-            elif event_type == "error":
-                response_time_ms = event.get("response_time_ms", 0)
-                is_timeout = event.get("is_timeout", False)
-                test_record.error_message = event["message"]
-                test_record.response_time_ms = response_time_ms
-                test_record.status = RecordStatus.TIMEOUT if is_timeout else RecordStatus.FAILED
-                test_record.output_text = full_text
-                await db.flush()
-
-                yield ("error", {"message": event["message"]})
+    try:
+        # 单次推理优先级最高，并可使用上游名额中的预留部分
+        async with get_limiter(model_config).slot(UpstreamPriority.INTERACTIVE, admitted=admitted) as call:
+            test_record.queue_wait_ms = call.queue_wait_ms
+            events = open_stream(model_config)
+            if hedge:
+                # 对冲时两路事件由 hedged_stream 记录到各自的名额上
+                events = hedged_stream(
+                    events, call, model_config,
+                    lambda: open_stream(hedge_model_config or model_config),
+                    hedge_model_config,
+                )
+            async with aclosing(events) as events:
+                async for event in events:
+                    if not hedge:
+                        call.observe(event)
+                    event_type = event.get("type")
+
+                    if event_type == "hedge":
+                        # 结果来自等价模型时，记录归属实际应答的模型
+                        test_record.model_config_id = event["model_config_id"]
+                        yield ("hedge", {"winner": event["winner"], "model_config_id": event["model_config_id"]})
+
+                    elif event_type == "token":
+                        full_text += event["text"]
+                        yield ("token", {"text": event["text"]})
+
+                    elif event_type == "audio":
+                        yield ("audio", {"audio_url": event["audio_url"]})
+
+                    elif event_type == "usage":
+                        input_tokens = event.get("input_tokens", 0)
+                        output_tokens = event.get("output_tokens", 0)
+                        yield ("usage", {
+                            "input_tokens": input_tokens,
+                            "output_tokens": output_tokens,
+                            "estimated": event.get("estimated", False),
+                        })
+
+                    elif event_type == "done":
+                        response_time_ms = event.get("response_time_ms", 0)
+                        raw_chunks = event.get("raw_chunks")
+
+                        # 更新记录
+                        test_record.output_text = full_text
+                        test_record.token_input = input_tokens
+                        test_record.token_output = output_tokens
+                        test_record.response_time_ms = response_time_ms
+                        test_record.stop_reason = event.get("stop_reason")
+                        test_record.status = RecordStatus.SUCCESS
+
+                        # 保留 raw 原始返回（调试用）
+                        if raw_chunks:
+                            try:
+                                test_record.raw_response = json.dumps(raw_chunks, ensure_ascii=False)
+                            except Exception:
+                                pass
+
+                        await db.flush()
+
+                        yield ("done", {
+                            "record_id": test_record.id,
+                            "response_time_ms": response_time_ms,
+                            "stop_reason": test_record.stop_reason,
+                        })
+
+                    elif event_type == "error":
+                        response_time_ms = event.get("response_time_ms", 0)
+                        is_timeout = event.get("is_timeout", False)
+                        test_record.error_message = event["message"]
+                        test_record.response_time_ms = response_time_ms
+                        test_record.status = RecordStatus.TIMEOUT if is_timeout else RecordStatus.FAILED
+                        test_record.stop_reason = event.get("stop_reason")
+                        test_record.output_text = full_text  # 保留已生成的部分输出
+                        await db.flush()
+
+                        yield ("error", {"message": event["message"], "stop_reason": event.get("stop_reason")})
+
+    except (asyncio.CancelledError, GeneratorExit):
+        # 客户端断开：上游连接已随生成器关闭，保存部分输出
+        await save_cancelled([test_record], [full_text])
+        raise
 
     except Exception as e:
         test_record.error_message = str(e)
@@ -0,0 +1,177 @@
+"""后台任务注册表：记录任务状态与进度，供 API 轮询
+
+执行进程在内存中维护任务状态，并每 JOB_SYNC_INTERVAL 秒写入 background_jobs 表，
+多个 Web 进程（uvicorn --workers N）中任一进程都可查询；
+执行中的任务超过 JOB_STALE_SECONDS 未写入进度时视为执行进程已退出（失败）。
+"""
+
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable
+
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from backend.config import JOB_STALE_SECONDS, JOB_SYNC_INTERVAL
+from backend.database import async_session
+from backend.models import BackgroundJob
+
+logger = logging.getLogger(__name__)
+
+# 任务的固定字段，其余字段存入 BackgroundJob.details
+_BASE_FIELDS = ("id", "kind", "status", "total", "processed", "error", "started_at", "finished_at")
+
+_jobs: dict[str, dict] = {}
+_running_tasks: set[asyncio.Task] = set()
+
+
+def spawn(coro: Awaitable) -> asyncio.Task:
+    """启动后台协程并持有引用，防止任务被垃圾回收"""
+    task = asyncio.create_task(coro)
+    _running_tasks.add(task)
+    task.add_done_callback(_running_tasks.discard)
+    return task
+
+
+def create_job(kind: str, **fields) -> dict:
+    """登记一个新任务（pending 状态）"""
+    job = {
+        "id": uuid.uuid4().hex,
+        "kind": kind,
+        "status": "pending",
+        "total": 0,
+        "processed": 0,
+        "error": None,
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "finished_at": None,
+        **fields,
+    }
+    _jobs[job["id"]] = job
+    return job
+
+
+async def find_active_job(kind: str) -> dict | None:
+    """查找指定类型中尚未结束的任务（包括其他进程中执行的任务）"""
+    for job in _jobs.values():
+        if job["kind"] == kind and job["status"] in ("pending", "running"):
+            return job
+    async with async_session() as session:
+        rows = (await session.execute(
+            select(BackgroundJob)
+            .where(BackgroundJob.kind == kind)
+            .where(BackgroundJob.status.in_(["pending", "running"]))
+            .order_by(BackgroundJob.started_at.desc())
+        )).scalars().all()
+    for row in rows:
+        job = _job_from_row(row)
+        if job["status"] in ("pending", "running"):
+            return job
+    return None
+
+
+async def get_job(job_id: str, kind: str | None = None) -> dict | None:
+    """按 ID 获取任务，可限定任务类型；不在本进程中的任务从数据库读取"""
+    job = _jobs.get(job_id)
+    if job is None:
+        async with async_session() as session:
+            row = await session.get(BackgroundJob, job_id)
+        job = _job_from_row(row) if row else None
+    if not job or (kind and job["kind"] != kind):
+        return None
+    return job
+
+
+async def start_job(job: dict, work: Callable[[dict], Awaitable[None]]) -> asyncio.Task:
+    """在后台执行任务，自动维护 running / completed / failed 状态（先写入数据库，返回后即可从任意进程查询）"""
+    await _save_job(job)
+
+    async def runner():
+        job["status"] = "running"
+        sync_task = spawn(_sync_loop(job))
+        try:
+            await work(job)
+            job["status"] = "completed"
+        except Exception as e:
+            logger.error(f"后台任务失败: {job['kind']} {job['id']} - {e}", exc_info=True)
+            job["status"] = "failed"
+            job["error"] = str(e)
+        finally:
+            job["finished_at"] = datetime.now(timezone.utc).isoformat()
+            sync_task.cancel()
+            try:
+                await _save_job(job)
+            except Exception as e:
+                logger.warning(f"后台任务状态写入失败: {job['id']} - {e}")
+
+    return spawn(runner())
+
+
+async def _sync_loop(job: dict):
+    """执行期间定期把任务状态写入数据库"""
+    while True:
+        try:
+            await _save_job(job)
+        except Exception as e:
+            logger.warning(f"后台任务状态写入失败: {job['id']} - {e}")
+        await asyncio.sleep(JOB_SYNC_INTERVAL)
+
+
+async def _save_job(job: dict):
+    """写入（或更新）任务状态"""
+    values = {
+        "kind": job["kind"],
+        "status": job["status"],
+        "total": job["total"],
+        "processed": job["processed"],
+        "error": job["error"],
+        "details": {k: v for k, v in job.items() if k not in _BASE_FIELDS},
+        "started_at": datetime.fromisoformat(job["started_at"]),
+        "finished_at": datetime.fromisoformat(job["finished_at"]) if job["finished_at"] else None,
+        "updated_at": datetime.now(timezone.utc),
+    }
+    async with async_session() as session:
+        await session.execute(
+            sqlite_insert(BackgroundJob)
+            .values(id=job["id"], created_at=values["started_at"], **values)
+            .on_conflict_do_update(index_elements=["id"], set_=values)
+        )
+        await session.commit()
+
+
+def _job_from_row(row: BackgroundJob) -> dict:
+    """数据库中的任务状态转换为任务 dict；心跳超时的执行中任务视为失败"""
+    job = {
+        "id": row.id,
+        "kind": row.kind,
+        "status": row.status,
+        "total": row.total,
+        "processed": row.processed,
+        "error": row.error,
+        "started_at": _isoformat(row.started_at),
+        "finished_at": _isoformat(row.finished_at) if row.finished_at else None,
+        **(row.details or {}),
+    }
+    updated_at = row.updated_at.replace(tzinfo=row.updated_at.tzinfo or timezone.utc)
+    stale = datetime.now(timezone.utc) - updated_at > timedelta(seconds=JOB_STALE_SECONDS)
+    if job["status"] in ("pending", "running") and stale:
+        job["status"] = "failed"
+        job["error"] = "执行进程已退出"
+    return job
+
+
+def _isoformat(value: datetime) -> str:
+    """SQLite 读出的时间不带时区，按 UTC 补齐"""
+    return value.replace(tzinfo=value.tzinfo or timezone.utc).isoformat()
+
+
+def job_view(job: dict) -> dict:
+    """任务进度视图（嵌套 dict 拷贝一份，附带进度百分比）"""
+    if job["total"]:
+        progress = job["processed"] / job["total"]
+    else:
+        progress = 1.0 if job["status"] == "completed" else 0.0
+    view = {k: (dict(v) if isinstance(v, dict) else v) for k, v in job.items()}
+    view["progress"] = round(min(progress, 1.0), 4)
+    return view
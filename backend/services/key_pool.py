@@ -0,0 +1,185 @@
+"""API Key 池：同一服务商持有多个 Key 时分摊调用，提高总配额
+
+- 每次调用选择未在暂停期、进行中调用数最少的 Key（相同时选最久未使用的）
+- 返回 429 的 Key 暂停 KEY_COOLDOWN_RATE_LIMITED 秒（连续限流时逐次翻倍），
+  返回 401 / 403 的 Key 暂停 KEY_COOLDOWN_AUTH 秒；全部 Key 都在暂停期时选最早恢复的
+- 预置模型使用全局 Key 池（设置页的 Key 或 .env 中的 Key，加上 api_key_pool 设置与 DASHSCOPE_API_KEYS），
+  自定义模型使用 custom_api_key 加上 custom_api_keys
+- 各 Key 的调用次数、token 用量与暂停状态按进程统计，通过 /api/upstream/keys 查看（Key 脱敏）
+"""
+
+import time
+
+from backend.config import (
+    DASHSCOPE_API_KEY,
+    DASHSCOPE_API_KEYS,
+    KEY_COOLDOWN_AUTH,
+    KEY_COOLDOWN_MAX,
+    KEY_COOLDOWN_RATE_LIMITED,
+)
+from backend.models import ModelConfig
+from backend.services.runtime_settings import get_setting
+
+# 触发暂停的上游状态码
+RATE_LIMITED_STATUS = 429
+AUTH_FAILED_STATUSES = (401, 403)
+
+
+class KeyState:
+    """单个 Key 的负载与统计"""
+
+    def __init__(self, key: str):
+        self.key = key
+        self.in_flight = 0
+        self.requests = 0
+        self.tokens = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self.auth_failed = 0
+        self.consecutive_rate_limited = 0
+        self.cooldown_until = 0.0
+        self.last_used = 0.0
+
+    def cooling(self, now: float) -> bool:
+        """是否在暂停期"""
+        return self.cooldown_until > now
+
+    def settle(self, status_code: int | None, tokens: int):
+        """记录一次调用的结果，被限流或鉴权失败时进入暂停期"""
+        self.tokens += tokens
+        now = time.monotonic()
+        if status_code == RATE_LIMITED_STATUS:
+            self.rate_limited += 1
+            if self.cooling(now):
+                return  # 同一波并发调用的限流只计一次
+            self.consecutive_rate_limited += 1
+            cooldown = KEY_COOLDOWN_RATE_LIMITED * 2 ** (self.consecutive_rate_limited - 1)
+            self.cooldown_until = now + min(cooldown, KEY_COOLDOWN_MAX)
+            return
+        if status_code in AUTH_FAILED_STATUSES:
+            self.auth_failed += 1
+            self.cooldown_until = now + KEY_COOLDOWN_AUTH
+            return
+        if status_code is not None:
+            self.errors += 1
+        self.consecutive_rate_limited = 0
+
+    def snapshot(self) -> dict:
+        """当前状态（Key 脱敏）"""
+        now = time.monotonic()
+        return {
+            "masked_key": mask_key(self.key),
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "tokens": self.tokens,
+            "errors": self.errors,
+            "rate_limited": self.rate_limited,
+            "auth_failed": self.auth_failed,
+            "cooldown_remaining": round(self.cooldown_until - now, 1) if self.cooling(now) else 0,
+        }
+
+
+class KeyLease:
+    """一次调用占用的 Key，调用结束时须 release"""
+
+    __slots__ = ("state", "released")
+
+    def __init__(self, state: KeyState):
+        self.state = state
+        self.released = False
+
+    @property
+    def key(self) -> str:
+        return self.state.key
+
+    def release(self, status_code: int | None = None, tokens: int = 0):
+        """归还 Key 并记录结果（可重复调用，只生效一次）"""
+        if self.released:
+            return
+        self.released = True
+        self.state.in_flight -= 1
+        self.state.settle(status_code, tokens)
+
+
+# Key → 状态
+_keys: dict[str, KeyState] = {}
+
+
+def mask_key(key: str) -> str:
+    """脱敏 API Key"""
+    if not key or len(key) < 8:
+        return "****"
+    return key[:3] + "****" + key[-4:]
+
+
+def global_api_keys() -> list[str]:
+    """预置模型使用的全局 Key 池（设置页的 Key 覆盖 .env 中的 DASHSCOPE_API_KEY）"""
+    primary = get_setting("api_key_override") or DASHSCOPE_API_KEY
+    keys = [primary, *(get_setting("api_key_pool") or []), *DASHSCOPE_API_KEYS]
+    return list(dict.fromkeys(key for key in keys if key))
+
+
+def model_api_keys(model_config: ModelConfig) -> list[str] | None:
+    """模型的 Key 池：自定义模型为 custom_api_key 加 custom_api_keys，预置模型为 None（使用全局 Key 池）"""
+    if not model_config.is_custom:
+        return None
+    keys = [model_config.custom_api_key, *(model_config.custom_api_keys or [])]
+    return list(dict.fromkeys(key for key in keys if key))
+
+
+def validate_api_keys(keys: list[str] | None) -> list[str] | None:
+    """
+    校验并去重 Key 列表（去除首尾空白）。
+
+    Raises:
+        ValueError: 含空 Key
+    """
+    if not keys:
+        return None
+    keys = [key.strip() for key in keys]
+    if not all(keys):
+        raise ValueError("API Key 不能为空")
+    return list(dict.fromkeys(keys))
+
+
+def acquire_key(keys: list[str], exclude: set[str] | frozenset = frozenset(), ready_only: bool = False) -> KeyLease | None:
+    """
+    从 Key 池中选择负载最低的 Key。
+
+    Args:
+        keys: Key 池
+        exclude: 不参与选择的 Key（如本次调用已失败的 Key）
+        ready_only: 只选择不在暂停期的 Key
+
+    Returns:
+        占用的 Key；没有可选的 Key 时为 None
+    """
+    candidates = []
+    for key in dict.fromkeys(keys):
+        if key in exclude:
+            continue
+        state = _keys.get(key)
+        if state is None:
+            state = _keys[key] = KeyState(key)
+        candidates.append(state)
+    if not candidates:
+        return None
+
+    now = time.monotonic()
+    ready = [state for state in candidates if not state.cooling(now)]
+    if ready:
+        state = min(ready, key=lambda s: (s.in_flight, s.last_used))
+    elif ready_only:
+        return None
+    else:
+        state = min(candidates, key=lambda s: s.cooldown_until)
+
+    state.in_flight += 1
+    state.requests += 1
+    state.last_used = now
+    return KeyLease(state)
+
+
+def list_key_stats() -> list[dict]:
+    """全部 Key 的负载与统计（本进程）"""
+    return [state.snapshot() for state in _keys.values()]
@@ -1,65 +1,167 @@
 """模型 API 客户端封装：OpenAI 兼容接口、流式调用、超时处理
 
 支持两种模式：
-1. 预置模型 — 使用全局 DASHSCOPE_BASE_URL + DASHSCOPE_API_KEY
-2. 自定义模型 — 使用 ModelConfig 中的 custom_base_url + custom_api_key
+1. 预置模型 — 使用全局 DASHSCOPE_BASE_URL + 全局 Key 池（DASHSCOPE_API_KEY 等）
+2. 自定义模型 — 使用 ModelConfig 中的 custom_base_url + custom_api_key / custom_api_keys
+
+每次调用从 Key 池中选择负载最低的 Key（见 key_pool），建立连接时被限流或鉴权失败会换用其他 Key 重试。
+端点连续不可用时按 base_url 熔断（见 circuit_breaker），熔断期间调用立即返回错误事件。
+同一 base_url 的客户端共享一个 HTTP 连接池，空闲连接保留 UPSTREAM_KEEPALIVE_EXPIRY 秒（见 prewarm）。
+
+流式调用有四个截止时间（连接、首 token、输出间隔、总耗时），任一到期即中止并关闭上游连接，
+错误事件的 stop_reason 标明是哪一个截止时间触发。
 """
 
 import asyncio
 import json
 import time
+from functools import partial
 from typing import AsyncGenerator
 
-from openai import AsyncOpenAI
+import httpx
+from openai import APIConnectionError, AsyncOpenAI, DefaultAsyncHttpxClient
 
 from backend.config import (
     DASHSCOPE_API_KEY,
     DASHSCOPE_BASE_URL,
     MODEL_API_TIMEOUT,
+    PROBE_TIMEOUT,
+    STREAM_CONNECT_TIMEOUT,
+    STREAM_FIRST_TOKEN_TIMEOUT,
+    STREAM_IDLE_TIMEOUT,
+    STREAM_TOTAL_TIMEOUT,
+    UPSTREAM_KEEPALIVE_CONNECTIONS,
+    UPSTREAM_KEEPALIVE_EXPIRY,
 )
+from backend.services.circuit_breaker import get_breaker
+from backend.services.key_pool import AUTH_FAILED_STATUSES, RATE_LIMITED_STATUS, acquire_key, global_api_keys
+from backend.services.runtime_settings import get_setting
+from backend.services.stop_rules import StopMatcher
+
+# 截止时间名称 → (全局默认值, 超时提示)
+STREAM_DEADLINES = {
+    "connect": (STREAM_CONNECT_TIMEOUT, "连接超时"),
+    "first_token": (STREAM_FIRST_TOKEN_TIMEOUT, "等待首个输出超时"),
+    "idle": (STREAM_IDLE_TIMEOUT, "输出中断超时"),
+    "total": (STREAM_TOTAL_TIMEOUT, "总耗时超时"),
+}
+
+
+def _estimate_tokens(text: str) -> int:
+    """粗略估算 token 数：中日韩字符约 1 个 token，其余字符约 4 个一个 token"""
+    cjk = sum(1 for ch in text if "\u2e80" <= ch <= "\u9fff" or "\uac00" <= ch <= "\ud7af" or "\uff00" <= ch <= "\uffef")
+    return cjk + -(-(len(text) - cjk) // 4)
+
+
+def _messages_text(messages: list[dict]) -> str:
+    """messages 中的全部文本（content 可能是字符串或文本片段列表）"""
+    texts = []
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            texts.append(content)
+        elif isinstance(content, list):
+            texts.extend(part.get("text", "") for part in content if isinstance(part, dict))
+    return "".join(texts)
 
 
-# 运行时自定义 API Key 存储（内存级别，重启后失效）
-_custom_api_key: str | None = None
+class StreamDeadlineExceeded(Exception):
+    """流式调用的某个截止时间到期"""
+
+    def __init__(self, deadline: str, seconds: float):
+        super().__init__(f"{STREAM_DEADLINES[deadline][1]}（{seconds:g} 秒），已中止调用")
+        self.deadline = deadline
+        self.seconds = seconds
+
+
+def validate_stream_deadlines(deadlines: dict | None) -> dict | None:
+    """
+    校验模型的截止时间覆盖配置，如 {"first_token": 30, "total": 300}。
+
+    Raises:
+        ValueError: 名称未知或取值不是正数
+    """
+    if not deadlines:
+        return None
+    unknown = [name for name in deadlines if name not in STREAM_DEADLINES]
+    if unknown:
+        raise ValueError(f"未知的截止时间: {', '.join(unknown)}（可用: {', '.join(STREAM_DEADLINES)}）")
+    for name, seconds in deadlines.items():
+        if seconds is not None and (isinstance(seconds, bool) or not isinstance(seconds, (int, float)) or seconds <= 0):
+            raise ValueError(f"截止时间 {name} 须为正数（秒）")
+    return {name: seconds for name, seconds in deadlines.items() if seconds is not None}
 
 
-def set_custom_api_key(api_key: str | None):
-    """设置用户自定义的全局 API Key（覆盖 .env 配置）"""
-    global _custom_api_key
-    _custom_api_key = api_key
+def resolve_stream_deadlines(overrides: dict | None = None) -> dict[str, float]:
+    """全局默认截止时间叠加模型的覆盖配置"""
+    overrides = overrides or {}
+    return {name: float(overrides.get(name) or default) for name, (default, _) in STREAM_DEADLINES.items()}
 
 
 def get_custom_api_key() -> str | None:
-    """获取当前自定义全局 API Key"""
-    return _custom_api_key
+    """获取当前自定义全局 API Key（运行时设置，多进程共享）"""
+    return get_setting("api_key_override")
 
 
-def _get_client(
+# base_url → 共享的 HTTP 连接池；(base_url, API Key) → 客户端
+_http_clients: dict[str, httpx.AsyncClient] = {}
+_clients: dict[tuple[str, str], AsyncOpenAI] = {}
+
+# base_url → 最近一次实际模型调用的时间（单调时钟，预热探测不计入），保温时跳过近期有调用的端点
+endpoint_last_used: dict[str, float] = {}
+
+
+def get_client(
     api_key: str | None = None,
     base_url: str | None = None,
 ) -> AsyncOpenAI:
-    """获取 OpenAI 兼容客户端
+    """获取 OpenAI 兼容客户端（按 base_url + Key 缓存，同一 base_url 复用 keep-alive 连接）
 
     Args:
         api_key: 指定 API Key（优先级最高）
         base_url: 指定 Base URL（如果为 None 则使用全局 DashScope URL）
     """
-    key = api_key or _custom_api_key or DASHSCOPE_API_KEY
+    key = api_key or get_custom_api_key() or DASHSCOPE_API_KEY
     if not key:
         raise ValueError("未配置 API Key，请在 .env 文件或设置页面中配置 DASHSCOPE_API_KEY")
-    return AsyncOpenAI(
-        api_key=key,
-        base_url=base_url or DASHSCOPE_BASE_URL,
-        timeout=MODEL_API_TIMEOUT,
-    )
+    base_url = base_url or DASHSCOPE_BASE_URL
+
+    client = _clients.get((base_url, key))
+    if client is None:
+        http_client = _http_clients.get(base_url)
+        if http_client is None:
+            http_client = _http_clients[base_url] = DefaultAsyncHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=None,  # 并发由上游自适应并发控制器约束
+                    max_keepalive_connections=UPSTREAM_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=UPSTREAM_KEEPALIVE_EXPIRY,
+                ),
+            )
+        client = _clients[(base_url, key)] = AsyncOpenAI(
+            api_key=key,
+            base_url=base_url,
+            timeout=MODEL_API_TIMEOUT,
+            http_client=http_client,
+        )
+    return client
+
+
+async def close_clients():
+    """关闭全部连接池（应用退出时调用）"""
+    for http_client in _http_clients.values():
+        await http_client.aclose()
+    _http_clients.clear()
+    _clients.clear()
 
 
 async def stream_chat_completion(
     model_id: str,
     messages: list[dict],
     params: dict | None = None,
-    api_key: str | None = None,
+    api_key: str | list[str] | None = None,
     base_url: str | None = None,
+    deadlines: dict | None = None,
+    stop_rules: list[dict] | None = None,
 ) -> AsyncGenerator[dict, None]:
     """
     流式调用模型 API，返回增量事件流（统一格式）。
@@ -71,22 +173,55 @@ async def stream_chat_completion(
         model_id: 模型标识符
         messages: OpenAI 格式 messages
         params: temperature / max_tokens / top_p 等
-        api_key: 自定义模型的 API Key（None 则用全局）
+        api_key: 自定义模型的 API Key 或 Key 池（None 则用全局 Key 池）
         base_url: 自定义模型的 Base URL（None 则用 DashScope）
+        deadlines: 截止时间覆盖配置（秒），见 STREAM_DEADLINES；未指定的使用全局默认值
+        stop_rules: 客户端停止规则（见 stop_rules），命中时立即关闭上游连接并正常结束
 
     Yields:
         dict: 标准化事件数据
             - {"type": "token", "text": "增量文本"}
-            - {"type": "usage", "input_tokens": N, "output_tokens": N}
-            - {"type": "done", "response_time_ms": N, "raw_chunks": [...]}
-            - {"type": "error", "message": "错误描述", ...}
+            - {"type": "usage", "input_tokens": N, "output_tokens": N, "cached_tokens": 输入中命中上下文缓存的 N,
+               "estimated": 是否为估算值（停止规则提前结束时收不到上游的 usage，按文本估算）}
+            - {"type": "done", "response_time_ms": N, "raw_chunks": [...], "stop_reason": 上游 finish_reason,
+               "stopped_early": 是否因停止规则提前结束（此时 stop_reason 为 "rule_<type>"）}
+            - {"type": "error", "message": "错误描述", "status_code": HTTP 状态码或 None, ...}
+              截止时间到期时 is_timeout 为 True，stop_reason 为 "<截止时间名称>_timeout"；
+              上游熔断时立即返回，stop_reason 为 "circuit_open"
     """
-    client = _get_client(api_key=api_key, base_url=base_url)
+    breaker = get_breaker(base_url or DASHSCOPE_BASE_URL)
+    if not breaker.allow():
+        yield {
+            "type": "error",
+            "message": f"上游暂不可用（已熔断，约 {breaker.retry_in():.0f} 秒后探测恢复）: {breaker.last_error}",
+            "response_time_ms": 0,
+            "is_timeout": False,
+            "status_code": None,
+            "stop_reason": "circuit_open",
+        }
+        return
+
+    keys = [api_key] if isinstance(api_key, str) else (api_key or global_api_keys())
+    lease = acquire_key(keys)
+    client = get_client(api_key=lease.key if lease else None, base_url=base_url)
+    endpoint_last_used[breaker.base_url] = time.monotonic()
+    breaker.probe = partial(probe_model, base_url=breaker.base_url, api_key=lease.key, model_id=model_id)
     params = params or {}
+    limits = resolve_stream_deadlines(deadlines)
     start_time = time.time()
+    started = time.monotonic()
 
     # 收集原始 chunk 用于调试（只保留关键信息，不保留完整对象以避免过大）
     raw_chunks = []
+    stream = None
+    input_tokens = 0
+    output_tokens = 0
+    cached_tokens = 0
+    status_code = None
+    received = False  # 是否收到过数据块（端点可用）
+    matcher = StopMatcher(stop_rules) if stop_rules else None
+    stopped_early = False
+    output_parts = []  # 提前结束时用于估算输出 token
 
     try:
         # 构建请求参数
@@ -103,64 +238,191 @@ async def stream_chat_completion(
         # 对自定义模型也尝试启用，如果不支持会被忽略
         create_kwargs["stream_options"] = {"include_usage": True}
 
-        stream = await asyncio.wait_for(
-            client.chat.completions.create(**create_kwargs),
-            timeout=MODEL_API_TIMEOUT,
-        )
-
-        input_tokens = 0
-        output_tokens = 0
+        failed_keys = set()
+        while stream is None:
+            try:
+                stream = await asyncio.wait_for(
+                    client.chat.completions.create(**create_kwargs),
+                    timeout=max(min(limits["connect"], limits["total"]) - (time.monotonic() - started), 0),
+                )
+            except asyncio.TimeoutError:
+                deadline = "connect" if limits["connect"] <= limits["total"] else "total"
+                raise StreamDeadlineExceeded(deadline, limits[deadline])
+            except Exception as e:
+                # Key 被限流或鉴权失败：暂停该 Key，换用池中其他可用的 Key 重试
+                failed_status = getattr(e, "status_code", None)
+                if failed_status != RATE_LIMITED_STATUS and failed_status not in AUTH_FAILED_STATUSES:
+                    raise
+                failed_keys.add(lease.key)
+                retry_lease = acquire_key(keys, exclude=failed_keys, ready_only=True)
+                if retry_lease is None:
+                    raise
+                lease.release(failed_status)
+                lease = retry_lease
+                client = get_client(api_key=lease.key, base_url=base_url)
+
+        finish_reason = None
+        chunks = stream.__aiter__()
+        got_token = False
+
+        while True:
+            # 本次等待的期限：首个输出之前受首 token 截止时间约束，之后受输出间隔约束，始终受总耗时约束
+            elapsed = time.monotonic() - started
+            if not got_token:
+                deadline, wait = "first_token", limits["first_token"] - elapsed
+            else:
+                deadline, wait = "idle", limits["idle"]
+            if limits["total"] - elapsed <= wait:
+                deadline, wait = "total", limits["total"] - elapsed
+            try:
+                chunk = await asyncio.wait_for(chunks.__anext__(), timeout=max(wait, 0))
+            except StopAsyncIteration:
+                break
+            except asyncio.TimeoutError:
+                raise StreamDeadlineExceeded(deadline, limits[deadline])
+            if not received:
+                received = True
+                breaker.record_success()
 
-        async for chunk in stream:
             # 收集 raw（精简版）
             try:
                 raw_chunks.append(_serialize_chunk(chunk))
             except Exception:
                 pass  # raw 收集不应影响主流程
 
+            if chunk.choices and chunk.choices[0].finish_reason:
+                finish_reason = chunk.choices[0].finish_reason
+
             # 标准化：提取增量文本
             if chunk.choices and chunk.choices[0].delta.content:
+                got_token = True
+                if matcher:
+                    output_parts.append(chunk.choices[0].delta.content)
                 yield {
                     "type": "token",
                     "text": chunk.choices[0].delta.content,
                 }
+                # 停止规则命中：不再接收后续输出，上游连接在 finally 中关闭
+                rule_reason = matcher.feed(chunk.choices[0].delta.content) if matcher else None
+                if rule_reason:
+                    finish_reason = rule_reason
+                    stopped_early = True
+                    break
 
             # 标准化：提取 usage 信息（通常在最后一个 chunk）
             if hasattr(chunk, "usage") and chunk.usage:
                 input_tokens = chunk.usage.prompt_tokens or 0
                 output_tokens = chunk.usage.completion_tokens or 0
+                details = getattr(chunk.usage, "prompt_tokens_details", None)
+                cached_tokens = getattr(details, "cached_tokens", None) or 0
 
         elapsed_ms = int((time.time() - start_time) * 1000)
 
+        # 停止规则提前结束时 usage chunk（在流末尾）不会到达，按已发送与已接收的文本估算
+        estimated = stopped_early and not (input_tokens or output_tokens)
+        if estimated:
+            input_tokens = _estimate_tokens(_messages_text(messages))
+            output_tokens = _estimate_tokens("".join(output_parts))
+
         # 发送 usage 事件
         if input_tokens or output_tokens:
             yield {
                 "type": "usage",
                 "input_tokens": input_tokens,
                 "output_tokens": output_tokens,
+                "cached_tokens": cached_tokens,
+                "estimated": estimated,
             }
 
         yield {
             "type": "done",
             "response_time_ms": elapsed_ms,
             "raw_chunks": raw_chunks,
+            "stop_reason": finish_reason,
+            "stopped_early": stopped_early,
         }
 
-    except asyncio.TimeoutError:
+    except StreamDeadlineExceeded as e:
+        if not received:
+            breaker.record_failure(str(e))  # 连接或首个数据块超时：端点可能不可用
         elapsed_ms = int((time.time() - start_time) * 1000)
         yield {
             "type": "error",
-            "message": f"请求超时（{MODEL_API_TIMEOUT}秒），请稍后重试",
+            "message": str(e),
             "response_time_ms": elapsed_ms,
             "is_timeout": True,
+            "stop_reason": f"{e.deadline}_timeout",
         }
     except Exception as e:
         elapsed_ms = int((time.time() - start_time) * 1000)
+        status_code = getattr(e, "status_code", None)
+        if isinstance(e, APIConnectionError) or (status_code or 0) >= 500:
+            breaker.record_failure(str(e))
         yield {
             "type": "error",
             "message": str(e),
             "response_time_ms": elapsed_ms,
             "is_timeout": False,
+            "status_code": status_code,  # 上游 HTTP 状态码（如 429）
+        }
+    finally:
+        if lease:
+            lease.release(status_code, input_tokens + output_tokens)
+        # 调用方取消或提前关闭生成器时，关闭与上游的 HTTP 连接，不再继续接收（和计费）token
+        if stream is not None:
+            try:
+                await stream.close()
+            except Exception:
+                pass
+
+
+async def probe_model(base_url: str, api_key: str, model_id: str, timeout: float = PROBE_TIMEOUT) -> dict:
+    """
+    发送一个简短的非流式请求，验证 base_url、api_key、model_id 是否有效（测试连接与熔断探测共用）。
+
+    Returns:
+        {"success": bool, "message": 结果描述, "elapsed_ms": N, ...}；
+        成功时含 response_preview 与 model，失败时含上游 HTTP 状态码 status_code（无响应时为 None）
+    """
+    client = get_client(api_key=api_key, base_url=base_url)
+    start = time.time()
+    try:
+        response = await asyncio.wait_for(
+            client.chat.completions.create(
+                model=model_id,
+                messages=[{"role": "user", "content": "Hi"}],
+                max_tokens=5,
+                stream=False,
+            ),
+            timeout=timeout,
+        )
+        elapsed_ms = int((time.time() - start) * 1000)
+
+        # 提取返回信息
+        text = ""
+        if response.choices and response.choices[0].message.content:
+            text = response.choices[0].message.content[:100]
+
+        return {
+            "success": True,
+            "message": f"连接成功 ({elapsed_ms}ms)",
+            "response_preview": text,
+            "model": response.model if hasattr(response, "model") else model_id,
+            "elapsed_ms": elapsed_ms,
+        }
+    except asyncio.TimeoutError:
+        return {
+            "success": False,
+            "message": f"连接超时（{timeout:g}秒），请检查 Base URL 是否正确",
+            "elapsed_ms": int((time.time() - start) * 1000),
+            "status_code": None,
+        }
+    except Exception as e:
+        return {
+            "success": False,
+            "message": f"连接失败: {str(e)}",
+            "elapsed_ms": int((time.time() - start) * 1000),
+            "status_code": getattr(e, "status_code", None),
         }
 
 
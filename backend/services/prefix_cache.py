@@ -0,0 +1,103 @@
+"""批量任务的前缀缓存模式：模板固定部分作为各任务项共享的前缀，命中上游的上下文缓存
+
+- 提示词拆分见 PromptTemplate.render_prefixed（提示词不改写，在第一个占位符处拆分），前缀作为 user 消息的第一个文本片段发送
+- 创建批次时校验前缀长度（BATCH_PREFIX_CACHE_MIN_CHARS），变量在模板靠前位置时拒绝开启，而不是静默退化为普通请求
+- 预置模型（DashScope）在前缀片段上标记 cache_control（显式缓存）；
+  自定义模型不加标记（非标准字段可能被拒绝），依靠服务商的自动前缀缓存
+- usage 中的 cached_tokens 记入 TestRecord.token_cached，按批次汇总命中率与延迟、费用的节省
+"""
+
+from sqlalchemy import case, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.config import BATCH_CACHE_HIT_PRICE_RATIO, BATCH_PREFIX_CACHE_MIN_CHARS
+from backend.models import KeywordBatch, ModelConfig, RecordStatus, TestRecord
+from backend.services.prompt_template import PromptTemplate
+
+
+def validate_prefix_template(template: PromptTemplate, columns) -> None:
+    """
+    校验模板适合前缀缓存模式：第一个变量之前的固定文本不少于 BATCH_PREFIX_CACHE_MIN_CHARS 个字符。
+
+    Args:
+        template: 批次的提示词模板
+        columns: 任务项可提供的变量名（关键词批次只有 keyword，文件导入为表头）
+    Raises:
+        ValueError: 前缀过短，开启前缀缓存不会有效果
+    """
+    length = len(template.static_prefix(columns))
+    if length < BATCH_PREFIX_CACHE_MIN_CHARS:
+        raise ValueError(
+            f"前缀缓存模式要求模板在第一个变量之前至少有 {BATCH_PREFIX_CACHE_MIN_CHARS} 个字符的固定文本"
+            f"（当前 {length} 个），请把变量移到模板末尾，或关闭前缀缓存"
+        )
+
+
+def build_prefixed_messages(prefix: str, prompt: str, model_config: ModelConfig) -> list[dict]:
+    """
+    构建前缀缓存模式的 messages：静态前缀与变量部分作为两个文本片段。
+
+    Args:
+        prefix: 静态前缀（prompt 以其开头）
+        prompt: 完整提示词
+        model_config: 模型配置，决定是否标记 cache_control
+    """
+    prefix_part = {"type": "text", "text": prefix}
+    if not model_config.is_custom:
+        prefix_part["cache_control"] = {"type": "ephemeral"}
+    content = [prefix_part]
+    if len(prompt) > len(prefix):
+        content.append({"type": "text", "text": prompt[len(prefix):]})
+    return [{"role": "user", "content": content}]
+
+
+async def get_batch_cache_report(db: AsyncSession, batch_id: str) -> dict | None:
+    """
+    批次的上下文缓存统计：命中率、命中与未命中请求的平均耗时，以及按计费比例估算的输入费用节省。
+
+    Returns:
+        统计结果；批次不存在时为 None
+    """
+    batch = await db.get(KeywordBatch, batch_id)
+    if not batch:
+        return None
+
+    cached = func.coalesce(TestRecord.token_cached, 0)
+    row = (await db.execute(
+        select(
+            func.count(TestRecord.id).label("requests"),
+            func.count(case((cached > 0, TestRecord.id))).label("cached_requests"),
+            func.coalesce(func.sum(TestRecord.token_input), 0).label("input_tokens"),
+            func.coalesce(func.sum(cached), 0).label("cached_tokens"),
+            func.avg(case((cached > 0, TestRecord.response_time_ms))).label("avg_cached_ms"),
+            func.avg(case((cached == 0, TestRecord.response_time_ms))).label("avg_uncached_ms"),
+        )
+        .where(TestRecord.keyword_batch_id == batch_id)
+        .where(TestRecord.status == RecordStatus.SUCCESS)
+    )).one()
+
+    input_tokens = row.input_tokens or 0
+    cached_tokens = row.cached_tokens or 0
+    # 命中缓存的部分只按 BATCH_CACHE_HIT_PRICE_RATIO 计费，节省量折算为等价的输入 token 数
+    saved_tokens = cached_tokens * (1 - BATCH_CACHE_HIT_PRICE_RATIO)
+    latency_saved = (
+        row.avg_uncached_ms - row.avg_cached_ms
+        if row.avg_cached_ms is not None and row.avg_uncached_ms is not None else None
+    )
+    return {
+        "batch_id": batch_id,
+        "prefix_cache": batch.prefix_cache,
+        "requests": row.requests,
+        "cached_requests": row.cached_requests,
+        "input_tokens": input_tokens,
+        "cached_tokens": cached_tokens,
+        "cache_hit_ratio": round(cached_tokens / input_tokens, 4) if input_tokens else 0.0,
+        "avg_response_time_ms": {
+            "cached": round(row.avg_cached_ms, 1) if row.avg_cached_ms is not None else None,
+            "uncached": round(row.avg_uncached_ms, 1) if row.avg_uncached_ms is not None else None,
+        },
+        "latency_saved_ms": round(latency_saved, 1) if latency_saved is not None else None,
+        "saved_input_tokens": round(saved_tokens),
+        "input_cost_saved_ratio": round(saved_tokens / input_tokens, 4) if input_tokens else 0.0,
+        "cache_hit_price_ratio": BATCH_CACHE_HIT_PRICE_RATIO,
+    }
@@ -0,0 +1,107 @@
+"""连接预热：启动时向启用模型的端点预先建立 keep-alive 连接，之后定期保温空闲端点
+
+首个请求不必再承担 DNS、TCP 与 TLS 握手的开销。探测使用 GET /models（不消耗 token），
+任何 HTTP 响应（包括 4xx）都说明连接已建立；熔断中的端点不探测。
+每轮至多探测 WARM_MAX_ENDPOINTS 个端点、每个端点 WARM_CONNECTIONS 个并行连接，
+WARM_INTERVAL 内有过调用的端点本轮跳过。
+"""
+
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+
+from openai import APIStatusError
+from sqlalchemy import select
+
+from backend.config import PROBE_TIMEOUT, WARM_CONNECTIONS, WARM_INTERVAL, WARM_MAX_ENDPOINTS
+from backend.database import async_session
+from backend.models import ModelConfig
+from backend.services.circuit_breaker import BreakerState, get_breaker
+from backend.services.key_pool import global_api_keys, model_api_keys
+from backend.services.model_client import endpoint_last_used, get_client
+from backend.services.upstream_limiter import upstream_base_url
+
+logger = logging.getLogger(__name__)
+
+# base_url → 最近一次预热的结果
+_status: dict[str, dict] = {}
+
+
+async def active_endpoints() -> dict[str, str]:
+    """启用模型的端点：base_url → 探测使用的 Key（预置模型优先，至多 WARM_MAX_ENDPOINTS 个）"""
+    async with async_session() as session:
+        result = await session.execute(
+            select(ModelConfig)
+            .where(ModelConfig.is_active == True)
+            .order_by(ModelConfig.is_custom, ModelConfig.name)
+        )
+        models = result.scalars().all()
+
+    endpoints = {}
+    for model in models:
+        base_url = upstream_base_url(model)
+        keys = model_api_keys(model) or global_api_keys()
+        if base_url in endpoints or not keys:
+            continue
+        endpoints[base_url] = keys[0]
+        if len(endpoints) >= WARM_MAX_ENDPOINTS:
+            break
+    return endpoints
+
+
+async def warm_endpoint(base_url: str, api_key: str) -> dict:
+    """向端点并行发送 WARM_CONNECTIONS 个轻量请求，在共享连接池中留下 keep-alive 连接"""
+    client = get_client(api_key=api_key, base_url=base_url).with_options(max_retries=0, timeout=PROBE_TIMEOUT)
+    start = time.monotonic()
+    results = await asyncio.gather(
+        *(client.models.list() for _ in range(WARM_CONNECTIONS)),
+        return_exceptions=True,
+    )
+    errors = [r for r in results if isinstance(r, Exception) and not isinstance(r, APIStatusError)]
+    status = {
+        "base_url": base_url,
+        "warmed_at": datetime.now(timezone.utc).isoformat(),
+        "elapsed_ms": int((time.monotonic() - start) * 1000),
+        "connections": len(results) - len(errors),
+        "error": str(errors[0]) if errors else None,
+    }
+    _status[base_url] = status
+    return status
+
+
+async def warm_endpoints(idle_only: bool = False) -> list[dict]:
+    """
+    预热启用模型的端点。
+
+    Args:
+        idle_only: 只探测 WARM_INTERVAL 内没有调用过的端点（保温）
+    """
+    now = time.monotonic()
+    targets = []
+    for base_url, api_key in (await active_endpoints()).items():
+        if get_breaker(base_url).state != BreakerState.CLOSED:
+            continue
+        if idle_only and now - endpoint_last_used.get(base_url, 0.0) < WARM_INTERVAL:
+            continue
+        targets.append(warm_endpoint(base_url, api_key))
+    return await asyncio.gather(*targets)
+
+
+async def warm_loop():
+    """启动时预热全部端点，之后每 WARM_INTERVAL 秒保温空闲端点（应用启动时运行）"""
+    idle_only = False
+    while True:
+        try:
+            for status in await warm_endpoints(idle_only):
+                if status["error"]:
+                    logger.warning(f"预热 {status['base_url']} 失败: {status['error']}")
+        except Exception as e:
+            logger.warning(f"连接预热失败: {e}")
+        idle_only = True
+        await asyncio.sleep(WARM_INTERVAL)
+
+
+def list_warm_status() -> list[dict]:
+    """各端点最近一次预热的结果（本进程）"""
+    return list(_status.values())
@@ -0,0 +1,84 @@
+"""提示词模板：{列名} 占位符，编译一次后按每行变量渲染"""
+
+import re
+
+# 占位符：{keyword}、{product}、{lang} 等
+_PLACEHOLDER = re.compile(r"\{(\w+)\}")
+
+
+class PromptTemplate:
+    """已编译的提示词模板
+
+    编译时把模板拆分为 文本 / 占位符 交替的片段，渲染时只做一次拼接。
+    变量中没有的占位符原样保留（兼容模板中本身含有花括号的文本）。
+    """
+
+    __slots__ = ("text", "fields", "_parts")
+
+    def __init__(self, text: str):
+        self.text = text
+        # re.split 带分组：偶数位为文本，奇数位为占位符名
+        self._parts = _PLACEHOLDER.split(text)
+        self.fields = tuple(dict.fromkeys(self._parts[1::2]))
+
+    def render(self, variables: dict) -> str:
+        """用变量渲染模板，None 渲染为空字符串"""
+        out = []
+        for i, part in enumerate(self._parts):
+            if i % 2 == 0:
+                out.append(part)
+            elif part in variables:
+                value = variables[part]
+                out.append("" if value is None else str(value))
+            else:
+                out.append("{" + part + "}")
+        return "".join(out)
+
+    def render_prefixed(self, variables: dict) -> tuple[str, str]:
+        """
+        前缀缓存模式的渲染：返回 (静态前缀, 完整提示词)。
+
+        完整提示词与 render 完全相同，只在第一个有取值的占位符处拆分，其前的固定文本
+        即同一批次各任务项共享的前缀（见 static_prefix）。
+        """
+        return self.static_prefix(variables), self.render(variables)
+
+    def static_prefix(self, columns) -> str:
+        """第一个可取值（在 columns 中）的占位符之前的固定文本；没有这样的占位符时为整个模板"""
+        out = []
+        for i, part in enumerate(self._parts):
+            if i % 2 == 0:
+                out.append(part)
+            elif part in columns:
+                break
+            else:
+                out.append("{" + part + "}")  # 没有取值的占位符原样保留，与 render 一致
+        return "".join(out)
+
+    def validate(self, columns) -> None:
+        """
+        校验模板引用的列都存在。
+
+        Raises:
+            ValueError: 模板引用了不存在的列
+        """
+        missing = [field for field in self.fields if field not in columns]
+        if missing:
+            raise ValueError(
+                f"模板引用的列不存在: {', '.join(missing)}（可用列: {', '.join(columns)}）"
+            )
+
+
+def compile_template(text: str) -> PromptTemplate:
+    """编译提示词模板"""
+    return PromptTemplate(text)
+
+
+def render_item_prompt(template: PromptTemplate, keyword: str, variables: dict | None) -> str:
+    """渲染任务项的提示词：文件导入的项使用整行变量，其余只有 {keyword}"""
+    return template.render(variables if variables is not None else {"keyword": keyword})
+
+
+def render_item_prompt_prefixed(template: PromptTemplate, keyword: str, variables: dict | None) -> tuple[str, str]:
+    """前缀缓存模式下渲染任务项的提示词，返回 (静态前缀, 完整提示词)"""
+    return template.render_prefixed(variables if variables is not None else {"keyword": keyword})
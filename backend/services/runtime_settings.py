@@ -0,0 +1,178 @@
+"""运行时设置服务：数据库存储 + 进程内缓存，支持多个 uvicorn worker 进程共享
+
+- 设置写入 runtime_settings 表，每次写入递增全表版本号
+- 各进程定期（SETTINGS_REFRESH_INTERVAL）检查 MAX(version)，变化时整体重新加载
+- 模型配置同样按需缓存，增删改模型后递增 model_configs_revision 使各进程缓存失效
+"""
+
+import asyncio
+import logging
+import time
+import uuid
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from backend.config import SETTINGS_REFRESH_INTERVAL
+from backend.database import async_session
+from backend.models import ModelConfig, RuntimeSetting
+from backend.models.base import generate_uuid, utcnow
+
+logger = logging.getLogger(__name__)
+
+# 可通过 API 修改的设置项及其默认值
+SETTING_DEFAULTS = {
+    "api_key_override": None,   # 覆盖 .env 中的 DASHSCOPE_API_KEY
+    "api_key_pool": [],         # 额外的全局 API Key，与主 Key 组成 Key 池分摊调用
+    "rate_limits": {},          # 限流参数，如 {"batch_model_concurrency": 8}
+    "features": {},             # 功能开关，如 {"autocomplete": false}
+}
+
+# 可设置的限流参数（取值均为正整数）
+RATE_LIMIT_NAMES = {
+    "batch_model_concurrency": "同一模型所有批次的并发上限",
+}
+
+# 内部设置项：模型配置修订号（变化时清空模型配置缓存）
+_MODEL_CONFIGS_REVISION = "model_configs_revision"
+
+_settings: dict[str, object] = {}
+_loaded_version: int | None = None
+_last_check = 0.0
+_refresh_lock = asyncio.Lock()
+
+_model_configs: dict[str, ModelConfig] = {}
+_model_configs_revision: object = None
+
+
+def get_setting(key: str):
+    """读取设置（进程内缓存，最多滞后 SETTINGS_REFRESH_INTERVAL 秒）"""
+    value = _settings.get(key)
+    return SETTING_DEFAULTS.get(key) if value is None else value
+
+
+def get_feature(name: str, default: bool = True) -> bool:
+    """读取功能开关"""
+    return bool(get_setting("features").get(name, default))
+
+
+def get_rate_limit(name: str, default):
+    """读取限流参数（未设置或取值不合法时返回 default，如校验加入前写入的值）"""
+    value = get_setting("rate_limits").get(name)
+    if isinstance(value, bool) or not isinstance(value, int) or value <= 0:
+        return default
+    return value
+
+
+def validate_rate_limits(rate_limits: dict) -> dict:
+    """
+    校验限流参数：只接受 RATE_LIMIT_NAMES 中的参数，取值须为正整数。
+
+    Raises:
+        ValueError: 参数未知或取值不合法
+    """
+    for name, value in rate_limits.items():
+        if name not in RATE_LIMIT_NAMES:
+            raise ValueError(f"未知的限流参数: {name}（可用: {', '.join(RATE_LIMIT_NAMES)}）")
+        if isinstance(value, bool) or not isinstance(value, int) or value <= 0:
+            raise ValueError(f"限流参数 {name} 须为正整数")
+    return rate_limits
+
+
+def list_settings() -> dict:
+    """全部可修改设置的当前值"""
+    return {key: get_setting(key) for key in SETTING_DEFAULTS}
+
+
+async def set_setting(key: str, value):
+    """写入设置（value 为 None 表示恢复默认），并立即刷新本进程缓存"""
+    async with async_session() as session:
+        next_version = (
+            select(func.coalesce(func.max(RuntimeSetting.version), 0) + 1)
+            .scalar_subquery()
+        )
+        stmt = sqlite_insert(RuntimeSetting).values(
+            id=generate_uuid(),
+            key=key,
+            value=value,
+            version=next_version,
+            created_at=utcnow(),
+            updated_at=utcnow(),
+        )
+        await session.execute(stmt.on_conflict_do_update(
+            index_elements=[RuntimeSetting.key],
+            set_={
+                "value": stmt.excluded.value,
+                "version": stmt.excluded.version,
+                "updated_at": stmt.excluded.updated_at,
+            },
+        ))
+        await session.commit()
+    await refresh_settings(force=True)
+
+
+async def refresh_settings(force: bool = False) -> bool:
+    """
+    检查设置版本，变化时重新加载。
+
+    Args:
+        force: 忽略检查间隔，立即检查
+
+    Returns:
+        是否重新加载了设置
+    """
+    global _settings, _loaded_version, _last_check, _model_configs_revision
+    if not force and time.monotonic() - _last_check < SETTINGS_REFRESH_INTERVAL:
+        return False
+
+    async with _refresh_lock:
+        _last_check = time.monotonic()
+        async with async_session() as session:
+            version = (await session.execute(
+                select(func.max(RuntimeSetting.version))
+            )).scalar() or 0
+            if version == _loaded_version:
+                return False
+            rows = (await session.execute(
+                select(RuntimeSetting.key, RuntimeSetting.value)
+            )).all()
+
+        _settings = {row.key: row.value for row in rows}
+        _loaded_version = version
+
+        revision = _settings.get(_MODEL_CONFIGS_REVISION)
+        if revision != _model_configs_revision:
+            _model_configs.clear()
+            _model_configs_revision = revision
+    return True
+
+
+async def settings_refresh_loop():
+    """后台定期检查设置版本（应用启动时运行）"""
+    while True:
+        try:
+            await refresh_settings(force=True)
+        except Exception as e:
+            logger.warning(f"刷新运行时设置失败: {e}")
+        await asyncio.sleep(SETTINGS_REFRESH_INTERVAL)
+
+
+async def get_model_config(model_config_id: str) -> ModelConfig | None:
+    """按 ID 获取模型配置（进程内缓存，模型增删改后各进程在刷新间隔内失效）
+
+    返回的是脱离会话的对象，只可读取列属性。
+    """
+    await refresh_settings()
+    model_config = _model_configs.get(model_config_id)
+    if model_config is None:
+        async with async_session() as session:
+            model_config = await session.get(ModelConfig, model_config_id)
+        if model_config is None:
+            return None
+        _model_configs[model_config_id] = model_config
+    return model_config
+
+
+async def invalidate_model_configs():
+    """模型配置变更后调用（须在变更提交之后），使所有进程的模型配置缓存失效"""
+    await set_setting(_MODEL_CONFIGS_REVISION, uuid.uuid4().hex)
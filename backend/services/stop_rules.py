@@ -0,0 +1,122 @@
+"""客户端停止规则：在流式输出上逐块判断，命中时立即中止调用（关闭上游连接），不再等到 max_tokens
+
+规则为 JSON 列表，可按单次推理请求或批次设置，任一规则命中即停止：
+- {"type": "regex", "pattern": "..."}：已输出文本匹配正则
+- {"type": "json_complete"}：输出中第一个 JSON 对象 / 数组的括号已闭合
+- {"type": "max_chars", "value": N}：已输出字符数达到 N
+- {"type": "predicate", "name": "..."}：已注册的判断函数返回真（见 STOP_PREDICATES）
+命中后记录的 stop_reason 为 "rule_<type>"。
+"""
+
+import re
+from typing import Callable
+
+# 判断函数名称 → 函数（参数为已输出的全部文本）
+STOP_PREDICATES: dict[str, Callable[[str], bool]] = {}
+
+
+def register_stop_predicate(name: str):
+    """注册可在 predicate 规则中引用的判断函数"""
+    def decorator(func: Callable[[str], bool]):
+        STOP_PREDICATES[name] = func
+        return func
+    return decorator
+
+
+@register_stop_predicate("first_line")
+def _first_line(text: str) -> bool:
+    """已输出一行非空内容（适用于单行分类结果）"""
+    return "\n" in text.lstrip()
+
+
+@register_stop_predicate("first_sentence")
+def _first_sentence(text: str) -> bool:
+    """已输出一个完整句子"""
+    return any(mark in text for mark in "。！？!?")
+
+
+def validate_stop_rules(rules: list[dict] | None) -> list[dict] | None:
+    """
+    校验停止规则。
+
+    Raises:
+        ValueError: 规则类型未知或参数不合法
+    """
+    if not rules:
+        return None
+    for rule in rules:
+        rule_type = rule.get("type") if isinstance(rule, dict) else None
+        if rule_type == "regex":
+            pattern = rule.get("pattern")
+            if not isinstance(pattern, str) or not pattern:
+                raise ValueError("regex 规则须提供 pattern")
+            try:
+                re.compile(pattern)
+            except re.error as e:
+                raise ValueError(f"regex 规则的 pattern 不合法: {e}")
+        elif rule_type == "max_chars":
+            value = rule.get("value")
+            if isinstance(value, bool) or not isinstance(value, int) or value <= 0:
+                raise ValueError("max_chars 规则的 value 须为正整数")
+        elif rule_type == "predicate":
+            if rule.get("name") not in STOP_PREDICATES:
+                raise ValueError(f"未知的判断函数: {rule.get('name')}（可用: {', '.join(STOP_PREDICATES)}）")
+        elif rule_type != "json_complete":
+            raise ValueError(f"未知的停止规则: {rule_type}（可用: regex / json_complete / max_chars / predicate）")
+    return rules
+
+
+class _JsonScanner:
+    """增量扫描输出，判断第一个 JSON 对象 / 数组是否已闭合（忽略其前的文字）"""
+
+    def __init__(self):
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+
+    def feed(self, text: str) -> bool:
+        for char in text:
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char in "{[":
+                self.depth += 1
+            elif char in "}]" and self.depth:
+                self.depth -= 1
+                if self.depth == 0:
+                    return True
+            elif char == '"' and self.depth:
+                self.in_string = True
+        return False
+
+
+class StopMatcher:
+    """对一次调用的输出逐块判断停止规则"""
+
+    def __init__(self, rules: list[dict]):
+        self.text = ""
+        self._checks: list[tuple[str, Callable[[str], bool]]] = []
+        for rule in rules:
+            rule_type = rule["type"]
+            if rule_type == "regex":
+                pattern = re.compile(rule["pattern"])
+                check = lambda delta, pattern=pattern: pattern.search(self.text) is not None
+            elif rule_type == "max_chars":
+                check = lambda delta, limit=rule["value"]: len(self.text) >= limit
+            elif rule_type == "predicate":
+                check = lambda delta, func=STOP_PREDICATES[rule["name"]]: func(self.text)
+            else:
+                check = _JsonScanner().feed
+            self._checks.append((f"rule_{rule_type}", check))
+
+    def feed(self, delta: str) -> str | None:
+        """传入新输出的文本，命中规则时返回 stop_reason"""
+        self.text += delta
+        for reason, check in self._checks:
+            if check(delta):
+                return reason
+        return None
@@ -0,0 +1,432 @@
+"""上游调度：按 (base_url, 模型) 的自适应并发控制（AIMD）与优先级调度
+
+- 调用成功且首 token 延迟正常时加性增长：每完成约 limit 次调用，上限 +1
+- 遇到 429 / 503 时乘性下调（UPSTREAM_DECREASE_FACTOR），首 token 延迟突增时小幅下调
+- 同一波拥塞只下调一次（UPSTREAM_DECREASE_COOLDOWN），避免连续减半
+- 名额不足时按优先级排队：单次推理 > 对比 > 批量 > 后台；
+  上限中预留一部分（UPSTREAM_INTERACTIVE_RESERVE）只给单次推理使用，
+  多个批次之间按加权公平排队（WFQ）轮流获得名额
+- 准入控制：单次推理与对比在返回响应前先获取名额，同一上游（base_url）排队已满或
+  等待超过 UPSTREAM_QUEUE_MAX_WAIT 时快速拒绝（UpstreamOverloaded → 429 + Retry-After）；
+  批量任务在创建 / 续跑时检查排队深度
+- 上限、排队深度、拒绝次数及变化历史通过 /api/upstream 查看
+
+控制器为进程内状态：worker 模式下每个 worker 进程各自收敛。
+"""
+
+import asyncio
+import enum
+import heapq
+import itertools
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from typing import AsyncIterator, Iterable
+
+from backend.config import (
+    DASHSCOPE_BASE_URL,
+    UPSTREAM_DECREASE_COOLDOWN,
+    UPSTREAM_DECREASE_FACTOR,
+    UPSTREAM_HISTORY_SIZE,
+    UPSTREAM_INTERACTIVE_RESERVE,
+    UPSTREAM_LIMIT_INITIAL,
+    UPSTREAM_LIMIT_MAX,
+    UPSTREAM_LIMIT_MIN,
+    UPSTREAM_QUEUE_MAX_DEPTH,
+    UPSTREAM_QUEUE_MAX_WAIT,
+    UPSTREAM_RETRY_AFTER_MAX,
+    UPSTREAM_TTFT_DECREASE_FACTOR,
+    UPSTREAM_TTFT_MIN_SAMPLES,
+    UPSTREAM_TTFT_SPIKE_RATIO,
+)
+from backend.models import ModelConfig
+
+# 视为上游过载的 HTTP 状态码
+OVERLOAD_STATUS_CODES = (429, 503)
+
+# 首 token 延迟、调用耗时平均值的平滑系数
+_TTFT_EWMA_ALPHA = 0.1
+
+
+class UpstreamOverloaded(Exception):
+    """上游繁忙，请求未被准入（API 返回 429，retry_after 为建议的重试间隔秒数）"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class UpstreamPriority(enum.IntEnum):
+    """上游调用优先级（值越小越优先）"""
+    INTERACTIVE = 0   # 单次推理
+    COMPARISON = 1    # 模型对比
+    BATCH = 2         # 批量任务
+    BACKGROUND = 3    # 后台任务（如自动补全）
+
+
+class UpstreamCall:
+    """单次上游调用的观测：记录排队时间、首 token 时间与结果，释放名额时结算"""
+
+    __slots__ = ("limiter", "queue_wait_ms", "started_at", "ttft_ms", "succeeded", "status_code", "released")
+
+    def __init__(self, limiter: "AdaptiveLimiter", queue_wait_ms: int):
+        self.limiter = limiter
+        self.queue_wait_ms = queue_wait_ms
+        self.released = False
+        self.started_at = time.monotonic()
+        self.ttft_ms: float | None = None
+        self.succeeded = False
+        self.status_code: int | None = None
+
+    def observe(self, event: dict):
+        """传入 stream_chat_completion 的每个事件"""
+        event_type = event["type"]
+        if event_type == "token" and self.ttft_ms is None:
+            self.ttft_ms = (time.monotonic() - self.started_at) * 1000
+        elif event_type == "done":
+            self.succeeded = True
+        elif event_type == "error":
+            self.status_code = event.get("status_code")
+
+    def release(self):
+        """释放名额（可重复调用）"""
+        self.limiter.release(self)
+
+
+class AdaptiveLimiter:
+    """单个 (base_url, 模型) 的 AIMD 并发控制器"""
+
+    def __init__(self, base_url: str, model_id: str):
+        self.base_url = base_url
+        self.model_id = model_id
+        self.limit = float(UPSTREAM_LIMIT_INITIAL)
+        self.in_flight = 0
+        self.ttft_ewma_ms: float | None = None
+        self.ttft_samples = 0
+        self.successes = 0
+        self.overloads = 0
+        self.ttft_spikes = 0
+        self.duration_ewma_s: float | None = None
+        self.ttft_window: deque[float] = deque(maxlen=UPSTREAM_HISTORY_SIZE)  # 最近的首 token 延迟（毫秒）
+        self.rejected_full = 0
+        self.rejected_timeout = 0
+        self.history: deque[dict] = deque(maxlen=UPSTREAM_HISTORY_SIZE)
+        self._last_decrease = 0.0
+        # 等待队列：(优先级, 虚拟完成时间, 序号, 流, future)
+        self._waiters: list[tuple[int, float, int, str | None, asyncio.Future]] = []
+        self._seq = itertools.count()
+        # WFQ 虚拟时间与各流（批次）最后一个排队请求的虚拟完成时间
+        self._virtual_time = 0.0
+        self._flow_finish: dict[str, float] = {}
+        self._record("initial")
+
+    @asynccontextmanager
+    async def slot(
+        self,
+        priority: UpstreamPriority = UpstreamPriority.INTERACTIVE,
+        flow: str | None = None,
+        weight: float = 1.0,
+        admitted: UpstreamCall | None = None,
+    ) -> AsyncIterator[UpstreamCall]:
+        """
+        占用一个调用名额（名额不足时按优先级排队）；退出时根据观测结果调整上限。
+
+        Args:
+            priority: 优先级
+            flow: 公平排队的流标识（如批次 ID），同一优先级内各流轮流获得名额
+            weight: 流的权重，权重越大获得名额越多
+            admitted: 已通过准入控制获得的名额（见 admit），传入时不再排队
+        """
+        call = admitted or await self.acquire(priority, flow, weight)
+        try:
+            yield call
+        finally:
+            self.release(call)
+
+    async def acquire(
+        self,
+        priority: UpstreamPriority,
+        flow: str | None = None,
+        weight: float = 1.0,
+        max_wait: float | None = None,
+    ) -> UpstreamCall:
+        """
+        获取一个调用名额，使用完毕后须调用 release。
+
+        Args:
+            max_wait: 最长等待秒数；不为空时启用准入控制（排队已满立即拒绝，超时拒绝）
+        Raises:
+            UpstreamOverloaded: 准入控制拒绝
+        """
+        enqueued_at = time.monotonic()
+        if max_wait is None:
+            await self._acquire(priority, flow, weight)
+        else:
+            depth = provider_queue_depth(self.base_url, priority)
+            if depth >= UPSTREAM_QUEUE_MAX_DEPTH:
+                self.rejected_full += 1
+                raise UpstreamOverloaded("上游排队已满，请稍后重试", self.retry_after(depth))
+            try:
+                await asyncio.wait_for(self._acquire(priority, flow, weight), max_wait)
+            except asyncio.TimeoutError:
+                self.rejected_timeout += 1
+                raise UpstreamOverloaded(
+                    f"等待上游超过 {max_wait:g} 秒，请稍后重试",
+                    self.retry_after(provider_queue_depth(self.base_url, priority)),
+                )
+        return UpstreamCall(self, int((time.monotonic() - enqueued_at) * 1000))
+
+    def try_acquire(self, priority: UpstreamPriority) -> UpstreamCall | None:
+        """不排队地获取名额：有排队者或没有空闲名额时返回 None"""
+        if self.queued() or self.in_flight >= self._capacity(priority):
+            return None
+        self.in_flight += 1
+        return UpstreamCall(self, 0)
+
+    def release(self, call: UpstreamCall):
+        """归还名额并结算调用（重复调用无效）"""
+        if call.released:
+            return
+        call.released = True
+        self._settle(call)
+        self.in_flight -= 1
+        self._dispatch()
+
+    def queued(self, max_priority: int = UpstreamPriority.BACKGROUND) -> int:
+        """优先级不低于 max_priority 的排队数"""
+        return sum(1 for waiter in self._waiters if waiter[0] <= max_priority and not waiter[4].done())
+
+    def retry_after(self, depth: int) -> int:
+        """按排队深度与平均调用耗时估算的重试间隔（秒）"""
+        per_call = self.duration_ewma_s or 1.0
+        estimate = (depth + 1) / max(int(self.limit), 1) * per_call
+        return min(max(math.ceil(estimate), 1), UPSTREAM_RETRY_AFTER_MAX)
+
+    def _capacity(self, priority: int) -> int:
+        """该优先级可使用的名额：预留部分只给单次推理
+
+        上限不小于 2 时至少预留 1 个（向上取整），上限被下调到很小时单次推理仍有名额；
+        上限为 1 时不预留，否则其他优先级永远无法执行。
+        """
+        limit = int(self.limit)
+        if priority == UpstreamPriority.INTERACTIVE or limit < 2 or UPSTREAM_INTERACTIVE_RESERVE <= 0:
+            return limit
+        reserve = min(max(1, math.ceil(limit * UPSTREAM_INTERACTIVE_RESERVE)), limit - 1)
+        return limit - reserve
+
+    async def _acquire(self, priority: int, flow: str | None, weight: float):
+        """获取名额：没有排队者且有空闲名额时直接获得，否则进入等待队列"""
+        if not self._waiters and self.in_flight < self._capacity(priority):
+            self.in_flight += 1
+            return
+
+        # WFQ：虚拟开始时间取当前虚拟时间与该流上一个请求完成时间的较大者
+        start = max(self._virtual_time, self._flow_finish.get(flow, 0.0)) if flow else self._virtual_time
+        finish = start + 1.0 / max(weight, 1e-6)
+        if flow:
+            self._flow_finish[flow] = finish
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (int(priority), finish, next(self._seq), flow, future))
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 已分配名额但等待者被取消：归还名额
+                self.in_flight -= 1
+                self._dispatch()
+            raise
+
+    def _dispatch(self):
+        """按优先级与虚拟完成时间把空闲名额分配给等待者"""
+        while self._waiters:
+            priority, finish, _, flow, future = self._waiters[0]
+            if future.done():  # 等待者已取消
+                heapq.heappop(self._waiters)
+                continue
+            # 队首是可用名额最多的等待者，它无法获得名额时其余也不能
+            if self.in_flight >= self._capacity(priority):
+                return
+            heapq.heappop(self._waiters)
+            self.in_flight += 1
+            self._virtual_time = max(self._virtual_time, finish)
+            if flow and self._flow_finish.get(flow) == finish:
+                del self._flow_finish[flow]  # 该流已无排队请求
+            future.set_result(None)
+
+    def _settle(self, call: UpstreamCall):
+        """结算一次调用"""
+        if call.status_code in OVERLOAD_STATUS_CODES:
+            self.overloads += 1
+            self._decrease(UPSTREAM_DECREASE_FACTOR, f"http_{call.status_code}")
+            return
+        if not call.succeeded:
+            return  # 其他错误与上游容量无关，不调整
+
+        self.successes += 1
+        duration = time.monotonic() - call.started_at
+        self.duration_ewma_s = duration if self.duration_ewma_s is None else (
+            _TTFT_EWMA_ALPHA * duration + (1 - _TTFT_EWMA_ALPHA) * self.duration_ewma_s
+        )
+        if call.ttft_ms is not None:
+            self.ttft_window.append(call.ttft_ms)
+            spike = (
+                self.ttft_samples >= UPSTREAM_TTFT_MIN_SAMPLES
+                and call.ttft_ms > self.ttft_ewma_ms * UPSTREAM_TTFT_SPIKE_RATIO
+            )
+            if spike:
+                self.ttft_spikes += 1
+                self._decrease(UPSTREAM_TTFT_DECREASE_FACTOR, "ttft_spike")
+                return
+            self.ttft_samples += 1
+            self.ttft_ewma_ms = call.ttft_ms if self.ttft_ewma_ms is None else (
+                _TTFT_EWMA_ALPHA * call.ttft_ms + (1 - _TTFT_EWMA_ALPHA) * self.ttft_ewma_ms
+            )
+
+        # 只有名额用满时增长才有意义（否则上限不是瓶颈）
+        if self.in_flight >= int(self.limit):
+            before = int(self.limit)
+            self.limit = min(float(UPSTREAM_LIMIT_MAX), self.limit + 1 / self.limit)
+            if int(self.limit) != before:
+                self._record("increase")
+                self._dispatch()
+
+    def ttft_percentile(self, q: float) -> float | None:
+        """最近首 token 延迟的分位数（毫秒），没有样本时返回 None"""
+        if not self.ttft_window:
+            return None
+        samples = sorted(self.ttft_window)
+        return samples[min(int(len(samples) * q), len(samples) - 1)]
+
+    def _decrease(self, factor: float, reason: str):
+        """乘性下调（冷却期内忽略）"""
+        now = time.monotonic()
+        if now - self._last_decrease < UPSTREAM_DECREASE_COOLDOWN:
+            return
+        self._last_decrease = now
+        self.limit = max(float(UPSTREAM_LIMIT_MIN), self.limit * factor)
+        self._record(reason)
+
+    def _record(self, reason: str):
+        """记录上限变化"""
+        self.history.append({
+            "at": datetime.now(timezone.utc).isoformat(),
+            "limit": int(self.limit),
+            "reason": reason,
+        })
+
+    def snapshot(self) -> dict:
+        """当前状态"""
+        ttft_p90 = self.ttft_percentile(0.9)
+        return {
+            "base_url": self.base_url,
+            "model_id": self.model_id,
+            "limit": int(self.limit),
+            "in_flight": self.in_flight,
+            "queued": self.queued(),
+            "ttft_ewma_ms": round(self.ttft_ewma_ms) if self.ttft_ewma_ms is not None else None,
+            "ttft_p90_ms": round(ttft_p90) if ttft_p90 is not None else None,
+            "successes": self.successes,
+            "overloads": self.overloads,
+            "ttft_spikes": self.ttft_spikes,
+            "rejected_full": self.rejected_full,
+            "rejected_timeout": self.rejected_timeout,
+        }
+
+
+# (base_url, 模型标识) → 控制器
+_limiters: dict[tuple[str, str], AdaptiveLimiter] = {}
+
+
+def upstream_base_url(model_config: ModelConfig) -> str:
+    """模型实际请求的 base_url（与 stream_chat_completion 的选择一致）"""
+    if model_config.is_custom and model_config.custom_base_url:
+        return model_config.custom_base_url
+    return DASHSCOPE_BASE_URL
+
+
+def get_limiter(model_config: ModelConfig) -> AdaptiveLimiter:
+    """获取模型对应的并发控制器（同一 base_url 下的同名模型共享）"""
+    return get_limiter_for(upstream_base_url(model_config), model_config.model_id)
+
+
+def get_limiter_for(base_url: str, model_id: str) -> AdaptiveLimiter:
+    """按 (base_url, 模型标识) 获取并发控制器"""
+    key = (base_url, model_id)
+    limiter = _limiters.get(key)
+    if limiter is None:
+        limiter = _limiters[key] = AdaptiveLimiter(*key)
+    return limiter
+
+
+def list_limiters() -> list[dict]:
+    """全部控制器的当前状态"""
+    return [limiter.snapshot() for limiter in _limiters.values()]
+
+
+def provider_queue_depth(base_url: str, max_priority: int = UpstreamPriority.BACKGROUND) -> int:
+    """同一上游下所有模型中，优先级不低于 max_priority 的排队数"""
+    return sum(
+        limiter.queued(max_priority)
+        for (url, _), limiter in _limiters.items()
+        if url == base_url
+    )
+
+
+def list_providers() -> list[dict]:
+    """按上游（base_url）汇总的排队深度与拒绝次数"""
+    providers: dict[str, dict] = {}
+    for limiter in _limiters.values():
+        stats = providers.setdefault(limiter.base_url, {
+            "base_url": limiter.base_url,
+            "in_flight": 0,
+            "queued": 0,
+            "queued_by_priority": {p.name.lower(): 0 for p in UpstreamPriority},
+            "rejected_full": 0,
+            "rejected_timeout": 0,
+        })
+        stats["in_flight"] += limiter.in_flight
+        stats["rejected_full"] += limiter.rejected_full
+        stats["rejected_timeout"] += limiter.rejected_timeout
+        for priority, _, _, _, future in limiter._waiters:
+            if not future.done():
+                stats["queued"] += 1
+                stats["queued_by_priority"][UpstreamPriority(priority).name.lower()] += 1
+    return list(providers.values())
+
+
+async def admit(model_config: ModelConfig, priority: UpstreamPriority) -> UpstreamCall:
+    """
+    准入控制：在返回响应前获取上游名额（最多等待 UPSTREAM_QUEUE_MAX_WAIT 秒）。
+
+    获得的名额传给 slot(admitted=...) 使用，调用方须保证最终 release。
+
+    Raises:
+        UpstreamOverloaded: 排队已满或等待超时
+    """
+    return await get_limiter(model_config).acquire(priority, max_wait=UPSTREAM_QUEUE_MAX_WAIT)
+
+
+def admit_batch(model_configs: Iterable[ModelConfig]):
+    """
+    批量任务准入：涉及的任一上游的排队已满时拒绝创建 / 续跑。
+
+    Raises:
+        UpstreamOverloaded: 排队已满
+    """
+    for base_url in {upstream_base_url(mc) for mc in model_configs}:
+        depth = provider_queue_depth(base_url, UpstreamPriority.BATCH)
+        if depth >= UPSTREAM_QUEUE_MAX_DEPTH:
+            limiters = [limiter for (url, _), limiter in _limiters.items() if url == base_url]
+            for limiter in limiters:
+                limiter.rejected_full += 1
+            retry_after = max(limiter.retry_after(depth) for limiter in limiters)
+            raise UpstreamOverloaded(f"上游 {base_url} 排队已满，请稍后再启动批量任务", retry_after)
+
+
+def get_limiter_history(base_url: str, model_id: str) -> list[dict] | None:
+    """控制器的上限变化历史；不存在时返回 None"""
+    limiter = _limiters.get((base_url, model_id))
+    return list(limiter.history) if limiter else None
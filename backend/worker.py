@@ -0,0 +1,126 @@
+"""批量任务 worker 进程：从 SQLite 任务队列领取批量任务项并执行
+
+需配合 BATCH_EXECUTION_MODE=worker 使用，可启动多个进程按 CPU 核数扩展吞吐。
+
+运行方式:
+    python -m backend.worker [--concurrency 8]
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import signal
+import socket
+import uuid
+
+from backend.config import (
+    BATCH_EXECUTION_MODE,
+    WORKER_CONCURRENCY,
+    WORKER_HEARTBEAT_INTERVAL,
+    WORKER_POLL_INTERVAL,
+)
+from backend.database import init_db
+from backend.services.batch_queue import (
+    claim_batch_item,
+    execute_claimed_item,
+    release_leases,
+    renew_leases,
+)
+from backend.services.runtime_settings import refresh_settings, settings_refresh_loop
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+
+async def run_worker(concurrency: int):
+    """领取并执行任务项，直到收到退出信号；退出时等待执行中的项完成"""
+    await init_db()
+    await refresh_settings(force=True)
+
+    owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stopping.set)
+        except NotImplementedError:  # Windows
+            pass
+
+    slots = asyncio.Semaphore(concurrency)
+    in_flight: set[asyncio.Task] = set()
+    heartbeat = asyncio.create_task(_heartbeat_loop(owner))
+    settings_refresh = asyncio.create_task(settings_refresh_loop())
+    logger.info(f"[*] worker 已启动: {owner}（并发 {concurrency}）")
+
+    try:
+        while not stopping.is_set():
+            await slots.acquire()
+            try:
+                claim = await claim_batch_item(owner)
+            except Exception as e:
+                logger.error(f"领取任务项失败: {e}")
+                claim = None
+            if claim is None:
+                slots.release()
+                try:
+                    await asyncio.wait_for(stopping.wait(), timeout=WORKER_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            task = asyncio.create_task(_execute(owner, claim))
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+            task.add_done_callback(lambda _: slots.release())
+
+        if in_flight:
+            logger.info(f"[*] 等待 {len(in_flight)} 个执行中的任务项完成...")
+            await asyncio.gather(*in_flight, return_exceptions=True)
+    finally:
+        heartbeat.cancel()
+        settings_refresh.cancel()
+        for task in in_flight:
+            task.cancel()
+        released = await release_leases(owner)
+        if released:
+            logger.info(f"[*] 已归还 {released} 个未完成的任务项")
+    logger.info("[*] worker 已退出")
+
+
+async def _execute(owner: str, claim: dict):
+    """执行单个任务项，异常只记录日志（租约过期后会被重新领取）"""
+    try:
+        await execute_claimed_item(owner, claim)
+    except Exception as e:
+        logger.error(f"任务项执行失败: {claim['batch_id']}#{claim['index']} - {e}", exc_info=True)
+
+
+async def _heartbeat_loop(owner: str):
+    """定期为持有的任务项续约"""
+    while True:
+        await asyncio.sleep(WORKER_HEARTBEAT_INTERVAL)
+        try:
+            await renew_leases(owner)
+        except Exception as e:
+            logger.warning(f"续约失败: {e}")
+
+
+def main(argv: list[str] | None = None):
+    """命令行入口"""
+    parser = argparse.ArgumentParser(prog="python -m backend.worker", description="批量任务 worker 进程")
+    parser.add_argument("--concurrency", type=int, default=WORKER_CONCURRENCY, help="同时执行的任务项数")
+    args = parser.parse_args(argv)
+
+    if BATCH_EXECUTION_MODE != "worker":
+        logger.warning("BATCH_EXECUTION_MODE 不是 worker，Web 进程也会执行批量任务，请先修改配置")
+        return
+
+    asyncio.run(run_worker(max(1, args.concurrency)))
+
+
+if __name__ == "__main__":
+    main()
@@ -196,6 +196,9 @@ function _dispatchSSEEvent(eventType, eventData, handlers) {
       case 'result':
         handlers.onResult?.(data);
         break;
+      case 'snapshot':
+        handlers.onSnapshot?.(data);
+        break;
     }
   } catch (e) {
     console.warn('[SSE] 解析事件失败:', eventType, eventData, e);
@@ -230,6 +233,16 @@ export const history = {
   detail: (id) => get(`/history/${id}`),
   remove: (id) => del(`/history/${id}`),
   batchDelete: (data) => post('/history/batch-delete', data),
+  deleteJob: (jobId) => get(`/history/delete-jobs/${jobId}`),
+  export: (params = {}) => {
+    const searchParams = new URLSearchParams();
+    for (const [key, value] of Object.entries(params)) {
+      if (value !== undefined && value !== null && value !== '') {
+        searchParams.append(key, value);
+      }
+    }
+    window.open(`${API_BASE}/history/export?${searchParams.toString()}`, '_blank');
+  },
 };
 
 export const statistics = {
@@ -244,7 +257,19 @@ export const settings = {
 
 export const batch = {
   create: (body) => post('/batch', body),
+  upload: (file, fields) => {
+    // 文件导入：CSV / JSONL，其余字段以表单提交（对象字段序列化为 JSON）
+    const formData = new FormData();
+    formData.append('file', file);
+    Object.entries(fields).forEach(([key, value]) => {
+      if (value === undefined || value === null) return;
+      formData.append(key, typeof value === 'object' ? JSON.stringify(value) : String(value));
+    });
+    return post('/batch/upload', formData);
+  },
   get: (id) => get(`/batch/${id}`),
+  results: (id, params) => get(`/batch/${id}/results`, params),
+  resume: (id) => post(`/batch/${id}/resume`, {}),
   stream: (id, handlers) => {
     // GET SSE — 使用统一的 SSE 解析逻辑
     const controller = new AbortController();
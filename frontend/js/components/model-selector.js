@@ -380,6 +380,9 @@ export function createModelSelector(container, options = {}) {
         return;
       }
 
+      // 上游熔断中的模型标注不可用（调用会立即失败）
+      const getHealthLabel = (m) => (m.health && m.health.state !== 'closed' ? ' （暂不可用）' : '');
+
       // 分组显示：先预置后自定义
       const presetModels = modelList.filter((m) => !m.is_custom);
       const customModels = modelList.filter((m) => m.is_custom);
@@ -391,7 +394,7 @@ export function createModelSelector(container, options = {}) {
         optionsHtml += presetModels
           .map((m) => {
             const icons = (m.supported_modalities || []).map(getModalityIcon).join('');
-            return `<option value="${m.id}">${m.name} ${icons}</option>`;
+            return `<option value="${m.id}">${m.name} ${icons}${getHealthLabel(m)}</option>`;
           })
           .join('');
         optionsHtml += '</optgroup>';
@@ -402,7 +405,7 @@ export function createModelSelector(container, options = {}) {
         optionsHtml += customModels
           .map((m) => {
             const icons = (m.supported_modalities || []).map(getModalityIcon).join('');
-            return `<option value="${m.id}">${m.name} ${icons}</option>`;
+            return `<option value="${m.id}">${m.name} ${icons}${getHealthLabel(m)}</option>`;
           })
           .join('');
         optionsHtml += '</optgroup>';
@@ -17,7 +17,7 @@ export default function render(container) {
         <label class="input-field__label">提示词模板</label>
         <textarea class="input-field__textarea" id="batch-template"
           placeholder="请用100字描述&quot;{keyword}&quot;的主要特征和用途" rows="3"></textarea>
-        <div class="input-field__helper">使用 {keyword} 作为关键词占位符</div>
+        <div class="input-field__helper">使用 {keyword} 作为关键词占位符；导入文件时可用 {列名} 引用任意列</div>
       </div>
 
       <div class="input-field mb-md">
@@ -26,6 +26,18 @@ export default function render(container) {
           placeholder="人工智能&#10;云计算&#10;大数据&#10;物联网" rows="5"></textarea>
       </div>
 
+      <div class="input-field mb-md">
+        <label class="input-field__label">或导入文件（CSV / JSONL）</label>
+        <input type="file" class="input-field__input" id="batch-file" accept=".csv,.jsonl,.ndjson">
+        <div class="input-field__helper">CSV 首行为表头；有 keyword 列时作为关键词，否则取第一列。选择文件后忽略上方关键词列表</div>
+      </div>
+
+      <div class="input-field mb-md">
+        <label class="input-field__label">并发数</label>
+        <input type="number" class="input-field__input" id="batch-concurrency" min="1" max="32" value="4">
+        <div class="input-field__helper">同时执行的关键词数量，受单模型并发上限约束</div>
+      </div>
+
       <button class="btn btn--filled btn--block" id="btn-batch-run">
         <span class="material-symbols-outlined">playlist_play</span>
         <span id="btn-batch-text">执行批量测试</span>
@@ -41,21 +53,30 @@ export default function render(container) {
       <div class="progress-bar">
         <div class="progress-bar__fill" id="progress-fill" style="width:0%"></div>
       </div>
+      <div class="text-body-small text-secondary mt-sm" id="progress-stats"></div>
+      <div class="text-body-small mt-sm" id="recent-failures" style="display:none"></div>
     </div>
 
     <!-- 结果表格 -->
     <div id="batch-results" class="card" style="display:none">
       <div class="flex justify-between items-center mb-md">
         <span class="text-title-medium">测试结果</span>
-        <button class="btn btn--outlined" id="btn-export">
-          <span class="material-symbols-outlined">download</span>
-          导出 CSV
-        </button>
+        <div class="flex gap-sm">
+          <button class="btn btn--outlined" id="btn-resume" style="display:none">
+            <span class="material-symbols-outlined">replay</span>
+            重试失败项
+          </button>
+          <button class="btn btn--outlined" id="btn-export">
+            <span class="material-symbols-outlined">download</span>
+            导出 CSV
+          </button>
+        </div>
       </div>
       <div style="overflow-x:auto">
         <table class="data-table">
           <thead>
             <tr>
+              <th>#</th>
               <th>关键词</th>
               <th>状态</th>
               <th>输出摘要</th>
@@ -65,10 +86,21 @@ export default function render(container) {
           <tbody id="results-tbody"></tbody>
         </table>
       </div>
+      <div class="flex justify-between items-center mt-md">
+        <button class="btn btn--text" id="btn-page-prev">上一页</button>
+        <span class="text-body-small text-secondary" id="page-label"></span>
+        <button class="btn btn--text" id="btn-page-next">下一页</button>
+      </div>
     </div>
   `;
 
+  // 结果按页从分页接口读取，进度事件只携带聚合数据
+  const PAGE_SIZE = 100;
   let currentBatchId = null;
+  let currentPage = 0;
+  let totalItems = 0;
+  let pageComplete = false;
+  let pageLoading = false;
 
   const modelSelector = createModelSelector(
     container.querySelector('#batch-model-mount')
@@ -76,81 +108,185 @@ export default function render(container) {
 
   const runBtn = container.querySelector('#btn-batch-run');
   const exportBtn = container.querySelector('#btn-export');
+  const resumeBtn = container.querySelector('#btn-resume');
 
   runBtn.addEventListener('click', handleRun);
   exportBtn.addEventListener('click', () => {
     if (currentBatchId) batchApi.export(currentBatchId, 'csv');
   });
+  resumeBtn.addEventListener('click', handleResume);
+  container.querySelector('#btn-page-prev').addEventListener('click', () => loadPage(currentPage - 1));
+  container.querySelector('#btn-page-next').addEventListener('click', () => loadPage(currentPage + 1));
+
+  function updateProgress(data) {
+    const pct = data.total ? Math.round((data.completed / data.total) * 100) : 0;
+    container.querySelector('#progress-fill').style.width = `${pct}%`;
+    container.querySelector('#progress-label').textContent = `执行中（并发 ${data.concurrency ?? '--'}），失败 ${data.failed}`;
+    container.querySelector('#progress-count').textContent = `${data.completed}/${data.total}`;
+
+    const stats = [];
+    if (data.rate) stats.push(`${data.rate} 项/秒`);
+    if (data.eta_seconds != null) stats.push(`预计剩余 ${formatEta(data.eta_seconds)}`);
+    container.querySelector('#progress-stats').textContent = stats.join(' · ');
+
+    const failures = data.recent_failures || [];
+    const failuresEl = container.querySelector('#recent-failures');
+    failuresEl.style.display = failures.length ? '' : 'none';
+    failuresEl.innerHTML = failures.length
+      ? '最近失败：' + failures.map(f => `<div>#${f.index + 1} ${f.keyword}：${f.error_message || '--'}</div>`).join('')
+      : '';
+
+    if (data.total !== totalItems) {
+      totalItems = data.total;
+      updatePager();
+    }
+  }
+
+  function formatEta(seconds) {
+    if (seconds < 60) return `${seconds} 秒`;
+    if (seconds < 3600) return `${Math.round(seconds / 60)} 分钟`;
+    return `${(seconds / 3600).toFixed(1)} 小时`;
+  }
+
+  function updatePager() {
+    const pages = Math.max(1, Math.ceil(totalItems / PAGE_SIZE));
+    container.querySelector('#page-label').textContent = `第 ${currentPage + 1} / ${pages} 页`;
+    container.querySelector('#btn-page-prev').disabled = currentPage <= 0;
+    container.querySelector('#btn-page-next').disabled = currentPage >= pages - 1;
+  }
+
+  function renderResultRow(data) {
+    const tr = document.createElement('tr');
+    tr.innerHTML = `
+      <td>${data.index + 1}</td>
+      <td>${data.keyword}</td>
+      <td>${getStatusChip(data.status)}</td>
+      <td class="text-body-small">${data.output ? data.output.slice(0, 100) + '...' : (data.error_message || '--')}</td>
+      <td>${data.token_input ? formatNumber(data.token_input + (data.token_output || 0)) : '--'}</td>
+    `;
+    return tr;
+  }
+
+  async function loadPage(page) {
+    if (!currentBatchId || pageLoading) return;
+    const pages = Math.max(1, Math.ceil(totalItems / PAGE_SIZE));
+    page = Math.min(Math.max(page, 0), pages - 1);
+    pageLoading = true;
+    try {
+      const data = await batchApi.results(currentBatchId, { offset: page * PAGE_SIZE, limit: PAGE_SIZE });
+      currentPage = page;
+      totalItems = data.total;
+      pageComplete = data.results.every(r => r.status !== 'pending');
+      container.querySelector('#results-tbody').replaceChildren(...data.results.map(renderResultRow));
+      updatePager();
+    } catch (err) {
+      showToast(`加载批量结果失败: ${err.message}`, 'error');
+    } finally {
+      pageLoading = false;
+    }
+  }
+
+  function subscribe(batchId) {
+    // 流式监听进度
+    console.log('[Batch] Starting stream for batch:', batchId);
+    batchApi.stream(batchId, {
+      onSnapshot: (data) => {
+        console.log('[Batch] snapshot:', data);
+        updateProgress(data);
+        loadPage(currentPage);
+      },
+      onProgress: (data) => {
+        updateProgress(data);
+        // 当前页还有未完成的项时随进度刷新（进度事件本身按固定间隔推送）
+        if (!pageComplete) loadPage(currentPage);
+      },
+      onDone: (data) => {
+        console.log('[Batch] done:', data);
+        container.querySelector('#progress-fill').style.width = '100%';
+        container.querySelector('#progress-label').textContent = `完成！成功 ${data.completed - data.failed}，失败 ${data.failed}`;
+        runBtn.disabled = false;
+        container.querySelector('#btn-batch-text').textContent = '执行批量测试';
+        resumeBtn.style.display = data.failed > 0 ? '' : 'none';
+        container.querySelector('#progress-stats').textContent = '';
+        loadPage(currentPage);
+        showToast('批量测试完成', 'success');
+      },
+      onError: (msg) => {
+        console.error('[Batch] error:', msg);
+        showToast(`批量测试出错: ${msg}`, 'error');
+        runBtn.disabled = false;
+        container.querySelector('#btn-batch-text').textContent = '执行批量测试';
+      },
+    });
+  }
+
+  async function handleResume() {
+    if (!currentBatchId) return;
+    resumeBtn.disabled = true;
+    try {
+      const result = await batchApi.resume(currentBatchId);
+      if (result.resumed_count > 0) {
+        resumeBtn.style.display = 'none';
+        runBtn.disabled = true;
+        pageComplete = false;
+        subscribe(currentBatchId);
+      }
+      showToast(`已重新执行 ${result.resumed_count} 项`, 'success');
+    } catch (err) {
+      showToast(`重试失败: ${err.message}`, 'error');
+    } finally {
+      resumeBtn.disabled = false;
+    }
+  }
 
   async function handleRun() {
     const modelId = modelSelector.getSelectedModelId();
     const template = container.querySelector('#batch-template').value.trim();
     const keywordsText = container.querySelector('#batch-keywords').value.trim();
+    const file = container.querySelector('#batch-file').files[0];
 
     if (!modelId) { showToast('请选择模型', 'warning'); return; }
     if (!template) { showToast('请输入提示词模板', 'warning'); return; }
-    if (!keywordsText) { showToast('请输入关键词', 'warning'); return; }
-    if (!template.includes('{keyword}')) { showToast('模板中需包含 {keyword} 占位符', 'warning'); return; }
+    if (!file && !keywordsText) { showToast('请输入关键词或导入文件', 'warning'); return; }
+    if (!file && !template.includes('{keyword}')) { showToast('模板中需包含 {keyword} 占位符', 'warning'); return; }
 
-    const keywords = keywordsText.split('\n').map(k => k.trim()).filter(Boolean);
-    if (keywords.length === 0) { showToast('请至少输入一个关键词', 'warning'); return; }
+    const keywords = file ? [] : keywordsText.split('\n').map(k => k.trim()).filter(Boolean);
+    if (!file && keywords.length === 0) { showToast('请至少输入一个关键词', 'warning'); return; }
+    const concurrency = parseInt(container.querySelector('#batch-concurrency').value, 10) || undefined;
 
     runBtn.disabled = true;
-    container.querySelector('#btn-batch-text').textContent = `执行批量测试 (${keywords.length}个关键词)`;
+    container.querySelector('#btn-batch-text').textContent = file
+      ? `执行批量测试 (${file.name})`
+      : `执行批量测试 (${keywords.length}个关键词)`;
 
     try {
-      // 创建任务
-      const result = await batchApi.create({
+      // 创建任务（列校验在服务端完成，模板引用了不存在的列时直接报错）
+      const fields = {
         model_config_id: modelId,
-        keywords,
         prompt_template: template,
         params: modelSelector.getParams(),
-      });
+        concurrency,
+      };
+      const result = file
+        ? await batchApi.upload(file, fields)
+        : await batchApi.create({ ...fields, keywords });
 
       currentBatchId = result.id;
+      if (result.saved_calls > 0) {
+        showToast(`${result.saved_calls} 个重复项将直接复用结果，不再调用模型`, 'info');
+      }
 
       // 显示进度和结果
       container.querySelector('#batch-progress').style.display = 'block';
       container.querySelector('#batch-results').style.display = 'block';
       container.querySelector('#results-tbody').innerHTML = '';
+      resumeBtn.style.display = 'none';
+      currentPage = 0;
+      totalItems = result.total_count;
+      pageComplete = false;
+      updatePager();
 
-      // 流式监听进度
-      console.log('[Batch] Starting stream for batch:', currentBatchId);
-      batchApi.stream(currentBatchId, {
-        onProgress: (data) => {
-          console.log('[Batch] progress:', data);
-          const pct = Math.round((data.completed / data.total) * 100);
-          container.querySelector('#progress-fill').style.width = `${pct}%`;
-          container.querySelector('#progress-label').textContent = `当前: ${data.current_keyword}`;
-          container.querySelector('#progress-count').textContent = `${data.completed}/${data.total}`;
-        },
-        onResult: (data) => {
-          console.log('[Batch] result:', data);
-          const tbody = container.querySelector('#results-tbody');
-          const tr = document.createElement('tr');
-          tr.innerHTML = `
-            <td>${data.keyword}</td>
-            <td>${getStatusChip(data.status)}</td>
-            <td class="text-body-small">${data.output ? data.output.slice(0, 100) + '...' : (data.error_message || '--')}</td>
-            <td>${data.token_input ? formatNumber(data.token_input + (data.token_output || 0)) : '--'}</td>
-          `;
-          tbody.appendChild(tr);
-        },
-        onDone: (data) => {
-          console.log('[Batch] done:', data);
-          container.querySelector('#progress-fill').style.width = '100%';
-          container.querySelector('#progress-label').textContent = `完成！成功 ${data.completed - data.failed}，失败 ${data.failed}`;
-          runBtn.disabled = false;
-          container.querySelector('#btn-batch-text').textContent = '执行批量测试';
-          showToast('批量测试完成', 'success');
-        },
-        onError: (msg) => {
-          console.error('[Batch] error:', msg);
-          showToast(`批量测试出错: ${msg}`, 'error');
-          runBtn.disabled = false;
-          container.querySelector('#btn-batch-text').textContent = '执行批量测试';
-        },
-      });
+      subscribe(currentBatchId);
     } catch (err) {
       showToast(`创建批量任务失败: ${err.message}`, 'error');
       runBtn.disabled = false;
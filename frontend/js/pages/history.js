@@ -14,6 +14,10 @@ export default function render(container) {
     <div class="flex justify-between items-center mb-lg">
       <h2 class="text-title-large">历史记录</h2>
       <div class="flex gap-sm">
+        <button class="btn btn--outlined" id="btn-export-history">
+          <span class="material-symbols-outlined">download</span>
+          导出 CSV
+        </button>
         <button class="btn btn--outlined" id="btn-batch-del" disabled>
           <span class="material-symbols-outlined">delete</span>
           批量删除
@@ -42,8 +46,13 @@ export default function render(container) {
             <option value="success">成功</option>
             <option value="failed">失败</option>
             <option value="timeout">超时</option>
+            <option value="cancelled">已取消</option>
           </select>
         </div>
+        <label class="flex items-center gap-sm text-body-medium">
+          <input type="checkbox" id="filter-archived">
+          包含归档
+        </label>
       </div>
     </div>
 
@@ -65,6 +74,7 @@ export default function render(container) {
   const filterKeyword = container.querySelector('#filter-keyword');
   const filterModel = container.querySelector('#filter-model');
   const filterStatus = container.querySelector('#filter-status');
+  const filterArchived = container.querySelector('#filter-archived');
 
   let searchTimer = null;
   filterKeyword.addEventListener('input', () => {
@@ -73,10 +83,14 @@ export default function render(container) {
   });
   filterModel.addEventListener('change', () => { currentPage = 1; loadHistory(); });
   filterStatus.addEventListener('change', () => { currentPage = 1; loadHistory(); });
+  filterArchived.addEventListener('change', () => { currentPage = 1; loadHistory(); });
 
   // 批量删除按钮
   container.querySelector('#btn-batch-del').addEventListener('click', handleBatchDelete);
   container.querySelector('#btn-clear-all').addEventListener('click', handleClearAll);
+  container.querySelector('#btn-export-history').addEventListener('click', () => {
+    historyApi.export({ format: 'csv', ...currentFilters() });
+  });
 
   // Ctrl+K 快捷键
   document.addEventListener('keydown', (e) => {
@@ -99,15 +113,22 @@ export default function render(container) {
     } catch { /* ignore */ }
   }
 
+  function currentFilters() {
+    return {
+      model_id: filterModel.value || undefined,
+      keyword: filterKeyword.value || undefined,
+      status: filterStatus.value || undefined,
+      include_archived: filterArchived.checked || undefined,
+    };
+  }
+
   async function loadHistory() {
     const listEl = container.querySelector('#history-list');
 
     const params = {
       page: currentPage,
       page_size: 20,
-      model_id: filterModel.value || undefined,
-      keyword: filterKeyword.value || undefined,
-      status: filterStatus.value || undefined,
+      ...currentFilters(),
     };
 
     try {
@@ -205,8 +226,18 @@ export default function render(container) {
 
   async function handleClearAll() {
     if (!confirm('确定清空所有历史记录？此操作不可恢复。')) return;
-    await historyApi.batchDelete({ delete_all: true });
-    showToast('已清空所有记录', 'success');
+    // 清空在后台分块执行，轮询任务进度直到结束
+    let job = await historyApi.batchDelete({ delete_all: true });
+    showToast('正在后台清空记录...', 'info');
+    while (job.status === 'pending' || job.status === 'running') {
+      await new Promise((resolve) => setTimeout(resolve, 1000));
+      job = await historyApi.deleteJob(job.id);
+    }
+    if (job.status === 'completed') {
+      showToast(`已清空 ${job.counts.records} 条记录`, 'success');
+    } else {
+      showToast(`清空失败: ${job.error || '未知错误'}`, 'error');
+    }
     loadHistory();
   }
 
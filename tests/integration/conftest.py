@@ -0,0 +1,79 @@
+"""集成测试公共夹具：每个测试使用独立的临时 SQLite 数据库"""
+
+import pytest_asyncio
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine
+
+import backend.models  # noqa: F401  确保 Base.metadata 包含所有表
+from backend.database import _set_sqlite_pragma, async_session
+from backend.models import BatchItem, KeywordBatch, ModelConfig
+from backend.models.base import Base
+from backend.services import runtime_settings
+
+
+@pytest_asyncio.fixture
+async def db(tmp_path, monkeypatch):
+    """把全局会话工厂指向临时数据库（与正式库相同的 PRAGMA），并清空进程内的设置与模型缓存"""
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'test.db'}", connect_args={"timeout": 30})
+    event.listen(engine.sync_engine, "connect", _set_sqlite_pragma)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    original_bind = async_session.kw["bind"]
+    async_session.configure(bind=engine)
+    monkeypatch.setattr(runtime_settings, "_settings", {})
+    monkeypatch.setattr(runtime_settings, "_loaded_version", None)
+    monkeypatch.setattr(runtime_settings, "_last_check", 0.0)
+    runtime_settings._model_configs.clear()
+    try:
+        yield engine
+    finally:
+        async_session.configure(bind=original_bind)
+        runtime_settings._model_configs.clear()
+        await engine.dispose()
+
+
+@pytest_asyncio.fixture
+async def model_config(db) -> ModelConfig:
+    async with async_session() as session:
+        model_config = ModelConfig(
+            name="Test-Model",
+            model_id="test-model",
+            provider="aliyun",
+            api_endpoint="http://upstream.test/v1",
+            default_params={"temperature": 0.7, "max_tokens": 64},
+            supported_modalities=["text"],
+            is_active=True,
+        )
+        session.add(model_config)
+        await session.commit()
+    return model_config
+
+
+@pytest_asyncio.fixture
+async def make_batch(model_config):
+    """创建批次及其任务项（不经过 create_batch，便于构造队列状态）"""
+
+    async def make(keywords: list[str], concurrency: int = 1, **fields) -> KeywordBatch:
+        async with async_session() as session:
+            batch = KeywordBatch(
+                model_config_id=model_config.id,
+                keywords=keywords,
+                prompt_template="{keyword}",
+                total_count=len(keywords),
+                concurrency=concurrency,
+                **fields,
+            )
+            session.add(batch)
+            await session.flush()
+            for index, keyword in enumerate(keywords):
+                session.add(BatchItem(
+                    keyword_batch_id=batch.id,
+                    item_index=index,
+                    keyword_index=index,
+                    keyword=keyword,
+                ))
+            await session.commit()
+        return batch
+
+    return make
@@ -0,0 +1,157 @@
+"""归档的集成测试：上传文件随归档索引移除而删除、关键字搜索只解压候选分区"""
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import select
+
+from backend import models
+from backend.database import async_session
+from backend.models import ArchivedRecord, ArchivePartition, FileModality, InputType, RecordStatus, UploadedFile
+from backend.services import archive, cleanup
+from backend.services.archive import _run_archive, forget_archived_record, search_archive
+
+pytestmark = pytest.mark.asyncio
+
+OLD = datetime.now(timezone.utc) - timedelta(days=400)
+
+
+@pytest.fixture
+def dirs(tmp_path, monkeypatch):
+    """归档目录与上传目录指向临时目录"""
+    monkeypatch.setattr(archive, "ARCHIVE_DIR", tmp_path / "archive")
+    monkeypatch.setattr(cleanup, "UPLOAD_DIR", tmp_path / "uploads")
+    return tmp_path
+
+
+async def _add_records(model_config, dirs, texts: list[str], created_at: datetime = OLD, file_name: str | None = None):
+    """创建共享同一输入的记录；file_name 不为空时为输入附带一个上传文件"""
+    async with async_session() as session:
+        test_input = models.TestInput(text_content=texts[0], input_type=InputType.SINGLE)
+        session.add(test_input)
+        await session.flush()
+        if file_name:
+            file_path = f"2024-01-01/image/{file_name}"
+            (dirs / "uploads" / "2024-01-01" / "image").mkdir(parents=True, exist_ok=True)
+            (dirs / "uploads" / file_path).write_bytes(b"img")
+            session.add(UploadedFile(
+                test_input_id=test_input.id,
+                file_name=file_name,
+                file_path=file_path,
+                file_size=3,
+                mime_type="image/png",
+                modality=FileModality.IMAGE,
+            ))
+        records = [
+            models.TestRecord(
+                model_config_id=model_config.id,
+                test_input_id=test_input.id,
+                prompt_text=text,
+                output_text="ok",
+                status=RecordStatus.SUCCESS,
+                created_at=created_at,
+            )
+            for text in texts
+        ]
+        session.add_all(records)
+        await session.commit()
+    return [r.id for r in records]
+
+
+async def _archive():
+    await _run_archive({"older_than_days": 30, "total": 0, "processed": 0, "partitions": 0})
+
+
+async def _forget(record_id: str) -> bool:
+    async with async_session() as session:
+        return await forget_archived_record(session, record_id)
+
+
+# ---------- 上传文件 ----------
+
+async def test_archive_keeps_files_until_record_is_forgotten(model_config, dirs):
+    [record_id] = await _add_records(model_config, dirs, ["看图"], file_name="a.png")
+    upload = dirs / "uploads" / "2024-01-01" / "image" / "a.png"
+
+    await _archive()
+
+    assert upload.exists()  # 归档记录的预览链接仍然可用
+    async with async_session() as session:
+        ref = await session.get(ArchivedRecord, record_id)
+        assert ref.file_paths == ["2024-01-01/image/a.png"]
+        assert (await session.execute(select(UploadedFile))).first() is None
+
+    assert await _forget(record_id) is True
+    assert not upload.exists()
+    assert await _forget(record_id) is False
+
+
+async def test_shared_input_files_removed_with_last_archived_record(model_config, dirs):
+    first, second = await _add_records(model_config, dirs, ["对比", "对比"], file_name="b.png")
+    upload = dirs / "uploads" / "2024-01-01" / "image" / "b.png"
+    await _archive()
+
+    await _forget(first)
+    assert upload.exists()
+    async with async_session() as session:
+        assert (await session.get(ArchivedRecord, second)).file_paths == ["2024-01-01/image/b.png"]
+
+    await _forget(second)
+    assert not upload.exists()
+
+
+async def test_files_still_used_online_are_not_registered(model_config, dirs):
+    [old_id, new_id] = await _add_records(model_config, dirs, ["旧", "新"], file_name="c.png")
+    async with async_session() as session:
+        new = await session.get(models.TestRecord, new_id)
+        new.created_at = datetime.now(timezone.utc)
+        await session.commit()
+
+    await _archive()
+    await _forget(old_id)
+
+    assert (dirs / "uploads" / "2024-01-01" / "image" / "c.png").exists()
+
+
+# ---------- 关键字搜索 ----------
+
+async def _search(**kwargs):
+    async with async_session() as session:
+        return await search_archive(session, offset=0, limit=10, **kwargs)
+
+
+async def test_keyword_search_scans_only_partitions_in_range(model_config, dirs, monkeypatch):
+    await _add_records(model_config, dirs, ["猫 一月"], created_at=datetime(2024, 1, 10, tzinfo=timezone.utc))
+    await _add_records(model_config, dirs, ["猫 三月"], created_at=datetime(2024, 3, 10, tzinfo=timezone.utc))
+    await _add_records(model_config, dirs, ["狗 三月"], created_at=datetime(2024, 3, 11, tzinfo=timezone.utc))
+    await _archive()
+    opened = []
+    scan = archive._scan_partition
+    monkeypatch.setattr(archive, "_scan_partition", lambda path, fmt, predicate: opened.append(path) or scan(path, fmt, predicate))
+
+    total, rows = await _search(keyword="猫")
+    assert total == 2
+    assert [row["input_summary"] for row in rows] == ["猫 三月", "猫 一月"]
+    assert len(opened) == 2
+
+    opened.clear()
+    total, rows = await _search(keyword="猫", start=datetime(2024, 3, 1), end=datetime(2024, 3, 31))
+    assert (total, [row["input_summary"] for row in rows]) == (1, ["猫 三月"])
+    assert len(opened) == 1
+    assert opened[0].startswith("2024-03/")
+
+
+async def test_keyword_search_rejects_too_many_partitions(model_config, dirs, monkeypatch):
+    for month in (1, 2, 3):
+        await _add_records(model_config, dirs, ["猫"], created_at=datetime(2024, month, 10, tzinfo=timezone.utc))
+    await _archive()
+    async with async_session() as session:
+        assert len((await session.execute(select(ArchivePartition))).all()) == 3
+    monkeypatch.setattr(archive, "ARCHIVE_KEYWORD_SCAN_PARTITIONS", 2)
+
+    with pytest.raises(ValueError, match="缩小日期范围"):
+        await _search(keyword="猫")
+    total, _ = await _search(keyword="猫", start=datetime(2024, 2, 1))
+    assert total == 2
+    total, _ = await _search()  # 无关键字只走索引，不受限制
+    assert total == 3
@@ -0,0 +1,145 @@
+"""创建批次的集成测试"""
+
+import io
+
+import pytest
+from sqlalchemy import func, select
+
+from backend.config import BATCH_PREFIX_CACHE_MIN_CHARS
+from backend.database import async_session
+from backend.models import BatchItem, KeywordBatch
+from backend.services import runtime_settings
+from backend.services.batch import create_batch
+from backend.services.batch_upload import create_batch_from_upload
+
+pytestmark = pytest.mark.asyncio
+
+RULES = "x" * BATCH_PREFIX_CACHE_MIN_CHARS
+
+
+async def _counts() -> tuple[int, int]:
+    async with async_session() as session:
+        batches = (await session.execute(select(func.count()).select_from(KeywordBatch))).scalar()
+        items = (await session.execute(select(func.count()).select_from(BatchItem))).scalar()
+    return batches, items
+
+
+# ---------- 前缀缓存模式 ----------
+
+async def test_prefix_cache_accepts_template_with_long_static_prefix(model_config):
+    async with async_session() as session:
+        result = await create_batch(
+            session, ["a", "b"], RULES + "{keyword}", model_config_id=model_config.id, prefix_cache=True,
+        )
+        await session.commit()
+    assert result["total_count"] == 2
+    assert await _counts() == (1, 2)
+
+
+@pytest.mark.parametrize("template", ["{keyword} " + RULES, "分析{keyword}：" + RULES])
+async def test_prefix_cache_rejects_short_static_prefix(model_config, template):
+    async with async_session() as session:
+        with pytest.raises(ValueError, match="前缀缓存模式"):
+            await create_batch(session, ["a"], template, model_config_id=model_config.id, prefix_cache=True)
+        await session.commit()
+    assert await _counts() == (0, 0)
+
+
+async def test_short_prefix_allowed_without_prefix_cache(model_config):
+    async with async_session() as session:
+        await create_batch(session, ["a"], "{keyword} 解释", model_config_id=model_config.id)
+        await session.commit()
+    assert await _counts() == (1, 1)
+
+
+async def test_upload_prefix_cache_rejects_short_static_prefix(model_config):
+    data = io.BytesIO("keyword,src\n猫,微博\n".encode())
+    async with async_session() as session:
+        with pytest.raises(ValueError, match="前缀缓存模式"):
+            await create_batch_from_upload(
+                session, data, "rows.csv", "{src}" + RULES + "{keyword}",
+                model_config_id=model_config.id, prefix_cache=True,
+            )
+        await session.commit()
+    assert await _counts() == (0, 0)
+
+
+# ---------- 文件导入 ----------
+
+async def _upload(model_config, content: str, filename: str = "rows.csv", template: str = "{keyword} 来自 {src}"):
+    async with async_session() as session:
+        try:
+            result = await create_batch_from_upload(
+                session, io.BytesIO(content.encode()), filename, template, model_config_id=model_config.id,
+            )
+            await session.commit()
+        except Exception:
+            await session.rollback()
+            raise
+    return result
+
+
+async def test_upload_creates_items_with_row_variables(model_config):
+    result = await _upload(model_config, "src,keyword\n微博,猫\n知乎,狗\n知乎,狗\n")
+
+    assert (result["total_count"], result["row_count"], result["saved_calls"]) == (3, 3, 1)
+    assert result["columns"] == ["src", "keyword"]
+    async with async_session() as session:
+        items = (await session.execute(select(BatchItem).order_by(BatchItem.item_index))).scalars().all()
+    assert [(item.keyword, item.variables, item.duplicate_of) for item in items] == [
+        ("猫", {"src": "微博", "keyword": "猫"}, None),
+        ("狗", {"src": "知乎", "keyword": "狗"}, None),
+        ("狗", {"src": "知乎", "keyword": "狗"}, 1),
+    ]
+
+
+async def test_upload_keyword_column_defaults_to_first_column(model_config):
+    await _upload(model_config, '{"text": "猫", "src": "微博"}\n', filename="rows.jsonl", template="{text} {src}")
+    async with async_session() as session:
+        item = (await session.execute(select(BatchItem))).scalar_one()
+    assert item.keyword == "猫"
+
+
+async def test_upload_rejects_unknown_template_column_before_inserting(model_config):
+    with pytest.raises(ValueError, match="模板引用的列不存在: lang"):
+        await _upload(model_config, "keyword,src\n猫,微博\n", template="{keyword} {lang}")
+    assert await _counts() == (0, 0)
+
+
+@pytest.mark.parametrize("filename, content, message", [
+    ("rows.csv", "keyword,src\n猫,微博\n狗\n", "第 3 行"),
+    ("rows.jsonl", '{"keyword": "猫", "src": "微博"}\n{"keyword": "狗"}\n', "缺少字段"),
+    ("rows.csv", "keyword,src\n", "没有数据行"),
+    ("rows.txt", "keyword\n猫\n", "不支持的文件格式"),
+])
+async def test_upload_errors_leave_nothing_behind(model_config, filename, content, message):
+    with pytest.raises(ValueError, match=message):
+        await _upload(model_config, content, filename=filename)
+    assert await _counts() == (0, 0)
+
+
+# ---------- 并发上限 ----------
+
+@pytest.fixture
+def model_concurrency(monkeypatch):
+    """把运行时设置中的单模型并发上限设为 2"""
+    monkeypatch.setattr(runtime_settings, "_settings", {"rate_limits": {"batch_model_concurrency": 2}})
+
+
+async def test_batch_concurrency_capped_by_runtime_model_limit(model_config, model_concurrency):
+    async with async_session() as session:
+        capped = await create_batch(session, ["a"], "{keyword}", model_config_id=model_config.id, concurrency=6)
+        kept = await create_batch(session, ["a"], "{keyword}", model_config_id=model_config.id, concurrency=1)
+        await session.commit()
+    assert (capped["concurrency"], kept["concurrency"]) == (2, 1)
+
+
+async def test_upload_concurrency_capped_by_runtime_model_limit(model_config, model_concurrency):
+    async with async_session() as session:
+        result = await create_batch_from_upload(
+            session, io.BytesIO(b"keyword\na\n"), "rows.csv", "{keyword}",
+            model_config_id=model_config.id, concurrency=6,
+        )
+        await session.commit()
+    async with async_session() as session:
+        assert (await session.get(KeywordBatch, result["id"])).concurrency == 2
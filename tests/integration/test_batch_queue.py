@@ -0,0 +1,303 @@
+"""worker 模式任务队列的集成测试：原子领取、租约过期重领、续约与归还、重试次数上限"""
+
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import select, update
+
+from backend import models, worker
+from backend.config import WORKER_LEASE_SECONDS, WORKER_MAX_ATTEMPTS
+from backend.database import async_session
+from backend.models import (
+    BatchItem,
+    BatchItemStatus,
+    BatchStatus,
+    InputType,
+    KeywordBatch,
+    RecordStatus,
+)
+from backend.services import batch as batch_service
+from backend.services import batch_queue
+from backend.services.batch_queue import (
+    claim_batch_item,
+    execute_claimed_item,
+    release_leases,
+    renew_leases,
+)
+pytestmark = pytest.mark.asyncio
+
+
+async def _fake_stream(model_id, messages, **kwargs):
+    yield {"type": "token", "text": "ok"}
+    yield {"type": "usage", "input_tokens": 3, "output_tokens": 1, "cached_tokens": 0}
+    yield {"type": "done", "response_time_ms": 1, "raw_chunks": [], "stop_reason": "stop", "stopped_early": False}
+
+
+@pytest.fixture(autouse=True)
+def fake_upstream(monkeypatch):
+    monkeypatch.setattr(batch_service, "stream_chat_completion", _fake_stream)
+    batch_queue._batch_settings.clear()
+
+
+async def _items(batch_id: str) -> list[BatchItem]:
+    async with async_session() as session:
+        return list((await session.execute(
+            select(BatchItem).where(BatchItem.keyword_batch_id == batch_id).order_by(BatchItem.item_index)
+        )).scalars())
+
+
+async def _batch(batch_id: str) -> KeywordBatch:
+    async with async_session() as session:
+        return await session.get(KeywordBatch, batch_id)
+
+
+async def _expire_lease(item_id: str):
+    async with async_session() as session:
+        await session.execute(
+            update(BatchItem)
+            .where(BatchItem.id == item_id)
+            .values(lease_expires_at=datetime.now(timezone.utc) - timedelta(seconds=1))
+        )
+        await session.commit()
+
+
+def _aware(value: datetime) -> datetime:
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+# ---------- 领取 ----------
+
+async def test_claim_leases_item_and_starts_batch(make_batch):
+    batch = await make_batch(["a", "b"], concurrency=2)
+
+    claim = await claim_batch_item("w1")
+
+    assert claim["batch_id"] == batch.id
+    assert (claim["index"], claim["keyword"]) == (0, "a")
+    item = (await _items(batch.id))[0]
+    assert item.status == BatchItemStatus.RUNNING
+    assert item.lease_owner == "w1"
+    assert item.attempts == 1
+    assert _aware(item.lease_expires_at) > datetime.now(timezone.utc) + timedelta(seconds=WORKER_LEASE_SECONDS - 5)
+    assert (await _batch(batch.id)).status == BatchStatus.RUNNING
+
+
+async def test_claim_respects_batch_concurrency(make_batch):
+    await make_batch(["a", "b", "c"], concurrency=2)
+
+    claims = [await claim_batch_item("w1") for _ in range(3)]
+
+    assert [claim["index"] for claim in claims[:2]] == [0, 1]
+    assert claims[2] is None
+
+
+async def test_claim_skips_duplicates_and_finished_batches(make_batch):
+    batch = await make_batch(["a", "a"], concurrency=2)
+    async with async_session() as session:
+        await session.execute(
+            update(BatchItem)
+            .where(BatchItem.keyword_batch_id == batch.id, BatchItem.item_index == 1)
+            .values(duplicate_of=0)
+        )
+        await session.commit()
+    cancelled = await make_batch(["x"], status=BatchStatus.CANCELLED)
+
+    assert (await claim_batch_item("w1"))["index"] == 0
+    assert await claim_batch_item("w1") is None
+    assert (await _items(cancelled.id))[0].status == BatchItemStatus.PENDING
+
+
+async def test_two_workers_compete_for_one_item(make_batch):
+    batch = await make_batch(["only"], concurrency=4)
+
+    claims = await asyncio.gather(*(claim_batch_item(f"w{i}") for i in range(2)))
+
+    won = [claim for claim in claims if claim is not None]
+    assert len(won) == 1
+    item = (await _items(batch.id))[0]
+    assert item.attempts == 1
+    assert item.lease_owner in ("w0", "w1")
+
+
+async def test_many_workers_never_share_items(make_batch):
+    batch = await make_batch([f"k{i}" for i in range(6)], concurrency=6)
+
+    claims = await asyncio.gather(*(claim_batch_item(f"w{i}") for i in range(10)))
+
+    indexes = [claim["index"] for claim in claims if claim is not None]
+    assert sorted(indexes) == list(range(6))
+    assert all(item.attempts == 1 for item in await _items(batch.id))
+
+
+# ---------- 租约过期与重领 ----------
+
+async def test_live_lease_is_not_reclaimed(make_batch):
+    await make_batch(["a"], concurrency=2)
+    assert await claim_batch_item("w1") is not None
+
+    assert await claim_batch_item("w2") is None
+
+
+async def test_expired_lease_is_reclaimed_and_stale_record_failed(make_batch, model_config):
+    batch = await make_batch(["a"])
+    claim = await claim_batch_item("w1")
+    async with async_session() as session:
+        test_input = models.TestInput(text_content="a", input_type=InputType.BATCH)
+        session.add(test_input)
+        await session.flush()
+        record = models.TestRecord(
+            model_config_id=model_config.id,
+            test_input_id=test_input.id,
+            status=RecordStatus.RUNNING,
+            keyword_batch_id=batch.id,
+            batch_item_index=0,
+        )
+        session.add(record)
+        await session.flush()
+        await session.execute(update(BatchItem).where(BatchItem.id == claim["id"]).values(test_record_id=record.id))
+        await session.commit()
+    await _expire_lease(claim["id"])
+
+    reclaimed = await claim_batch_item("w2")
+
+    assert reclaimed["id"] == claim["id"]
+    item = (await _items(batch.id))[0]
+    assert (item.lease_owner, item.attempts) == ("w2", 2)
+    async with async_session() as session:
+        stale = await session.get(models.TestRecord, record.id)
+    assert stale.status == RecordStatus.FAILED
+
+
+async def test_result_of_expired_lease_is_not_counted(make_batch):
+    batch = await make_batch(["a"])
+    claim = await claim_batch_item("w1")
+    await _expire_lease(claim["id"])
+    reclaimed = await claim_batch_item("w2")
+
+    await execute_claimed_item("w1", claim)  # 租约已被 w2 取得：结果不计入批次
+    assert (await _batch(batch.id)).completed_count == 0
+
+    await execute_claimed_item("w2", reclaimed)
+    finished = await _batch(batch.id)
+    assert (finished.status, finished.completed_count, finished.failed_count) == (BatchStatus.COMPLETED, 1, 0)
+    assert (await _items(batch.id))[0].status == BatchItemStatus.DONE
+
+
+# ---------- 续约与归还 ----------
+
+async def test_renew_extends_only_own_leases(make_batch):
+    batch = await make_batch(["a", "b"], concurrency=2)
+    first = await claim_batch_item("w1")
+    await claim_batch_item("w2")
+    await _expire_lease(first["id"])
+
+    assert await renew_leases("w1") == 1
+
+    items = {item.lease_owner: item for item in await _items(batch.id)}
+    assert _aware(items["w1"].lease_expires_at) > datetime.now(timezone.utc)
+    assert await claim_batch_item("w3") is None
+
+
+async def test_release_makes_items_claimable_immediately(make_batch):
+    batch = await make_batch(["a", "b"], concurrency=2)
+    await claim_batch_item("w1")
+    await claim_batch_item("w1")
+
+    assert await release_leases("w1") == 2
+
+    reclaimed = [await claim_batch_item("w2") for _ in range(2)]
+    assert sorted(claim["index"] for claim in reclaimed) == [0, 1]
+    assert all(item.lease_owner == "w2" for item in await _items(batch.id))
+
+
+async def test_worker_heartbeat_renews_leases(make_batch, monkeypatch):
+    batch = await make_batch(["a"])
+    claim = await claim_batch_item("w1")
+    await _expire_lease(claim["id"])
+    monkeypatch.setattr(worker, "WORKER_HEARTBEAT_INTERVAL", 0.01)
+
+    heartbeat = asyncio.create_task(worker._heartbeat_loop("w1"))
+    await asyncio.sleep(0.2)
+    heartbeat.cancel()
+
+    item = (await _items(batch.id))[0]
+    assert _aware(item.lease_expires_at) > datetime.now(timezone.utc)
+
+
+async def test_worker_execute_completes_batch(make_batch):
+    batch = await make_batch(["a", "b"], concurrency=2)
+
+    for _ in range(2):
+        await worker._execute("w1", await claim_batch_item("w1"))
+
+    finished = await _batch(batch.id)
+    assert (finished.status, finished.completed_count, finished.failed_count) == (BatchStatus.COMPLETED, 2, 0)
+    assert all(item.lease_owner is None for item in await _items(batch.id))
+
+
+# ---------- 重试次数上限 ----------
+
+async def test_item_failed_after_max_attempts(make_batch):
+    batch = await make_batch(["crash", "ok"], concurrency=1)
+
+    for attempt in range(WORKER_MAX_ATTEMPTS):
+        claim = await claim_batch_item("w1")
+        assert claim["index"] == 0
+        await _expire_lease(claim["id"])  # 模拟 worker 执行中崩溃
+
+    claim = await claim_batch_item("w1")
+
+    assert claim["index"] == 1
+    crashed = (await _items(batch.id))[0]
+    assert crashed.status == BatchItemStatus.FAILED
+    assert crashed.attempts == WORKER_MAX_ATTEMPTS
+    assert str(WORKER_MAX_ATTEMPTS) in crashed.error_message
+    assert crashed.lease_owner is None
+    counts = await _batch(batch.id)
+    assert (counts.completed_count, counts.failed_count) == (1, 1)
+
+    await execute_claimed_item("w1", claim)
+    assert (await _batch(batch.id)).status == BatchStatus.COMPLETED
+
+
+async def test_exhausted_item_fails_duplicates_and_completes_batch(make_batch):
+    batch = await make_batch(["a", "a"], concurrency=1)
+    async with async_session() as session:
+        await session.execute(
+            update(BatchItem)
+            .where(BatchItem.keyword_batch_id == batch.id)
+            .values(attempts=WORKER_MAX_ATTEMPTS)
+        )
+        await session.execute(
+            update(BatchItem)
+            .where(BatchItem.keyword_batch_id == batch.id, BatchItem.item_index == 1)
+            .values(duplicate_of=0)
+        )
+        await session.commit()
+
+    assert await claim_batch_item("w1") is None
+
+    assert [item.status for item in await _items(batch.id)] == [BatchItemStatus.FAILED] * 2
+    finished = await _batch(batch.id)
+    assert (finished.status, finished.completed_count, finished.failed_count) == (BatchStatus.COMPLETED, 2, 2)
+
+
+async def test_last_attempt_with_live_lease_is_not_failed(make_batch):
+    batch = await make_batch(["a"])
+    async with async_session() as session:
+        await session.execute(
+            update(BatchItem)
+            .where(BatchItem.keyword_batch_id == batch.id)
+            .values(attempts=WORKER_MAX_ATTEMPTS - 1)
+        )
+        await session.commit()
+    claim = await claim_batch_item("w1")
+    assert claim is not None
+
+    assert await claim_batch_item("w2") is None  # 最后一次执行仍持有租约
+
+    item = (await _items(batch.id))[0]
+    assert (item.status, item.lease_owner) == (BatchItemStatus.RUNNING, "w1")
+    await execute_claimed_item("w1", claim)
+    assert (await _items(batch.id))[0].status == BatchItemStatus.DONE
@@ -0,0 +1,34 @@
+"""历史导出接口：日期参数在响应开始前校验"""
+
+import httpx
+import pytest
+import pytest_asyncio
+
+from app import create_app
+
+pytestmark = pytest.mark.asyncio
+
+
+@pytest_asyncio.fixture
+async def client(db):
+    transport = httpx.ASGITransport(app=create_app())
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        yield client
+
+
+@pytest.mark.parametrize("path", ["/api/history/export", "/api/history/export/parquet"])
+@pytest.mark.parametrize("params", [{"start_date": "2024-13-01"}, {"end_date": "yesterday"}])
+async def test_invalid_dates_rejected_before_streaming(client, path, params):
+    response = await client.get(path, params=params)
+
+    assert response.status_code == 400
+    assert "日期格式错误" in response.json()["detail"]
+
+
+async def test_valid_dates_stream_export(client):
+    response = await client.get(
+        "/api/history/export", params={"format": "jsonl", "start_date": "2024-01-01", "end_date": "2024-01-31"},
+    )
+
+    assert response.status_code == 200
+    assert response.content == b""
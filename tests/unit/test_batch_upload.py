@@ -0,0 +1,113 @@
+"""批量任务文件导入的单元测试：CSV / JSONL 流式解析"""
+
+import io
+
+import pytest
+
+from backend.services.batch_upload import _iter_csv_rows, _iter_jsonl_rows, _next_chunk
+
+
+def _parse(parser, content: str | bytes) -> tuple[list[str], list[dict]]:
+    data = content.encode("utf-8") if isinstance(content, str) else content
+    rows = parser(io.BytesIO(data))
+    columns = next(rows)
+    return columns, list(rows)
+
+
+# ---------- CSV ----------
+
+def test_csv_header_and_rows():
+    columns, rows = _parse(_iter_csv_rows, "keyword, src \n猫,微博\n\n狗,知乎\n")
+    assert columns == ["keyword", "src"]
+    assert rows == [{"keyword": "猫", "src": "微博"}, {"keyword": "狗", "src": "知乎"}]
+
+
+def test_csv_quoted_fields_with_commas_and_newlines():
+    columns, rows = _parse(_iter_csv_rows, 'keyword,note\n"a, b","第一行\n第二行"\n')
+    assert rows == [{"keyword": "a, b", "note": "第一行\n第二行"}]
+
+
+def test_csv_strips_bom():
+    columns, rows = _parse(_iter_csv_rows, "﻿keyword\n猫\n".encode("utf-8"))
+    assert columns == ["keyword"]
+    assert rows == [{"keyword": "猫"}]
+
+
+@pytest.mark.parametrize("content", ["", "\n", "keyword,,src\n猫,1,2\n", "keyword, \n猫,1\n"])
+def test_csv_missing_or_empty_header_columns(content):
+    with pytest.raises(ValueError, match="表头"):
+        _parse(_iter_csv_rows, content)
+
+
+def test_csv_duplicate_header_columns():
+    with pytest.raises(ValueError, match="重复列名"):
+        _parse(_iter_csv_rows, "keyword,src,keyword\n1,2,3\n")
+
+
+@pytest.mark.parametrize("line", ["猫", "猫,微博,多余"])
+def test_csv_row_column_count_mismatch(line):
+    rows = _iter_csv_rows(io.BytesIO(f"keyword,src\n狗,知乎\n{line}\n".encode()))
+    assert next(rows) == ["keyword", "src"]
+    assert next(rows) == {"keyword": "狗", "src": "知乎"}
+    with pytest.raises(ValueError, match="第 3 行"):
+        next(rows)
+
+
+def test_csv_non_utf8_input():
+    with pytest.raises(ValueError, match="UTF-8"):
+        _parse(_iter_csv_rows, "关键词\n猫\n".encode("gbk"))
+
+
+def test_csv_non_utf8_after_header():
+    rows = _iter_csv_rows(io.BytesIO("keyword\n".encode() + "狗\n".encode("gbk")))
+    with pytest.raises(ValueError, match="UTF-8"):
+        list(rows)
+
+
+# ---------- JSONL ----------
+
+def test_jsonl_header_from_first_row():
+    columns, rows = _parse(_iter_jsonl_rows, '{"keyword": "猫", "n": 1}\n\n{"n": 2, "keyword": "狗", "extra": true}\n')
+    assert columns == ["keyword", "n"]
+    assert rows == [{"keyword": "猫", "n": 1}, {"n": 2, "keyword": "狗", "extra": True}]
+
+
+def test_jsonl_strips_bom():
+    columns, rows = _parse(_iter_jsonl_rows, '﻿{"keyword": "猫"}\n'.encode("utf-8"))
+    assert columns == ["keyword"]
+
+
+def test_jsonl_row_missing_keys():
+    with pytest.raises(ValueError, match="第 2 行缺少字段: src"):
+        _parse(_iter_jsonl_rows, '{"keyword": "猫", "src": "微博"}\n{"keyword": "狗"}\n')
+
+
+@pytest.mark.parametrize("line, message", [
+    ("{not json}", "不是合法的 JSON"),
+    ("[1, 2]", "非空 JSON 对象"),
+    ("{}", "非空 JSON 对象"),
+])
+def test_jsonl_invalid_rows(line, message):
+    with pytest.raises(ValueError, match=message):
+        _parse(_iter_jsonl_rows, line + "\n")
+
+
+@pytest.mark.parametrize("content", ["", "\n  \n"])
+def test_jsonl_without_rows(content):
+    with pytest.raises(ValueError, match="没有数据行"):
+        _parse(_iter_jsonl_rows, content)
+
+
+def test_jsonl_non_utf8_input():
+    with pytest.raises(ValueError, match="UTF-8"):
+        _parse(_iter_jsonl_rows, '{"keyword": "关键词"}\n'.encode("gbk"))
+
+
+# ---------- 分块 ----------
+
+def test_next_chunk():
+    rows = iter(range(5))
+    assert _next_chunk(rows, 2) == [0, 1]
+    assert _next_chunk(rows, 2) == [2, 3]
+    assert _next_chunk(rows, 2) == [4]
+    assert _next_chunk(rows, 2) == []
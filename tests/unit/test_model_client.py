@@ -0,0 +1,159 @@
+"""流式调用：停止规则提前结束时按文本估算 token，端点最近调用时间只由实际调用更新"""
+
+from types import SimpleNamespace
+
+import pytest
+
+from backend.services import model_client
+from backend.services.model_client import (
+    _estimate_tokens,
+    _messages_text,
+    endpoint_last_used,
+    get_client,
+    stream_chat_completion,
+)
+
+BASE_URL = "http://model-client.test/v1"
+
+
+def _chunk(text: str | None = None, usage: tuple[int, int] | None = None):
+    if usage:
+        return SimpleNamespace(
+            choices=[],
+            usage=SimpleNamespace(prompt_tokens=usage[0], completion_tokens=usage[1], prompt_tokens_details=None),
+        )
+    return SimpleNamespace(
+        choices=[SimpleNamespace(delta=SimpleNamespace(content=text), finish_reason=None)],
+        usage=None,
+    )
+
+
+class _FakeStream:
+    """按顺序返回 chunk 的流，记录是否被关闭"""
+
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+        self.closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self.chunks:
+            raise StopAsyncIteration
+        return self.chunks.pop(0)
+
+    async def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """替换上游客户端，返回本次调用的流"""
+    state = {}
+
+    async def create(**kwargs):
+        return state["stream"]
+
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    monkeypatch.setattr(model_client, "get_client", lambda api_key=None, base_url=None: client)
+
+    def respond(chunks) -> _FakeStream:
+        state["stream"] = _FakeStream(chunks)
+        return state["stream"]
+
+    return respond
+
+
+async def _events(messages, stop_rules=None) -> dict:
+    events = {}
+    async for event in stream_chat_completion(
+        "m", messages, api_key="k", base_url=BASE_URL, stop_rules=stop_rules,
+    ):
+        events.setdefault(event["type"], []).append(event)
+    return events
+
+
+MESSAGES = [{"role": "user", "content": "请判断情感 hello"}]
+
+
+@pytest.mark.asyncio
+async def test_usage_from_upstream(upstream):
+    upstream([_chunk("正面"), _chunk(usage=(100, 2))])
+
+    events = await _events(MESSAGES)
+
+    [usage] = events["usage"]
+    assert (usage["input_tokens"], usage["output_tokens"], usage["estimated"]) == (100, 2, False)
+
+
+@pytest.mark.asyncio
+async def test_usage_estimated_when_stop_rule_ends_stream(upstream):
+    stream = upstream([_chunk("正面"), _chunk("STOP"), _chunk("更多输出"), _chunk(usage=(100, 20))])
+
+    events = await _events(MESSAGES, stop_rules=[{"type": "regex", "pattern": "STOP"}])
+
+    [usage] = events["usage"]
+    assert usage["estimated"] is True
+    assert usage["input_tokens"] == _estimate_tokens("请判断情感 hello") > 0
+    assert usage["output_tokens"] == _estimate_tokens("正面STOP") > 0
+    [done] = events["done"]
+    assert (done["stop_reason"], done["stopped_early"]) == ("rule_regex", True)
+    assert [event["text"] for event in events["token"]] == ["正面", "STOP"]
+    assert stream.closed
+
+
+@pytest.mark.asyncio
+async def test_usage_not_estimated_when_stream_finishes_with_rules(upstream):
+    upstream([_chunk("正面"), _chunk(usage=(100, 2))])
+
+    events = await _events(MESSAGES, stop_rules=[{"type": "regex", "pattern": "STOP"}])
+
+    assert events["usage"][0]["estimated"] is False
+    assert events["done"][0]["stopped_early"] is False
+
+
+@pytest.mark.asyncio
+async def test_estimate_covers_prefixed_message_parts(upstream):
+    upstream([_chunk("{}")])
+    messages = [{"role": "user", "content": [
+        {"type": "text", "text": "固定的前缀说明", "cache_control": {"type": "ephemeral"}},
+        {"type": "text", "text": "关键词"},
+    ]}]
+
+    events = await _events(messages, stop_rules=[{"type": "json_complete"}])
+
+    assert events["usage"][0]["input_tokens"] == _estimate_tokens("固定的前缀说明关键词")
+
+
+def test_estimate_tokens():
+    assert _estimate_tokens("") == 0
+    assert _estimate_tokens("你好世界") == 4
+    assert _estimate_tokens("hello world!") == 3
+    assert _estimate_tokens("你好 abcd") == 2 + 2
+
+
+def test_messages_text():
+    assert _messages_text([
+        {"role": "system", "content": "a"},
+        {"role": "user", "content": [{"type": "text", "text": "b"}, {"type": "image_url", "image_url": {}}]},
+    ]) == "ab"
+
+
+# ---------- 端点最近调用时间 ----------
+
+def test_get_client_does_not_mark_endpoint_used(monkeypatch):
+    monkeypatch.setattr(model_client, "endpoint_last_used", {})
+    get_client(api_key="k", base_url="http://warm-only.test/v1")  # 预热探测同样经由 get_client
+
+    assert model_client.endpoint_last_used == {}
+
+
+@pytest.mark.asyncio
+async def test_stream_marks_endpoint_used(upstream):
+    endpoint_last_used.pop(BASE_URL, None)
+    upstream([_chunk("正面"), _chunk(usage=(1, 1))])
+
+    await _events(MESSAGES)
+
+    assert BASE_URL in endpoint_last_used
@@ -0,0 +1,113 @@
+"""单模型并发限制器：上限原地调整，新旧调用共用一份计数"""
+
+import asyncio
+
+import pytest
+
+from backend.services import batch
+from backend.services.batch import ModelConcurrencyLimiter, get_model_limiter
+
+pytestmark = pytest.mark.asyncio
+
+
+async def _hold(limiter: ModelConcurrencyLimiter, entered: list, release: asyncio.Event, name: str):
+    async with limiter:
+        entered.append(name)
+        await release.wait()
+
+
+async def _settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+async def test_limits_concurrent_holders_in_fifo_order():
+    limiter = ModelConcurrencyLimiter(2)
+    entered, release = [], asyncio.Event()
+    tasks = [asyncio.create_task(_hold(limiter, entered, release, str(i))) for i in range(4)]
+    await _settle()
+
+    assert (entered, limiter.active) == (["0", "1"], 2)
+    release.set()
+    await asyncio.gather(*tasks)
+    assert (entered, limiter.active) == (["0", "1", "2", "3"], 0)
+
+
+async def test_shrink_waits_for_existing_holders():
+    limiter = ModelConcurrencyLimiter(3)
+    entered, release_old, release_new = [], asyncio.Event(), asyncio.Event()
+    old = [asyncio.create_task(_hold(limiter, entered, release_old, f"old{i}")) for i in range(3)]
+    await _settle()
+
+    limiter.resize(1)
+    new = [asyncio.create_task(_hold(limiter, entered, release_new, f"new{i}")) for i in range(2)]
+    await _settle()
+    assert entered == ["old0", "old1", "old2"]  # 旧调用未释放前新调用不能进入
+
+    release_old.set()
+    await asyncio.gather(*old)
+    await _settle()
+    assert entered[3:] == ["new0"]
+    assert limiter.active == 1
+
+    release_new.set()
+    await asyncio.gather(*new)
+    assert limiter.active == 0
+
+
+async def test_grow_wakes_waiters_immediately():
+    limiter = ModelConcurrencyLimiter(1)
+    entered, release = [], asyncio.Event()
+    tasks = [asyncio.create_task(_hold(limiter, entered, release, str(i))) for i in range(3)]
+    await _settle()
+    assert entered == ["0"]
+
+    limiter.resize(3)
+    await _settle()
+    assert (entered, limiter.active) == (["0", "1", "2"], 3)
+    release.set()
+    await asyncio.gather(*tasks)
+
+
+async def test_cancelled_waiter_leaves_queue():
+    limiter = ModelConcurrencyLimiter(1)
+    entered, release = [], asyncio.Event()
+    holder = asyncio.create_task(_hold(limiter, entered, release, "holder"))
+    waiter = asyncio.create_task(_hold(limiter, entered, release, "waiter"))
+    await _settle()
+
+    waiter.cancel()
+    await asyncio.gather(waiter, return_exceptions=True)
+    release.set()
+    await holder
+
+    assert limiter.active == 0
+    async with limiter:  # 队列已清空，可直接进入
+        assert limiter.active == 1
+
+
+async def test_cancelled_after_grant_returns_slot():
+    limiter = ModelConcurrencyLimiter(1)
+    await limiter.__aenter__()
+    waiter = asyncio.create_task(limiter.__aenter__())
+    await _settle()
+
+    await limiter.__aexit__(None, None, None)  # 名额分配给等待者
+    waiter.cancel()  # 等待者尚未恢复执行即被取消
+    await asyncio.gather(waiter, return_exceptions=True)
+
+    assert waiter.cancelled()
+    assert limiter.active == 0
+
+
+async def test_get_model_limiter_resizes_in_place(monkeypatch):
+    monkeypatch.setattr(batch, "_model_limiters", {})
+    limit = {"value": 4}
+    monkeypatch.setattr(batch, "model_concurrency_limit", lambda: limit["value"])
+
+    limiter = get_model_limiter("m1")
+    limit["value"] = 2
+
+    assert get_model_limiter("m1") is limiter
+    assert limiter.limit == 2
+    assert get_model_limiter("m2") is not limiter
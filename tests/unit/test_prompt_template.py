@@ -0,0 +1,130 @@
+"""提示词模板的单元测试：渲染、前缀缓存拆分与列校验"""
+
+import pytest
+
+from backend.config import BATCH_PREFIX_CACHE_MIN_CHARS
+from backend.services.prefix_cache import build_prefixed_messages, validate_prefix_template
+from backend.services.prompt_template import compile_template, render_item_prompt, render_item_prompt_prefixed
+
+LONG_RULES = "你是一个情感分析助手，请严格按照以下规则判断文本的情感倾向并输出 JSON。" * 10
+
+
+# ---------- render ----------
+
+def test_render_substitutes_all_occurrences():
+    template = compile_template("{keyword} 用 {lang} 介绍 {keyword}")
+    assert template.fields == ("keyword", "lang")
+    assert template.render({"keyword": "猫", "lang": "英文"}) == "猫 用 英文 介绍 猫"
+
+
+def test_render_none_as_empty_and_values_as_str():
+    template = compile_template("[{a}] [{b}]")
+    assert template.render({"a": None, "b": 3}) == "[] [3]"
+
+
+def test_render_keeps_unknown_placeholders_and_literal_braces():
+    template = compile_template('输出 {"label": ...} 与 {missing}：{keyword} {}')
+    assert template.render({"keyword": "猫"}) == '输出 {"label": ...} 与 {missing}：猫 {}'
+
+
+def test_render_without_placeholders():
+    assert compile_template("固定文本").render({"keyword": "x"}) == "固定文本"
+
+
+def test_render_item_prompt_uses_row_or_keyword():
+    template = compile_template("{keyword}/{src}")
+    assert render_item_prompt(template, "kw", None) == "kw/{src}"
+    assert render_item_prompt(template, "kw", {"keyword": "row", "src": "微博"}) == "row/微博"
+
+
+# ---------- render_prefixed ----------
+
+def test_render_prefixed_splits_at_first_placeholder():
+    template = compile_template(LONG_RULES + "文本：{keyword}，来源：{src}")
+    prefix, prompt = template.render_prefixed({"keyword": "好", "src": "微博"})
+    assert prefix == LONG_RULES + "文本："
+    assert prompt == template.render({"keyword": "好", "src": "微博"})
+    assert prompt.startswith(prefix)
+
+
+def test_render_prefixed_never_rewrites_the_template():
+    template = compile_template("分析{keyword}：" + LONG_RULES + "来源 {src}")
+    variables = {"keyword": "好", "src": "微博"}
+    prefix, prompt = template.render_prefixed(variables)
+    assert prompt == template.render(variables)
+    assert prefix == "分析"
+
+
+def test_render_prefixed_skips_placeholders_without_values():
+    template = compile_template("规则 {note} 说明：{keyword}")
+    prefix, prompt = template.render_prefixed({"keyword": "猫"})
+    assert prefix == "规则 {note} 说明："
+    assert prompt == "规则 {note} 说明：猫"
+
+
+def test_render_prefixed_template_starting_with_variable():
+    prefix, prompt = compile_template("{keyword} 解释").render_prefixed({"keyword": "猫"})
+    assert (prefix, prompt) == ("", "猫 解释")
+
+
+def test_render_prefixed_without_variables():
+    assert compile_template("固定").render_prefixed({"keyword": "猫"}) == ("固定", "固定")
+
+
+def test_render_item_prompt_prefixed_is_shared_across_items():
+    template = compile_template(LONG_RULES + "{keyword}")
+    prefixes = {render_item_prompt_prefixed(template, keyword, None)[0] for keyword in ("a", "b", "c")}
+    assert prefixes == {LONG_RULES}
+
+
+# ---------- 前缀缓存模式校验与消息构建 ----------
+
+def test_validate_prefix_template_accepts_long_prefix():
+    validate_prefix_template(compile_template("x" * BATCH_PREFIX_CACHE_MIN_CHARS + "{keyword}"), ["keyword"])
+
+
+@pytest.mark.parametrize("text", [
+    "{keyword} " + LONG_RULES,
+    "分析{keyword}：" + LONG_RULES,
+    "x" * (BATCH_PREFIX_CACHE_MIN_CHARS - 1) + "{keyword}",
+])
+def test_validate_prefix_template_rejects_short_prefix(text):
+    with pytest.raises(ValueError, match="前缀缓存模式"):
+        validate_prefix_template(compile_template(text), ["keyword"])
+
+
+def test_validate_prefix_template_uses_available_columns():
+    template = compile_template("{lang}" + "x" * BATCH_PREFIX_CACHE_MIN_CHARS + "{keyword}")
+    validate_prefix_template(template, ["keyword"])  # 关键词批次中 {lang} 原样保留，属于固定文本
+    with pytest.raises(ValueError):
+        validate_prefix_template(template, ["keyword", "lang"])
+
+
+def test_build_prefixed_messages():
+    class Preset:
+        is_custom = False
+
+    class Custom:
+        is_custom = True
+
+    [message] = build_prefixed_messages("前缀", "前缀内容", Preset())
+    assert message["content"] == [
+        {"type": "text", "text": "前缀", "cache_control": {"type": "ephemeral"}},
+        {"type": "text", "text": "内容"},
+    ]
+    [message] = build_prefixed_messages("前缀", "前缀", Custom())
+    assert message["content"] == [{"type": "text", "text": "前缀"}]
+
+
+# ---------- 列校验 ----------
+
+def test_validate_accepts_known_columns():
+    compile_template("{keyword} 来自 {src}").validate(["keyword", "src", "extra"])
+    compile_template("没有变量").validate(["keyword"])
+
+
+def test_validate_rejects_unknown_columns():
+    with pytest.raises(ValueError) as exc:
+        compile_template("{keyword} {lang} {src} {lang}").validate(["keyword", "src"])
+    assert "lang" in str(exc.value)
+    assert "可用列: keyword, src" in str(exc.value)
@@ -0,0 +1,143 @@
+"""客户端停止规则的单元测试"""
+
+import pytest
+
+from backend.services.stop_rules import STOP_PREDICATES, StopMatcher, register_stop_predicate, validate_stop_rules
+
+
+def _feed_all(matcher: StopMatcher, deltas: list[str]) -> tuple[str | None, int]:
+    """逐块传入，返回 (stop_reason, 命中时已传入的块数)"""
+    for count, delta in enumerate(deltas, 1):
+        reason = matcher.feed(delta)
+        if reason:
+            return reason, count
+    return None, len(deltas)
+
+
+# ---------- 校验 ----------
+
+@pytest.mark.parametrize("rules", [None, []])
+def test_validate_empty(rules):
+    assert validate_stop_rules(rules) is None
+
+
+def test_validate_accepts_all_types():
+    rules = [
+        {"type": "regex", "pattern": r"\d+"},
+        {"type": "json_complete"},
+        {"type": "max_chars", "value": 10},
+        {"type": "predicate", "name": "first_line"},
+    ]
+    assert validate_stop_rules(rules) == rules
+
+
+@pytest.mark.parametrize("rule, message", [
+    ({"type": "regex"}, "pattern"),
+    ({"type": "regex", "pattern": "("}, "不合法"),
+    ({"type": "max_chars", "value": 0}, "正整数"),
+    ({"type": "max_chars", "value": True}, "正整数"),
+    ({"type": "max_chars", "value": "10"}, "正整数"),
+    ({"type": "predicate", "name": "missing"}, "未知的判断函数"),
+    ({"type": "stop_words"}, "未知的停止规则"),
+    ("json_complete", "未知的停止规则"),
+])
+def test_validate_rejects(rule, message):
+    with pytest.raises(ValueError, match=message):
+        validate_stop_rules([rule])
+
+
+# ---------- regex ----------
+
+def test_regex_matches_across_chunks():
+    matcher = StopMatcher([{"type": "regex", "pattern": r"答案[:：]\s*[A-D]"}])
+    assert _feed_all(matcher, ["分析……", "答案", "：", " C", "，因为"]) == ("rule_regex", 4)
+
+
+def test_regex_no_match():
+    matcher = StopMatcher([{"type": "regex", "pattern": "END"}])
+    assert _feed_all(matcher, ["a", "b", "c"]) == (None, 3)
+
+
+# ---------- json_complete ----------
+
+def test_json_complete_object_after_prose():
+    matcher = StopMatcher([{"type": "json_complete"}])
+    assert _feed_all(matcher, ["结果如下：\n", '{"label": ', '"positive"', "}", "\n以上"]) == ("rule_json_complete", 4)
+
+
+def test_json_complete_nested_array():
+    matcher = StopMatcher([{"type": "json_complete"}])
+    assert _feed_all(matcher, ['[{"a": [1, 2]}', ', {"b": {}}', "]"]) == ("rule_json_complete", 3)
+
+
+def test_json_complete_ignores_braces_inside_strings():
+    matcher = StopMatcher([{"type": "json_complete"}])
+    reason, count = _feed_all(matcher, ['{"text": "a } b ] c {', ' [ d"', ', "n": 1', "}"])
+    assert (reason, count) == ("rule_json_complete", 4)
+
+
+def test_json_complete_handles_escaped_quotes():
+    matcher = StopMatcher([{"type": "json_complete"}])
+    # 字符串中的 \" 不结束字符串，其后的 } 仍在字符串内
+    reason, count = _feed_all(matcher, ['{"q": "say \\"hi\\" }', ' ok"', "}"])
+    assert (reason, count) == ("rule_json_complete", 3)
+
+
+def test_json_complete_escape_split_across_chunks():
+    matcher = StopMatcher([{"type": "json_complete"}])
+    reason, count = _feed_all(matcher, ['{"q": "a\\', '"}', '"}'])
+    assert (reason, count) == ("rule_json_complete", 3)
+
+
+def test_json_complete_escaped_backslash_ends_string():
+    matcher = StopMatcher([{"type": "json_complete"}])
+    # "c:\\" 是以反斜杠结尾的完整字符串，随后的 } 闭合对象
+    assert _feed_all(matcher, ['{"path": "c:\\\\"', "}"]) == ("rule_json_complete", 2)
+
+
+def test_json_complete_ignores_quotes_and_closers_before_json():
+    matcher = StopMatcher([{"type": "json_complete"}])
+    assert _feed_all(matcher, ['他说 "好的" }', '{"a": 1', "}"]) == ("rule_json_complete", 3)
+
+
+def test_json_complete_incomplete():
+    matcher = StopMatcher([{"type": "json_complete"}])
+    assert _feed_all(matcher, ['{"a": {"b": 1}', ', "c": 2']) == (None, 2)
+
+
+# ---------- max_chars ----------
+
+def test_max_chars_counts_accumulated_text():
+    matcher = StopMatcher([{"type": "max_chars", "value": 5}])
+    assert _feed_all(matcher, ["ab", "cd", "e", "f"]) == ("rule_max_chars", 3)
+
+
+# ---------- predicate ----------
+
+def test_builtin_predicates():
+    assert _feed_all(StopMatcher([{"type": "predicate", "name": "first_line"}]), ["\n", "正面", "\n负面"]) == (
+        "rule_predicate", 3,
+    )
+    assert _feed_all(StopMatcher([{"type": "predicate", "name": "first_sentence"}]), ["这是", "一句话。", "第二句"]) == (
+        "rule_predicate", 2,
+    )
+
+
+def test_registered_predicate(monkeypatch):
+    monkeypatch.setitem(STOP_PREDICATES, "_test_has_ok", None)
+    register_stop_predicate("_test_has_ok")(lambda text: "OK" in text)
+
+    assert validate_stop_rules([{"type": "predicate", "name": "_test_has_ok"}])
+    matcher = StopMatcher([{"type": "predicate", "name": "_test_has_ok"}])
+    assert _feed_all(matcher, ["O", "K", "!"]) == ("rule_predicate", 2)
+
+
+# ---------- 组合 ----------
+
+def test_first_matching_rule_wins():
+    matcher = StopMatcher([
+        {"type": "max_chars", "value": 100},
+        {"type": "regex", "pattern": "STOP"},
+    ])
+    assert _feed_all(matcher, ["go ", "STOP", "x" * 200]) == ("rule_regex", 2)
+    assert matcher.text == "go STOP"
@@ -0,0 +1,307 @@
+"""上游自适应并发控制（AIMD）、优先级调度与准入控制的单元测试"""
+
+import asyncio
+
+import pytest
+
+from backend.config import (
+    UPSTREAM_DECREASE_COOLDOWN,
+    UPSTREAM_DECREASE_FACTOR,
+    UPSTREAM_TTFT_DECREASE_FACTOR,
+    UPSTREAM_TTFT_MIN_SAMPLES,
+)
+from backend.services import upstream_limiter
+from backend.services.upstream_limiter import (
+    AdaptiveLimiter,
+    UpstreamOverloaded,
+    UpstreamPriority,
+    get_limiter_for,
+)
+
+
+def _limiter(limit: float) -> AdaptiveLimiter:
+    limiter = AdaptiveLimiter("http://upstream.test", "m")
+    limiter.limit = float(limit)
+    return limiter
+
+
+def _finish(limiter: AdaptiveLimiter, call, status_code: int | None = None, ttft_ms: float | None = None):
+    """以给定结果结束一次调用并归还名额"""
+    if status_code is None:
+        call.succeeded = True
+        call.ttft_ms = ttft_ms
+    else:
+        call.status_code = status_code
+    limiter.release(call)
+
+
+def _end_cooldown(limiter: AdaptiveLimiter):
+    limiter._last_decrease -= UPSTREAM_DECREASE_COOLDOWN
+
+
+@pytest.fixture
+def registered():
+    """注册到全局表中的控制器（准入控制按 base_url 统计排队深度），测试结束后移除"""
+    created = []
+
+    def make(limit: float) -> AdaptiveLimiter:
+        limiter = get_limiter_for(f"http://admit-{len(created)}.test", "m")
+        limiter.limit = float(limit)
+        created.append(limiter)
+        return limiter
+
+    yield make
+    for limiter in created:
+        upstream_limiter._limiters.pop((limiter.base_url, limiter.model_id), None)
+
+
+# ---------- 加性增长 ----------
+
+def test_no_increase_when_not_saturated():
+    limiter = _limiter(4)
+    for _ in range(20):
+        _finish(limiter, limiter.try_acquire(UpstreamPriority.INTERACTIVE))
+    assert limiter.limit == 4
+    assert limiter.successes == 20
+
+
+def test_additive_increase_when_saturated():
+    limiter = _limiter(4)
+    calls = [limiter.try_acquire(UpstreamPriority.INTERACTIVE) for _ in range(4)]
+    assert all(calls)
+
+    # 名额始终用满：每完成一次立即补上一次，约 limit 次后上限 +1（4 → 4.25 → 4.49 → 4.71 → 4.92 → 5.12）
+    for expected in (4.25, 4.4853, 4.7080, 4.9204):
+        _finish(limiter, calls.pop(0))
+        assert limiter.limit == pytest.approx(expected, abs=1e-3)
+        calls.append(limiter.try_acquire(UpstreamPriority.INTERACTIVE))
+    assert limiter.history[-1]["reason"] == "initial"
+
+    _finish(limiter, calls.pop(0))
+    assert int(limiter.limit) == 5
+    assert limiter.history[-1]["reason"] == "increase"
+
+
+# ---------- 乘性下调 ----------
+
+@pytest.mark.parametrize("status_code", [429, 503])
+def test_overload_decreases_multiplicatively(status_code):
+    limiter = _limiter(8)
+    _finish(limiter, limiter.try_acquire(UpstreamPriority.BATCH), status_code=status_code)
+    assert limiter.limit == 8 * UPSTREAM_DECREASE_FACTOR
+    assert limiter.overloads == 1
+    assert limiter.history[-1]["reason"] == f"http_{status_code}"
+
+
+def test_other_errors_do_not_adjust():
+    limiter = _limiter(8)
+    _finish(limiter, limiter.try_acquire(UpstreamPriority.BATCH), status_code=500)
+    call = limiter.try_acquire(UpstreamPriority.BATCH)
+    limiter.release(call)  # 未成功也无状态码（如超时）
+    assert limiter.limit == 8
+    assert limiter.successes == 0
+
+
+def test_decrease_cooldown():
+    limiter = _limiter(16)
+    _finish(limiter, limiter.try_acquire(UpstreamPriority.BATCH), status_code=429)
+    _finish(limiter, limiter.try_acquire(UpstreamPriority.BATCH), status_code=503)
+    assert limiter.limit == 16 * UPSTREAM_DECREASE_FACTOR  # 同一波拥塞只下调一次
+    assert limiter.overloads == 2
+
+    _end_cooldown(limiter)
+    _finish(limiter, limiter.try_acquire(UpstreamPriority.BATCH), status_code=429)
+    assert limiter.limit == 16 * UPSTREAM_DECREASE_FACTOR ** 2
+
+
+def test_decrease_stops_at_minimum():
+    limiter = _limiter(1)
+    _finish(limiter, limiter.try_acquire(UpstreamPriority.BATCH), status_code=429)
+    assert limiter.limit == 1
+
+
+def test_ttft_spike_decreases():
+    limiter = _limiter(10)
+    for _ in range(UPSTREAM_TTFT_MIN_SAMPLES):
+        _finish(limiter, limiter.try_acquire(UpstreamPriority.BATCH), ttft_ms=100)
+    assert limiter.limit == 10
+
+    _finish(limiter, limiter.try_acquire(UpstreamPriority.BATCH), ttft_ms=1000)
+    assert limiter.limit == pytest.approx(10 * UPSTREAM_TTFT_DECREASE_FACTOR)
+    assert limiter.ttft_spikes == 1
+    assert limiter.history[-1]["reason"] == "ttft_spike"
+
+    # 冷却期内的突增不再下调，冷却后再次下调
+    _finish(limiter, limiter.try_acquire(UpstreamPriority.BATCH), ttft_ms=1000)
+    assert limiter.limit == pytest.approx(10 * UPSTREAM_TTFT_DECREASE_FACTOR)
+    _end_cooldown(limiter)
+    _finish(limiter, limiter.try_acquire(UpstreamPriority.BATCH), ttft_ms=1000)
+    assert limiter.limit == pytest.approx(10 * UPSTREAM_TTFT_DECREASE_FACTOR ** 2)
+
+
+def test_no_spike_detection_before_enough_samples():
+    limiter = _limiter(10)
+    for _ in range(UPSTREAM_TTFT_MIN_SAMPLES - 1):
+        _finish(limiter, limiter.try_acquire(UpstreamPriority.BATCH), ttft_ms=100)
+    _finish(limiter, limiter.try_acquire(UpstreamPriority.BATCH), ttft_ms=1000)
+    assert limiter.limit == 10
+    assert limiter.ttft_spikes == 0
+
+
+# ---------- 单次推理预留名额 ----------
+
+@pytest.mark.parametrize("limit, batch_capacity", [(1, 1), (2, 1), (3, 2), (4, 3), (8, 6)])
+def test_interactive_reserve(limit, batch_capacity):
+    limiter = _limiter(limit)
+    for priority in (UpstreamPriority.COMPARISON, UpstreamPriority.BATCH, UpstreamPriority.BACKGROUND):
+        assert limiter._capacity(priority) == batch_capacity
+    assert limiter._capacity(UpstreamPriority.INTERACTIVE) == limit
+
+    calls = [limiter.try_acquire(UpstreamPriority.BATCH) for _ in range(batch_capacity)]
+    assert all(calls)
+    assert limiter.try_acquire(UpstreamPriority.BATCH) is None
+    if limit >= 2:
+        assert limiter.try_acquire(UpstreamPriority.INTERACTIVE) is not None
+
+
+@pytest.mark.asyncio
+async def test_queued_batch_cannot_take_reserved_slot():
+    limiter = _limiter(2)
+    held = limiter.try_acquire(UpstreamPriority.BATCH)
+    batch = asyncio.create_task(limiter.acquire(UpstreamPriority.BATCH, flow="b1"))
+    await asyncio.sleep(0)
+    assert not batch.done()
+    assert limiter.queued() == 1
+
+    interactive = await asyncio.wait_for(limiter.acquire(UpstreamPriority.INTERACTIVE), 1)
+    assert limiter.in_flight == 2
+    assert not batch.done()
+
+    limiter.release(interactive)
+    assert not batch.done()  # 预留的名额空出后仍不分配给批量
+    limiter.release(held)
+    call = await asyncio.wait_for(batch, 1)
+    limiter.release(call)
+    assert limiter.in_flight == 0
+
+
+# ---------- 排队顺序 ----------
+
+@pytest.mark.asyncio
+async def test_dispatch_by_priority_then_fair_between_flows():
+    limiter = _limiter(1)
+    held = limiter.try_acquire(UpstreamPriority.INTERACTIVE)
+    order = []
+
+    async def wait(name, priority, flow=None):
+        call = await limiter.acquire(priority, flow=flow)
+        order.append(name)
+        limiter.release(call)
+
+    tasks = [asyncio.create_task(wait(f"a{i}", UpstreamPriority.BATCH, "a")) for i in range(3)]
+    await asyncio.sleep(0)
+    tasks += [asyncio.create_task(wait(f"b{i}", UpstreamPriority.BATCH, "b")) for i in range(2)]
+    await asyncio.sleep(0)
+    tasks.append(asyncio.create_task(wait("bg", UpstreamPriority.BACKGROUND)))
+    tasks.append(asyncio.create_task(wait("cmp", UpstreamPriority.COMPARISON)))
+    await asyncio.sleep(0)
+
+    limiter.release(held)
+    await asyncio.wait_for(asyncio.gather(*tasks), 1)
+    assert order == ["cmp", "a0", "b0", "a1", "b1", "a2", "bg"]
+
+
+# ---------- 准入控制 ----------
+
+@pytest.mark.asyncio
+async def test_admission_rejects_when_queue_full(registered, monkeypatch):
+    monkeypatch.setattr(upstream_limiter, "UPSTREAM_QUEUE_MAX_DEPTH", 1)
+    limiter = registered(1)
+    held = limiter.try_acquire(UpstreamPriority.INTERACTIVE)
+    waiter = asyncio.create_task(limiter.acquire(UpstreamPriority.INTERACTIVE))
+    await asyncio.sleep(0)
+
+    with pytest.raises(UpstreamOverloaded) as exc:
+        await limiter.acquire(UpstreamPriority.INTERACTIVE, max_wait=5)
+    assert exc.value.retry_after >= 1
+    assert limiter.rejected_full == 1
+
+    limiter.release(held)
+    limiter.release(await asyncio.wait_for(waiter, 1))
+    assert limiter.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_admission_rejects_on_wait_timeout(registered):
+    limiter = registered(1)
+    held = limiter.try_acquire(UpstreamPriority.INTERACTIVE)
+
+    with pytest.raises(UpstreamOverloaded):
+        await limiter.acquire(UpstreamPriority.INTERACTIVE, max_wait=0.05)
+    assert limiter.rejected_timeout == 1
+    assert limiter.queued() == 0
+
+    limiter.release(held)
+    assert limiter.in_flight == 0
+    assert limiter.try_acquire(UpstreamPriority.INTERACTIVE) is not None
+
+
+@pytest.mark.asyncio
+async def test_admission_counts_lower_priority_queue_separately(registered, monkeypatch):
+    monkeypatch.setattr(upstream_limiter, "UPSTREAM_QUEUE_MAX_DEPTH", 1)
+    limiter = registered(1)
+    held = limiter.try_acquire(UpstreamPriority.INTERACTIVE)
+    batch = asyncio.create_task(limiter.acquire(UpstreamPriority.BATCH))
+    await asyncio.sleep(0)
+
+    # 排队的批量请求不占用单次推理的排队深度
+    interactive = asyncio.create_task(limiter.acquire(UpstreamPriority.INTERACTIVE, max_wait=1))
+    await asyncio.sleep(0.01)
+    assert limiter.queued() == 2
+    limiter.release(held)
+    limiter.release(await asyncio.wait_for(interactive, 1))
+    limiter.release(await asyncio.wait_for(batch, 1))
+    assert limiter.rejected_full == 0
+
+
+# ---------- 取消 ----------
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_returns_granted_slot():
+    limiter = _limiter(1)
+    held = limiter.try_acquire(UpstreamPriority.INTERACTIVE)
+    waiter = asyncio.create_task(limiter.acquire(UpstreamPriority.BATCH))
+    await asyncio.sleep(0)
+
+    limiter.release(held)  # 名额分配给等待者，但它尚未恢复执行
+    assert limiter.in_flight == 1
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+
+    assert limiter.in_flight == 0
+    assert limiter.try_acquire(UpstreamPriority.BATCH) is not None
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_before_grant_leaves_no_trace():
+    limiter = _limiter(1)
+    held = limiter.try_acquire(UpstreamPriority.INTERACTIVE)
+    waiter = asyncio.create_task(limiter.acquire(UpstreamPriority.BATCH))
+    await asyncio.sleep(0)
+
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    assert limiter.queued() == 0
+
+    limiter.release(held)
+    assert limiter.in_flight == 0
+
+
+def test_release_is_idempotent():
+    limiter = _limiter(2)
+    call = limiter.try_acquire(UpstreamPriority.INTERACTIVE)
+    limiter.release(call)
+    call.release()
+    assert limiter.in_flight == 0